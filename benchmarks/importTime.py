@@ -0,0 +1,75 @@
+###############################################################################
+#   ilastik: interactive learning and segmentation toolkit
+#
+#       Copyright (C) 2011-2022, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# In addition, as a special exception, the copyright holders of
+# ilastik give you permission to combine ilastik with applets,
+# workflows and plugins which are not covered under the GNU
+# General Public License.
+#
+# See the LICENSE file for details. License information is also available
+# on the ilastik web site at:
+#           http://ilastik.org/license.html
+###############################################################################
+"""
+Measures the time it takes to import lazyflow/ilastik (and to look up a workflow) in a fresh interpreter,
+together with the number of modules that were imported.
+
+    python benchmarks/importTime.py --repeat 5
+
+For a per-module breakdown, run e.g. `python -X importtime -c "import lazyflow"`.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+STATEMENTS = {
+    "import lazyflow": "import lazyflow",
+    "import lazyflow.operators": "from lazyflow.operators import OpArrayPiper",
+    "import ilastik.workflows": "import ilastik.workflows",
+    "first workflow": "import ilastik.workflow; ilastik.workflow.getWorkflowFromName('Pixel Classification')",
+    "all workflows": "import ilastik.workflow; list(ilastik.workflow.getAvailableWorkflows())",
+}
+
+_TIMING_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+{statement}
+stop = time.perf_counter()
+print(json.dumps({{"seconds": stop - start, "modules": len(sys.modules)}}))
+"""
+
+
+def time_statement(statement):
+    """Run the statement in a new interpreter and return (seconds, number of loaded modules)"""
+    output = subprocess.check_output([sys.executable, "-c", _TIMING_SCRIPT.format(statement=statement)])
+    result = json.loads(output.decode().strip().splitlines()[-1])
+    return result["seconds"], result["modules"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="number of fresh interpreters per statement")
+    args = parser.parse_args()
+
+    for name, statement in STATEMENTS.items():
+        timings = [time_statement(statement) for _ in range(args.repeat)]
+        seconds = [t for t, _ in timings]
+        print(
+            "{:<28} median {:6.3f}s  min {:6.3f}s  {:5d} modules".format(
+                name, statistics.median(seconds), min(seconds), timings[-1][1]
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -330,6 +330,7 @@ def _prepare_lazyflow_config(parsed_args):
     n_threads = os.getenv("LAZYFLOW_THREADS", None)
     total_ram_mb = os.getenv("LAZYFLOW_TOTAL_RAM_MB", None)
     status_interval_secs = int(os.getenv("LAZYFLOW_STATUS_MONITOR_SECONDS", "0"))
+    cache_pools = os.getenv("LAZYFLOW_CACHE_POOLS", None)
 
     # Convert str -> int
     if n_threads is not None:
@@ -342,9 +343,10 @@ def _prepare_lazyflow_config(parsed_args):
         if n_threads == -1:
             n_threads = None
     total_ram_mb = total_ram_mb or ilastik_config.getint("lazyflow", "total_ram_mb")
+    cache_pools = cache_pools or ilastik_config.get("lazyflow", "cache_pools", raw=True, fallback="")
 
     # Note that n_threads == 0 is valid and useful for debugging.
-    if (n_threads is not None) or total_ram_mb or status_interval_secs:
+    if (n_threads is not None) or total_ram_mb or status_interval_secs or cache_pools:
 
         def _configure_lazyflow_settings():
             import lazyflow
@@ -371,6 +373,8 @@ def _prepare_lazyflow_config(parsed_args):
                 fmt = Memory.format(ram)
                 logger.info("Configuring lazyflow RAM limit to {}".format(fmt))
                 Memory.setAvailableRam(ram)
+            for name, (fraction, pinned) in Memory.parseCachePools(cache_pools).items():
+                Memory.setCachePool(name, fraction, pinned)
 
         return _configure_lazyflow_settings
     return None
@@ -39,12 +39,18 @@ import os
 import sys
 import re
 import tempfile
+import hashlib
+import itertools
+import weakref
+import zlib
+from functools import partial
 import h5py
 import json
 import numpy
 import warnings
 import pickle as pickle
 
+from lazyflow.request import Request, RequestPool
 from lazyflow.roi import TinyVector, roiToSlice, sliceToRoi
 from lazyflow.utility import timeLogged
 from lazyflow.slot import OutputSlot, Slot
@@ -73,6 +79,18 @@ def deleteIfPresent(parentGroup, name):
         del parentGroup[name]
 
 
+def _block_hash(block):
+    """Content hash of a (possibly masked) block, stored with each saved block."""
+    content = hashlib.blake2b(digest_size=16)
+    content.update("{}{}".format(block.dtype.str, block.shape).encode())
+    if isinstance(block, numpy.ma.MaskedArray):
+        content.update(numpy.ascontiguousarray(block.mask).tobytes())
+        content.update(numpy.asarray(block.fill_value).tobytes())
+        block = block.data
+    content.update(numpy.ascontiguousarray(block).tobytes())
+    return content.hexdigest()
+
+
 def slicingToString(slicing):
     """Convert the given slicing into a string of the form
     '[0:1,2:3,4:5]'
@@ -402,7 +420,15 @@ class SerialListSlot(SerialSlot):
 
 
 class SerialBlockSlot(SerialSlot):
-    """A slot which only saves nonzero blocks."""
+    """
+    A slot which only saves nonzero blocks.
+
+    Saving is incremental: only blocks that intersect a dirty roi are read, and only those whose
+    content hash differs from the saved one are written.
+    """
+
+    # Number of blocks that are read and compressed in parallel before they are written
+    SAVE_BATCH_SIZE = 64
 
     def __init__(
         self,
@@ -430,146 +456,301 @@ class SerialBlockSlot(SerialSlot):
         self._shrink_to_bb = shrink_to_bb
         self.compression_level = compression_level
 
-    def shouldSerialize(self, group):
-        # Should this be a docstring?
-        #
-        # Must be overloaded as SerialBlockSlot does not serialize itself in the simple way that other SerialSlot do
-        # as a consequence of the nesting of groups required. Follows the same logic as _serialize and checks to see
-        # if each relevant subgroup has been created and if any are missing or their data is missing it should be
-        # serialized. Otherwise, if everything is intact, it doesn't suggest serialization unless the state has changed.
+        # lane -> list of dirty rois since the last save (None: everything)
+        self._dirty_rois = weakref.WeakKeyDictionary()
+        # lane -> (file name, group name) it was last saved to
+        self._saved_lanes = weakref.WeakKeyDictionary()
+        # operators with blocks that are read from the project file once needed (lazy_project_loading)
+        self._deferred_targets = weakref.WeakSet()
+        self._bindBlocks()
 
-        logger.debug("Checking whether to serialize BlockSlot: {}".format(self.name))
+    def _bindBlocks(self):
+        """
+        Keep track of the dirty rois of each lane, so that unchanged blocks don't have to be read when saving.
+        """
 
+        def onDirty(lane, roi):
+            rois = self._dirty_rois.setdefault(lane, [])
+            if rois is None:
+                return
+            if hasattr(roi, "start") and hasattr(roi, "stop"):
+                rois.append((TinyVector(roi.start), TinyVector(roi.stop)))
+            else:
+                self._dirty_rois[lane] = None
+
+        def onValueChanged(lane, *args):
+            self._dirty_rois[lane] = None
+
+        def bindLane(slot, index, size):
+            slot[index].notifyDirty(onDirty)
+            slot[index].notifyValueChanged(onValueChanged)
+
+        self.slot.notifyInserted(bindLane)
+        for index in range(len(self.slot)):
+            bindLane(self.slot, index, len(self.slot))
+
+    def _blockMayHaveChanged(self, lane, saved_to, roi):
+        """
+        Whether the data of roi in the lane may differ from what was saved to saved_to (file name, group name).
+        """
+        if self._saved_lanes.get(lane) != saved_to:
+            return True
+        rois = self._dirty_rois.get(lane, [])
+        if rois is None:
+            return True
+        start, stop = roi
+        return any(
+            (numpy.less(start, dirty_stop) & numpy.greater(stop, dirty_start)).all() for dirty_start, dirty_stop in rois
+        )
+
+    def shouldSerialize(self, group):
+        # Must be overloaded as SerialBlockSlot does not serialize itself in the simple way that other SerialSlot do
+        # as a consequence of the nesting of groups required. Checks whether each lane's subgroup exists and holds
+        # as many blocks as there are non-zero blocks. Otherwise, it doesn't suggest serialization unless the state
+        # has changed.
         if self.dirty:
-            logger.debug('BlockSlot "' + self.name + '" appears to be dirty. Should serialize.')
+            logger.debug("BlockSlot %s appears to be dirty. Should serialize.", self.name)
             return True
 
-        # SerialSlot interchanges self.name and name when they frequently are the same thing. It is not clear if using
-        # self.name would be acceptable here or whether name should be an input to shouldSerialize or if there should be
-        # a _shouldSerialize method, which takes the name.
         if self.name not in group:
-            logger.debug(
-                'Missing "'
-                + self.name
-                + '" in group "'
-                + repr(group)
-                + '" belonging to BlockSlot "'
-                + self.name
-                + '". Should serialize.'
-            )
+            logger.debug("Missing group of BlockSlot %s. Should serialize.", self.name)
             return True
-        else:
-            logger.debug(
-                'Found "' + self.name + '" in group "' + repr(group) + '" belonging to BlockSlot "' + self.name + '".'
-            )
 
-        # Just because the group was serialized doesn't mean that the relevant data was.
         mygroup = group[self.name]
-        num = len(self.blockslot)
-        for index in range(num):
+        for index in range(len(self.blockslot)):
             subname = self.subname.format(index)
-
-            # Check to se if each subname has been created as a group
-            if subname not in mygroup:
-                logger.debug(
-                    'Missing "'
-                    + subname
-                    + '" from "'
-                    + repr(mygroup)
-                    + '" belonging to BlockSlot "'
-                    + self.name
-                    + '". Should serialize.'
-                )
+            if subname not in mygroup or len(mygroup[subname]) != len(self.blockslot[index].value):
+                logger.debug("Blocks of lane %s of BlockSlot %s are missing. Should serialize.", subname, self.name)
                 return True
-            else:
-                logger.debug(
-                    'Found "' + subname + '" from "' + repr(mygroup) + '" belonging to BlockSlot "' + self.name + '".'
-                )
-
-            subgroup = mygroup[subname]
 
-            nonZeroBlocks = self.blockslot[index].value
-            for blockIndex in range(len(nonZeroBlocks)):
-                blockName = "block{:04d}".format(blockIndex)
-
-                if blockName not in subgroup:
-                    logger.debug('Missing "' + blockName + '" from "' + repr(subgroup) + '". Should serialize.')
-                    return True
-                else:
-                    logger.debug(
-                        'Found "'
-                        + blockName
-                        + '" from "'
-                        + repr(subgroup)
-                        + '" belonging to BlockSlot "'
-                        + self.name
-                        + '".'
-                    )
+        logger.debug("Everything belonging to BlockSlot %s appears to be in order. Should not serialize.", self.name)
+        return False
 
-        logger.debug(
-            'Everything belonging to BlockSlot "' + self.name + '" appears to be in order. Should not serialize.'
-        )
+    def serialize(self, group):
+        """
+        Only writes the blocks that were added or changed since the last save, and removes the ones that are gone,
+        instead of recreating the whole group.
+        """
+        # Blocks that were not read yet may be overwritten or removed below (and must be copied on "save as")
+        for target in list(self._deferred_targets):
+            target.loadDeferredInput()
+        self._deferred_targets.clear()
 
-        return False
+        if not self.shouldSerialize(group):
+            return
+        if self.slot.ready():
+            self._serialize(group, self.name, self.slot)
+        else:
+            deleteIfPresent(group, self.name)
+        self.dirty = False
 
     @timeLogged(logger, logging.DEBUG)
     def _serialize(self, group, name, slot):
         logger.debug("Serializing BlockSlot: {}".format(self.name))
-        mygroup = group.create_group(name)
+        mygroup = group.require_group(name)
         num = len(self.blockslot)
-        compression_options = {}
-        if self.compression_level:
-            compression_options = {"compression_opts": self.compression_level, "compression": "gzip"}
-        for index in range(num):
-            subname = self.subname.format(index)
-            subgroup = mygroup.create_group(subname)
-            nonZeroBlocks = self.blockslot[index].value
-            for blockIndex, slicing in enumerate(nonZeroBlocks):
-                if not isinstance(slicing[0], slice):
-                    slicing = roiToSlice(*slicing)
-
-                block = self.slot[index][slicing].wait()
-                block_tags = self.slot[index].meta.axistags
-                blockName = "block{:04d}".format(blockIndex)
-
-                if self._shrink_to_bb:
-                    nonzero_coords = numpy.nonzero(block)
-                    if len(nonzero_coords[0]) > 0:
-                        block_start = sliceToRoi(slicing, [sl.stop for sl in slicing])[0]
-                        block_bounding_box_start = numpy.array(list(map(numpy.min, nonzero_coords)))
-                        block_bounding_box_stop = 1 + numpy.array(list(map(numpy.max, nonzero_coords)))
-                        block_slicing = roiToSlice(block_bounding_box_start, block_bounding_box_stop)
-                        bounding_box_roi = numpy.array([block_bounding_box_start, block_bounding_box_stop])
-                        bounding_box_roi += block_start
-
-                        # Overwrite the vars that are written to the file
-                        slicing = roiToSlice(*bounding_box_roi)
-                        block = block[block_slicing]
-
-                # If we have a masked array, convert it to a structured array so that h5py can handle it.
-                if slot[index].meta.has_mask:
-                    mygroup.attrs["meta.has_mask"] = True
-
-                    block_group = subgroup.create_group(blockName)
-
-                    block_group.create_dataset("data", data=block.data, **compression_options)
-
-                    block_group.create_dataset("mask", data=block.mask, compression="gzip", compression_opts=2)
-                    block_group.create_dataset("fill_value", data=block.fill_value)
-
-                    block_group.attrs["blockSlice"] = slicingToString(slicing)
-                    block_group.attrs["axistags"] = block_tags.toJSON()
+
+        subnames = [self.subname.format(index) for index in range(num)]
+        for subname in set(mygroup.keys()) - set(subnames):
+            # Lanes that were removed
+            del mygroup[subname]
+
+        if num and slot[0].meta.has_mask:
+            mygroup.attrs["meta.has_mask"] = True
+
+        for index, subname in enumerate(subnames):
+            subgroup = mygroup.require_group(subname)
+            self._serializeLane(subgroup, slot[index], self.blockslot[index].value)
+
+    def _serializeLane(self, subgroup, lane, nonZeroBlocks):
+        saved_to = (subgroup.file.filename, subgroup.name)
+        # Saved blocks by the slicing they were read from (blockSlice, for files written before blockSourceSlice)
+        saved_blocks = {}
+        for blockName, blockData in subgroup.items():
+            key = blockData.attrs.get("blockSourceSlice", blockData.attrs["blockSlice"])
+            saved_blocks[bytes(key) if isinstance(key, bytes) else key.encode("utf-8")] = blockName
+
+        candidates = []
+        for slicing in nonZeroBlocks:
+            if not isinstance(slicing[0], slice):
+                slicing = roiToSlice(*slicing)
+            key = slicingToString(slicing)
+            blockName = saved_blocks.pop(key, None)
+            roi = sliceToRoi(slicing, [sl.stop for sl in slicing])
+            if blockName is None or self._blockMayHaveChanged(lane, saved_to, roi):
+                candidates.append((key, slicing, blockName))
+
+        for blockName in saved_blocks.values():
+            # Blocks that are all zero now
+            del subgroup[blockName]
+
+        self._saved_lanes.pop(lane, None)
+        self._dirty_rois[lane] = []
+        used_names = set(subgroup.keys())
+        new_names = ("block{:04d}".format(i) for i in itertools.count() if "block{:04d}".format(i) not in used_names)
+
+        written = 0
+        for batch_start in range(0, len(candidates), self.SAVE_BATCH_SIZE):
+            batch = candidates[batch_start : batch_start + self.SAVE_BATCH_SIZE]
+            # Read, hash and compress the blocks in parallel, then write them from this thread.
+            prepared = [None] * len(batch)
+            pool = RequestPool()
+            for i, (key, slicing, blockName) in enumerate(batch):
+                stored_hash = subgroup[blockName].attrs.get("contentHash") if blockName is not None else None
+                pool.add(Request(partial(self._prepareBlock, lane, slicing, stored_hash, prepared, i)))
+            pool.wait()
+
+            for (key, slicing, blockName), block in zip(batch, prepared):
+                if block is None:
+                    # Unchanged
+                    continue
+                if blockName is None:
+                    blockName = next(new_names)
                 else:
-                    subgroup.create_dataset(blockName, data=block, **compression_options)
-                    subgroup[blockName].attrs["blockSlice"] = slicingToString(slicing)
-                    subgroup[blockName].attrs["axistags"] = block_tags.toJSON()
+                    del subgroup[blockName]
+                self._writeBlock(subgroup, blockName, key, block, lane.meta.axistags)
+                written += 1
+
+        self._saved_lanes[lane] = saved_to
+        logger.debug(
+            "Saved {} of {} blocks of {} ({} checked)".format(written, len(nonZeroBlocks), saved_to, len(candidates))
+        )
+
+    def _prepareBlock(self, lane, slicing, stored_hash, prepared, i):
+        block = lane[slicing].wait()
+        content_hash = _block_hash(block)
+        if content_hash == stored_hash:
+            return
+
+        if self._shrink_to_bb:
+            nonzero_coords = numpy.nonzero(block)
+            if len(nonzero_coords[0]) > 0:
+                block_start = sliceToRoi(slicing, [sl.stop for sl in slicing])[0]
+                block_bounding_box_start = numpy.array(list(map(numpy.min, nonzero_coords)))
+                block_bounding_box_stop = 1 + numpy.array(list(map(numpy.max, nonzero_coords)))
+                block_slicing = roiToSlice(block_bounding_box_start, block_bounding_box_stop)
+                bounding_box_roi = numpy.array([block_bounding_box_start, block_bounding_box_stop])
+                bounding_box_roi += block_start
+
+                # Overwrite the vars that are written to the file
+                slicing = roiToSlice(*bounding_box_roi)
+                block = block[block_slicing]
+
+        compressed = None
+        if self.compression_level and not isinstance(block, numpy.ma.MaskedArray) and block.size:
+            block = numpy.ascontiguousarray(block)
+            # zlib releases the GIL, so blocks are compressed in parallel
+            compressed = zlib.compress(block.tobytes(), self.compression_level)
+        prepared[i] = (block, slicing, content_hash, compressed)
+
+    def _writeBlock(self, subgroup, blockName, key, prepared, block_tags):
+        block, slicing, content_hash, compressed = prepared
+
+        # If we have a masked array, convert it to a structured array so that h5py can handle it.
+        if isinstance(block, numpy.ma.MaskedArray):
+            compression_options = {}
+            if self.compression_level:
+                compression_options = {"compression_opts": self.compression_level, "compression": "gzip"}
+            dataset = subgroup.create_group(blockName)
+            dataset.create_dataset("data", data=block.data, **compression_options)
+            dataset.create_dataset("mask", data=block.mask, compression="gzip", compression_opts=2)
+            dataset.create_dataset("fill_value", data=block.fill_value)
+        elif compressed is not None:
+            # Store the block as a single gzip chunk, which was compressed already.
+            dataset = subgroup.create_dataset(
+                blockName,
+                shape=block.shape,
+                dtype=block.dtype,
+                chunks=block.shape,
+                compression="gzip",
+                compression_opts=self.compression_level,
+            )
+            dataset.id.write_direct_chunk((0,) * block.ndim, compressed)
+        else:
+            dataset = subgroup.create_dataset(blockName, data=block)
+
+        dataset.attrs["blockSlice"] = slicingToString(slicing)
+        dataset.attrs["blockSourceSlice"] = key
+        dataset.attrs["contentHash"] = content_hash
+        dataset.attrs["axistags"] = block_tags.toJSON()
+
+    def reshape_slicing_for_input(self, slicing: List[slice], slot: Slot, project: Project) -> List[slice]:
+        """Reshapes the slicing of a stored block relative to the whole data into the shape expected by the
+        slot being deserialized"""
+        return slicing
 
     def reshape_datablock_and_slicing_for_input(
         self, block: numpy.ndarray, slicing: List[slice], slot: Slot, project: Project
     ) -> Tuple[numpy.ndarray, List[slice]]:
         """Reshapes a block of data and its corresponding slicing relative to the whole data into a shape that is
         adequate for deserialization (in), i.e., the shape expected by the slot being deserialized"""
-        return block, slicing
+        return block, self.reshape_slicing_for_input(slicing, slot, project)
+
+    @staticmethod
+    def _deferredTarget(inslot):
+        """
+        The operator that data written to inslot (a lane) ends up in, if it can defer writing it (see
+        OpCompressedUserLabelArray.deferInput) and the data is only forwarded on the way there, else None.
+        """
+        targets = set()
+        pending = [inslot]
+        while pending:
+            slot = pending.pop()
+            if slot._value is not None:
+                # Slot.__setitem__ would write into the value, too
+                return None
+            if slot.downstream_slots:
+                pending.extend(slot.downstream_slots)
+                continue
+            operator = slot.operator
+            if not hasattr(operator, "deferInput") or slot is not getattr(operator, "Input", None):
+                return None
+            targets.add(operator)
+        return targets.pop() if len(targets) == 1 else None
+
+    def _readBlocks(self, labelGroup, lane, inlane):
+        """
+        Yields the (slicing, data) of the blocks stored in labelGroup, in the shape expected by inlane.
+        """
+        project = Project(labelGroup.file)
+        for blockData in list(labelGroup.values()):
+            slicing = stringToSlicing(blockData.attrs["blockSlice"])
+
+            # If it is suppose to be a masked array,
+            # deserialize the pieces and rebuild the masked array.
+            if lane.meta.has_mask:
+                blockArray = numpy.ma.masked_array(
+                    blockData["data"][()],
+                    mask=blockData["mask"][()],
+                    fill_value=blockData["fill_value"][()],
+                    shrink=False,
+                )
+            else:
+                blockArray = blockData[...]
+
+            blockArray, slicing = self.reshape_datablock_and_slicing_for_input(blockArray, slicing, inlane, project)
+            yield slicing, blockArray
+
+    def _deferBlocks(self, labelGroup, lane, inlane):
+        """
+        Hand the blocks stored in labelGroup to the operator behind inlane, to be read once they are needed.
+        Returns False if that operator can't defer reading them.
+        """
+        target = self._deferredTarget(inlane)
+        if target is None:
+            return False
+
+        project = Project(labelGroup.file)
+        rois = []
+        for blockData in labelGroup.values():
+            slicing = self.reshape_slicing_for_input(stringToSlicing(blockData.attrs["blockSlice"]), inlane, project)
+            rois.append(sliceToRoi(slicing, [sl.stop for sl in slicing]))
+
+        # The key replaces blocks deferred earlier for the same lane, e.g. when a project snapshot is loaded
+        # into the same workflow (the snapshot holds the same blocks then).
+        target.deferInput(self, rois, partial(self._readBlocks, labelGroup, lane, inlane))
+        self._deferred_targets.add(target)
+        return True
 
     @timeLogged(logger, logging.DEBUG)
     def _deserialize(self, mygroup, slot):
@@ -585,41 +766,28 @@ class SerialBlockSlot(SerialSlot):
         def extract_index(s):
             return int(index_capture.match(s).groups()[0])
 
+        lazy = ilastik_config.getboolean("ilastik", "lazy_project_loading", fallback=False)
         for index, t in enumerate(sorted(list(mygroup.items()), key=lambda k_v: extract_index(k_v[0]))):
             groupName, labelGroup = t
-            for blockData in list(labelGroup.values()):
-                slicing = stringToSlicing(blockData.attrs["blockSlice"])
-
-                # If it is suppose to be a masked array,
-                # deserialize the pieces and rebuild the masked array.
-                assert slot[index].meta.has_mask == mygroup.attrs.get("meta.has_mask"), (
-                    "The slot and stored data have different values for"
-                    + " `has_mask`. They are"
-                    + " `bool(slot[index].meta.has_mask)`="
-                    + repr(bool(slot[index].meta.has_mask))
-                    + " and"
-                    + ' `mygroup.attrs.get("meta.has_mask", False)`='
-                    + repr(mygroup.attrs.get("meta.has_mask", False))
-                    + ". Please fix this to proceed with deserialization."
-                )
-                if slot[index].meta.has_mask:
-                    blockArray = numpy.ma.masked_array(
-                        blockData["data"][()],
-                        mask=blockData["mask"][()],
-                        fill_value=blockData["fill_value"][()],
-                        shrink=False,
-                    )
-                else:
-                    blockArray = blockData[...]
-
-                blockArray, slicing = self.reshape_datablock_and_slicing_for_input(
-                    blockArray, slicing, self.inslot[index], Project(mygroup.file)
-                )
+            assert len(labelGroup) == 0 or slot[index].meta.has_mask == mygroup.attrs.get("meta.has_mask"), (
+                "The slot and stored data have different values for"
+                + " `has_mask`. They are"
+                + " `bool(slot[index].meta.has_mask)`="
+                + repr(bool(slot[index].meta.has_mask))
+                + " and"
+                + ' `mygroup.attrs.get("meta.has_mask", False)`='
+                + repr(mygroup.attrs.get("meta.has_mask", False))
+                + ". Please fix this to proceed with deserialization."
+            )
+            if lazy and self._deferBlocks(labelGroup, slot[index], self.inslot[index]):
+                continue
+            for slicing, blockArray in self._readBlocks(labelGroup, slot[index], self.inslot[index]):
                 self.inslot[index][slicing] = blockArray
 
 
 class SerialHdf5BlockSlot(SerialBlockSlot):
     def _serialize(self, group, name, slot):
+        deleteIfPresent(group, name)
         mygroup = group.create_group(name)
         num = len(self.blockslot)
         for index in range(num):
@@ -81,3 +81,21 @@ class CountingDataExportApplet(DataExportApplet):
         nickname = info_slot.value.nickname
         object_count = sum_slot[:].wait()[0]
         export_file.write(nickname + "," + str(object_count) + "\n")
+
+    def write_region_counts(self, export_file, lane_index, boxes):
+        """
+        Write the counting sum in each of the given boxes for the given lane to the
+        given export file object (which must be open already).
+        The boxes are (startX, startY, stopX, stopY), as in the box CSV files of the counting GUI.
+        """
+        info_slot = self.topLevelOperator.getLane(lane_index).RawDatasetInfo
+        opLane = self.opCounting.getLane(lane_index)
+        nickname = info_slot.value.nickname
+        roi_sum = opLane.OutputRoiSum.value
+        shape = opLane.Density.meta.shape
+        axes = opLane.Density.meta.getAxisKeys()
+        for box in boxes:
+            start, stop = [0] * len(shape), list(shape)
+            start[axes.index("x")], start[axes.index("y")], stop[axes.index("x")], stop[axes.index("y")] = box
+            object_count = roi_sum(start, stop)
+            export_file.write(",".join([nickname, *map(str, box), str(object_count)]) + "\n")
@@ -209,7 +209,9 @@ class CountingGui(LabelingGui):
         self.density5d = OpReorderAxes(graph=self.op.graph, parent=self.op.parent)  #
 
         self.density5d.Input.connect(self.op.Density)
-        self.boxController = BoxController(self.editor, self.density5d.Output, self.labelingDrawerUi.boxListModel)
+        self.boxController = BoxController(
+            self.editor, self.density5d.Output, self.labelingDrawerUi.boxListModel, sumRoi=self._sumDensityRoi
+        )
         self.boxInterpreter = BoxInterpreter(self.editor.navInterpret, self.editor.posModel, self.centralWidget())
         self.boxInterpreter.boxDrawn.connect(self.boxController.addNewBox)
 
@@ -1095,6 +1097,16 @@ class CountingGui(LabelingGui):
             self._labelControlUi.SigmaBox.setEnabled(False)
             self._labelControlUi.brushSizeComboBox.setCurrentIndex(self._cachedBrushSizeIndex)
 
+    def _sumDensityRoi(self, start, stop):
+        """
+        Sum of the density in a box, given in the (5D) coordinates of the box controller.
+        """
+        boxAxes = self.density5d.Output.meta.getAxisKeys()
+        densityAxes = self.op.Density.meta.getAxisKeys()
+        start = [start[boxAxes.index(axis)] for axis in densityAxes]
+        stop = [stop[boxAxes.index(axis)] for axis in densityAxes]
+        return self.op.OutputRoiSum.value(start, stop)
+
     def updateSum(self, *args, **kw):
         state = self.labelingDrawerUi.liveUpdateButton.isChecked()
         self.labelingDrawerUi.liveUpdateButton.setChecked(True)
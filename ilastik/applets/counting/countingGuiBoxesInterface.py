@@ -470,7 +470,9 @@ class RedRubberBand(QRubberBand):
 
 
 class CoupledRectangleElement(object):
-    def __init__(self, pos: QRect, inputSlot, editor=None, scene=None, parent=None, qcolor=QColor(0, 0, 255)):
+    def __init__(
+        self, pos: QRect, inputSlot, editor=None, scene=None, parent=None, qcolor=QColor(0, 0, 255), sumRoi=None
+    ):
         """
         Couples the functionality of the lazyflow operator OpSubRegion which gets a subregion of interest
         and the functionality of the resizable rectangle Item.
@@ -482,6 +484,8 @@ class CoupledRectangleElement(object):
         :param scene: the scene where to put the graphics item
         :param parent: the parent object if any
         :param qcolor: initial color of the rectangle
+        :param sumRoi: optional function(start, stop) that returns the sum of the inputSlot over the given
+                       (5D) roi without requesting it, e.g. from a summed-area table
         """
         assert inputSlot.meta.getTaggedShape()["c"] == 1
 
@@ -493,6 +497,7 @@ class CoupledRectangleElement(object):
         self._opsub = OpSubRegion(graph=inputSlot.operator.graph, parent=inputSlot.operator.parent)
 
         self._inputSlot = inputSlot  # input slot which connect to the sub array
+        self._sumRoi = sumRoi
 
         self.boxLabel = None  # a reference to the label in the labellist model
         self._initConnect()
@@ -519,10 +524,13 @@ class CoupledRectangleElement(object):
         # region get a wrong size
         # try:
         try:
-            subarray = self.getSubRegion()
             value = 0
-            if subarray is not None:
-                value = subarray.sum()
+            if self._sumRoi is not None:
+                value = self._sumRoi(self.getStart(), self.getStop())
+            else:
+                subarray = self.getSubRegion()
+                if subarray is not None:
+                    value = subarray.sum()
 
             self._rectItem.updateText(f"{value:.1f}")
 
@@ -702,13 +710,14 @@ class BoxController(QObject):
     fixedBoxesChanged = pyqtSignal(dict)
     viewBoxesChanged = pyqtSignal(dict)
 
-    def __init__(self, editor, connectionInput, boxListModel):
+    def __init__(self, editor, connectionInput, boxListModel, sumRoi=None):
         """
         Class which controls all boxes on the scene
 
         :param scene:
         :param connectionInput: The imput slot to which connect all the new boxes
         :param boxListModel:
+        :param sumRoi: optional function(start, stop) to compute the box sums with (see CoupledRectangleElement)
 
         """
 
@@ -719,6 +728,7 @@ class BoxController(QObject):
         self._setUpRandomColors()
         self.scene = scene
         self.connectionInput = connectionInput
+        self._sumRoi = sumRoi
         self._currentBoxesList = []
         self.currentColor = self._getNextBoxColor()
         self.boxListModel = boxListModel
@@ -737,7 +747,12 @@ class BoxController(QObject):
             return
 
         rect = CoupledRectangleElement(
-            pos, self.connectionInput, editor=self._editor, scene=self.scene, parent=self.scene.parent()
+            pos,
+            self.connectionInput,
+            editor=self._editor,
+            scene=self.scene,
+            parent=self.scene.parent(),
+            sumRoi=self._sumRoi,
         )
         rect.setZValue(len(self._currentBoxesList))
         rect.setColor(self.currentColor)
@@ -29,6 +29,7 @@ import numpy as np
 import time
 import copy
 import importlib
+import threading
 from functools import partial
 
 from lazyflow.graph import Operator, InputSlot, OutputSlot, OrderedSignal
@@ -183,117 +184,77 @@ class OpTrainCounter(Operator):
     # @traceLogged(logger, level=logging.INFO, msg="OpTrainCounter: Training Counting Regressor")
     def execute(self, slot, subindex, roi, result):
 
-        progress = 0
-        numImages = len(self.Images)
-        self.progressSignal(progress)
-        featMatrix = []
-        labelsMatrix = []
-        tagList = []
-
-        # result[0] = self._svr
+        self.progressSignal(0)
 
+        # Smoothed dot annotations, features and background labels of all label blocks (of all lanes)
+        # are fetched and turned into training samples in parallel.
+        opGaussians = []
+        blockKeys = []
         for i, labels in enumerate(self.inputs["ForegroundLabels"]):
             if labels.meta.shape is not None:
                 opGaussian = OpLabelPreviewer(parent=self)
                 opGaussian.name = "ManuallyGuardedOpGaussianSmoothing"
                 opGaussian.sigma.setValue(self.Sigma.value)
                 opGaussian.Input.connect(self.ForegroundLabels[i])
+                opGaussians.append(opGaussian)
                 blocks = self.inputs["nonzeroLabelBlocks"][i][0].wait()
+                blockKeys += [(i, opGaussian, b) for b in blocks[0]]
+        self.progressSignal(10)
+
+        samples = [None] * len(blockKeys)
+        progress = [10]
+        progressLock = threading.Lock()
+
+        def prepare_block(index):
+            i, opGaussian, b = blockKeys[index]
+            featurekey = list(b)
+            featurekey[-1] = slice(None, None, None)
+            reqlabels = opGaussian.Output[b]
+            reqfeat = self.Images[i][featurekey]
+            reqbg = self.inputs["BackgroundLabels"][i][b]
+            for req in (reqlabels, reqfeat, reqbg):
+                req.submit()
+            labblock = reqlabels.wait()
+            image = reqfeat.wait()
+            labbgblock = reqbg.wait()
+
+            labblock = labblock.reshape((image.shape[:-1]))
+            image = image.reshape((-1, image.shape[-1]))
+            labbgindices = np.flatnonzero(labbgblock == 2)
+
+            newDot, mapping, tags = self._svr.prepareDataRefactored(labblock, labbgindices)
+            samples[index] = (image[mapping], newDot[mapping], tags)
+
+            with progressLock:
+                progress[0] += 70 / len(blockKeys)
+                self.progressSignal(progress[0])
 
-                reqlistlabels = []
-                reqlistbg = []
-                reqlistfeat = []
-                progress += 10 // numImages
-                self.progressSignal(progress)
-
-                for b in blocks[0]:
-                    request = opGaussian.Output[b]
-                    # request = labels[b]
-                    featurekey = list(b)
-                    featurekey[-1] = slice(None, None, None)
-                    request2 = self.Images[i][featurekey]
-                    request3 = self.inputs["BackgroundLabels"][i][b]
-                    reqlistlabels.append(request)
-                    reqlistfeat.append(request2)
-                    reqlistbg.append(request3)
-
-                traceLogger.debug("Requests prepared")
-
-                numLabelBlocks = len(reqlistlabels)
-                progress_outer = [progress]
-                if numLabelBlocks > 0:
-                    progressInc = (80 - 10) // (numLabelBlocks * numImages)
-
-                def progressNotify(req):
-                    progress_outer[0] += progressInc // 2
-                    self.progressSignal(progress_outer[0])
-
-                for ir, req in enumerate(reqlistfeat):
-                    req.notify_finished(progressNotify)
-                    req.submit()
-
-                for ir, req in enumerate(reqlistlabels):
-                    req.notify_finished(progressNotify)
-                    req.submit()
-
-                for ir, req in enumerate(reqlistbg):
-                    req.notify_finished(progressNotify)
-                    req.submit()
-
-                traceLogger.debug("Requests fired")
-
-                # Fixme: Maybe later request only part of the region?
-
-                # image=self.inputs["Images"][i][:].wait()
-                for ir, req in enumerate(reqlistlabels):
-
-                    labblock = req.wait()
-
-                    image = reqlistfeat[ir].wait()
-                    labbgblock = reqlistbg[ir].wait()
-                    labblock = labblock.reshape((image.shape[:-1]))
-                    image = image.reshape((-1, image.shape[-1]))
-                    labbgindices = np.where(labbgblock == 2)
-                    labbgindices = np.ravel_multi_index(labbgindices, labbgblock.shape)
-
-                    newDot, mapping, tags = self._svr.prepareDataRefactored(labblock, labbgindices)
-                    # self._svr.prepareData(labblock, smooth = True)
-
-                    labels = newDot[mapping]
-                    features = image[mapping]
-
-                    featMatrix.append(features)
-                    labelsMatrix.append(labels)
-                    tagList.append(tags)
-
-                progress = progress_outer[0]
-
-                traceLogger.debug("Requests processed")
-
-        self.progressSignal(80 / numImages)
-        if len(featMatrix) == 0 or len(labelsMatrix) == 0:
+        try:
+            pool = RequestPool()
+            for index in range(len(blockKeys)):
+                pool.request(partial(prepare_block, index))
+            pool.wait()
+            pool.clean()
+        finally:
+            for opGaussian in opGaussians:
+                opGaussian.cleanUp()
+        traceLogger.debug("Requests processed")
+
+        self.progressSignal(80)
+        if len(samples) == 0:
             result[:] = None
 
         else:
-            posTags = [tag[0] for tag in tagList]
-            negTags = [tag[1] for tag in tagList]
-            numPosTags = np.sum(posTags)
-            numTags = np.sum(posTags) + np.sum(negTags)
-            fullFeatMatrix = np.ndarray((numTags, self.Images[0].meta.shape[-1]), dtype=np.float64)
-            fullLabelsMatrix = np.ndarray((numTags), dtype=np.float64)
-            fullFeatMatrix[:] = np.NAN
-            fullLabelsMatrix[:] = np.NAN
-            currPosCount = 0
-            currNegCount = numPosTags
-            for i, posCount in enumerate(posTags):
-                fullFeatMatrix[currPosCount : currPosCount + posTags[i], :] = featMatrix[i][:posCount, :]
-                fullLabelsMatrix[currPosCount : currPosCount + posTags[i]] = labelsMatrix[i][:posCount]
-                fullFeatMatrix[currNegCount : currNegCount + negTags[i], :] = featMatrix[i][posCount:, :]
-                fullLabelsMatrix[currNegCount : currNegCount + negTags[i]] = labelsMatrix[i][posCount:]
-                currPosCount += posTags[i]
-                currNegCount += negTags[i]
-
-            assert not np.isnan(np.sum(fullFeatMatrix))
+            # Positive samples (of all blocks) first, then the negative ones
+            posTags = [tags[0] for _, _, tags in samples]
+            negTags = [tags[1] for _, _, tags in samples]
+            fullFeatMatrix = np.concatenate(
+                [features[: tags[0]] for features, _, tags in samples]
+                + [features[tags[0] :] for features, _, tags in samples]
+            ).astype(np.float64, copy=False)
+            fullLabelsMatrix = np.concatenate(
+                [labels[: tags[0]] for _, labels, tags in samples] + [labels[tags[0] :] for _, labels, tags in samples]
+            ).astype(np.float64, copy=False)
 
             fullTags = [np.sum(posTags), np.sum(negTags)]
             # pool = RequestPool()
@@ -455,28 +416,22 @@ class OpPredictCounter(Operator):
 
         shape = res.shape
         prod = np.prod(shape[:-1])
-        res.shape = (prod, shape[-1])
-        features = res
-
-        predictions = [0] * len(forests)
+        # All regressors predict on the same (converted once) feature matrix,
+        # and write straight into their channel of the result
+        features = np.asarray(res, dtype=np.float32).reshape((prod, shape[-1]))
 
         t2 = time.perf_counter()
 
         pool = RequestPool()
 
         def predict_forest(i):
-            predictions[i] = forests[i].predict(np.asarray(features, dtype=np.float32))
-            predictions[i] = predictions[i].reshape(result.shape[:-1])
+            result[..., i - roi.start[-1]] = forests[i].predict(features).reshape(result.shape[:-1])
 
-        for i, f in enumerate(forests):
+        for i in range(roi.start[-1], roi.stop[-1]):
             req = pool.request(partial(predict_forest, i))
 
         pool.wait()
         pool.clean()
-        # predictions[0] = forests[0].predict(np.asarray(features, dtype = np.float32), normalize = False)
-        # predictions[0] = predictions[0].reshape(result.shape)
-        prediction = np.dstack(predictions)
-        result[...] = prediction
 
         # If our LabelsCount is higher than the number of labels in the training set,
         # then our results aren't really valid.  FIXME !!!
@@ -292,8 +292,9 @@ class SVR(object):
 
     def smoothLabels(self, dot):
 
-        backupindices = np.where(dot == 2)
-        dot[backupindices] = 0
+        background = dot == 2
+        backupindices = np.nonzero(background)
+        dot[background] = 0
         sigma = self._Sigma
 
         oldShape = dot.shape
@@ -308,14 +309,14 @@ class SVR(object):
                 raise Exception
 
         dot = dot.reshape(oldShape)
-        dot[backupindices] = 0
+        dot[background] = 0
 
         return dot, backupindices
 
     def prepareDataRefactored(self, dot, nindices):
 
         dot = dot.reshape(-1)
-        pindices = np.where(dot > 0.0001)[0]
+        pindices = np.flatnonzero(dot > 0.0001)
         # pindices = pindices[:250]
         lindices = None
         # if self.DENSITYBOUND:
@@ -482,23 +483,19 @@ class SVR(object):
 
     def predict(self, oldImage):
         oldShape = oldImage.shape
-        resShape = oldShape[:-1]
-        image = np.copy(oldImage.reshape((-1, oldImage.shape[-1])))
-        image = self.normalize(image)
-
-        reslist = []
-        for r in self._regressor:
-            if r is None:
-                reslist.append(np.zeros(oldImage.shape[:-1]))
-            else:
-                reslist.append(r.predict(image))
-            res = np.dstack(reslist)
-            resShape = oldShape[:-1] + (len(self._regressor),)
-
-        # res = np.zeros(oldShape[:-1])
-        res = res.view(np.ndarray)
-        res[res < 0] = 0
-        return res.reshape(resShape)
+        image = oldImage.reshape((-1, oldImage.shape[-1]))
+        if self._normalizes():
+            # normalize works in place, the image may be shared with other predictions
+            image = self.normalize(np.copy(image))
+
+        # All regressors predict on the same feature matrix, each into its own channel
+        res = np.zeros((image.shape[0], len(self._regressor)))
+        for i, r in enumerate(self._regressor):
+            if r is not None:
+                res[:, i] = r.predict(image).reshape(-1)
+
+        np.maximum(res, 0, out=res)
+        return res.reshape(oldShape[:-1] + (len(self._regressor),))
 
     def writeHDF5(self, cachePath, targetname):
         data = (np.void(pickle.dumps(self)),)
@@ -535,8 +532,11 @@ class SVR(object):
                 boxConstraints.append(valfeaturepair)
         return boxConstraints
 
+    def _normalizes(self):
+        return hasattr(self, "_scalingFactor") and self._method != "RandomForest"
+
     def normalize(self, image):
-        if not hasattr(self, "_scalingFactor") or self._method == "RandomForest":
+        if not self._normalizes():
             return image
         image - self._minmax[0]
 
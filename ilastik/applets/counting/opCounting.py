@@ -132,6 +132,198 @@ class OpVolumeOperator(Operator):
         self.cache = None
 
 
+def _summedAreaTable(data):
+    # zero-padded at the start of each axis, so that table[stop] - ... includes index 0
+    table = numpy.zeros(tuple(s + 1 for s in data.shape), dtype=numpy.float64)
+    table[(slice(1, None),) * data.ndim] = data
+    for axis in range(data.ndim):
+        numpy.cumsum(table, axis=axis, out=table)
+    return table
+
+
+def _cornerSum(table, start, stop):
+    """
+    sum over [start, stop) from a summed-area table, by inclusion-exclusion of the roi corners
+    """
+    total = 0.0
+    ndim = len(start)
+    for corner in itertools.product((False, True), repeat=ndim):
+        index = tuple(int(b) if upper else int(a) for a, b, upper in zip(start, stop, corner))
+        total += (-1) ** (ndim - sum(corner)) * table[index]
+    return total
+
+
+class OpSummedAreaTable(Operator):
+    """
+    Sums of the input over arbitrary rois, looked up in cached summed-area tables (integral images).
+
+    The input is split into blocks.  A block's summed-area table is only computed when a roi
+    has a border inside that block, otherwise only the block's sum is needed.  The sum over the
+    blocks that lie completely inside a roi is looked up in a summed-area table of the block sums,
+    so a roi sum costs a few lookups per block on its border, independent of the size of the roi.
+    When the input becomes dirty, only the blocks that intersect the dirty roi are computed again.
+
+    Output is the sum over the whole input, RoiSum provides a function(start, stop) that returns
+    the sum over the given roi (in the coordinates of the input, clipped to its shape).
+    """
+
+    name = "OpSummedAreaTable"
+
+    Input = InputSlot()
+
+    # None is replaced with the image shape in the respective axis.
+    DefaultBlockSize = (128, 128, None)
+    BlockShape = InputSlot(value=DefaultBlockSize)
+
+    Output = OutputSlot()
+    RoiSum = OutputSlot()
+
+    def __init__(self, *args, **kwargs):
+        super(OpSummedAreaTable, self).__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+        self._tables = {}
+        self._blockSums = None
+        self._blockTable = None
+        # incremented whenever blocks are invalidated, so that results computed meanwhile are not stored
+        self._generation = 0
+
+    def setupOutputs(self):
+        shape = self.Input.meta.shape
+        self._shape = numpy.array(shape)
+        self._blockShape = numpy.array([s if b is None else b for b, s in zip(self.BlockShape.value, shape)])
+
+        self.Output.meta.dtype = numpy.float64
+        self.Output.meta.shape = (1,)
+        self.RoiSum.meta.dtype = object
+        self.RoiSum.meta.shape = (1,)
+
+        with self._lock:
+            self._tables = {}
+            self._blockSums = numpy.full(-(-self._shape // self._blockShape), numpy.nan)
+            self._blockTable = None
+            self._generation += 1
+
+    def execute(self, slot, subindex, roi, result):
+        if slot is self.RoiSum:
+            result[0] = self.roiSum
+        else:
+            result[0] = self.roiSum([0] * len(self._shape), self._shape)
+        return result
+
+    def propagateDirty(self, slot, subindex, roi):
+        if slot is self.Input:
+            first = numpy.array(roi.start) // self._blockShape
+            last = (numpy.maximum(numpy.array(roi.stop), 1) - 1) // self._blockShape
+            with self._lock:
+                for block in itertools.product(*(range(a, b + 1) for a, b in zip(first, last))):
+                    self._tables.pop(block, None)
+                self._blockSums[roiToSlice(first, last + 1)] = numpy.nan
+                self._blockTable = None
+                self._generation += 1
+        self.Output.setDirty()
+        self.RoiSum.setDirty()
+
+    def roiSum(self, start, stop):
+        """
+        sum of the input over the roi [start, stop)
+        """
+        start = numpy.clip(numpy.asarray(start), 0, self._shape)
+        stop = numpy.clip(numpy.asarray(stop), 0, self._shape)
+        if numpy.any(stop <= start):
+            return 0.0
+
+        blockShape = self._blockShape
+        # blocks that intersect the roi, and blocks that lie completely inside of it
+        outer = list(zip(start // blockShape, (stop - 1) // blockShape + 1))
+        innerStart = -(-start // blockShape)
+        innerStop = numpy.where(stop == self._shape, -(-stop // blockShape), stop // blockShape)
+        inner = list(zip(innerStart, numpy.maximum(innerStop, innerStart)))
+
+        border = list(self._borderBlocks(outer, inner))
+        tables = self._getTables(border)
+        total = 0.0
+        for block in border:
+            blockStart = numpy.array(block) * blockShape
+            localStart = numpy.maximum(start - blockStart, 0)
+            localStop = numpy.minimum(stop - blockStart, blockShape)
+            total += _cornerSum(tables[block], localStart, localStop)
+        return total + self._innerSum(inner)
+
+    @staticmethod
+    def _borderBlocks(outer, inner):
+        # Every block of outer that is not in inner exactly once: first the ones outside
+        # of inner along the first axis, then (within inner along the first axis) the ones
+        # outside of inner along the second axis, and so on.
+        for axis in range(len(outer)):
+            outside = [i for i in range(*outer[axis]) if not inner[axis][0] <= i < inner[axis][1]]
+            ranges = [range(*r) for r in inner[:axis]] + [outside] + [range(*r) for r in outer[axis + 1 :]]
+            yield from itertools.product(*ranges)
+
+    def _blockData(self, block):
+        start = numpy.array(block) * self._blockShape
+        stop = numpy.minimum(start + self._blockShape, self._shape)
+        return numpy.asarray(self.Input(start, stop).wait(), dtype=numpy.float64)
+
+    def _computeBlocks(self, blocks, compute):
+        """
+        compute(block) for all blocks in parallel, returns (generation before computing, {block: result})
+        """
+        with self._lock:
+            generation = self._generation
+        results = {}
+
+        def computeBlock(block):
+            results[block] = compute(block)
+
+        pool = RequestPool()
+        for block in blocks:
+            pool.request(partial(computeBlock, block))
+        pool.wait()
+        return generation, results
+
+    def _getTables(self, blocks):
+        with self._lock:
+            tables = {block: self._tables[block] for block in blocks if block in self._tables}
+        missing = [block for block in blocks if block not in tables]
+        if not missing:
+            return tables
+
+        generation, computed = self._computeBlocks(missing, lambda block: _summedAreaTable(self._blockData(block)))
+        with self._lock:
+            if generation == self._generation:
+                self._tables.update(computed)
+                for block, table in computed.items():
+                    self._storeBlockSum(block, table[(-1,) * table.ndim])
+        tables.update(computed)
+        return tables
+
+    def _storeBlockSum(self, block, blockSum):
+        if numpy.isnan(self._blockSums[block]):
+            self._blockSums[block] = blockSum
+            self._blockTable = None
+
+    def _innerSum(self, inner):
+        key = tuple(slice(a, b) for a, b in inner)
+        with self._lock:
+            blockSums = self._blockSums[key].copy()
+            blockTable = self._blockTable
+            if blockTable is None and not numpy.isnan(self._blockSums).any():
+                blockTable = self._blockTable = _summedAreaTable(self._blockSums)
+        if blockTable is not None:
+            return _cornerSum(blockTable, [a for a, _ in inner], [b for _, b in inner])
+
+        offset = numpy.array([a for a, _ in inner])
+        missing = [tuple(int(i) for i in offset + index) for index in numpy.argwhere(numpy.isnan(blockSums))]
+        generation, computed = self._computeBlocks(missing, lambda block: self._blockData(block).sum())
+        with self._lock:
+            if generation == self._generation:
+                for block, blockSum in computed.items():
+                    self._storeBlockSum(block, blockSum)
+        for block, blockSum in computed.items():
+            blockSums[tuple(numpy.array(block) - offset)] = blockSum
+        return float(blockSums.sum())
+
+
 # FIXME: this operator does _not_ calculate anything related to data - just
 # for a hypothetical one pixel gaussian
 class OpUpperBound(Operator):
@@ -250,6 +442,7 @@ class OpCounting(Operator):
     Density = OutputSlot(level=1)
     LabelPreview = OutputSlot(level=1)
     OutputSum = OutputSlot(level=1)
+    OutputRoiSum = OutputSlot(level=1)
     WorkingDirectory = OutputSlot()
 
     def __init__(self, *args, **kwargs):
@@ -336,6 +529,7 @@ class OpCounting(Operator):
         self.UncertaintyEstimate.connect(self.opPredictionPipeline.UncertaintyEstimate)
         self.Density.connect(self.opPredictionPipeline.CachedPredictionProbabilities)
         self.OutputSum.connect(self.opPredictionPipeline.OutputSum)
+        self.OutputRoiSum.connect(self.opPredictionPipeline.OutputRoiSum)
 
         def inputResizeHandler(slot, oldsize, newsize):
             if newsize == 0:
@@ -569,6 +763,7 @@ class OpPredictionPipelineNoCache(Operator):
     HeadlessPredictionProbabilities = OutputSlot()  # drange is 0.0 to 1.0
     # HeadlessUint8PredictionProbabilities = OutputSlot() # drange 0 to 255
     OutputSum = OutputSlot()
+    OutputRoiSum = OutputSlot()  # function(start, stop) that returns the sum of the density over a roi
 
     def __init__(self, *args, **kwargs):
         super(OpPredictionPipelineNoCache, self).__init__(*args, **kwargs)
@@ -585,10 +780,10 @@ class OpPredictionPipelineNoCache(Operator):
         self.meaner.Input.connect(self.cacheless_predict.PMaps)
         self.HeadlessPredictionProbabilities.connect(self.meaner.Output)
 
-        self.opVolumeSum = OpVolumeOperator(parent=self)
-        self.opVolumeSum.Input.connect(self.meaner.Output)
-        self.opVolumeSum.Function.setValue(numpy.sum)
-        self.OutputSum.connect(self.opVolumeSum.Output)
+        self.opDensitySum = OpSummedAreaTable(parent=self)
+        self.opDensitySum.Input.connect(self.meaner.Output)
+        self.OutputSum.connect(self.opDensitySum.Output)
+        self.OutputRoiSum.connect(self.opDensitySum.RoiSum)
 
         # Alternate headless output: uint8 instead of float.
         # Note that drange is automatically updated.
@@ -659,6 +854,9 @@ class OpPredictionPipeline(OpPredictionPipelineNoCache):
         self.precomputed_predictions_gui.PrecomputedInput.connect(self.PredictionsFromDisk)
         self.CachedPredictionProbabilities.connect(self.precomputed_predictions_gui.Output)
 
+        # The GUI counts the density that it displays, so that its boxes and the total agree with it
+        self.opDensitySum.Input.connect(self.precomputed_predictions_gui.Output)
+
     def setupOutputs(self):
         pass
 
@@ -687,12 +885,9 @@ class OpEnsembleMargin(Operator):
         roi.stop[chanAxis] = taggedShape["c"]
         pmap = self.Input.get(roi).wait()
 
-        pmap_sort = numpy.sort(pmap, axis=self.Input.meta.axistags.index("c")).view(vigra.VigraArray)
-        pmap_sort.axistags = self.Input.meta.axistags
-
-        res = pmap_sort.bindAxis("c", -1) - pmap_sort.bindAxis("c", -2)
-        res = res.withAxes(*list(taggedShape.keys())).view(numpy.ndarray)
-        result[...] = res
+        # Only the two largest predictions are needed, no need to sort all of them
+        pmap = numpy.partition(pmap.view(numpy.ndarray), -2, axis=chanAxis)
+        result[...] = numpy.take(pmap, [-1], axis=chanAxis) - numpy.take(pmap, [-2], axis=chanAxis)
         return result
 
     def propagateDirty(self, inputSlot, subindex, roi):
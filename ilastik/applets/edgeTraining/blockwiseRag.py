@@ -0,0 +1,207 @@
+###############################################################################
+#   ilastik: interactive learning and segmentation toolkit
+#
+#       Copyright (C) 2011-2022, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# In addition, as a special exception, the copyright holders of
+# ilastik give you permission to combine ilastik with applets,
+# workflows and plugins which are not covered under the GNU
+# General Public License.
+#
+# See the LICENSE file for details. License information is also available
+# on the ilastik web site at:
+#           http://ilastik.org/license.html
+###############################################################################
+import numpy as np
+import pandas as pd
+import vigra
+
+import ilastikrag
+
+from lazyflow.request import RequestLock
+
+from .util import (
+    EDGE_STATISTICS,
+    blockwise_edge_statistics,
+    blockwise_edge_table,
+    rag_feature_columns,
+    rag_supported_features,
+)
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Features of ilastikrag that BlockwiseRag accumulates block by block
+STANDARD_EDGE_PREFIX = "standard_edge_"
+BLOCKWISE_FEATURES = tuple(STANDARD_EDGE_PREFIX + statistic for statistic in EDGE_STATISTICS)
+
+
+class BlockwiseRag:
+    """
+    Region adjacency graph whose edges are determined block by block (see blockwise_edge_table).
+
+    The edge ids are identical to those of an ilastikrag.Rag of the same label volume, and the
+    standard edge statistics (BLOCKWISE_FEATURES) are computed blockwise as well, so the label
+    and value volumes never have to be held in memory as a whole for them.
+    Everything else (other features, edge decisions from groundtruth, naive segmentation, ...)
+    is delegated to a whole-volume ilastikrag.Rag, which is only built when first needed.
+    """
+
+    SERIALIZATION_FORMAT = "blockwise_rag"
+
+    def __init__(self, label_source, axiskeys, edge_ids, edge_sizes, sp_ids, block_shape):
+        """
+        label_source: array-like (shape and slicing) label volume without channel axis
+        axiskeys: axis keys of the label volume, e.g. "zyx"
+        edge_ids, edge_sizes, sp_ids: as returned by blockwise_edge_table
+        block_shape: shape of the blocks to process
+        """
+        assert len(axiskeys) == len(label_source.shape)
+        self._label_source = label_source
+        self._axiskeys = axiskeys
+        self._edge_ids = edge_ids
+        self._edge_sizes = edge_sizes
+        self._sp_ids = sp_ids
+        self._block_shape = tuple(int(b) for b in block_shape)
+        self._rag = None
+        self._rag_lock = RequestLock()
+
+    @classmethod
+    def from_label_source(cls, label_source, axiskeys, block_shape):
+        edge_ids, edge_sizes, sp_ids = blockwise_edge_table(label_source, block_shape)
+        return cls(label_source, axiskeys, edge_ids, edge_sizes, sp_ids, block_shape)
+
+    @property
+    def axiskeys(self):
+        return self._axiskeys
+
+    @property
+    def block_shape(self):
+        return self._block_shape
+
+    @property
+    def edge_ids(self):
+        return self._edge_ids
+
+    @property
+    def num_edges(self):
+        return len(self._edge_ids)
+
+    @property
+    def edge_sizes(self):
+        """
+        Number of adjacent voxel pairs of each edge
+        """
+        return self._edge_sizes
+
+    @property
+    def sp_ids(self):
+        return self._sp_ids
+
+    @property
+    def num_sp(self):
+        return len(self._sp_ids)
+
+    @property
+    def max_sp(self):
+        return int(self._sp_ids[-1]) if len(self._sp_ids) else 0
+
+    @property
+    def rag(self):
+        """
+        The whole-volume ilastikrag.Rag of the label volume (built on first access)
+        """
+        with self._rag_lock:
+            if self._rag is None:
+                logger.info("Creating whole-volume RAG...")
+                self._rag = ilastikrag.Rag(vigra.taggedView(self._read_all(self._label_source), self._axiskeys))
+        return self._rag
+
+    def __getattr__(self, name):
+        # Only called for attributes that BlockwiseRag doesn't define itself
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.rag, name)
+
+    def supported_features(self):
+        # Doesn't depend on the labels, no need for the whole-volume Rag
+        return rag_supported_features(self._axiskeys)
+
+    def _read_all(self, source):
+        return np.asarray(source[tuple(slice(None) for _ in source.shape)])
+
+    def compute_features(self, value_img, feature_names):
+        """
+        Like ilastikrag.Rag.compute_features: returns a DataFrame with the columns sp1, sp2 and
+        the feature columns in the order of ilastikrag.
+
+        value_img: ndarray or array-like (shape and slicing) of the label volume's shape.
+        Features in BLOCKWISE_FEATURES are accumulated from one block of value_img at a time,
+        all others need the whole-volume Rag and value image.
+        """
+        feature_names = list(feature_names)
+        columns = rag_feature_columns(self._axiskeys, tuple(feature_names))
+        blockwise_names = [name for name in feature_names if name in BLOCKWISE_FEATURES and name in columns]
+        other_names = [name for name in feature_names if name not in blockwise_names]
+
+        features = {}
+        if blockwise_names:
+            statistics = [name[len(STANDARD_EDGE_PREFIX) :] for name in blockwise_names]
+            edge_statistics = blockwise_edge_statistics(
+                self._label_source, value_img, self._edge_ids, self._block_shape, statistics
+            )
+            for name, statistic in zip(blockwise_names, statistics):
+                features[name] = edge_statistics[statistic]
+
+        if other_names:
+            if not isinstance(value_img, vigra.VigraArray):
+                value_img = vigra.taggedView(self._read_all(value_img), self._axiskeys)
+            other_df = self.rag.compute_features(value_img, other_names)
+            for column in other_df.columns.values[2:]:
+                features[column] = other_df[column].values
+
+        edge_features = {"sp1": self._edge_ids[:, 0], "sp2": self._edge_ids[:, 1]}
+        edge_features.update((column, features[column]) for column in columns)
+        return pd.DataFrame(edge_features)
+
+    def serialize_hdf5(self, h5py_group):
+        """
+        Store the edge table (not the labels, they are taken from the superpixels on deserialization)
+        """
+        h5py_group.attrs["format"] = self.SERIALIZATION_FORMAT
+        h5py_group.attrs["axiskeys"] = self._axiskeys
+        h5py_group.attrs["block_shape"] = self._block_shape
+        h5py_group.create_dataset("edge_ids", data=self._edge_ids)
+        h5py_group.create_dataset("edge_sizes", data=self._edge_sizes)
+        h5py_group.create_dataset("sp_ids", data=self._sp_ids)
+
+    @classmethod
+    def is_serialized_in(cls, h5py_group):
+        """
+        Whether h5py_group holds a BlockwiseRag (and not an ilastikrag.Rag)
+        """
+        serialization_format = h5py_group.attrs.get("format")
+        if isinstance(serialization_format, bytes):
+            serialization_format = serialization_format.decode()
+        return serialization_format == cls.SERIALIZATION_FORMAT
+
+    @classmethod
+    def deserialize_hdf5(cls, h5py_group, label_source):
+        axiskeys = h5py_group.attrs["axiskeys"]
+        if isinstance(axiskeys, bytes):
+            axiskeys = axiskeys.decode()
+        return cls(
+            label_source,
+            axiskeys,
+            h5py_group["edge_ids"][:],
+            h5py_group["edge_sizes"][:],
+            h5py_group["sp_ids"][:],
+            tuple(h5py_group.attrs["block_shape"]),
+        )
@@ -24,6 +24,10 @@ from ilastik.applets.base.appletSerializer import AppletSerializer, SerialSlot,
 from ilastikrag import Rag
 from ilastikrag.util import dataframe_from_hdf5, dataframe_to_hdf5
 
+from ilastik.utility.slottools import SlotBlockSource
+
+from .blockwiseRag import BlockwiseRag
+
 import logging
 
 logger = logging.getLogger(__file__)
@@ -56,7 +60,10 @@ class SerialRagSlot(SerialSlot):
                 continue
 
             rag_group = rags_group.create_group(self.subname.format(lane_index))
-            rag.serialize_hdf5(rag_group, store_labels=False)
+            if isinstance(rag, BlockwiseRag):
+                rag.serialize_hdf5(rag_group)
+            else:
+                rag.serialize_hdf5(rag_group, store_labels=False)
 
     def deserialize(self, rags_group):
         """
@@ -78,11 +85,19 @@ class SerialRagSlot(SerialSlot):
 
         for rag_groupname, rag_group in rags_group.items():
             lane_index = keys_to_indexes[rag_groupname]
-            label_img = self.labels_slot[lane_index][:].wait()
-            label_img = vigra.taggedView(label_img, self.labels_slot.meta.axistags)
-            label_img = label_img.dropChannelAxis()
-
-            rag = Rag.deserialize_hdf5(rag_group, label_img)
+            labels_slot = self.labels_slot[lane_index]
+            if BlockwiseRag.is_serialized_in(rag_group):
+                # The labels are only read block by block, when needed
+                label_source = SlotBlockSource(
+                    labels_slot, (slice(None),) * (len(labels_slot.meta.shape) - 1) + (0,), dtype=np.uint32
+                )
+                rag = BlockwiseRag.deserialize_hdf5(rag_group, label_source)
+            else:
+                # Projects saved before the RAG was built blockwise
+                label_img = labels_slot[:].wait()
+                label_img = vigra.taggedView(label_img, labels_slot.meta.axistags)
+                label_img = label_img.dropChannelAxis()
+                rag = Rag.deserialize_hdf5(rag_group, label_img)
             self.cache[lane_index].forceValue(rag)
 
 
@@ -187,7 +202,7 @@ class SerialCachedDataFrameSlot(SerialSlot):
 
 
 class EdgeTrainingSerializer(AppletSerializer):
-    version = "0.2"
+    version = "0.3"
 
     def __init__(self, operator, projectFileGroupName):
         slots = [
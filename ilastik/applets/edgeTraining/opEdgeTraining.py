@@ -1,26 +1,33 @@
 from builtins import range
 
+import threading
 from functools import partial
 
 import numpy as np
 import pandas as pd
 import vigra
 
-import ilastikrag
-
 from lazyflow.graph import Operator, InputSlot, OutputSlot
-from lazyflow.roi import roiToSlice
+from lazyflow.request import Request, RequestPool
+from lazyflow.roi import determineBlockShape, roiToSlice
 from lazyflow.operators import OpValueCache, OpBlockedArrayCache
 from lazyflow.classifiers import ParallelVigraRfLazyflowClassifierFactory
 
 from ilastik.applets.base.applet import DatasetConstraintError
 from ilastik.utility.operatorSubView import OperatorSubView
 from ilastik.utility import OpMultiLaneWrapper
+from ilastik.utility.slottools import SlotBlockSource
+
+from .blockwiseRag import BlockwiseRag
+from .util import rag_feature_columns
 
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Number of superpixel voxels per block when building the RAG
+RAG_BLOCK_VOLUME = 128 ** 3
+
 
 class OpEdgeTraining(Operator):
     # Shared across lanes
@@ -236,12 +243,13 @@ class OpCreateRag(Operator):
         self.Rag.meta.dtype = object
 
     def execute(self, slot, subindex, roi, result):
-        superpixels = self.Superpixels[:].wait()
-        superpixels = vigra.taggedView(superpixels, self.Superpixels.meta.axistags)
-        superpixels = superpixels.dropChannelAxis()
+        # The edge table is built from the superpixels block by block, in parallel requests
+        shape = self.Superpixels.meta.shape
+        superpixels = SlotBlockSource(self.Superpixels, (slice(None),) * (len(shape) - 1) + (0,), dtype=np.uint32)
+        block_shape = determineBlockShape(superpixels.shape, RAG_BLOCK_VOLUME)
 
         logger.info("Creating RAG...")
-        result[0] = ilastikrag.Rag(superpixels)
+        result[0] = BlockwiseRag.from_label_source(superpixels, self.Superpixels.meta.getAxisKeys()[:-1], block_shape)
 
     def propagateDirty(self, slot, subindex, roi):
         self.Rag.setDirty()
@@ -255,6 +263,13 @@ def decodeToStringIfBytes(s):
 
 
 class OpComputeEdgeFeatures(Operator):
+    """
+    Computes the edge features of the RAG for the selected feature names of each channel.
+
+    The features of each channel are cached, so that only the features a channel's selection gained
+    (or all of its features, if its data changed) are computed. Channels are computed in parallel.
+    """
+
     WatershedSelectedInput = InputSlot()
     TrainRandomForest = InputSlot(value=False)
     FeatureNames = InputSlot()
@@ -262,18 +277,97 @@ class OpComputeEdgeFeatures(Operator):
     Rag = InputSlot()
     EdgeFeaturesDataFrame = OutputSlot()  # Includes columns 'sp1' and 'sp2'
 
+    def __init__(self, *args, **kwargs):
+        super(OpComputeEdgeFeatures, self).__init__(*args, **kwargs)
+        # channel_name -> (DataFrame with the (channel-prefixed) feature columns, set of the feature names it contains)
+        self._feature_cache = {}
+        self._cached_rag = None
+        self._cached_channels = None
+        # Incremented whenever cached features are discarded, so that features computed from outdated data aren't stored
+        self._cache_generation = 0
+        self._lock = threading.Lock()
+
     def setupOutputs(self):
         assert self.VoxelData.meta.getAxisKeys()[-1] == "c"
         self.EdgeFeaturesDataFrame.meta.shape = (1,)
         self.EdgeFeaturesDataFrame.meta.dtype = object
 
+        # cached features are only valid for the channels they were computed for
+        channels = (self.VoxelData.meta.shape, tuple(self.VoxelData.meta.channel_names or ()))
+        with self._lock:
+            if channels != self._cached_channels:
+                self._feature_cache.clear()
+                self._cache_generation += 1
+                self._cached_channels = channels
+
+    def _channel_data(self, slot, c, rag):
+        """
+        The data of channel c of slot (without channel axis), as needed by rag.compute_features
+        """
+        if isinstance(rag, BlockwiseRag):
+            # blockwise features only request one block at a time
+            key = (slice(None),) * (len(slot.meta.shape) - 1) + (c,)
+            return SlotBlockSource(slot, key, dtype=np.float32)
+        voxel_data = slot[..., c : c + 1].wait()
+        voxel_data = vigra.taggedView(voxel_data, self.VoxelData.meta.axistags)
+        return voxel_data[..., 0]  # drop channel
+
+    def _compute_channel_features(self, rag, c, channel_name, entry, feature_names, generation):
+        """
+        Compute the features of channel c that are missing in the cache entry, and merge them into it.
+        The merged entry is stored in the cache, unless the cache was invalidated since generation.
+        """
+        cached_df, cached_feature_names = entry if entry is not None else (None, frozenset())
+        missing_feature_names = [f for f in feature_names if f not in cached_feature_names]
+
+        edge_features_df = rag.compute_features(self._channel_data(self.VoxelData, c, rag), missing_feature_names)
+
+        # if np.isnan(edge_features_df.values).any():
+        #    raise RuntimeError("Whoa, why are there NaN values in the feature matrix?")
+
+        edge_features_df = edge_features_df.iloc[:, 2:]  # Discard columns [sp1, sp2]
+
+        # Prefix all column names with the channel name, to guarantee uniqueness
+        # (Generally a nice feature, but also required for serialization.)
+        edge_features_df.columns = [channel_name + " " + column for column in edge_features_df.columns.values]
+
+        if cached_df is not None:
+            new_columns = [column for column in edge_features_df.columns.values if column not in cached_df.columns]
+            edge_features_df = pd.concat([cached_df, edge_features_df[new_columns]], axis=1, copy=False)
+
+        entry = (edge_features_df, cached_feature_names | frozenset(missing_feature_names))
+        with self._lock:
+            if generation == self._cache_generation:
+                self._feature_cache[channel_name] = entry
+        return entry
+
+    def _select_features(self, entry, channel_name, feature_names):
+        """
+        Columns of the given features from a cache entry, in the order of ilastikrag.
+        Returns None if the entry doesn't contain all of the features.
+        """
+        if entry is None:
+            return None
+        edge_features_df, cached_feature_names = entry
+        if any(feature_name not in cached_feature_names for feature_name in feature_names):
+            return None
+        # The column order of ilastikrag depends on the whole selection of features
+        columns = rag_feature_columns("".join(self.VoxelData.meta.getAxisKeys()[:-1]), tuple(feature_names))
+        return edge_features_df[[channel_name + " " + column for column in columns]]
+
     def execute(self, slot, subindex, roi, result):
         if self.TrainRandomForest.value:
             rag = self.Rag.value
             channel_feature_names = self.FeatureNames.value
 
-            edge_feature_dfs = []
+            with self._lock:
+                # cached features are only valid for the rag they were computed for
+                if rag is not self._cached_rag:
+                    self._feature_cache.clear()
+                    self._cache_generation += 1
+                    self._cached_rag = rag
 
+            selected = []  # (channel index, channel name, feature names)
             for c in range(self.VoxelData.meta.shape[-1]):
                 channel_name = self.VoxelData.meta.channel_names[c]
                 if channel_name not in channel_feature_names:
@@ -283,23 +377,32 @@ class OpComputeEdgeFeatures(Operator):
                 if not feature_names:
                     # No features selected for this channel
                     continue
-
-                voxel_data = self.VoxelData[..., c : c + 1].wait()
-                voxel_data = vigra.taggedView(voxel_data, self.VoxelData.meta.axistags)
-                voxel_data = voxel_data[..., 0]  # drop channel
-                edge_features_df = rag.compute_features(voxel_data, feature_names)
-
-                # if np.isnan(edge_features_df.values).any():
-                #    raise RuntimeError("Whoa, why are there NaN values in the feature matrix?")
-
-                edge_features_df = edge_features_df.iloc[:, 2:]  # Discard columns [sp1, sp2]
-
-                # Prefix all column names with the channel name, to guarantee uniqueness
-                # (Generally a nice feature, but also required for serialization.)
-                edge_features_df.columns = [
-                    channel_name + " " + feature_name for feature_name in edge_features_df.columns.values
-                ]
-                edge_feature_dfs.append(edge_features_df)
+                selected.append((c, channel_name, feature_names))
+
+            # The results are kept locally, since propagateDirty() may clear the cache meanwhile
+            with self._lock:
+                generation = self._cache_generation
+                entries = {channel_name: self._feature_cache.get(channel_name) for _c, channel_name, _f in selected}
+            channel_dfs = {
+                channel_name: self._select_features(entries[channel_name], channel_name, feature_names)
+                for _c, channel_name, feature_names in selected
+            }
+
+            def compute_channel(c, channel_name, feature_names):
+                entry = self._compute_channel_features(
+                    rag, c, channel_name, entries[channel_name], feature_names, generation
+                )
+                channel_dfs[channel_name] = self._select_features(entry, channel_name, feature_names)
+
+            # Only compute the features that are not cached yet, one request per channel
+            pool = RequestPool()
+            for c, channel_name, feature_names in selected:
+                if channel_dfs[channel_name] is None:
+                    logger.info("Computing edge features for channel {}...".format(channel_name))
+                    pool.add(Request(partial(compute_channel, c, channel_name, feature_names)))
+            pool.wait()
+
+            edge_feature_dfs = [channel_dfs[channel_name] for _c, channel_name, _feature_names in selected]
 
             # Could use join() or merge() here, but we know the rows are already in the right order, and concat() should be faster.
             all_edge_features_df = pd.DataFrame(rag.edge_ids, columns=["sp1", "sp2"])
@@ -320,16 +423,26 @@ class OpComputeEdgeFeatures(Operator):
             # user has selected to run watershed on. The data source
             # cannot be hard coded, because there might be
             # many channels.
-            voxel_data = self.WatershedSelectedInput[..., 0].wait()
-            voxel_data = vigra.taggedView(voxel_data, self.VoxelData.meta.axistags)
-            voxel_data = voxel_data[..., 0]  # drop channel
             rag = self.Rag.value
+            voxel_data = self._channel_data(self.WatershedSelectedInput, 0, rag)
             edge_features_df = rag.compute_features(voxel_data, [BEST_FEATURE])
             edge_features_df[BEST_FEATURE] = normalize1(edge_features_df[BEST_FEATURE])
 
             result[0] = edge_features_df
 
     def propagateDirty(self, slot, subindex, roi):
+        with self._lock:
+            if slot is self.Rag:
+                self._feature_cache.clear()
+                self._cache_generation += 1
+            elif slot is self.VoxelData:
+                # Only the features of the dirty channels need to be recomputed
+                if self.VoxelData.meta.channel_names is not None:
+                    for channel_name in self.VoxelData.meta.channel_names[roi.start[-1] : roi.stop[-1]]:
+                        self._feature_cache.pop(channel_name, None)
+                else:
+                    self._feature_cache.clear()
+                self._cache_generation += 1
         self.EdgeFeaturesDataFrame.setDirty()
 
 
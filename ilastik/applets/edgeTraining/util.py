@@ -1,17 +1,224 @@
 from __future__ import print_function
 from builtins import range
 import logging
+from functools import lru_cache, partial
 
 
 import numpy as np
 import networkx as nx
 import vigra
 
+import ilastikrag
 from ilastikrag.util import edge_mask_for_axis, edge_ids_for_axis, unique_edge_labels, label_vol_mapping
 
+from lazyflow.request import Request, RequestPool
+from lazyflow.roi import getIntersectingRois, roiToSlice
+
+from ilastik.utility.edge_tables import block_boundary_pairs, edge_ids_from_keys, edge_keys, outer_block_stop
+
 logger = logging.getLogger(__name__)
 
 
+def block_edge_table(label_source, block_start, block_stop):
+    """
+    Determine the superpixel adjacencies within a single block.
+
+    Voxel pairs are assigned to the block of their lower voxel, so the tables of
+    all blocks of a volume can be merged without counting any pair twice.
+    Only the block and a one-voxel border in each upper direction are read from
+    label_source, which can be any array-like object supporting shape and slicing.
+
+    Returns a tuple (edge_keys, edge_sizes, sp_ids), where edge_keys encodes each
+    edge (sp1, sp2) with sp1 < sp2 as sp1 << 32 | sp2 (sorted ascending), edge_sizes
+    is the number of adjacent voxel pairs of each edge in the block and sp_ids are
+    the (sorted) superpixel ids within the block.
+    """
+    block_start = tuple(int(b) for b in block_start)
+    block_stop = tuple(int(e) for e in block_stop)
+    outer_stop = outer_block_stop(block_stop, label_source.shape)
+    labels = np.asarray(label_source[roiToSlice(block_start, outer_stop)], dtype=np.uint64)
+
+    keys = [
+        edge_keys(labels[lower][boundary], labels[upper][boundary])
+        for lower, upper, boundary in block_boundary_pairs(labels, block_start, block_stop)
+    ]
+    block_keys, edge_sizes = np.unique(np.concatenate(keys), return_counts=True)
+    sp_ids = np.unique(labels[tuple(slice(0, e - b) for b, e in zip(block_start, block_stop))])
+    return block_keys, edge_sizes, sp_ids
+
+
+def block_edge_statistics(label_source, value_source, block_start, block_stop):
+    """
+    Statistics of the edge values within a single block, for the edges of block_edge_table.
+
+    Like for the standard edge features of ilastikrag, the value of an adjacent voxel pair
+    is the mean of the values of its two voxels.
+
+    Returns a tuple (edge_keys, counts, sums, m2, minima, maxima), where m2 is the sum of the
+    squared deviations from the mean of each edge in the block.
+    """
+    block_start = tuple(int(b) for b in block_start)
+    block_stop = tuple(int(e) for e in block_stop)
+    outer_slicing = roiToSlice(block_start, outer_block_stop(block_stop, label_source.shape))
+    labels = np.asarray(label_source[outer_slicing], dtype=np.uint64)
+    values = np.asarray(value_source[outer_slicing], dtype=np.float32)
+
+    keys = []
+    edge_values = []
+    for lower, upper, boundary in block_boundary_pairs(labels, block_start, block_stop):
+        keys.append(edge_keys(labels[lower][boundary], labels[upper][boundary]))
+        edge_values.append((values[lower][boundary] + values[upper][boundary]) / 2)
+    edge_values = np.concatenate(edge_values).astype(np.float64)
+
+    block_keys, inverse, counts = np.unique(np.concatenate(keys), return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+    sums = np.bincount(inverse, weights=edge_values, minlength=len(block_keys))
+    m2 = np.bincount(inverse, weights=(edge_values - (sums / counts)[inverse]) ** 2, minlength=len(block_keys))
+
+    # The values sorted by edge, to reduce them per edge
+    sorted_values = edge_values[np.argsort(inverse, kind="stable")]
+    starts = np.cumsum(counts) - counts
+    minima = np.minimum.reduceat(sorted_values, starts) if len(starts) else sorted_values
+    maxima = np.maximum.reduceat(sorted_values, starts) if len(starts) else sorted_values
+    return block_keys, counts, sums, m2, minima, maxima
+
+
+def _block_rois(shape, block_shape):
+    block_shape = tuple(min(b, s) for b, s in zip(block_shape, shape))
+    return getIntersectingRois(shape, block_shape, ([0] * len(shape), shape))
+
+
+def _process_blocks(process_block, block_rois):
+    """
+    Call process_block(block_start, block_stop) for all blocks in parallel requests.
+    Returns the results in the order of block_rois.
+    """
+    results = [None] * len(block_rois)
+
+    def process(index, block_roi):
+        results[index] = process_block(*block_roi)
+
+    pool = RequestPool()
+    for index, block_roi in enumerate(block_rois):
+        pool.add(Request(partial(process, index, block_roi)))
+    pool.wait()
+    return results
+
+
+def blockwise_edge_table(label_source, block_shape):
+    """
+    Compute the edges of the region adjacency graph of a label volume block by block.
+
+    The per-block tables are computed in parallel requests and merged afterwards.
+    The resulting edge ids are identical to those of an ilastikrag.Rag built from the whole
+    volume, but at no point is more than one block per request held in memory.
+
+    label_source: array-like (shape and slicing) label volume without channel axis,
+                  labels must fit into 32 bits
+    block_shape: shape of the blocks to process
+
+    Returns a tuple (edge_ids, edge_sizes, sp_ids): a (N, 2) array of superpixel id pairs in
+    ascending order, the number of adjacent voxel pairs for each edge, and the sorted ids of
+    all superpixels in the volume.
+    """
+    block_rois = _block_rois(tuple(label_source.shape), block_shape)
+    block_tables = _process_blocks(partial(block_edge_table, label_source), block_rois)
+
+    all_keys = np.concatenate([keys for keys, _, _ in block_tables])
+    all_sizes = np.concatenate([sizes for _, sizes, _ in block_tables])
+    merged_keys, inverse = np.unique(all_keys, return_inverse=True)
+    edge_sizes = np.bincount(inverse.reshape(-1), weights=all_sizes, minlength=len(merged_keys)).astype(np.uint64)
+
+    sp_ids = np.unique(np.concatenate([ids for _, _, ids in block_tables])).astype(np.uint32)
+    return edge_ids_from_keys(merged_keys), edge_sizes, sp_ids
+
+
+# Statistics of the edge values that can be accumulated blockwise (see blockwise_edge_statistics)
+EDGE_STATISTICS = ("count", "sum", "minimum", "maximum", "mean", "variance")
+
+
+def blockwise_edge_statistics(label_source, value_source, edge_ids, block_shape, statistics=EDGE_STATISTICS):
+    """
+    Accumulate statistics of the values along the edges of a label volume block by block.
+
+    The value of an adjacent voxel pair is the mean of the values of its two voxels, the statistics
+    match the standard edge features of ilastikrag (e.g. "mean" is standard_edge_mean, the variance
+    is the population variance).
+
+    label_source, value_source: array-likes (shape and slicing) of the same shape without channel axis
+    edge_ids: (N, 2) edge ids of the label volume in ascending order, as returned by blockwise_edge_table
+    statistics: names from EDGE_STATISTICS
+
+    Returns a dict of statistic name -> float32 array of shape (N,) in the order of edge_ids.
+    """
+    assert tuple(label_source.shape) == tuple(value_source.shape)
+    assert set(statistics) <= set(EDGE_STATISTICS), f"Unknown edge statistics: {statistics}"
+    block_rois = _block_rois(tuple(label_source.shape), block_shape)
+    block_stats = _process_blocks(partial(block_edge_statistics, label_source, value_source), block_rois)
+
+    keys, counts, sums, m2, minima, maxima = (np.concatenate(column) for column in zip(*block_stats))
+    table_keys = edge_keys(edge_ids[:, 0], edge_ids[:, 1])
+    index = np.searchsorted(table_keys, keys)
+    assert (index < len(table_keys)).all() and (
+        table_keys[np.minimum(index, len(table_keys) - 1)] == keys
+    ).all(), "Edges of the blocks are missing in edge_ids"
+
+    num_edges = len(table_keys)
+    edge_counts = np.bincount(index, weights=counts, minlength=num_edges)
+    edge_sums = np.bincount(index, weights=sums, minlength=num_edges)
+    edge_means = edge_sums / np.maximum(edge_counts, 1)
+    # Combine the squared deviations of the blocks (Chan et al.)
+    edge_m2 = np.bincount(index, weights=m2 + counts * (sums / counts - edge_means[index]) ** 2, minlength=num_edges)
+    edge_minima = np.full(num_edges, np.inf)
+    np.minimum.at(edge_minima, index, minima)
+    edge_maxima = np.full(num_edges, -np.inf)
+    np.maximum.at(edge_maxima, index, maxima)
+
+    results = {
+        "count": edge_counts,
+        "sum": edge_sums,
+        "minimum": edge_minima,
+        "maximum": edge_maxima,
+        "mean": edge_means,
+        "variance": edge_m2 / np.maximum(edge_counts, 1),
+    }
+    return {name: results[name].astype(np.float32) for name in statistics}
+
+
+@lru_cache(maxsize=None)
+def _tiny_rag(axiskeys):
+    """
+    ilastikrag.Rag of a tiny label image (two superpixels) with the given axes, and a value image for it
+    """
+    shape = (6,) * len(axiskeys)
+    labels = np.ones(shape, dtype=np.uint32)
+    labels[3:] = 2
+    values = np.arange(np.prod(shape), dtype=np.float32).reshape(shape)
+    return ilastikrag.Rag(vigra.taggedView(labels, axiskeys)), vigra.taggedView(values, axiskeys)
+
+
+@lru_cache(maxsize=None)
+def rag_feature_columns(axiskeys, feature_names):
+    """
+    Names of the columns of ilastikrag.Rag.compute_features for the given features (without sp1 and sp2),
+    in the order of ilastikrag, which depends on the whole selection of features.
+
+    The columns are determined once for each selection, by computing the features of a tiny label image
+    with the given axes. feature_names must be a tuple.
+    """
+    tiny_rag, values = _tiny_rag(axiskeys)
+    edge_features_df = tiny_rag.compute_features(values, list(feature_names))
+    return tuple(edge_features_df.columns.values[2:])
+
+
+def rag_supported_features(axiskeys):
+    """
+    Features ilastikrag supports for label images with the given axes
+    """
+    tiny_rag, _values = _tiny_rag(axiskeys)
+    return tiny_rag.supported_features()
+
+
 def edge_decisions(overseg_vol, groundtruth_vol, asdict=True):
     """
     Given an oversegmentation and a reference segmentation,
@@ -237,6 +237,7 @@ class OpFeatureSelection(OpFeatureSelectionNoCache):
         # Create the cache
         self.opPixelFeatureCache = OpSlicedBlockedArrayCache(parent=self)
         self.opPixelFeatureCache.name = "opPixelFeatureCache"
+        self.opPixelFeatureCache.setCachePool("features")
         self.opPixelFeatureCache.BypassModeEnabled.connect(self.BypassCache)
 
         # Connect the cache to the feature output
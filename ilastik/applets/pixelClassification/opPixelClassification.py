@@ -581,6 +581,7 @@ class OpPredictionPipeline(OpPredictionPipelineNoCache):
         # Prediction cache for the GUI
         self.prediction_cache_gui = OpSlicedBlockedArrayCache(parent=self)
         self.prediction_cache_gui.name = "prediction_cache_gui"
+        self.prediction_cache_gui.setCachePool("predictions")
         self.prediction_cache_gui.inputs["fixAtCurrent"].connect(self.FreezePredictions)
         self.prediction_cache_gui.inputs["Input"].connect(self.predict.PMaps)
         self.CachedPredictionProbabilities.connect(self.prediction_cache_gui.Output)
@@ -608,6 +609,7 @@ class OpPredictionPipeline(OpPredictionPipelineNoCache):
         # Cache the uncertainty so we get zeros for uncomputed points
         self.opUncertaintyCache = OpSlicedBlockedArrayCache(parent=self)
         self.opUncertaintyCache.name = "opUncertaintyCache"
+        self.opUncertaintyCache.setCachePool("predictions")
         self.opUncertaintyCache.Input.connect(self.opUncertaintyEstimator.Output)
         self.opUncertaintyCache.fixAtCurrent.connect(self.FreezePredictions)
         self.UncertaintyEstimate.connect(self.opUncertaintyCache.Output)
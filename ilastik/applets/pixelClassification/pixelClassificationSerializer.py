@@ -79,13 +79,19 @@ class BackwardsCompatibleLabelSerialBlockSlot(SerialBlockSlot):
             return self.get_input_image_original_axiskeys(slot)
         return self.get_input_image_current_axiskeys(slot)
 
+    def reshape_slicing_for_input(self, slicing: List[slice], slot: OutputSlot, project: Project) -> List[slice]:
+        """Reshapes the slicing of a stored block into the slot's current shape"""
+        current_axiskeys = self.get_input_image_current_axiskeys(slot)
+        saved_data_axiskeys = self.get_saved_data_axiskeys(slot, project)
+        return Slice5D.zero(**dict(zip(saved_data_axiskeys, slicing))).to_slices(current_axiskeys)
+
     def reshape_datablock_and_slicing_for_input(
         self, block: numpy.ndarray, slicing: List[slice], slot: OutputSlot, project: Project
     ) -> Tuple[numpy.ndarray, List[slice]]:
         """Reshapes a block of data and its corresponding slicing into the slot's current shape"""
         current_axiskeys = self.get_input_image_current_axiskeys(slot)
         saved_data_axiskeys = self.get_saved_data_axiskeys(slot, project)
-        fixed_slicing = Slice5D.zero(**dict(zip(saved_data_axiskeys, slicing))).to_slices(current_axiskeys)
+        fixed_slicing = self.reshape_slicing_for_input(slicing, slot, project)
         fixed_block = Array5D(block, saved_data_axiskeys).raw(current_axiskeys)
 
         if current_axiskeys != saved_data_axiskeys:
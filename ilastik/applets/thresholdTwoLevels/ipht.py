@@ -4,7 +4,9 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-from lazyflow.utility import vigra_bincount
+from lazyflow.operators.opFilterLabels import remove_wrongly_sized_connected_components
+from lazyflow.utility import for_each_slab
+from lazyflow.utility.alternative_numpy_functions import slab_slices
 
 
 def identity_preserving_hysteresis_thresholding(img, high_threshold, low_threshold, min_size, max_size=None, out=None):
@@ -17,11 +19,8 @@ def identity_preserving_hysteresis_thresholding(img, high_threshold, low_thresho
 
     Ideas for improvement: Allow separate images for the high and low thresholding steps.
     """
-    logger.debug("Computing high threshold")
-    binary_seeds = (img >= high_threshold).view(numpy.uint8)  # bool is 8-bit in numpy
-
-    logger.debug("Labeling")
-    core_labels = label_with_background(binary_seeds)
+    logger.debug("Computing high threshold and labeling")
+    core_labels = label_blockwise(img.squeeze(), high_threshold)
 
     # Toss out the tiny objects
     logger.debug("Filtering core labels")
@@ -80,11 +79,111 @@ def threshold_from_cores(img, core_labels, final_threshold, out=None):
 
 def label_with_background(img):
     img = img.squeeze()
-    if img.ndim == 2:
-        return vigra.analysis.labelImageWithBackground(img)
-    if img.ndim == 3:
-        return vigra.analysis.labelVolumeWithBackground(img)
-    assert False
+    assert img.ndim in (2, 3)
+    return label_blockwise(img)
+
+
+def label_blockwise(img, threshold=None, out=None):
+    """
+    Label the connected components (direct neighborhood) of the non-zero pixels of a 2d or 3d image,
+    or of the pixels >= threshold, if a threshold is given.  0 is the background label.
+
+    Slabs of the image are thresholded and labeled in parallel, components that touch across the slab
+    borders are merged afterwards.  The labels are consecutive, ordered by the slab a component starts in
+    (and by the vigra label order within that slab).
+
+    out:
+        (Optional.) uint32 array with the shape of img, where to write the labels.
+    """
+    if out is None:
+        out = numpy.zeros(img.shape, dtype=numpy.uint32)
+        if hasattr(img, "axistags"):
+            out = vigra.taggedView(out, img.axistags)
+
+    data = numpy.asarray(img).squeeze()
+    labels = numpy.asarray(out).squeeze()
+    if data.ndim < 2:
+        data = data.reshape((1,) * (2 - data.ndim) + data.shape)
+        labels = labels.reshape(data.shape)
+    assert data.ndim in (2, 3), "Can only label 2d or 3d images, got shape {}".format(img.shape)
+    axistags = "zyx"[-data.ndim :]
+
+    def label_slab(index, data_slab, label_slab):
+        if threshold is None:
+            binary = (data_slab != 0).view(numpy.uint8)
+        else:
+            binary = (data_slab >= threshold).view(numpy.uint8)
+        local_labels = vigra.analysis.labelMultiArrayWithBackground(vigra.taggedView(binary, axistags))
+        label_slab[...] = local_labels
+        return int(local_labels.max())
+
+    logger.debug("Labeling slabs")
+    counts = for_each_slab(label_slab, data, labels)
+    if len(counts) < 2:
+        return out
+
+    # global label of local label l in slab i: offsets[i] + l
+    offsets = numpy.concatenate(([0], numpy.cumsum(counts[:-1], dtype=numpy.int64)))
+    n_labels = int(offsets[-1] + counts[-1])
+
+    logger.debug("Merging labels across {} slab borders".format(len(counts) - 1))
+    slices = slab_slices(data.shape)
+    axis = len(slices[0]) - 1
+    before = []
+    after = []
+    for i in range(1, len(slices)):
+        border = slices[i][axis].start
+        labels_before = labels.take(border - 1, axis=axis)
+        labels_after = labels.take(border, axis=axis)
+        touching = (labels_before != 0) & (labels_after != 0)
+        before.append(labels_before[touching] + offsets[i - 1])
+        after.append(labels_after[touching] + offsets[i])
+
+    pairs = numpy.stack((numpy.concatenate(before), numpy.concatenate(after)), axis=1)
+    if len(pairs) > 0:
+        pairs = numpy.unique(pairs, axis=0)
+        representatives = merge_equivalences(n_labels, pairs[:, 0], pairs[:, 1])
+        # number the merged components consecutively
+        is_representative = representatives == numpy.arange(n_labels + 1)
+        mapping = (numpy.cumsum(is_representative) - 1)[representatives].astype(numpy.uint32)
+    else:
+        mapping = numpy.arange(n_labels + 1, dtype=numpy.uint32)
+
+    def relabel(index, label_slab):
+        lut = mapping[offsets[index] : offsets[index] + counts[index] + 1].copy()
+        lut[0] = 0
+        if (lut != numpy.arange(len(lut))).any():
+            label_slab[...] = lut[label_slab]
+
+    logger.debug("Relabeling slabs")
+    for_each_slab(relabel, labels)
+    return out
+
+
+def merge_equivalences(n_labels, a, b):
+    """
+    Given that the labels a[i] and b[i] belong to the same component, for all i,
+    return the representative (the smallest label) of the component of every label 0..n_labels.
+    """
+    representatives = numpy.arange(n_labels + 1, dtype=numpy.int64)
+    while True:
+        representatives_a = representatives[a]
+        representatives_b = representatives[b]
+        unmerged = representatives_a != representatives_b
+        if not unmerged.any():
+            return representatives
+        # attach the larger representative to the smaller one
+        numpy.minimum.at(
+            representatives,
+            numpy.maximum(representatives_a[unmerged], representatives_b[unmerged]),
+            numpy.minimum(representatives_a[unmerged], representatives_b[unmerged]),
+        )
+        # path compression
+        while True:
+            compressed = representatives[representatives]
+            if (compressed == representatives).all():
+                break
+            representatives = compressed
 
 
 def filter_labels(a, min_size, max_size=None):
@@ -92,14 +191,5 @@ def filter_labels(a, min_size, max_size=None):
     Remove (set to 0) labeled connected components that are too small or too large.
     Note: Operates in-place.
     """
-    if min_size == 0 and (max_size is None or max_size > numpy.prod(a.shape)):  # shortcut for efficiency
-        return a
-
-    component_sizes = vigra_bincount(a)
-    bad_sizes = component_sizes < min_size
-    if max_size is not None:
-        numpy.logical_or(bad_sizes, component_sizes > max_size, out=bad_sizes)
-
-    bad_locations = bad_sizes[a]
-    a[bad_locations] = 0
+    remove_wrongly_sized_connected_components(a, min_size, max_size, in_place=True)
     return a
@@ -42,7 +42,7 @@ from lazyflow.operators.generic import OpConvertDtype, OpPixelOperator
 
 # local
 from .thresholdingTools import OpAnisotropicGaussianSmoothing5d, select_labels
-from .ipht import threshold_from_cores
+from .ipht import threshold_from_cores, label_blockwise
 
 try:
     from ._OpGraphCut import segmentGC
@@ -287,8 +287,8 @@ class OpLabeledThreshold(Operator):
 
         result = vigra.taggedView(result, self.Output.meta.axistags)
 
-        binary = (data >= final_threshold).view(np.uint8)
-        vigra.analysis.labelMultiArrayWithBackground(binary[0, ..., 0], out=result[0, ..., 0])
+        # Thresholded and labeled in parallel slabs
+        label_blockwise(data[0, ..., 0], final_threshold, out=result[0, ..., 0])
 
     def _execute_HYSTERESIS(self, roi, result):
         self._execute_SIMPLE(roi, result)
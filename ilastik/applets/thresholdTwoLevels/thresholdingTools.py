@@ -40,7 +40,7 @@ from lazyflow.graph import Operator, InputSlot, OutputSlot
 from lazyflow.roi import enlargeRoiForHalo, TinyVector
 
 # ilastik
-from lazyflow.utility import Timer, vigra_bincount
+from lazyflow.utility import Timer, vigra_bincount, for_each_slab
 
 logger = logging.getLogger(__name__)
 
@@ -367,7 +367,8 @@ def select_labels(small_labels, big_labels):
 
     ** Works IN-PLACE (to save RAM) **
 
-    Both inputs are modified: small_labels for temporary storage, big_labels for the result
+    big_labels is modified for the result, small_labels is left unchanged.
+    The overlaps are collected for slabs of the volume in parallel.
     """
     assert hasattr(small_labels, "axistags")
     assert hasattr(big_labels, "axistags")
@@ -376,20 +377,25 @@ def select_labels(small_labels, big_labels):
     small_labels = small_labels.withAxes("tzyx")
     big_labels = big_labels.withAxes("tzyx")
 
+    def overlapping_labels(index, small_slab, big_slab):
+        values = big_slab[small_slab != 0]
+        return vigra.analysis.unique(values) if len(values) > 0 else values
+
     for small_labels_3d, big_labels_3d in zip(small_labels, big_labels):
-        # For each non-zero small label pixel, replace it with the corresponding big label pixel
-        np.copyto(small_labels_3d, big_labels_3d, where=(small_labels_3d != 0))
+        small_labels_3d = small_labels_3d.view(np.ndarray)
+        big_labels_3d = big_labels_3d.view(np.ndarray)
 
-        # Construct mapping to relabel big_labels
-        # By default, big labels map to 0
-        orig_big_values = vigra.analysis.unique(big_labels_3d)
-        mapping = {v: 0 for v in orig_big_values}
+        # By default, big labels map to 0,
+        # but big labels that overlap with small labels map to themselves.
+        keep = np.zeros(int(big_labels_3d.max()) + 1, dtype=bool)
+        for values in for_each_slab(overlapping_labels, small_labels_3d, big_labels_3d):
+            keep[values] = True
+        keep[0] = False
 
-        # But big labels that pass the filter map to themselves.
-        filtered_big_values = vigra.analysis.unique(small_labels_3d)
-        mapping.update({v: v for v in filtered_big_values})
+        def drop_labels(index, big_slab):
+            big_slab[~keep[big_slab]] = 0
 
-        vigra.analysis.applyMapping(big_labels_3d, mapping, out=big_labels_3d)
+        for_each_slab(drop_labels, big_labels_3d)
 
 
 if __name__ == "__main__":
@@ -5,6 +5,7 @@ from builtins import range
 from past.utils import old_div
 import numpy as np
 import os
+import threading
 from lazyflow.graph import Operator, InputSlot, OutputSlot
 
 from ilastik.plugins import PluginExportContext, TrackingExportFormatPlugin
@@ -59,6 +60,136 @@ except ImportError:
         logger.warning("Could not find any ILP solver")
 
 
+# Probabilities handed to the solver are kept away from 0 and 1
+_MIN_PROBABILITY = 0.0000001
+_MAX_PROBABILITY = 0.99999999
+
+
+def _filter_objects_by_range(lower, upper, sizes, x_range, y_range, z_range, size_range):
+    """
+    Vectorized object filter used when constructing the traxel store.
+
+    :param lower: (N, 3) array of bounding box minima (x, y, z)
+    :param upper: (N, 3) array of bounding box maxima (x, y, z)
+    :param sizes: (N,) array of object sizes
+    :returns: boolean mask of length N, True for objects that intersect the given
+      coordinate ranges and whose size lies within ``size_range``
+    """
+    range_starts = np.array([x_range[0], y_range[0], z_range[0]])
+    range_stops = np.array([x_range[1], y_range[1], z_range[1]])
+    inside = np.all((upper >= range_starts) & (lower < range_stops), axis=1)
+    return inside & (sizes >= size_range[0]) & (sizes < size_range[1])
+
+
+def _pad_to_3d(coordinates):
+    """
+    Append a zero z-coordinate to (N, 2) coordinate arrays, leave (N, 3) arrays as they are.
+    """
+    if coordinates.shape[1] == 2:
+        return np.concatenate([coordinates, np.zeros((coordinates.shape[0], 1), dtype=coordinates.dtype)], axis=1)
+    elif coordinates.shape[1] == 3:
+        return coordinates
+    raise DatasetConstraintError("Tracking", "The RegionCenter feature must have dimensionality 2 or 3.")
+
+
+def _set_traxel_feature(traxel, name, values):
+    traxel.add_feature_array(name, len(values))
+    for i, v in enumerate(values):
+        traxel.set_feature_value(name, i, v)
+
+
+def _build_traxels_for_frame(
+    t,
+    frame_features,
+    x_range,
+    y_range,
+    z_range,
+    size_range,
+    scales,
+    div_probs=None,
+    det_probs=None,
+    local_centers=None,
+):
+    """
+    Create the traxels of a single time step.
+
+    Filtering and feature vector assembly operate on the whole feature arrays of the frame,
+    only the construction of the Traxel objects themselves is done per object.
+
+    :param frame_features: default region features of time step t (including the background object 0)
+    :param scales: (x_scale, y_scale, z_scale)
+    :param div_probs: division probabilities of this time step, indexed by label id
+    :param det_probs: detection probabilities of this time step, indexed by label id
+    :param local_centers: local centers of this time step, indexed by label id
+    :returns: tuple (traxels, filtered_labels) of a dict label id -> Traxel of all objects that passed
+      the filter and a list of label ids that were filtered out
+    """
+    rc = np.asarray(frame_features["RegionCenter"])
+    if rc.size == 0:
+        return {}, []
+
+    # drop the background object
+    rc = _pad_to_3d(rc[1:, ...])
+    lower = _pad_to_3d(np.asarray(frame_features["Coord<Minimum>"])[1:, ...])
+    upper = _pad_to_3d(np.asarray(frame_features["Coord<Maximum>"])[1:, ...])
+    sizes = np.asarray(frame_features["Count"])[1:, ...].reshape(-1)
+
+    logger.debug("at timestep {}, {} traxels found".format(t, rc.shape[0]))
+
+    keep = _filter_objects_by_range(lower, upper, sizes, x_range, y_range, z_range, size_range)
+    # label ids start at 1, feature rows start at the background object
+    label_ids = np.arange(1, rc.shape[0] + 1)
+    filtered_labels = label_ids[~keep].tolist()
+    kept_ids = label_ids[keep]
+
+    # Assemble all per-object feature vectors for the frame at once
+    com = rc[keep].astype(float).tolist()
+    coord_min = lower[keep].astype(float).tolist()
+    coord_max = upper[keep].astype(float).tolist()
+    counts = sizes[keep].astype(float).tolist()
+
+    if div_probs is not None:
+        prob = np.clip(np.asarray(div_probs, dtype=float)[kept_ids, 1], _MIN_PROBABILITY, _MAX_PROBABILITY)
+        div_features = np.stack([1.0 - prob, prob], axis=1).tolist()
+
+    if det_probs is not None:
+        det_features = np.clip(np.asarray(det_probs, dtype=float)[kept_ids], _MIN_PROBABILITY, _MAX_PROBABILITY)
+        det_features = det_features.tolist()
+
+    x_scale, y_scale, z_scale = scales
+    traxels = {}
+    for i, label in enumerate(kept_ids.tolist()):
+        traxel = Traxel()
+        traxel.Id = label
+        traxel.Timestep = int(t)
+        traxel.set_x_scale(x_scale)
+        traxel.set_y_scale(y_scale)
+        traxel.set_z_scale(z_scale)
+
+        # Expects always 3 coordinates, z=0 for 2d data
+        _set_traxel_feature(traxel, "com", com[i])
+        _set_traxel_feature(traxel, "CoordMinimum", coord_min[i])
+        _set_traxel_feature(traxel, "CoordMaximum", coord_max[i])
+
+        if div_probs is not None:
+            _set_traxel_feature(traxel, "divProb", div_features[i])
+
+        if det_probs is not None:
+            _set_traxel_feature(traxel, "detProb", det_features[i])
+
+        # FIXME: check whether it is 2d or 3d data!
+        if local_centers is not None:
+            centers = [[float(c) for c in v] for v in local_centers[label]]
+            _set_traxel_feature(traxel, "localCentersX", [v[0] for v in centers])
+            _set_traxel_feature(traxel, "localCentersY", [v[1] for v in centers])
+            _set_traxel_feature(traxel, "localCentersZ", [v[2] for v in centers])
+
+        _set_traxel_feature(traxel, "count", [counts[i]])
+        traxels[label] = traxel
+
+    return traxels, filtered_labels
+
+
 class OpConservationTracking(Operator):
     LabelImage = InputSlot()
     ObjectFeatures = InputSlot(stype=Opaque, rtype=List)
@@ -813,140 +944,49 @@ class OpConservationTracking(Operator):
 
         logger.info("filling traxelstore")
 
-        filtered_labels = {}
-        total_count = 0
-        empty_frame = False
-        numTimeStep = len(list(feats.keys()))
-        countT = 0
-
         stepStr = "Creating traxel store"
         self.progressVisitor.showState(stepStr + "                              ")
 
-        for t in list(feats.keys()):
-            countT += 1
-            self.progressVisitor.showProgress(old_div(countT, float(numTimeStep)))
-
-            rc = feats[t][default_features_key]["RegionCenter"]
-            lower = feats[t][default_features_key]["Coord<Minimum>"]
-            upper = feats[t][default_features_key]["Coord<Maximum>"]
-            if rc.size:
-                rc = rc[1:, ...]
-                lower = lower[1:, ...]
-                upper = upper[1:, ...]
-
-            ct = feats[t][default_features_key]["Count"]
-            if ct.size:
-                ct = ct[1:, ...]
-
-            logger.debug("at timestep {}, {} traxels found".format(t, rc.shape[0]))
-            count = 0
-            filtered_labels_at = []
-            for idx in range(rc.shape[0]):
-                traxel = Traxel()
-
-                # for 2d data, set z-coordinate to 0:
-                if len(rc[idx]) == 2:
-                    x, y = rc[idx]
-                    z = 0
-                    x_lower, y_lower = lower[idx]
-                    x_upper, y_upper = upper[idx]
-                    z_lower = 0
-                    z_upper = 0
-                elif len(rc[idx]) == 3:
-                    x, y, z = rc[idx]
-                    x_lower, y_lower, z_lower = lower[idx]
-                    x_upper, y_upper, z_upper = upper[idx]
-                else:
-                    raise DatasetConstraintError(
-                        "Tracking", "The RegionCenter feature must have dimensionality 2 or 3."
-                    )
+        timesteps = list(feats.keys())
+        numTimeStep = len(timesteps)
+        progress_lock = threading.Lock()
+        frames_done = [0]
+
+        def build_frame(t):
+            frame = _build_traxels_for_frame(
+                t,
+                feats[t][default_features_key],
+                x_range,
+                y_range,
+                z_range,
+                size_range,
+                (x_scale, y_scale, z_scale),
+                div_probs=divProbs[t] if with_div else None,
+                det_probs=detProbs[t] if with_classifier_prior else None,
+                local_centers=localCenters[t] if with_local_centers else None,
+            )
+            with progress_lock:
+                frames_done[0] += 1
+                self.progressVisitor.showProgress(old_div(frames_done[0], float(numTimeStep)))
+            return frame
+
+        # Frames are independent of each other, build them concurrently and merge afterwards
+        frames = {}
+        pool = RequestPool()
+        for t in timesteps:
+            req = Request(partial(build_frame, t))
+            req.notify_finished(partial(frames.__setitem__, t))
+            pool.add(req)
+        pool.wait()
 
-                size = ct[idx]
-
-                if (
-                    x_upper < x_range[0]
-                    or x_lower >= x_range[1]
-                    or y_upper < y_range[0]
-                    or y_lower >= y_range[1]
-                    or z_upper < z_range[0]
-                    or z_lower >= z_range[1]
-                    or size < size_range[0]
-                    or size >= size_range[1]
-                ):
-                    filtered_labels_at.append(int(idx + 1))
-                    continue
-                else:
-                    count += 1
-
-                traxel.Id = int(idx + 1)
-                traxel.Timestep = int(t)
-                traxel.set_x_scale(x_scale)
-                traxel.set_y_scale(y_scale)
-                traxel.set_z_scale(z_scale)
-
-                # Expects always 3 coordinates, z=0 for 2d data
-                traxel.add_feature_array("com", 3)
-                for i, v in enumerate([x, y, z]):
-                    traxel.set_feature_value("com", i, float(v))
-
-                traxel.add_feature_array("CoordMinimum", 3)
-                for i, v in enumerate(lower[idx]):
-                    traxel.set_feature_value("CoordMinimum", i, float(v))
-                traxel.add_feature_array("CoordMaximum", 3)
-                for i, v in enumerate(upper[idx]):
-                    traxel.set_feature_value("CoordMaximum", i, float(v))
-
-                if with_div:
-                    traxel.add_feature_array("divProb", 2)
-                    # idx+1 because rc and ct start from 1, divProbs starts from 0
-                    prob = float(divProbs[t][idx + 1][1])
-                    prob = float(prob)
-                    if prob < 0.0000001:
-                        prob = 0.0000001
-                    if prob > 0.99999999:
-                        prob = 0.99999999
-                    traxel.set_feature_value("divProb", 0, 1.0 - prob)
-                    traxel.set_feature_value("divProb", 1, prob)
-
-                if with_classifier_prior:
-                    traxel.add_feature_array("detProb", len(detProbs[t][idx + 1]))
-                    for i, v in enumerate(detProbs[t][idx + 1]):
-                        val = float(v)
-                        if val < 0.0000001:
-                            val = 0.0000001
-                        if val > 0.99999999:
-                            val = 0.99999999
-                        traxel.set_feature_value("detProb", i, float(val))
-
-                # FIXME: check whether it is 2d or 3d data!
-                if with_local_centers:
-                    traxel.add_feature_array("localCentersX", len(localCenters[t][idx + 1]))
-                    traxel.add_feature_array("localCentersY", len(localCenters[t][idx + 1]))
-                    traxel.add_feature_array("localCentersZ", len(localCenters[t][idx + 1]))
-
-                    for i, v in enumerate(localCenters[t][idx + 1]):
-                        traxel.set_feature_value("localCentersX", i, float(v[0]))
-                        traxel.set_feature_value("localCentersY", i, float(v[1]))
-                        traxel.set_feature_value("localCentersZ", i, float(v[2]))
-
-                traxel.add_feature_array("count", 1)
-                traxel.set_feature_value("count", 0, float(size))
-
-                if (
-                    x_upper < x_range[0]
-                    or x_lower >= x_range[1]
-                    or y_upper < y_range[0]
-                    or y_lower >= y_range[1]
-                    or z_upper < z_range[0]
-                    or z_lower >= z_range[1]
-                    or size < size_range[0]
-                    or size >= size_range[1]
-                ):
-                    logger.info("Omitting traxel with ID: {} {}".format(traxel.Id, t))
-                    print("Omitting traxel with ID: {} {}".format(traxel.Id, t))
-                else:
-                    logger.debug("Adding traxel with ID: {}  {}".format(traxel.Id, t))
-                    traxelstore.TraxelsPerFrame.setdefault(int(t), {})[int(idx + 1)] = traxel
+        filtered_labels = {}
+        total_count = 0
+        empty_frame = False
+        for t in timesteps:
+            traxels, filtered_labels_at = frames[t]
+            count = len(traxels)
+            if traxels:
+                traxelstore.TraxelsPerFrame.setdefault(int(t), {}).update(traxels)
 
             if len(filtered_labels_at) > 0:
                 filtered_labels[str(int(t) - time_range[0])] = filtered_labels_at
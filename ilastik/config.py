@@ -43,10 +43,14 @@ default_config = """
 [ilastik]
 debug: false
 plugin_directories: ~/.ilastik/plugins,
+# only read stored labels from the project file when they are needed
+lazy_project_loading: false
 
 [lazyflow]
 threads: -1
 total_ram_mb: 0
+# memory pools for caches, e.g. "features=50%, predictions=30%, labels=pinned"
+cache_pools:
 
 [hbp]
 token_url: https://web.ilastik.org/token/
@@ -1,9 +1,12 @@
+import collections
+
 import vigra
 import numpy
 import xarray
 
 from functools import singledispatch
-from lazyflow.graph import Graph
+from lazyflow.graph import Graph, Operator, InputSlot, OutputSlot
+from lazyflow.roi import getIntersectingBlocks, getBlockBounds, roiFromShape, roiToSlice
 from lazyflow.utility.helpers import get_default_axisordering
 from lazyflow.operators.classifierOperators import OpClassifierPredict
 from lazyflow.operators import OpReorderAxes
@@ -12,12 +15,40 @@ from ilastik.experimental import parser
 from .types import Pipeline
 
 
+# Default edge length of prediction blocks for each axis (blocks always contain all channels)
+DEFAULT_BLOCK_SIZE = {"t": 1, "z": 64, "y": 256, "x": 256}
+
+
 def _ensure_channel_axis(axis_order):
     if "c" not in axis_order:
         return axis_order + "c"
     return axis_order
 
 
+class OpArrayLikeSource(Operator):
+    """
+    Provides the data of an array-like object (a numpy/vigra array, xarray.DataArray, h5py or zarr dataset, ...),
+    only reading the parts that are requested.
+    """
+
+    Source = InputSlot(stype="object")
+    AxisOrder = InputSlot()
+    Output = OutputSlot()
+
+    def setupOutputs(self):
+        source = self.Source.value
+        self.Output.meta.shape = tuple(source.shape)
+        self.Output.meta.dtype = numpy.dtype(source.dtype).type
+        self.Output.meta.axistags = vigra.defaultAxistags(self.AxisOrder.value)
+
+    def execute(self, slot, subindex, roi, result):
+        result[...] = numpy.asarray(self.Source.value[roiToSlice(roi.start, roi.stop)])
+        return result
+
+    def propagateDirty(self, slot, subindex, roi):
+        self.Output.setDirty()
+
+
 def from_project_file(path) -> Pipeline:
     project: parser.PixelClassificationProject
 
@@ -34,7 +65,9 @@ def from_project_file(path) -> Pipeline:
     class _PipelineImpl(Pipeline):
         def __init__(self):
             graph = Graph()
+            self._source_op = OpArrayLikeSource(graph=graph)
             self._reorder_op = OpReorderAxes(graph=graph, AxisOrder=_ensure_channel_axis(axis_order))
+            self._reorder_op.Input.connect(self._source_op.Output)
 
             self._feature_sel_op = OpFeatureSelection(graph=graph)
             self._feature_sel_op.InputImage.connect(self._reorder_op.Output)
@@ -49,26 +82,83 @@ def from_project_file(path) -> Pipeline:
             self._predict_op.Image.connect(self._feature_sel_op.OutputImage)
             self._predict_op.LabelsCount.setValue(classifer.label_count)
 
-        def predict(self, data):
-            data = convert_to_vigra(data)
-            num_channels_in_data = data.channels
+        def _set_input(self, source, axes):
+            num_channels_in_data = source.shape[axes.index("c")] if "c" in axes else 1
             if num_channels_in_data != num_channels:
                 raise ValueError(
                     f"Number of channels mismatch. Classifier trained for {num_channels} but input has {num_channels_in_data}"
                 )
 
-            num_spatial_in_data = sum(a.isSpatial() for a in data.axistags)
+            num_spatial_in_data = sum(a in "xyz" for a in axes)
             if num_spatial_in_data != num_spatial_dims:
                 raise ValueError(
                     "Number of spatial dims doesn't match. "
                     f"Classifier trained for {num_spatial_dims} but input has {num_spatial_in_data}"
                 )
 
-            self._reorder_op.Input.setValue(data)
+            # Don't compare the new source with the old one: that would read both completely.
+            self._source_op.Source.setValue(source, check_changed=False)
+            self._source_op.AxisOrder.setValue(axes)
+
+        def predict(self, data):
+            data = convert_to_vigra(data)
+            self._set_input(data, "".join(data.axistags.keys()))
 
             data = self._predict_op.PMaps.value[...]
             return xarray.DataArray(data, dims=tuple(self._predict_op.PMaps.meta.axistags.keys()))
 
+        def predict_blocks(self, data, axes=None, block_shape=None, prefetch=2):
+            # Set up the graph right away, so that invalid input is reported before iterating
+            self._set_input(*as_array_source(data, axes))
+
+            pmaps = self._predict_op.PMaps
+            block_shape = dict(DEFAULT_BLOCK_SIZE, **(block_shape or {}))
+            blockshape = tuple(
+                size if key == "c" else min(size, block_shape.get(key, size))
+                for key, size in zip(pmaps.meta.getAxisKeys(), pmaps.meta.shape)
+            )
+            return self._iter_blocks(blockshape, prefetch)
+
+        def _iter_blocks(self, blockshape, prefetch):
+            pmaps = self._predict_op.PMaps
+            dims = tuple(pmaps.meta.getAxisKeys())
+            block_starts = getIntersectingBlocks(blockshape, roiFromShape(pmaps.meta.shape))
+
+            def finish(block_roi, req):
+                data = req.wait()
+                req.clean()
+                return roiToSlice(*block_roi), xarray.DataArray(data, dims=dims)
+
+            pending = collections.deque()
+            try:
+                for block_start in block_starts:
+                    block_roi = getBlockBounds(pmaps.meta.shape, blockshape, block_start)
+                    req = pmaps(*block_roi)
+                    req.submit()
+                    pending.append((block_roi, req))
+                    # Keep at most `prefetch` blocks computing ahead of the one that is consumed
+                    if len(pending) > prefetch:
+                        yield finish(*pending.popleft())
+                while pending:
+                    yield finish(*pending.popleft())
+            finally:
+                # The consumer stopped early
+                for _, req in pending:
+                    req.cancel()
+
+        def predict_into(self, data, out, axes=None, block_shape=None, prefetch=2):
+            blocks = self.predict_blocks(data, axes, block_shape, prefetch)
+            expected_shape = tuple(self._predict_op.PMaps.meta.shape)
+            if tuple(out.shape) != expected_shape:
+                raise ValueError(
+                    f"Output has shape {tuple(out.shape)}, expected {expected_shape} "
+                    f"(axes {''.join(self._predict_op.PMaps.meta.getAxisKeys())})"
+                )
+
+            for slicing, block in blocks:
+                out[slicing] = block.values
+            return out
+
     return _PipelineImpl()
 
 
@@ -91,3 +181,21 @@ def _(data: numpy.ndarray):
 def _(data: xarray.DataArray):
     axistags = "".join(data.dims)
     return vigra.taggedView(data.values, axistags)
+
+
+def as_array_source(data, axes=None):
+    """
+    Returns ``(source, axes)`` for an array-like input without reading its data.
+
+    Arrays without axis information (numpy arrays, h5py/zarr datasets, ...) need the axes to be given,
+    e.g. ``axes="zyx"``.
+    """
+    if isinstance(data, vigra.VigraArray):
+        return data, "".join(data.axistags.keys())
+    if isinstance(data, xarray.DataArray):
+        return data, "".join(data.dims)
+    if axes is None:
+        raise ValueError(f"{type(data)} doesn't provide information about axistags, please specify the axes")
+    if len(axes) != len(data.shape):
+        raise ValueError(f"axes {axes!r} don't match the dimensions of the data with shape {data.shape}")
+    return data, axes
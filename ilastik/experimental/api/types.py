@@ -1,8 +1,35 @@
 import numpy
 import abc
+from typing import Dict, Iterator, Optional, Tuple
+
+import xarray
 
 
 class Pipeline(abc.ABC):
     @abc.abstractmethod
     def predict(self, data: numpy.ndarray) -> numpy.ndarray:
         ...
+
+    @abc.abstractmethod
+    def predict_blocks(
+        self, data, axes: Optional[str] = None, block_shape: Optional[Dict[str, int]] = None, prefetch: int = 2
+    ) -> Iterator[Tuple[Tuple[slice, ...], xarray.DataArray]]:
+        """
+        Predict blockwise, without loading the whole input or holding the whole output in memory.
+
+        data can be an xarray.DataArray or any array-like (e.g. a h5py or zarr dataset), in which case
+        axes (e.g. "zyx") must be given.  Only the parts of the input needed for the requested blocks are read.
+        Yields ``(slicing, block)`` pairs, where slicing locates the block in the full prediction.
+        Blocks span all channels, block_shape can override the default size per axis (e.g. ``{"z": 32}``).
+        At most prefetch blocks are computed ahead of the one that is being consumed.
+        """
+        ...
+
+    @abc.abstractmethod
+    def predict_into(
+        self, data, out, axes: Optional[str] = None, block_shape: Optional[Dict[str, int]] = None, prefetch: int = 2
+    ):
+        """
+        Like predict_blocks, but writes the blocks into out (e.g. a h5py or zarr dataset) and returns it.
+        """
+        ...
@@ -0,0 +1,333 @@
+###############################################################################
+#   ilastik: interactive learning and segmentation toolkit
+#
+#       Copyright (C) 2011-2022, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# In addition, as a special exception, the copyright holders of
+# ilastik give you permission to combine ilastik with applets,
+# workflows and plugins which are not covered under the GNU
+# General Public License.
+#
+# See the LICENSE file for details. License information is also available
+# on the ilastik web site at:
+# 		   http://ilastik.org/license.html
+###############################################################################
+"""
+Long-lived local server for headless batch processing.
+
+The projects are opened once, so the workflows (including their trained classifiers) stay loaded
+between jobs, which saves the interpreter startup and project loading of a headless run per job::
+
+    python -m ilastik.shell.headless.predictionServer MyProject.ilp Other.ilp --port 8765
+
+Jobs take the same batch processing arguments as a headless run and are submitted as JSON::
+
+    POST /jobs  {"project": "MyProject", "args": ["--export_source=Probabilities", "input.h5"], "priority": 1}
+    -> {"id": 1}
+
+Jobs with a higher priority run first.  Export settings given by a job stay in effect for later jobs
+of the same project, just as if they had been set in the project.
+
+    GET /projects                   names of the loaded projects
+    GET /jobs/<id>?wait=<seconds>   job status, results (exported paths) and timings
+    GET /jobs/<id>/result?index=i   result i of a job with "to_array": true, as a .npy file
+    DELETE /jobs/<id>               forget a finished job (and its results)
+
+The server only listens on localhost by default, there is no authentication.
+"""
+import argparse
+import http.server
+import io
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import urllib.parse
+
+import numpy
+
+logger = logging.getLogger(__name__)
+
+
+class Job(object):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, job_id, project, args, priority=0, to_array=False):
+        self.id = job_id
+        self.project = project
+        self.args = list(args)
+        self.priority = priority
+        self.to_array = to_array
+        self.status = Job.QUEUED
+        self.results = None
+        self.error = None
+        self.submit_time = time.time()
+        self.start_time = None
+        self.stop_time = None
+        self.finished = threading.Event()
+
+    def timings(self):
+        """seconds spent in the queue and running (so far)"""
+        now = time.time()
+        timings = {"queued": (self.start_time or now) - self.submit_time}
+        if self.start_time is not None:
+            timings["running"] = (self.stop_time or now) - self.start_time
+        return timings
+
+    def to_json(self):
+        results = self.results
+        if self.to_array and results is not None:
+            results = [{"shape": result.shape, "dtype": str(result.dtype)} for result in results]
+        return {
+            "id": self.id,
+            "project": self.project,
+            "status": self.status,
+            "priority": self.priority,
+            "results": results,
+            "error": self.error,
+            "timings": self.timings(),
+        }
+
+
+def run_export_job(shell, job):
+    """
+    Run the batch processing for the given job in the workflow of the shell,
+    returns the list of exported paths (or arrays, for jobs with to_array).
+    """
+    workflow = shell.workflow
+    export_args, unused_args = workflow.dataExportApplet.parse_known_cmdline_args(job.args)
+    input_args, unused_args = workflow.batchProcessingApplet.parse_known_cmdline_args(unused_args)
+    if unused_args:
+        raise ValueError(f"Unknown arguments: {unused_args}")
+
+    workflow.dataExportApplet.configure_operator_with_parsed_args(export_args)
+    if job.to_array:
+        lane_configs = workflow.dataSelectionApplet.lane_configs_from_parsed_args(input_args)
+        return workflow.batchProcessingApplet.run_export(lane_configs, export_to_array=True)
+    return workflow.batchProcessingApplet.run_export_from_parsed_args(input_args)
+
+
+class PredictionServer(object):
+    """
+    Runs jobs for already opened projects in priority order.
+
+    Workflows are not thread-safe, so jobs are run one at a time
+    (each job is still computed in parallel by lazyflow).
+
+    :param shells: project name -> HeadlessShell with the opened project
+    :param address: (host, port) to listen on
+    :param run_job: function(shell, job) that runs a job and returns its results
+    """
+
+    def __init__(self, shells, address=("127.0.0.1", 8765), run_job=run_export_job):
+        self.shells = dict(shells)
+        self._run_job = run_job
+        self._jobs = {}
+        self._jobs_lock = threading.Lock()
+        self._job_ids = itertools.count(1)
+        self._queue = queue.PriorityQueue()
+        self._httpd = http.server.ThreadingHTTPServer(address, _make_handler(self))
+        self._worker = threading.Thread(target=self._work, name="PredictionServerWorker", daemon=True)
+
+    @property
+    def address(self):
+        return self._httpd.server_address
+
+    def submit(self, project, args, priority=0, to_array=False):
+        if project not in self.shells:
+            raise KeyError(f"Unknown project {project!r}, available: {sorted(self.shells)}")
+        # Checked before the job is registered, the queue can only order jobs by integer priorities
+        try:
+            is_integer = int(priority) == priority
+        except (TypeError, ValueError, OverflowError):
+            is_integer = False
+        if not is_integer:
+            raise ValueError(f"Priority must be an integer, got {priority!r}")
+        priority = int(priority)
+        with self._jobs_lock:
+            job = Job(next(self._job_ids), project, args, priority, to_array)
+            self._jobs[job.id] = job
+        # Higher priority first, then first come first served
+        self._queue.put((-priority, job.id, job))
+        logger.info(f"Queued job {job.id} for {project}: {job.args}")
+        return job
+
+    def job(self, job_id):
+        with self._jobs_lock:
+            return self._jobs[job_id]
+
+    def forget(self, job_id):
+        with self._jobs_lock:
+            job = self._jobs[job_id]
+            if not job.finished.is_set():
+                raise ValueError(f"Job {job_id} is not finished")
+            del self._jobs[job_id]
+
+    def _work(self):
+        while True:
+            _, _, job = self._queue.get()
+            if job is None:
+                break
+            job.status = Job.RUNNING
+            job.start_time = time.time()
+            try:
+                job.results = self._run_job(self.shells[job.project], job)
+                job.status = Job.DONE
+            except Exception as e:
+                logger.exception(f"Job {job.id} failed")
+                job.error = f"{type(e).__name__}: {e}"
+                job.status = Job.FAILED
+            finally:
+                job.stop_time = time.time()
+                job.finished.set()
+            timings = job.timings()
+            logger.info(
+                f"Job {job.id} ({job.project}) {job.status} after {timings['queued']:.2f}s in the queue "
+                f"and {timings['running']:.2f}s running"
+            )
+
+    def start(self):
+        """Start processing jobs and serving requests in background threads."""
+        self._worker.start()
+        threading.Thread(target=self._httpd.serve_forever, name="PredictionServerHTTP", daemon=True).start()
+        logger.info("Prediction server listening on {}:{}".format(*self.address))
+
+    def serve_forever(self):
+        self._worker.start()
+        logger.info("Prediction server listening on {}:{}".format(*self.address))
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        # Sorts after all real jobs (which have finite priority)
+        self._queue.put((float("inf"), 0, None))
+
+
+def _make_handler(server):
+    class _Handler(http.server.BaseHTTPRequestHandler):
+        def _send(self, status, body, content_type="application/json"):
+            if content_type == "application/json":
+                body = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _route(self):
+            url = urllib.parse.urlparse(self.path)
+            return [part for part in url.path.split("/") if part], urllib.parse.parse_qs(url.query)
+
+        def _get_job(self, job_id):
+            try:
+                return server.job(int(job_id))
+            except (KeyError, ValueError):
+                self._send(404, {"error": f"no job {job_id}"})
+                return None
+
+        def do_GET(self):
+            parts, query = self._route()
+            if parts == ["projects"]:
+                return self._send(200, sorted(server.shells))
+            if len(parts) in (2, 3) and parts[0] == "jobs":
+                job = self._get_job(parts[1])
+                if job is None:
+                    return
+                if len(parts) == 2:
+                    if "wait" in query:
+                        job.finished.wait(float(query["wait"][0]))
+                    return self._send(200, job.to_json())
+                if parts[2] == "result":
+                    if job.status != Job.DONE or not job.to_array:
+                        return self._send(409, {"error": f"job {job.id} has no array results ({job.status})"})
+                    index = int(query.get("index", ["0"])[0])
+                    stream = io.BytesIO()
+                    numpy.save(stream, numpy.asarray(job.results[index]))
+                    return self._send(200, stream.getvalue(), "application/octet-stream")
+            self._send(404, {"error": f"unknown path {self.path}"})
+
+        def do_POST(self):
+            parts, _ = self._route()
+            if parts != ["jobs"]:
+                return self._send(404, {"error": f"unknown path {self.path}"})
+            try:
+                spec = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                job = server.submit(
+                    spec["project"], spec.get("args", []), spec.get("priority", 0), spec.get("to_array", False)
+                )
+            except (KeyError, ValueError, TypeError) as e:
+                return self._send(400, {"error": str(e)})
+            self._send(202, {"id": job.id})
+
+        def do_DELETE(self):
+            parts, _ = self._route()
+            if len(parts) != 2 or parts[0] != "jobs":
+                return self._send(404, {"error": f"unknown path {self.path}"})
+            job = self._get_job(parts[1])
+            if job is None:
+                return
+            try:
+                server.forget(job.id)
+            except ValueError as e:
+                return self._send(409, {"error": str(e)})
+            self._send(200, {"id": job.id})
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+    return _Handler
+
+
+def open_projects(project_paths, app_args=()):
+    """
+    Open each project in its own headless shell, returns {project name: shell}.
+    app_args are passed on to ilastik (e.g. ``--logfile``), as for a headless run.
+    """
+    from ilastik import app
+
+    shells = {}
+    for index, path in enumerate(project_paths):
+        name = os.path.splitext(os.path.basename(path))[0]
+        if name in shells:
+            raise ValueError(f"Two projects are named {name}")
+        parsed_args, workflow_cmdline_args = app.parse_known_args(["--headless", "--project", path, *app_args])
+        shells[name] = app.main(parsed_args, workflow_cmdline_args, init_logging=index == 0)
+    return shells
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve batch processing jobs for ilastik projects")
+    parser.add_argument("projects", nargs="+", help="project files to open")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on")
+    args, app_args = parser.parse_known_args(argv)
+
+    shells = open_projects(args.projects, app_args)
+    server = PredictionServer(shells, (args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for shell in shells.values():
+            shell.closeCurrentProject()
+
+
+if __name__ == "__main__":
+    main()
@@ -27,4 +27,4 @@ from .opMultiLaneWrapper import OpMultiLaneWrapper
 from .log_exception import log_exception
 from .autocleaned_tempdir import autocleaned_tempdir
 from .slot_name_enum import SlotNameEnum
-from .slottools import DtypeConvertFunction
+from .slottools import DtypeConvertFunction, SlotBlockSource
@@ -0,0 +1,86 @@
+###############################################################################
+#   ilastik: interactive learning and segmentation toolkit
+#
+#       Copyright (C) 2011-2022, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# In addition, as a special exception, the copyright holders of
+# ilastik give you permission to combine ilastik with applets,
+# workflows and plugins which are not covered under the GNU
+# General Public License.
+#
+# See the LICENSE file for details. License information is also available
+# on the ilastik web site at:
+#        http://ilastik.org/license.html
+###############################################################################
+"""
+Helpers to collect the edges of a region adjacency graph block by block.
+
+A pair of adjacent voxels belongs to the block of its lower voxel. So every block is read
+with one additional voxel in each upper direction (see outer_block_stop), and the pairs
+of all blocks can be merged without counting any pair twice.
+
+Edges (u, v) are encoded as a single key min(u, v) << 32 | max(u, v), so labels must fit into 32 bits.
+Sorting the keys sorts the edges by (u, v), like the edge_ids of an ilastikrag.Rag.
+
+    >>> labels = numpy.array([[1, 1, 2], [1, 3, 2]], dtype=numpy.uint32)
+    >>> keys = []
+    >>> for lower, upper, boundary in block_boundary_pairs(labels, (0, 0), (2, 3)):
+    ...     keys.append(edge_keys(labels[lower][boundary], labels[upper][boundary]))
+    >>> edge_ids_from_keys(numpy.unique(numpy.concatenate(keys))).tolist()
+    [[1, 2], [1, 3], [2, 3]]
+"""
+import numpy
+
+
+def outer_block_stop(block_stop, shape):
+    """
+    Stop of the region to read for a block: one voxel beyond the block in each direction, within shape
+    """
+    return tuple(min(int(e) + 1, int(s)) for e, s in zip(block_stop, shape))
+
+
+def block_boundary_pairs(block_labels, block_start, block_stop):
+    """
+    The voxel pairs of a block, one axis at a time.
+
+    block_labels: labels of the region from block_start to outer_block_stop(block_stop, shape)
+
+    Yields a tuple (lower, upper, boundary) for each axis: lower and upper are the slicings (relative
+    to block_labels) of the lower and upper voxels of the pairs along that axis whose lower voxel
+    lies within the block, boundary is the mask of the pairs with different labels.
+    """
+    inner = tuple(slice(0, int(e) - int(b)) for b, e in zip(block_start, block_stop))
+    for axis in range(len(inner)):
+        n_lower = min(inner[axis].stop, block_labels.shape[axis] - 1)
+        lower = list(inner)
+        upper = list(inner)
+        lower[axis] = slice(0, n_lower)
+        upper[axis] = slice(1, n_lower + 1)
+        lower, upper = tuple(lower), tuple(upper)
+        yield lower, upper, block_labels[lower] != block_labels[upper]
+
+
+def edge_keys(labels_u, labels_v):
+    """
+    Encode the edges between labels_u and labels_v (arrays of the same shape) as min << 32 | max
+    """
+    labels_u = numpy.asarray(labels_u, dtype=numpy.uint64)
+    labels_v = numpy.asarray(labels_v, dtype=numpy.uint64)
+    return (numpy.minimum(labels_u, labels_v) << numpy.uint64(32)) | numpy.maximum(labels_u, labels_v)
+
+
+def edge_ids_from_keys(keys, dtype=numpy.uint32):
+    """
+    Decode edge keys into an (N, 2) array of (u, v) pairs with u < v
+    """
+    keys = numpy.asarray(keys, dtype=numpy.uint64)
+    edge_ids = numpy.empty((len(keys), 2), dtype=dtype)
+    edge_ids[:, 0] = keys >> numpy.uint64(32)
+    edge_ids[:, 1] = keys & numpy.uint64(0xFFFFFFFF)
+    return edge_ids
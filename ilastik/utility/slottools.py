@@ -67,3 +67,30 @@ class DtypeConvertFunction:
 
     def __call__(self, val: numpy.ndarray) -> numpy.ndarray:
         return self._fun(val)
+
+
+class SlotBlockSource:
+    """
+    Read-only array-like view of an input slot for blockwise algorithms that slice arrays.
+
+    ``key`` selects the view with one entry per axis of the slot: an integer drops the axis,
+    slice(None) keeps it. Only the blocks that are actually sliced from the source are requested.
+    """
+
+    def __init__(self, slot, key, dtype=None):
+        assert len(key) == len(slot.meta.shape)
+        self._slot = slot
+        self._key = key
+        self._kept_axes = [i for i, k in enumerate(key) if isinstance(k, slice)]
+        self.shape = tuple(slot.meta.shape[i] for i in self._kept_axes)
+        self.ndim = len(self.shape)
+        self.dtype = numpy.dtype(dtype or slot.meta.dtype)
+
+    def __getitem__(self, slicing):
+        assert len(slicing) == self.ndim
+        full_slicing = [slice(k, k + 1) if not isinstance(k, slice) else k for k in self._key]
+        for axis, s in zip(self._kept_axes, slicing):
+            full_slicing[axis] = s
+        data = self._slot[tuple(full_slicing)].wait()
+        dropped = tuple(i for i, k in enumerate(self._key) if not isinstance(k, slice))
+        return numpy.asarray(data.squeeze(axis=dropped), dtype=self.dtype)
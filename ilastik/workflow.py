@@ -259,6 +259,8 @@ def getAvailableWorkflows() -> Tuple[Workflow, str, str]:
     This function used to iterate over all workflows that have been imported so far,
     but now we rely on the explicit list in workflows/__init__.py,
     and add any extra auto-discovered workflows at the end.
+    Workflows are imported while iterating, so stopping early (e.g. in getWorkflowFromName)
+    avoids importing the remaining ones.
 
     Yields:
         tuple of workflow_class, workflow_name, workflow_display_name
@@ -293,7 +295,7 @@ def getAvailableWorkflows() -> Tuple[Workflow, str, str]:
             return workflow_cls, wname, workflow_cls.workflowDisplayName
 
     # All explicitly registered workflows should be displayed
-    for W in workflows.WORKFLOW_CLASSES:
+    for W in workflows.iter_workflow_classes():
         if W.__name__ in alreadyListed:
             continue
         alreadyListed.add(W.__name__)
@@ -1,5 +1,3 @@
-from __future__ import absolute_import
-
 ###############################################################################
 #   ilastik: interactive learning and segmentation toolkit
 #
@@ -20,135 +18,160 @@ from __future__ import absolute_import
 # on the ilastik web site at:
 # 		   http://ilastik.org/license.html
 ###############################################################################
+import importlib
 import logging
+from typing import Callable, NamedTuple, Optional, Tuple
+
+import ilastik.config
+from lazyflow.utility.lazyImport import lazy_attributes
 
 logger = logging.getLogger(__name__)
 
-WORKFLOW_CLASSES = []
 
-import ilastik.config
+def _debug():
+    return ilastik.config.cfg.getboolean("ilastik", "debug")
+
+
+def _hbp():
+    return ilastik.config.cfg.getboolean("ilastik", "hbp", fallback=False)
+
 
-from .pixelClassification import PixelClassificationWorkflow
-
-WORKFLOW_CLASSES += [PixelClassificationWorkflow]
-
-from .newAutocontext.newAutocontextWorkflow import AutocontextTwoStage
-
-WORKFLOW_CLASSES += [AutocontextTwoStage]
-if ilastik.config.cfg.getboolean("ilastik", "debug"):
-    from .newAutocontext.newAutocontextWorkflow import AutocontextThreeStage, AutocontextFourStage
-
-    WORKFLOW_CLASSES += [AutocontextThreeStage, AutocontextFourStage]
-
-
-try:
-    from .objectClassification.objectClassificationWorkflow import (
-        ObjectClassificationWorkflowPixel,
-        ObjectClassificationWorkflowPrediction,
-        ObjectClassificationWorkflowBinary,
-    )
-
-    WORKFLOW_CLASSES += [
-        ObjectClassificationWorkflowPixel,
-        ObjectClassificationWorkflowPrediction,
-        ObjectClassificationWorkflowBinary,
-    ]
-except ImportError as e:
-    logger.warning("Failed to import object workflow; check dependencies: " + str(e))
-
-try:
-    from .tracking.manual.manualTrackingWorkflow import ManualTrackingWorkflow
-
-    WORKFLOW_CLASSES += [ManualTrackingWorkflow]
-except (ImportError, AttributeError) as e:
-    logger.warning("Failed to import tracking workflow; check pgmlink dependency: " + str(e))
-
-try:
-    from .tracking.conservation.conservationTrackingWorkflow import (
-        ConservationTrackingWorkflowFromBinary,
-        ConservationTrackingWorkflowFromPrediction,
-    )
-    from .tracking.conservation.animalConservationTrackingWorkflow import (
-        AnimalConservationTrackingWorkflowFromBinary,
-        AnimalConservationTrackingWorkflowFromPrediction,
-    )
-
-    WORKFLOW_CLASSES += [
-        ConservationTrackingWorkflowFromBinary,
-        ConservationTrackingWorkflowFromPrediction,
-        AnimalConservationTrackingWorkflowFromBinary,
-        AnimalConservationTrackingWorkflowFromPrediction,
-    ]
-except ImportError as e:
-    logger.warning(
-        "Failed to import automatic tracking workflow (conservation tracking). For this workflow, see the installation"
-        "instructions on our website ilastik.org; check dependencies: " + str(e)
-    )
-
-try:
-    from .tracking.structured.structuredTrackingWorkflow import (
-        StructuredTrackingWorkflowFromBinary,
-        StructuredTrackingWorkflowFromPrediction,
-    )
-
-    WORKFLOW_CLASSES += [StructuredTrackingWorkflowFromBinary, StructuredTrackingWorkflowFromPrediction]
-except ImportError as e:
-    logger.warning(
-        "Failed to import structured learning tracking workflow. For this workflow, see the installation"
-        "instructions on our website ilastik.org; check dependencies: " + str(e)
-    )
-try:
-    from .carving.carvingWorkflow import CarvingWorkflow
-
-    WORKFLOW_CLASSES += [CarvingWorkflow]
-except ImportError as e:
-    logger.warning("Failed to import carving workflow; check vigra dependency: " + str(e))
-
-# try:
-#     import multicut
-# except ImportError as e:
-#     logger.warning("Failed to import multicut workflow; check dependencies: " + str(e))
-
-try:
-    from .edgeTrainingWithMulticut import EdgeTrainingWithMulticutWorkflow
-
-    WORKFLOW_CLASSES += [EdgeTrainingWithMulticutWorkflow]
-except ImportError as e:
-    logger.warning("Failed to import 'Edge Training With Multicut' workflow; check dependencies: " + str(e))
-
-try:
-    from .counting import CountingWorkflow
-
-    WORKFLOW_CLASSES += [CountingWorkflow]
-except ImportError as e:
-    logger.warning("Failed to import counting workflow; check dependencies: " + str(e))
-
-from .examples.dataConversion.dataConversionWorkflow import DataConversionWorkflow
-
-WORKFLOW_CLASSES += [DataConversionWorkflow]
-
-if ilastik.config.cfg.getboolean("ilastik", "hbp", fallback=False):
-    from .voxelSegmentation import VoxelSegmentationWorkflow
-
-    WORKFLOW_CLASSES += [VoxelSegmentationWorkflow]
-
-# network classification, check whether required modules are available:
-try:
-    from . import neuralNetwork
-
-    WORKFLOW_CLASSES += [neuralNetwork.RemoteWorkflow]
+def _tiktorch_available():
     logger.debug(ilastik.config.runtime_cfg)
-    if ilastik.config.runtime_cfg.tiktorch_executable:
-        WORKFLOW_CLASSES += [neuralNetwork.LocalWorkflow]
-
-except ImportError as e:
-    logger.warning("Failed to import NeuralNet workflow; check dependencies: " + str(e), exc_info=1)
-
-# Examples
-if ilastik.config.cfg.getboolean("ilastik", "debug"):
-    from . import wsdt
-    from .examples import layerViewer
-    from .examples import thresholdMasking
-    from .examples import deviationFromMean
-    from .examples import labeling
-    from .examples import connectedComponents
+    return bool(ilastik.config.runtime_cfg.tiktorch_executable)
+
+
+class _RegisteredWorkflows(NamedTuple):
+    module: str
+    class_names: Tuple[str, ...]
+    # If set, failing imports are logged with this message instead of raising
+    warning: Optional[str] = None
+    errors: Tuple[type, ...] = (ImportError,)
+    # Only list the workflows if this returns True
+    condition: Optional[Callable[[], bool]] = None
+    exc_info: bool = False
+
+
+# Workflows are imported when they are listed (see iter_workflow_classes) or accessed by name,
+# so that starting ilastik doesn't import all workflows and their dependencies.
+_REGISTRY = (
+    _RegisteredWorkflows(".pixelClassification", ("PixelClassificationWorkflow",)),
+    _RegisteredWorkflows(".newAutocontext.newAutocontextWorkflow", ("AutocontextTwoStage",)),
+    _RegisteredWorkflows(
+        ".newAutocontext.newAutocontextWorkflow",
+        ("AutocontextThreeStage", "AutocontextFourStage"),
+        condition=_debug,
+    ),
+    _RegisteredWorkflows(
+        ".objectClassification.objectClassificationWorkflow",
+        (
+            "ObjectClassificationWorkflowPixel",
+            "ObjectClassificationWorkflowPrediction",
+            "ObjectClassificationWorkflowBinary",
+        ),
+        warning="Failed to import object workflow; check dependencies: ",
+    ),
+    _RegisteredWorkflows(
+        ".tracking.manual.manualTrackingWorkflow",
+        ("ManualTrackingWorkflow",),
+        warning="Failed to import tracking workflow; check pgmlink dependency: ",
+        errors=(ImportError, AttributeError),
+    ),
+    _RegisteredWorkflows(
+        ".tracking.conservation.conservationTrackingWorkflow",
+        ("ConservationTrackingWorkflowFromBinary", "ConservationTrackingWorkflowFromPrediction"),
+        warning="Failed to import automatic tracking workflow (conservation tracking). For this workflow, see the "
+        "installation instructions on our website ilastik.org; check dependencies: ",
+    ),
+    _RegisteredWorkflows(
+        ".tracking.conservation.animalConservationTrackingWorkflow",
+        ("AnimalConservationTrackingWorkflowFromBinary", "AnimalConservationTrackingWorkflowFromPrediction"),
+        warning="Failed to import automatic tracking workflow (conservation tracking). For this workflow, see the "
+        "installation instructions on our website ilastik.org; check dependencies: ",
+    ),
+    _RegisteredWorkflows(
+        ".tracking.structured.structuredTrackingWorkflow",
+        ("StructuredTrackingWorkflowFromBinary", "StructuredTrackingWorkflowFromPrediction"),
+        warning="Failed to import structured learning tracking workflow. For this workflow, see the installation "
+        "instructions on our website ilastik.org; check dependencies: ",
+    ),
+    _RegisteredWorkflows(
+        ".carving.carvingWorkflow",
+        ("CarvingWorkflow",),
+        warning="Failed to import carving workflow; check vigra dependency: ",
+    ),
+    _RegisteredWorkflows(
+        ".edgeTrainingWithMulticut",
+        ("EdgeTrainingWithMulticutWorkflow",),
+        warning="Failed to import 'Edge Training With Multicut' workflow; check dependencies: ",
+    ),
+    _RegisteredWorkflows(
+        ".counting", ("CountingWorkflow",), warning="Failed to import counting workflow; check dependencies: "
+    ),
+    _RegisteredWorkflows(".examples.dataConversion.dataConversionWorkflow", ("DataConversionWorkflow",)),
+    _RegisteredWorkflows(".voxelSegmentation", ("VoxelSegmentationWorkflow",), condition=_hbp),
+    # network classification, check whether required modules are available:
+    _RegisteredWorkflows(
+        ".neuralNetwork",
+        ("RemoteWorkflow",),
+        warning="Failed to import NeuralNet workflow; check dependencies: ",
+        exc_info=True,
+    ),
+    _RegisteredWorkflows(
+        ".neuralNetwork",
+        ("LocalWorkflow",),
+        warning="Failed to import NeuralNet workflow; check dependencies: ",
+        condition=_tiktorch_available,
+        exc_info=True,
+    ),
+)
+
+# Examples, these register themselves as Workflow subclasses (see ilastik.workflow.getAvailableWorkflows)
+_DEBUG_EXAMPLES = (
+    ".wsdt",
+    ".examples.layerViewer",
+    ".examples.thresholdMasking",
+    ".examples.deviationFromMean",
+    ".examples.labeling",
+    ".examples.connectedComponents",
+)
+
+_failed_imports = set()
+
+
+def iter_workflow_classes():
+    """
+    Yield the registered workflow classes in order, importing their modules on the way.
+    Workflows whose (optional) dependencies are missing are skipped with a warning.
+    """
+    for entry in _REGISTRY:
+        if entry.condition is not None and not entry.condition():
+            continue
+        if entry.module in _failed_imports:
+            continue
+        try:
+            module = importlib.import_module(entry.module, __name__)
+            classes = [getattr(module, class_name) for class_name in entry.class_names]
+        except entry.errors as e:
+            if entry.warning is None:
+                raise
+            _failed_imports.add(entry.module)
+            logger.warning(entry.warning + str(e), exc_info=entry.exc_info)
+            continue
+        yield from classes
+
+    if _debug():
+        for module_name in _DEBUG_EXAMPLES:
+            importlib.import_module(module_name, __name__)
+
+
+_lazy_getattr, __dir__, __all__ = lazy_attributes(
+    __name__, {class_name: entry.module for entry in _REGISTRY for class_name in entry.class_names}
+)
+
+
+def __getattr__(name):
+    if name == "WORKFLOW_CLASSES":
+        # All workflows that are currently available
+        return list(iter_workflow_classes())
+    return _lazy_getattr(name)
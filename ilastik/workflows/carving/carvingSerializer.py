@@ -24,6 +24,8 @@ from builtins import range
 from ilastik.applets.base.appletSerializer import AppletSerializer, getOrCreateGroup, deleteIfPresent, SerialSlot
 import numpy
 
+from .objectStore import DatasetLoader, SupervoxelIndex, read_array, read_voxels, write_compressed
+
 from lazyflow.roi import roiFromShape, roiToSlice
 
 import logging
@@ -38,6 +40,12 @@ class CarvingSerializer(AppletSerializer):
     def __init__(self, operator: "OpCarving", groupName):
         super().__init__(groupName, slots=[SerialSlot(operator.ObjectPrefix)])
         self._o = operator
+        # the project file the objects were deserialized from, lazily loaded objects are read from it
+        self._lazySourceFile = None
+
+    def _lazyLoader(self, dataset, read):
+        # loaders look up the dataset by path, the current file handle is only resolved when loading
+        return DatasetLoader(lambda: self._lazySourceFile, dataset.name, read)
 
     def _serializeToHdf5(self, topGroup, hdf5File, projectFilePath):
         obj = getOrCreateGroup(topGroup, "objects")
@@ -72,6 +80,11 @@ class CarvingSerializer(AppletSerializer):
                     deleteIfPresent(obj, name)
                     continue
 
+                # read everything before touching the group, lazily loaded values might live in there
+                fg_voxels = mst.object_seeds_fg_voxels[name]
+                bg_voxels = mst.object_seeds_bg_voxels[name]
+                sv = mst.object_lut[name]
+
                 g = getOrCreateGroup(obj, name)
                 deleteIfPresent(g, "fg_voxels")
                 deleteIfPresent(g, "bg_voxels")
@@ -79,21 +92,29 @@ class CarvingSerializer(AppletSerializer):
                 deleteIfPresent(g, "bg_prio")
                 deleteIfPresent(g, "no_bias_below")
 
-                v = mst.object_seeds_fg_voxels[name]
-                v = [v[i][:, numpy.newaxis] for i in range(3)]
+                v = [fg_voxels[i][:, numpy.newaxis] for i in range(3)]
                 v = numpy.concatenate(v, axis=1)
-                g.create_dataset("fg_voxels", data=v)
-                v = mst.object_seeds_bg_voxels[name]
-                v = [v[i][:, numpy.newaxis] for i in range(3)]
+                write_compressed(g, "fg_voxels", v)
+                v = [bg_voxels[i][:, numpy.newaxis] for i in range(3)]
                 v = numpy.concatenate(v, axis=1)
-                g.create_dataset("bg_voxels", data=v)
-                g.create_dataset("sv", data=mst.object_lut[name])
+                write_compressed(g, "bg_voxels", v)
+                write_compressed(g, "sv", sv)
 
                 d1 = numpy.asarray(mst.bg_priority[name], dtype=numpy.float32)
                 d2 = numpy.asarray(mst.no_bias_below[name], dtype=numpy.int32)
                 g.create_dataset("bg_prio", data=d1)
                 g.create_dataset("no_bias_below", data=d2)
 
+                # the seeds are only needed again when the object is loaded, release them from memory
+                if hdf5File is not None and hdf5File == self._lazySourceFile:
+                    mst.object_seeds_fg_voxels.set_lazy(name, self._lazyLoader(g["fg_voxels"], read_voxels))
+                    mst.object_seeds_bg_voxels.set_lazy(name, self._lazyLoader(g["bg_voxels"], read_voxels))
+
+            # the supervoxel index of all objects, so they don't have to be read to show the done segmentation
+            if objects_to_save or "object_index" not in topGroup:
+                deleteIfPresent(topGroup, "object_index")
+                mst.object_index.write_hdf5(topGroup.create_group("object_index"))
+
             opCarving._dirtyObjects = set()
 
             # save current seeds
@@ -117,7 +138,9 @@ class CarvingSerializer(AppletSerializer):
             logger.info("saved seeds")
 
     def _deserializeFromHdf5(self, topGroup, groupVersion, hdf5File, projectFilePath, headless=False):
+        self._lazySourceFile = hdf5File
         obj = topGroup["objects"]
+        stored_index = SupervoxelIndex.read_hdf5(topGroup["object_index"]) if "object_index" in topGroup else None
         for imageIndex, opCarving in enumerate(self._o.innerOperators):
             mst = opCarving._mst
 
@@ -125,29 +148,32 @@ class CarvingSerializer(AppletSerializer):
                 logger.info(" loading object with name='%s'" % name)
                 try:
                     g = obj[name]
-                    fg_voxels = g["fg_voxels"]
-                    bg_voxels = g["bg_voxels"]
-                    fg_voxels = [fg_voxels[:, k] for k in range(3)]
-                    bg_voxels = [bg_voxels[:, k] for k in range(3)]
-
-                    sv = g["sv"][()]
+                    for dataset_name in ("fg_voxels", "bg_voxels", "sv"):
+                        if dataset_name not in g:
+                            raise KeyError(f"missing dataset {dataset_name}")
 
+                    # seeds and supervoxels are only read from the project file when they are needed
                     mst.object_names[name] = i + 1
-                    mst.object_seeds_fg_voxels[name] = fg_voxels
-                    mst.object_seeds_bg_voxels[name] = bg_voxels
-                    mst.object_lut[name] = sv
+                    mst.object_seeds_fg_voxels.set_lazy(name, self._lazyLoader(g["fg_voxels"], read_voxels))
+                    mst.object_seeds_bg_voxels.set_lazy(name, self._lazyLoader(g["bg_voxels"], read_voxels))
+                    mst.object_lut.set_lazy(name, self._lazyLoader(g["sv"], read_array))
+                    if stored_index is not None and name in stored_index:
+                        mst.object_index[name] = stored_index.supervoxels(name)
+                    else:
+                        # projects saved without index: read the supervoxels once, they are indexed on the next save
+                        mst.object_index[name] = g["sv"][()]
                     mst.bg_priority[name] = g["bg_prio"][()]
                     mst.no_bias_below[name] = g["no_bias_below"][()]
 
-                    logger.info(
+                    logger.debug(
                         "[CarvingSerializer] de-serializing %s, with opCarving=%d, mst=%d"
                         % (name, id(opCarving), id(mst))
                     )
-                    logger.info("  %d voxels labeled with green seed" % fg_voxels[0].shape[0])
-                    logger.info("  %d voxels labeled with red seed" % bg_voxels[0].shape[0])
-                    logger.info("  object is made up of %d supervoxels" % sv.size)
-                    logger.info("  bg priority = %f" % mst.bg_priority[name])
-                    logger.info("  no bias below = %d" % mst.no_bias_below[name])
+                    logger.debug("  %d voxels labeled with green seed" % g["fg_voxels"].shape[0])
+                    logger.debug("  %d voxels labeled with red seed" % g["bg_voxels"].shape[0])
+                    logger.debug("  object is made up of %d supervoxels" % g["sv"].size)
+                    logger.debug("  bg priority = %f" % mst.bg_priority[name])
+                    logger.debug("  no bias below = %d" % mst.no_bias_below[name])
                 except Exception as e:
                     logger.info("object %s could not be loaded due to exception: %s" % (name, e))
 
@@ -10,7 +10,8 @@ import fastfilters
 import nifty
 import nifty.tools
 import nifty.graph.agglo
-import nifty.graph.rag
+
+from ilastik.utility.edge_tables import block_boundary_pairs, edge_ids_from_keys, edge_keys, outer_block_stop
 
 import logging
 
@@ -27,8 +28,14 @@ def choose_channel(data, sigma, function, channel):
     return function(data, sigma)[..., channel]
 
 
-def parallel_filter(filter_name, data, sigma, max_workers, block_shape=None, outer_scale=None, return_channel=None):
-    """Compute fiter response parallel over blocks."""
+def parallel_filter(
+    filter_name, data, sigma, max_workers, block_shape=None, outer_scale=None, return_channel=None, out=None
+):
+    """Compute fiter response parallel over blocks.
+
+    data can be any array-like object supporting shape and slicing, only the blocks (with halo)
+    are read from it. If out is given, the response is written into it blockwise.
+    """
     # order values for halo calculation, also used to check valid filters
     order_values = {
         "gaussianSmoothing": 0,
@@ -51,7 +58,7 @@ def parallel_filter(filter_name, data, sigma, max_workers, block_shape=None, out
     else:
         sigma_ = sigma
 
-    ndim = data.ndim
+    ndim = len(data.shape)
     # calculate the default halo on the sigma - value, see
     # https://github.com/ukoethe/vigra/blob/fb427440da8c42f96e14ebb60f7f22bdf0b7b1b2/include/vigra/multi_blockwise.hxx#L408
     halo = ndim * [int(ceil(3.0 * sigma_ + 0.5 * order + 0.5))]
@@ -81,7 +88,11 @@ def parallel_filter(filter_name, data, sigma, max_workers, block_shape=None, out
     blocking = nifty.tools.blocking(ndim * [0], shape, block_shape)
 
     # allocate the filter response
-    response = numpy.zeros(out_shape, dtype="float32")
+    if out is None:
+        response = numpy.zeros(out_shape, dtype="float32")
+    else:
+        assert tuple(out.shape) == tuple(out_shape), f"out has shape {out.shape}, expected {out_shape}"
+        response = out
 
     def filter_block(block_index):
         # get the block with halo and the slicings corresponding to
@@ -92,7 +103,7 @@ def parallel_filter(filter_name, data, sigma, max_workers, block_shape=None, out
         outer_slicing = block_to_slicing(block.outerBlock)
         inner_local_slicing = block_to_slicing(block.innerBlockLocal)
 
-        block_data = data[outer_slicing]
+        block_data = numpy.require(data[outer_slicing], dtype="float32")
         block_response = filter_function(block_data, sigma)
 
         response[inner_slicing] = block_response[inner_local_slicing]
@@ -105,8 +116,12 @@ def parallel_filter(filter_name, data, sigma, max_workers, block_shape=None, out
 
 
 # TODO it would make sense to apply an additional size filter here
-def parallel_watershed(data, block_shape=None, halo=None, max_workers=None):
-    """Parallel watershed with hard block boundaries."""
+def parallel_watershed(data, block_shape=None, halo=None, max_workers=None, out=None):
+    """Parallel watershed with hard block boundaries.
+
+    data can be any array-like object supporting shape and slicing, only the blocks (with halo)
+    are read from it. If out is given, the labels are written into it blockwise.
+    """
 
     logger.info(f"blockwise watershed with {max_workers} threads.")
     shape = data.shape
@@ -123,7 +138,7 @@ def parallel_watershed(data, block_shape=None, halo=None, max_workers=None):
     blocking = nifty.tools.blocking(roiBegin=roi_begin, roiEnd=shape, blockShape=block_shape)
     n_blocks = blocking.numberOfBlocks
 
-    labels = numpy.zeros(shape, dtype="uint32")
+    labels = numpy.zeros(shape, dtype="uint32") if out is None else out
 
     # watershed for a single block
     def ws_block(block_index):
@@ -165,7 +180,7 @@ def parallel_watershed(data, block_shape=None, halo=None, max_workers=None):
     # add the offset to blocks to make ids unique
     def add_offset_block(block_index):
         block = block_to_slicing(blocking.getBlock(block_index))
-        labels[block] += offsets[block_index]
+        labels[block] = labels[block] + numpy.uint32(offsets[block_index])
 
     # add offsets in parallel
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
@@ -175,47 +190,115 @@ def parallel_watershed(data, block_shape=None, halo=None, max_workers=None):
     return labels, max_id
 
 
-def agglomerate_labels(data, labels, block_shape=None, max_workers=None, reduce_to=0.2, size_regularizer=0.5):
-    """Agglomerate labels based on edge features."""
+def _block_edge_features(data, labels, block):
+    """Edges, boundary strength and node sizes within a single block.
+
+    Voxel pairs are assigned to the block of their lower voxel, so that every pair is
+    accounted for in exactly one block.
+    """
+    begin = tuple(block.begin)
+    end = tuple(block.end)
+    # read one additional voxel in each upper direction to see the pairs across the block border
+    outer_slicing = tuple(slice(b, e) for b, e in zip(begin, outer_block_stop(end, labels.shape)))
+    block_labels = numpy.asarray(labels[outer_slicing], dtype="uint64")
+    block_data = numpy.require(data[outer_slicing], dtype="float32")
+
+    inner_local = tuple(slice(0, e - b) for b, e in zip(begin, end))
+    node_sizes = numpy.bincount(block_labels[inner_local].ravel())
+
+    keys = []
+    strengths = []
+    for lower, upper, boundary in block_boundary_pairs(block_labels, begin, end):
+        keys.append(edge_keys(block_labels[lower][boundary], block_labels[upper][boundary]))
+        strengths.append(block_data[lower][boundary] + block_data[upper][boundary])
+
+    keys = numpy.concatenate(keys)
+    strengths = numpy.concatenate(strengths)
+    block_keys, inverse = numpy.unique(keys, return_inverse=True)
+    edge_sums = numpy.bincount(inverse, weights=strengths, minlength=len(block_keys))
+    edge_sizes = numpy.bincount(inverse, minlength=len(block_keys))
+    return block_keys, edge_sums, edge_sizes, node_sizes
+
+
+def accumulate_edge_features(data, labels, block_shape=None, max_workers=None):
+    """Build the region adjacency graph of labels and the mean boundary strength blockwise.
+
+    Neither data nor labels are required to be in memory, they only need to support shape and
+    slicing. Per block results are merged through a table of edges, so the peak memory is bounded
+    by the block size and the number of edges.
+
+    Returns:
+        uv_ids: (n_edges, 2) array of sorted node pairs, in ascending order
+        edge_strength: mean of the data along the boundary of each edge
+        edge_sizes: number of voxel pairs along the boundary of each edge
+        node_sizes: number of voxels per label id
+    """
+    shape = labels.shape
+    ndim = len(shape)
+    block_shape = [100] * ndim if block_shape is None else block_shape
+    max_workers = cpu_count() if max_workers is None else max_workers
 
-    logger.info("computing region adjacency graph")
-    max_label = labels.max() + 1
-    rag = nifty.graph.rag.gridRag(labels, max_label, numberOfThreads=max_workers)
-    n_nodes = rag.numberOfNodes
+    blocking = nifty.tools.blocking(roiBegin=[0] * ndim, roiEnd=list(shape), blockShape=list(block_shape))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        tasks = [
+            executor.submit(_block_edge_features, data, labels, blocking.getBlock(block_index))
+            for block_index in range(blocking.numberOfBlocks)
+        ]
+        block_results = [t.result() for t in tasks]
+
+    n_nodes = max(len(r[3]) for r in block_results)
+    node_sizes = numpy.zeros(n_nodes, dtype="uint64")
+    for r in block_results:
+        node_sizes[: len(r[3])] += r[3].astype("uint64")
+
+    unique_keys, inverse = numpy.unique(numpy.concatenate([r[0] for r in block_results]), return_inverse=True)
+    edge_sums = numpy.bincount(
+        inverse, weights=numpy.concatenate([r[1] for r in block_results]), minlength=len(unique_keys)
+    )
+    edge_sizes = numpy.bincount(
+        inverse, weights=numpy.concatenate([r[2] for r in block_results]), minlength=len(unique_keys)
+    )
 
-    shape = data.shape
+    uv_ids = edge_ids_from_keys(unique_keys, dtype="uint64")
+    # every voxel pair contributes the data of both voxels
+    edge_strength = edge_sums / (2 * numpy.maximum(edge_sizes, 1))
+    return uv_ids, edge_strength, edge_sizes, node_sizes
+
+
+def agglomerate_labels(data, labels, block_shape=None, max_workers=None, reduce_to=0.2, size_regularizer=0.5, out=None):
+    """Agglomerate labels based on edge features.
+
+    The region adjacency graph and the edge features are accumulated blockwise, and the
+    agglomerated labels are written blockwise to out (a new array if not given, may be labels).
+    """
+
+    shape = labels.shape
     ndim = len(shape)
     block_shape = [100] * ndim if block_shape is None else block_shape
     max_workers = cpu_count() if max_workers is None else max_workers
 
-    logger.info("accumulate edge strength along boundaries")
-
-    # extract edge features over the boundaries and sizes of edges and nodes
-    edge_features, node_features = nifty.graph.rag.accumulateMeanAndLength(
-        rag=rag,
-        data=numpy.require(data, dtype="float32"),
-        blockShape=list(block_shape),
-        numberOfThreads=max_workers,
-        saveMemory=True,
+    logger.info("computing region adjacency graph and accumulating edge strength along boundaries")
+    uv_ids, edge_strength, edge_sizes, node_sizes = accumulate_edge_features(
+        data, labels, block_shape=block_shape, max_workers=max_workers
     )
-    edge_strength = edge_features[:, 0]
-    edge_sizes = edge_features[:, 1]
-    node_sizes = node_features[:, 1]
+    n_nodes = len(node_sizes)
+    graph = nifty.graph.undirectedGraph(n_nodes)
+    graph.insertEdges(uv_ids)
 
     # we don't use node features in the agglomeration,
     # so we set all of them to one
-    node_features[:] = 1
+    node_features = numpy.ones((n_nodes, 2), dtype="float64")
 
     # calculate the number of nodes at which to stop agglomeration
     # = number of nodes times reduction factor
     n_stop = int(reduce_to * n_nodes)
 
     policy = nifty.graph.agglo.nodeAndEdgeWeightedClusterPolicy(
-        graph=rag,
+        graph=graph,
         edgeIndicators=edge_strength,
-        edgeSizes=edge_sizes,
+        edgeSizes=edge_sizes.astype("float64"),
         nodeFeatures=node_features,
-        nodeSizes=node_sizes,
+        nodeSizes=node_sizes.astype("float64"),
         beta=0.0,
         numberOfNodesStop=n_stop,
         sizeRegularizer=size_regularizer,
@@ -224,23 +307,40 @@ def agglomerate_labels(data, labels, block_shape=None, max_workers=None, reduce_
     logger.info("run agglomeration")
     agglomerative_clustering = nifty.graph.agglo.agglomerativeClustering(policy)
     agglomerative_clustering.run(True, 10000)
-    node_labels = agglomerative_clustering.result().astype("uint32")
+    node_labels = agglomerative_clustering.result()
+
+    # the ids in the output segmentation need to be consecutive and start at 1,
+    # otherwise the graph watershed will fail
+    present = node_sizes > 0
+    cluster_ids, consecutive = numpy.unique(node_labels[present], return_inverse=True)
+    mapping = numpy.zeros(n_nodes, dtype="uint32")
+    mapping[present] = consecutive + 1
+    max_id = len(cluster_ids)
 
     logger.info("project node labels to segmentation")
+    seg = numpy.zeros(shape, dtype="uint32") if out is None else out
+    blocking = nifty.tools.blocking(roiBegin=[0] * ndim, roiEnd=list(shape), blockShape=list(block_shape))
 
-    seg = nifty.graph.rag.projectScalarNodeDataToPixels(rag, node_labels, numberOfThreads=max_workers)
+    def project_block(block_index):
+        block = block_to_slicing(blocking.getBlock(block_index))
+        seg[block] = mapping[labels[block]]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        tasks = [executor.submit(project_block, block_index) for block_index in range(blocking.numberOfBlocks)]
+        [t.result() for t in tasks]
 
-    # the ids in the output segmentation need to start at 1, otherwise
-    # the graph watershed will fail
-    _, max_id, _ = vigra.analysis.relabelConsecutive(seg, start_label=1, keep_zeros=False, out=seg)
     logger.info("agglomerative supervoxel creation is done")
-    return numpy.require(seg, dtype="uint32"), max_id
+    return seg, max_id
+
 
+def watershed_and_agglomerate(data, block_shape=None, max_workers=None, reduce_to=0.2, size_regularizer=0.5, out=None):
+    """Run parallel watershed and agglomerate the resulting labels.
 
-def watershed_and_agglomerate(data, block_shape=None, max_workers=None, reduce_to=0.2, size_regularizer=0.5):
-    """Run parallel watershed and agglomerate the resulting labels."""
+    Both steps work blockwise: data is only read block by block, and the agglomerated
+    labels replace the watershed labels in place (in out, if given).
+    """
 
-    labels, _ = parallel_watershed(data=data, block_shape=block_shape, max_workers=max_workers)
+    labels, _ = parallel_watershed(data=data, block_shape=block_shape, max_workers=max_workers, out=out)
     labels, max_id = agglomerate_labels(
         data,
         labels,
@@ -248,5 +348,6 @@ def watershed_and_agglomerate(data, block_shape=None, max_workers=None, reduce_t
         max_workers=max_workers,
         reduce_to=reduce_to,
         size_regularizer=size_regularizer,
+        out=labels,
     )
     return labels, max_id
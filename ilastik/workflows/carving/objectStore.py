@@ -0,0 +1,214 @@
+###############################################################################
+#   ilastik: interactive learning and segmentation toolkit
+#
+#       Copyright (C) 2011-2022, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# In addition, as a special exception, the copyright holders of
+# ilastik give you permission to combine ilastik with applets,
+# workflows and plugins which are not covered under the GNU
+# General Public License.
+#
+# See the LICENSE file for details. License information is also available
+# on the ilastik web site at:
+# 		   http://ilastik.org/license.html
+###############################################################################
+import threading
+from collections.abc import MutableMapping
+from typing import Any, Callable, Dict, List
+
+import h5py
+import numpy
+
+
+class LazyObjectStore(MutableMapping):
+    """
+    Dict-like storage for per-object carving data (seed voxels, supervoxel ids).
+
+    Values are either held in memory (after assignment) or represented by a loader,
+    typically reading a dataset of the project file. Lazy values are only loaded when
+    they are accessed, e.g. by OpCarving.loadObject. With cache_loaded=False a lazy value
+    is read again on every access instead of being kept in memory, which keeps the memory
+    footprint independent of the number of stored objects.
+    """
+
+    def __init__(self, cache_loaded: bool = True):
+        # insertion ordered names of all entries, in memory or lazy
+        self._names: Dict[str, None] = {}
+        self._values: Dict[str, Any] = {}
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._cache_loaded = cache_loaded
+        self._lock = threading.Lock()
+
+    def set_lazy(self, name: str, loader: Callable[[], Any]) -> None:
+        """Replace the value of name by a loader, releasing the in-memory value."""
+        with self._lock:
+            self._names[name] = None
+            self._values.pop(name, None)
+            self._loaders[name] = loader
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._values
+
+    def __getitem__(self, name):
+        with self._lock:
+            if name in self._values:
+                return self._values[name]
+            loader = self._loaders[name]
+        value = loader()
+        if self._cache_loaded:
+            with self._lock:
+                # the entry might have been overwritten or removed while loading
+                if self._loaders.get(name) is loader:
+                    self._values[name] = value
+        return value
+
+    def __setitem__(self, name, value):
+        with self._lock:
+            self._names[name] = None
+            self._loaders.pop(name, None)
+            self._values[name] = value
+
+    def __delitem__(self, name):
+        with self._lock:
+            del self._names[name]
+            self._values.pop(name, None)
+            self._loaders.pop(name, None)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def __iter__(self):
+        return iter(list(self._names))
+
+    def __len__(self):
+        return len(self._names)
+
+
+class SupervoxelIndex:
+    """
+    Compact index of the supervoxel ids of all carved objects.
+
+    The supervoxel ids of the objects are kept as uint32 arrays, and stored in the project file
+    as one concatenated dataset (see write_hdf5). The done segmentation and the objects at a
+    position are determined from this index, so the per-object LUTs in OpCarving's object store
+    are only read when an object is loaded.
+    """
+
+    def __init__(self):
+        # insertion ordered, later objects win in the done segmentation where objects overlap
+        self._supervoxels: Dict[str, numpy.ndarray] = {}
+        self._concatenated = None
+
+    def __setitem__(self, name: str, supervoxels) -> None:
+        """Set the supervoxel ids of an object, e.g. the LUT of OpCarving.saveCurrentObjectAs"""
+        self._supervoxels[name] = numpy.asarray(supervoxels, dtype=numpy.uint32).reshape(-1)
+        self._concatenated = None
+
+    def __delitem__(self, name: str) -> None:
+        del self._supervoxels[name]
+        self._concatenated = None
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._supervoxels
+
+    def __len__(self) -> int:
+        return len(self._supervoxels)
+
+    def names(self) -> List[str]:
+        return list(self._supervoxels)
+
+    def supervoxels(self, name: str) -> numpy.ndarray:
+        return self._supervoxels[name]
+
+    def _concatenate(self):
+        """Supervoxel ids of all objects, and the index of the object of each of them"""
+        if self._concatenated is None:
+            arrays = list(self._supervoxels.values())
+            supervoxels = numpy.concatenate([numpy.zeros((0,), dtype=numpy.uint32)] + arrays)
+            objects = numpy.repeat(numpy.arange(len(arrays)), [len(a) for a in arrays])
+            self._concatenated = (supervoxels, objects)
+        return self._concatenated
+
+    def done_lut(self, num_nodes: int, object_numbers: Dict[str, int], exclude: str = None) -> numpy.ndarray:
+        """
+        LUT of the done segmentation: the object number of each supervoxel (0 for no object),
+        leaving out the object named exclude
+        """
+        supervoxels, objects = self._concatenate()
+        numbers = numpy.array(
+            [0 if name == exclude else object_numbers[name] for name in self._supervoxels], dtype=numpy.int32
+        )
+        entry_numbers = numbers[objects]
+        included = entry_numbers != 0
+        lut = numpy.zeros(num_nodes + 1, dtype=numpy.int32)
+        lut[supervoxels[included]] = entry_numbers[included]
+        return lut
+
+    def names_for_supervoxel(self, supervoxel: int) -> List[str]:
+        """Names of the objects containing the supervoxel"""
+        supervoxels, objects = self._concatenate()
+        names = list(self._supervoxels)
+        return [names[i] for i in numpy.unique(objects[supervoxels == supervoxel])]
+
+    def write_hdf5(self, group) -> None:
+        supervoxels, _objects = self._concatenate()
+        lengths = [len(a) for a in self._supervoxels.values()]
+        group.create_dataset(
+            "names", data=numpy.array(list(self._supervoxels), dtype=object), dtype=h5py.string_dtype()
+        )
+        group.create_dataset("offsets", data=numpy.cumsum([0] + lengths, dtype=numpy.int64))
+        write_compressed(group, "supervoxels", supervoxels)
+
+    @classmethod
+    def read_hdf5(cls, group) -> "SupervoxelIndex":
+        index = cls()
+        names = [n.decode() if isinstance(n, bytes) else n for n in group["names"][()]]
+        offsets = group["offsets"][()]
+        supervoxels = group["supervoxels"][()]
+        for name, start, stop in zip(names, offsets[:-1], offsets[1:]):
+            index[name] = supervoxels[start:stop]
+        return index
+
+
+class DatasetLoader:
+    """
+    Loader for LazyObjectStore, reading a dataset of the project file by its path.
+
+    The file is looked up on every access, so the loader stays valid when datasets are rewritten
+    on save, or the project file is reopened (e.g. after Save As).
+    """
+
+    def __init__(self, get_file: Callable[[], Any], path: str, read: Callable[[Any], Any]):
+        self._get_file = get_file
+        self._path = path
+        self._read = read
+
+    def __call__(self):
+        return self._read(self._get_file()[self._path])
+
+
+def read_voxels(dataset):
+    """Loader for seed voxels stored as (n, 3) coordinate arrays."""
+    voxels = dataset[()]
+    return [voxels[:, k] for k in range(3)]
+
+
+def read_array(dataset):
+    """Loader for arrays stored as they are (e.g. supervoxel ids)."""
+    return dataset[()]
+
+
+def write_compressed(group, name, data):
+    """
+    Write data as a chunked, compressed dataset (empty arrays can't be chunked and are stored as they are).
+    """
+    data = numpy.asarray(data)
+    if data.size == 0:
+        return group.create_dataset(name, data=data)
+    return group.create_dataset(name, data=data, compression="gzip", compression_opts=4, shuffle=True)
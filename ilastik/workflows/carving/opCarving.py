@@ -215,16 +215,10 @@ class OpCarving(Operator):
         if self._mst is None:
             return
         with Timer() as timer:
-            self._done_seg_lut = numpy.zeros(self._mst.numNodes + 1, dtype=numpy.int32)
             logger.info("building 'done' lut")
-            for name, objectSupervoxels in self._mst.object_lut.items():
-                if name == self._currObjectName:
-                    continue
-                assert name in self._mst.object_names, "%s not in self._mst.object_names, keys are %r" % (
-                    name,
-                    list(self._mst.object_names.keys()),
-                )
-                self._done_seg_lut[objectSupervoxels] = self._mst.object_names[name]
+            self._done_seg_lut = self._mst.object_index.done_lut(
+                self._mst.numNodes, self._mst.object_names, exclude=self._currObjectName
+            )
         logger.info("building the 'done' luts took {} seconds".format(timer.seconds()))
 
     def dataIsStorable(self):
@@ -306,10 +300,7 @@ class OpCarving(Operator):
 
         # find the supervoxel that was clicked
         sv = self._mst.supervoxelUint32[position3d]
-        names = []
-        for name, objectSupervoxels in self._mst.object_lut.items():
-            if numpy.sum(sv == objectSupervoxels) > 0:
-                names.append(name)
+        names = self._mst.object_index.names_for_supervoxel(sv)
         logger.info("click on %r, supervoxel=%d: %r" % (position3d, sv, names))
         return names
 
@@ -457,6 +448,7 @@ class OpCarving(Operator):
         # lut_seeds[:] = 0
 
         del self._mst.object_lut[name]
+        del self._mst.object_index[name]
         del self._mst.object_seeds_fg_voxels[name]
         del self._mst.object_seeds_bg_voxels[name]
         del self._mst.bg_priority[name]
@@ -532,6 +524,7 @@ class OpCarving(Operator):
         self._mst.no_bias_below[name] = self.NoBiasBelow.value
 
         self._mst.object_lut[name] = numpy.where(sVseg == 2)
+        self._mst.object_index[name] = self._mst.object_lut[name]
 
         self._setCurrObjectName("<not saved yet>")
         self.HasSegmentation.setValue(False)
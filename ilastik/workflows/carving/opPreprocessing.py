@@ -39,6 +39,7 @@ from lazyflow.request import Request
 
 from lazyflow.utility.timer import Timer
 from ilastik.applets.base.applet import DatasetConstraintError
+from ilastik.utility.slottools import SlotBlockSource
 
 # carving backend in ilastiktools
 from .watershed_segmentor import WatershedSegmentor
@@ -87,35 +88,34 @@ class OpFilter(Operator):
             assert ax[i].isSpatial()
         assert ax[4].key == "c" and sh[4] == 1
 
-        volume5d = self.Input.value
         sigma = self.Sigma.value
-        volume = volume5d[0, :, :, :, 0]
-        result_view = result[0, :, :, :, 0]
+
+        # check dimensionality of input and reduce to 2d volume
+        # if we have actual 2d input
+        if sh[3] == 1:
+            key = (0, slice(None), slice(None), 0, 0)
+        else:
+            key = (0, slice(None), slice(None), slice(None), 0)
+
+        # the input is only read block by block, and the response is written directly to the result
+        volume = SlotBlockSource(self.Input, key, dtype=numpy.float32)
+        result_view = result[key]
 
         logger.info("input volume shape: %r" % (volume.shape,))
-        logger.info("input volume size: %r MB", (old_div(volume.nbytes, 1024 ** 2),))
-        fvol = numpy.asarray(volume, numpy.float32)
+        volume_nbytes = volume.dtype.itemsize * int(numpy.prod(volume.shape))
+        logger.info("input volume size: %r MB", (old_div(volume_nbytes, 1024 ** 2),))
 
         # Choose filter selected by user
         volume_filter = self.Filter.value
         filter_name = self.FILTER_NAMES[volume_filter]
 
-        logger.info("applying filter on shape = %r" % (fvol.shape,))
+        logger.info("applying filter on shape = %r" % (volume.shape,))
         with Timer() as filterTimer:
 
-            # check dimensionality of input and reduce to 2d volume
-            # if we have actual 2d input
-            if fvol.shape[2] == 1:
-                fvol = fvol[:, :, 0]
-
-            # we need to invert the input for filter mode RAW_INVERTED
-            if volume_filter == OpFilter.RAW_INVERTED:
-                fvol = -fvol
-
             # for the hessian filters, we only need to keep one channel,
             # and we discard the other channels during block-wise computation to save memory
             if volume_filter == OpFilter.HESSIAN_BRIGHT:  # HESSIAN_BRIGHT -> last eigenvalue
-                channel = fvol.ndim - 1
+                channel = volume.ndim - 1
             elif volume_filter == OpFilter.HESSIAN_DARK:  # HESSIAN_DARK -> first eigenvalue
                 channel = 0
             else:
@@ -124,17 +124,18 @@ class OpFilter(Operator):
             # handle the special case of the Request threadpool not having any workers
             max_workers = max(1, Request.global_thread_pool.num_workers)
             # compute the filter response block-wise
-            response = parallel_filter(filter_name, fvol, sigma, max_workers=max_workers, return_channel=channel)
+            parallel_filter(
+                filter_name, volume, sigma, max_workers=max_workers, return_channel=channel, out=result_view
+            )
+
+            # we need to invert the input for filter mode RAW_INVERTED,
+            # gaussian smoothing is linear, so we can invert the response instead
+            if volume_filter == OpFilter.RAW_INVERTED:
+                numpy.negative(result_view, out=result_view)
 
             # need to invert response for hessian bright
             if volume_filter == OpFilter.HESSIAN_BRIGHT:
-                response = numpy.max(response) - response
-
-            # write the response to result view
-            if fvol.ndim == 2:
-                result_view[:, :, 0] = response
-            else:
-                result_view[...] = response
+                numpy.subtract(numpy.max(result_view), result_view, out=result_view)
 
             logger.info("Filter took {} seconds".format(filterTimer.seconds()))
 
@@ -192,7 +193,10 @@ class OpSimpleBlockwiseWatershed(Operator):
         else:
             result_idx = numpy.s_[0, ..., 0, 0]
 
-        input_ = self.Input(roi.start, roi.stop).wait().squeeze()
+        # the input is read block by block by the blockwise watershed, drop all singleton axes
+        shape = self.Input.meta.shape
+        key = tuple(slice(None) if s > 1 else 0 for s in shape)
+        input_ = SlotBlockSource(self.Input, key, dtype=numpy.float32)
         if input_.ndim not in (2, 3):
             raise ValueError(f"Input shape {input_.shape} has an invalid number of non-singleton dimensions")
 
@@ -200,14 +204,18 @@ class OpSimpleBlockwiseWatershed(Operator):
             logger.info("Run block-wise watershed in %dd", input_.ndim)
 
             if self.DoAgglo.value:
-                result[result_idx], max_id = watershed_and_agglomerate(
+                # supervoxels are computed and agglomerated in place in the result array
+                _, max_id = watershed_and_agglomerate(
                     input_,
                     max_workers=max(1, Request.global_thread_pool.num_workers),
                     size_regularizer=self.SizeRegularizer.value,
                     reduce_to=self.ReduceTo.value,
+                    out=result[result_idx],
                 )
             else:
-                result[result_idx], max_id = vigra.analysis.watershedsNew(input_)
+                # the plain watershed is not blockwise, it needs the whole input at once
+                whole_input = input_[tuple(slice(0, s) for s in input_.shape)]
+                result[result_idx], max_id = vigra.analysis.watershedsNew(whole_input)
 
             logger.info("done %d", max_id)
             logger.info("Blockwise Watershed took %f seconds", timer.seconds())
@@ -422,6 +430,7 @@ class OpPreprocessing(Operator):
         if self._prepData[0] is not None:
             # mst.seeds[:] = self._prepData[0].seeds[:]
             mst.object_lut = self._prepData[0].object_lut
+            mst.object_index = self._prepData[0].object_index
             mst.object_names = self._prepData[0].object_names
             mst.object_seeds_bg_voxels = self._prepData[0].object_seeds_bg_voxels
             mst.object_seeds_fg_voxels = self._prepData[0].object_seeds_fg_voxels
@@ -2,6 +2,8 @@ import ilastiktools
 import h5py
 import numpy
 
+from .objectStore import LazyObjectStore, SupervoxelIndex
+
 
 class WatershedSegmentor(object):
     def __init__(self, labels=None, volume_feat=None, edgeWeightFunctor=None, progressCallback=None, h5file=None):
@@ -9,11 +11,15 @@ class WatershedSegmentor(object):
         self.objects = dict()
         self.object_seeds_fg = dict()
         self.object_seeds_bg = dict()
-        self.object_seeds_fg_voxels = dict()
-        self.object_seeds_bg_voxels = dict()
+        # per-object data can be backed by the project file and is only loaded when needed,
+        # seed voxels are only needed when an object is loaded, and are not kept in memory
+        self.object_seeds_fg_voxels = LazyObjectStore(cache_loaded=False)
+        self.object_seeds_bg_voxels = LazyObjectStore(cache_loaded=False)
         self.bg_priority = dict()
         self.no_bias_below = dict()
-        self.object_lut = dict()
+        self.object_lut = LazyObjectStore()
+        # supervoxel ids of all objects, for the done segmentation without loading every object_lut entry
+        self.object_index = SupervoxelIndex()
         self.hasSeg = False
 
         if h5file is None:
@@ -7,6 +7,8 @@ See the __main__ section, below.
 It also includes a brief demonstration of lazyflow's OperatorWrapper mechanism.
 """
 import logging
+import threading
+from functools import partial
 
 import numpy
 
@@ -14,7 +16,15 @@ import skimage.segmentation
 
 from lazyflow.graph import Operator, InputSlot, OutputSlot
 from lazyflow.operators import OpBlockedArrayCache, OpReorderAxes
-from lazyflow.roi import roiToSlice
+from lazyflow.request import Request, RequestPool
+from lazyflow.roi import (
+    determineBlockShape,
+    getBlockBounds,
+    getIntersectingBlocks,
+    getIntersection,
+    roiFromShape,
+    roiToSlice,
+)
 from lazyflow.utility.helpers import bigintprod
 
 
@@ -29,6 +39,11 @@ class OpSlic(Operator):
     Every request is considered independently, so it isn't desirable to
     concatenate the results of several requests into one large image.
     (If you do, the final image will appear 'quilted'.)
+
+    Unless BlockShape is given: then the image is split into blocks of that shape, which are
+    segmented in parallel (each with a margin of Halo pixels of context) and kept until their input
+    or the parameters change. The supervoxels of each block get their own range of ids, so
+    the ids are consistent over the whole image (and supervoxels end at block boundaries).
     """
 
     Input = InputSlot()
@@ -39,11 +54,23 @@ class OpSlic(Operator):
     Compactness = InputSlot(value=0.4)
     MaxIter = InputSlot(value=10)
 
+    # Shape of the blocks to compute SLIC for (including the channel axis), () for no blocks
+    BlockShape = InputSlot(value=())
+    Halo = InputSlot(value=8)
+
     Output = OutputSlot()
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # block start -> (supervoxels of the block numbered from 0, number of supervoxels)
+        self._blocks = {}
+        self._blocks_lock = threading.Lock()
+        # Incremented whenever blocks are discarded, so that blocks computed from outdated input aren't stored
+        self._blocks_generation = 0
+
     def setupOutputs(self):
         self.Output.meta.assignFrom(self.Input.meta)
-        self.Output.meta.dtype = numpy.uint16
+        self.Output.meta.dtype = numpy.uint32 if self.BlockShape.value else numpy.uint16
 
         tagged_shape = self.Input.meta.getTaggedShape()
         assert "c" in tagged_shape, "We assume the image has an explicit channel axis."
@@ -53,15 +80,24 @@ class OpSlic(Operator):
         tagged_shape["c"] = 1
         self.Output.meta.shape = tuple(tagged_shape.values())
 
+        with self._blocks_lock:
+            self._blocks.clear()
+            self._blocks_generation += 1
+
     def execute(self, slot, subindex, roi, result):
-        input_data = self.Input(roi.start, roi.stop).wait()
         assert slot == self.Output
+        if self.BlockShape.value:
+            return self._executeBlockwise(roi, result)
 
-        n_segments = self.NumSegments.value
+        input_data = self.Input(roi.start, roi.stop).wait()
+        # slic result has no channel axis, so insert that axis before copying to 'result'
+        result[:] = self._slic(input_data, self.NumSegments.value)[..., None]
+        return result
 
+    def _slic(self, input_data, n_segments):
         if n_segments == 0:
             # If the number of supervoxels was not given, use a default proportional to the number of voxels
-            n_segments = numpy.int(bigintprod(input_data.shape) / 2500)
+            n_segments = int(bigintprod(input_data.shape) / 2500)
 
         logger.debug(
             "calling skimage.segmentation.slic with {}".format(
@@ -87,16 +123,91 @@ class OpSlic(Operator):
         # This would cause slic() to have special behavior for 3-channel data,
         # in which case we better really be dealing with RGB channels
         # (not, say 3 unrelated image features).
+        return slic_sp
+
+    def _blockStarts(self):
+        blockshape = tuple(self.BlockShape.value[:-1]) + (1,)
+        return blockshape, sorted(map(tuple, getIntersectingBlocks(blockshape, roiFromShape(self.Output.meta.shape))))
+
+    def _haloRoi(self, block_roi):
+        halo = self.Halo.value
+        start = numpy.maximum(numpy.subtract(block_roi[0], halo), 0)
+        stop = numpy.minimum(numpy.add(block_roi[1], halo), self.Input.meta.shape)
+        start[-1], stop[-1] = 0, self.Input.meta.shape[-1]
+        return start, stop
+
+    def _computeBlock(self, blockshape, block_start):
+        with self._blocks_lock:
+            generation = self._blocks_generation
+        shape = self.Output.meta.shape
+        block_roi = getBlockBounds(shape, blockshape, block_start)
 
-        # slic_sp has no channel axis, so insert that axis before copying to 'result'
-        result[:] = slic_sp[..., None]
-        # import IPython; IPython.embed()
+        # Segment the block with some context, so that the supervoxels at its boundaries are not too odd
+        halo_start, halo_stop = self._haloRoi(block_roi)
+        input_data = self.Input(halo_start, halo_stop).wait()
 
+        n_segments = self.NumSegments.value
+        if n_segments != 0:
+            # Same density of supervoxels as for the whole image
+            n_segments = max(1, round(n_segments * bigintprod(input_data.shape[:-1]) / bigintprod(shape[:-1])))
+        slic_sp = self._slic(input_data, n_segments)
+
+        core = slic_sp[roiToSlice(*numpy.subtract(block_roi, halo_start))[:-1]]
+        supervoxels, local_ids = numpy.unique(core, return_inverse=True)
+        local_ids = local_ids.reshape(core.shape).astype(numpy.min_scalar_type(len(supervoxels)))
+        block = (local_ids, len(supervoxels))
+        with self._blocks_lock:
+            if generation == self._blocks_generation:
+                self._blocks[block_start] = block
+        return block
+
+    def _executeBlockwise(self, roi, result):
+        blockshape, block_starts = self._blockStarts()
+
+        # The ids of a block start after those of all blocks before it, so all blocks are needed
+        # The blocks are kept locally, since propagateDirty() may discard them from self._blocks meanwhile
+        with self._blocks_lock:
+            blocks = {block_start: self._blocks.get(block_start) for block_start in block_starts}
+
+        def computeBlock(block_start):
+            blocks[block_start] = self._computeBlock(blockshape, block_start)
+
+        pool = RequestPool()
+        for block_start, block in blocks.items():
+            if block is None:
+                pool.add(Request(partial(computeBlock, block_start)))
+        pool.wait()
+
+        offset = 0
+        for block_start in block_starts:
+            local_ids, count = blocks[block_start]
+            block_roi = getBlockBounds(self.Output.meta.shape, blockshape, block_start)
+            intersection = getIntersection(block_roi, (roi.start, roi.stop), assertIntersect=False)
+            if intersection is not None:
+                destination = result[roiToSlice(*numpy.subtract(intersection, roi.start))]
+                destination[..., 0] = local_ids[roiToSlice(*numpy.subtract(intersection, block_roi[0]))[:-1]]
+                destination += offset
+            offset += count
         return result
 
     def propagateDirty(self, slot, subindex, roi):
+        if slot == self.Input and self.BlockShape.value:
+            # Only the blocks whose context intersects the dirty region have to be computed again
+            blockshape, block_starts = self._blockStarts()
+            with self._blocks_lock:
+                for block_start in block_starts:
+                    halo_roi = self._haloRoi(getBlockBounds(self.Output.meta.shape, blockshape, block_start))
+                    if getIntersection(halo_roi, (roi.start, roi.stop), assertIntersect=False) is not None:
+                        self._blocks.pop(block_start, None)
+                self._blocks_generation += 1
+        else:
+            with self._blocks_lock:
+                self._blocks.clear()
+                self._blocks_generation += 1
+
         # For some operators, a dirty in one part of the image only causes changes in nearby regions.
         # But for superpixel operators, changes in one corner can affect results in the opposite corner.
+        # (Blockwise, the ids of all following blocks can change.)
         # Therefore, everything is dirty.
         self.Output.setDirty()
 
@@ -159,8 +270,13 @@ class OpSlicBoundaries(Operator):
 class OpSlicCached(Operator):
     """
     Computes SLIC superpixels and cache the result for the entire image.
+    Large images are segmented blockwise (see OpSlic).
     """
 
+    # Images with more voxels than this are segmented in blocks of about BLOCK_VOLUME voxels
+    BLOCKWISE_MIN_VOXELS = 256 ** 3
+    BLOCK_VOLUME = 128 ** 3
+
     # Same slots as OpSlic
     Input = InputSlot()
     NumSegments = InputSlot(value=0)
@@ -220,6 +336,12 @@ class OpSlicCached(Operator):
         self.opCache.BlockShape.setValue(self.Input.meta.shape)
         self.opBoundariesCache.BlockShape.setValue(self.Input.meta.shape)
 
+        shape = self.Input.meta.shape
+        if bigintprod(shape[:-1]) > self.BLOCKWISE_MIN_VOXELS:
+            self.opSlic.BlockShape.setValue(determineBlockShape(shape[:-1], self.BLOCK_VOLUME) + (shape[-1],))
+        else:
+            self.opSlic.BlockShape.setValue(())
+
     def execute(self, slot, subindex, roi, result):
         # When an output slot is accessed, it asks for data from it's upstream connection (if any)
         # If it has no upstream connection, then it will call it's own operator's execute() function.
@@ -12,7 +12,6 @@ import vigra
 # lazyflow
 from lazyflow.roi import determineBlockShape
 from lazyflow.graph import Operator, InputSlot, OutputSlot
-from lazyflow.request import Request, RequestPool
 from lazyflow.operators import (
     OpValueCache,
     OpSlicedBlockedArrayCache,
@@ -35,7 +34,7 @@ from ilastik.utility.operatorSubView import OperatorSubView
 from ilastik.utility import OpMultiLaneWrapper
 
 from .classifierOperators import OpTrainSupervoxelClassifierBlocked, OpSupervoxelClassifierPredict
-from .utils import timeit
+from .utils import get_supervoxel_features, get_supervoxel_labels, timeit
 
 
 class OpVoxelSegmentation(Operator):
@@ -479,87 +478,34 @@ class OpSupervoxelFeaturesAndLabels(Operator):
     @timeit
     def execute(self, slot, subindex, roi, result):
         if slot == self.SupervoxelFeatures:
-            supervoxel_mask = self.SupervoxelSegmentation.value
-            features_matrix = self.FeatureImages.value
-
-            N_voxels = np.max(supervoxel_mask) + 1
-            N_features = features_matrix.shape[-1]
-
-            supervoxel_features = np.ndarray((N_voxels, N_features))
-
-            # Parallelize by mapping over supervoxels
-
-            for v in range(N_voxels):
-                supervoxel_features[v, :N_features] = np.mean(features_matrix[supervoxel_mask[..., 0] == v, :], axis=0)
-
-            return supervoxel_features
+            return get_supervoxel_features(self.FeatureImages.value, self.SupervoxelSegmentation.value)
         elif slot == self.SupervoxelLabels:
-            updated_labels = {}
-
             # If cache is empty, compute labels for all supervoxel
             if self.supervoxelLabelsCache is None:
-                updated_labels = self.computeSupervoxelLabels()  # updated_labels now contains all supervoxels
                 self.supervoxelLabelsCache = np.zeros((self.n_supervoxels,))
+                self.supervoxelLabelsCache[:] = self.computeSupervoxelLabels()
                 # Remove dirtyslices if we just computed labels on the whole stack
                 self.dirtySlices = []
 
-            # If cache is not empty but there are dirty regions, recompute labels for those regions
-            if self.supervoxelLabelsCache is not None and len(self.dirtySlices) > 0:
-                # updated_labels now contains only supervoxel that changed
-                updated_labels = self.getUpdatedSupervoxelLabels(self.dirtySlices)
-                self.dirtySlices = []
-
-            for (supervoxel, label) in updated_labels.items():
-                self.supervoxelLabelsCache[supervoxel] = label
+            # If cache is not empty but there are dirty regions, recompute labels
+            # of the supervoxels that intersect them
+            elif len(self.dirtySlices) > 0:
+                dirtySlices, self.dirtySlices = self.dirtySlices, []
+                supervoxels = self.getDirtySupervoxels(dirtySlices)
+                self.supervoxelLabelsCache[supervoxels] = self.computeSupervoxelLabels(supervoxels)
 
             return self.supervoxelLabelsCache
 
-    def getUpdatedSupervoxelLabels(self, dirtySlices):
-        updated = {}
-        for slice_ in dirtySlices:
-            updated.update(self.computeSupervoxelLabels(slice_))
-        return updated
-
-    def computeSupervoxelLabels(self, slice_=None):
-        if slice_ is None:
-            slice_ = (slice(None), slice(None), slice(None))
-
+    def getDirtySupervoxels(self, dirtySlices):
         supervoxel_mask = self.SupervoxelSegmentation.value[..., 0]
-        labels = self.Labels.value[:]
-
-        supervoxel_labels_dicts = []
-
-        def computeLabel(supervoxels):
-            # supervoxel_labels = np.ndarray((len(supervoxels),))
-            nonlocal supervoxel_labels_dicts
-            supervoxel_labels = {}
-            for supervoxel in supervoxels:
-                counts = np.bincount(labels[supervoxel_mask == supervoxel].ravel())
-
-                # Little trick to avoid labelling a supervoxel as unlabelled if only a small part of it has been labelled
-                if len(counts) == 1:  # or max(counts[1:]) == 0:
-                    # If there's only unlabelled pixels, label 0 (=unlabeled)
-                    label = 0
-                else:
-                    # Else, return the label which has the most pixels (excluding label 0)
-                    label = counts[1:].argmax() + 1
-
-                supervoxel_labels[supervoxel] = label
-            supervoxel_labels_dicts.append(supervoxel_labels)
-
-        pool = RequestPool()
-        supervoxels_list = np.unique(supervoxel_mask)
-        # supervoxel_labels = np.concatenate(pool.map(computeLabel, np.array_split(supervoxels_list, num_cores)))
-        supervoxel_labels = {}
-        num_workers = Request.global_thread_pool.num_workers
-        for subarray in np.array_split(supervoxels_list, num_workers):
-            pool.add(Request(partial(computeLabel, subarray)))
-        pool.wait()
-
-        # supervoxel_labels_dicts = [computeLabel(l) for l in np.array_split(supervoxels_list, num_cores)]
-        for d in supervoxel_labels_dicts:
-            supervoxel_labels.update(d)
-        return supervoxel_labels
+        return np.unique(np.concatenate([np.unique(supervoxel_mask[slice_]) for slice_ in dirtySlices]))
+
+    def computeSupervoxelLabels(self, supervoxels=None):
+        """
+        Label of each supervoxel: the most frequent label among its labeled voxels (0 if it has none)
+        If supervoxels is given, only the labels of these supervoxel ids are computed.
+        """
+        return get_supervoxel_labels(self.Labels.value, self.SupervoxelSegmentation.value, supervoxels)
 
     def setupOutputs(self):
         self.n_supervoxels = np.max(self.SupervoxelSegmentation.value) + 1
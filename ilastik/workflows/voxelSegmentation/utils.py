@@ -19,41 +19,85 @@ def timeit(method):
     return timed
 
 
-@timeit
-def get_supervoxel_features(featuresMatrix, supervoxel_mask):
-
-    N_voxels = np.max(supervoxel_mask) + 1
-    N_features = featuresMatrix.shape[-1]
-
-    supervoxel_features = np.ndarray((N_voxels, N_features))
-    # Parallelize by mapping over supervoxels
+def _blockwise_sum(compute, size):
+    """
+    Sums compute(start, stop) over blocks of range(size), which are computed in parallel.
+    """
+    num_workers = max(Request.global_thread_pool.num_workers, 1)
+    bounds = np.linspace(0, size, num_workers + 1).astype(int)
+    partial_sums = []
 
-    for v in range(N_voxels):
-        supervoxel_features[v, :N_features] = np.mean(featuresMatrix[supervoxel_mask[:, :, :, 0] == v, :], axis=0)
+    def compute_block(start, stop):
+        partial_sums.append(compute(start, stop))
 
-    return supervoxel_features
+    pool = RequestPool()
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        if stop > start:
+            pool.add(Request(partial(compute_block, start, stop)))
+    pool.wait()
+    return sum(partial_sums)
 
 
 @timeit
-def get_supervoxel_labels(labels, supervoxel_mask):
-    supervoxel_mask = supervoxel_mask[:, :, :, 0]
-
-    N_supervoxels = np.max(supervoxel_mask) + 1
-    supervoxel_labels = np.ndarray((N_supervoxels,))
-
-    for supervoxel in range(N_supervoxels):
-        counts = np.bincount(labels[supervoxel_mask == supervoxel].ravel())
+def get_supervoxel_features(featuresMatrix, supervoxel_mask):
+    """
+    Mean of each feature over each supervoxel (NaN for supervoxel ids without any voxels).
+    """
+    supervoxels = supervoxel_mask[..., 0].reshape(-1)
+    features = featuresMatrix.reshape(supervoxels.shape[0], -1)
+    N_supervoxels = int(np.max(supervoxels)) + 1
+    N_features = features.shape[-1]
+
+    def compute(start, stop):
+        # Column 0: number of voxels, then the sum of each feature
+        ids = supervoxels[start:stop].astype(np.intp, copy=False)
+        sums = np.empty((N_supervoxels, N_features + 1))
+        sums[:, 0] = np.bincount(ids, minlength=N_supervoxels)
+        for f in range(N_features):
+            sums[:, f + 1] = np.bincount(ids, weights=features[start:stop, f], minlength=N_supervoxels)
+        return sums
+
+    sums = _blockwise_sum(compute, supervoxels.shape[0])
+    with np.errstate(invalid="ignore"):
+        return sums[:, 1:] / sums[:, :1]
 
-        # Little trick to avoid labelling a supervoxel as unlabelled if only a small part of it has been labelled
-        if len(counts) == 1:  # or max(counts[1:]) == 0:
-            # If there's only unlabelled pixels, label 0 (=unlabeled)
-            label = 0
-        else:
-            # Else, return the label which has the most pixels (excluding label 0)
-            label = counts[1:].argmax() + 1
 
-        supervoxel_labels[supervoxel] = label
-    return supervoxel_labels
+@timeit
+def get_supervoxel_labels(labels, supervoxel_mask, supervoxel_ids=None):
+    """
+    Most frequent label of each supervoxel, not counting unlabeled (0) voxels: a supervoxel is labeled even
+    if only a small part of it is. Supervoxels without any labeled voxels get label 0.
+    Ties go to the smaller label.
+
+    If supervoxel_ids is given, only the labels of these supervoxels are counted and returned (in the same order).
+    """
+    supervoxels = supervoxel_mask[..., 0].reshape(-1)
+    labels = labels.reshape(supervoxels.shape[0])
+    N_supervoxels = int(np.max(supervoxels)) + 1
+    N_labels = int(np.max(labels)) + 1
+
+    if supervoxel_ids is None:
+        supervoxel_ids = np.arange(N_supervoxels)
+        rows = None
+    else:
+        # Row of each supervoxel id in the counts, -1 for the ones that aren't counted
+        supervoxel_ids = np.asarray(supervoxel_ids, dtype=np.intp)
+        rows = np.full(N_supervoxels, -1, dtype=np.intp)
+        rows[supervoxel_ids] = np.arange(len(supervoxel_ids))
+    N_rows = len(supervoxel_ids)
+
+    def compute(start, stop):
+        block_labels = labels[start:stop]
+        block_rows = supervoxels[start:stop].astype(np.intp)
+        if rows is not None:
+            block_rows = rows[block_rows]
+        counted = (block_labels > 0) & (block_rows >= 0)
+        ids = block_rows[counted] * N_labels + block_labels[counted]
+        return np.bincount(ids, minlength=N_rows * N_labels)
+
+    counts = _blockwise_sum(compute, supervoxels.shape[0]).reshape(N_rows, N_labels)
+    # counts[:, 0] is 0, so supervoxels without labeled voxels get label 0
+    return counts.argmax(axis=1)
 
 
 @timeit
@@ -1,16 +1,21 @@
-from __future__ import absolute_import
-from .lazyflowClassifier import (
-    LazyflowVectorwiseClassifierABC,
-    LazyflowVectorwiseClassifierFactoryABC,
-    LazyflowPixelwiseClassifierABC,
-    LazyflowPixelwiseClassifierFactoryABC,
-)
-from .vigraRfLazyflowClassifier import VigraRfLazyflowClassifier, VigraRfLazyflowClassifierFactory
-from .parallelVigraRfLazyflowClassifier import (
-    ParallelVigraRfLazyflowClassifier,
-    ParallelVigraRfLazyflowClassifierFactory,
-)
-from .sklearnLazyflowClassifier import SklearnLazyflowClassifier, SklearnLazyflowClassifierFactory
+from lazyflow.utility.lazyImport import lazy_attributes
 
-# Testing
-from .vigraRfPixelwiseClassifier import VigraRfPixelwiseClassifier, VigraRfPixelwiseClassifierFactory
+# The classifier modules (and their dependencies, e.g. sklearn) are only imported when they are used.
+__getattr__, __dir__, __all__ = lazy_attributes(
+    __name__,
+    {
+        "LazyflowVectorwiseClassifierABC": ".lazyflowClassifier",
+        "LazyflowVectorwiseClassifierFactoryABC": ".lazyflowClassifier",
+        "LazyflowPixelwiseClassifierABC": ".lazyflowClassifier",
+        "LazyflowPixelwiseClassifierFactoryABC": ".lazyflowClassifier",
+        "VigraRfLazyflowClassifier": ".vigraRfLazyflowClassifier",
+        "VigraRfLazyflowClassifierFactory": ".vigraRfLazyflowClassifier",
+        "ParallelVigraRfLazyflowClassifier": ".parallelVigraRfLazyflowClassifier",
+        "ParallelVigraRfLazyflowClassifierFactory": ".parallelVigraRfLazyflowClassifier",
+        "SklearnLazyflowClassifier": ".sklearnLazyflowClassifier",
+        "SklearnLazyflowClassifierFactory": ".sklearnLazyflowClassifier",
+        # Testing
+        "VigraRfPixelwiseClassifier": ".vigraRfPixelwiseClassifier",
+        "VigraRfPixelwiseClassifierFactory": ".vigraRfPixelwiseClassifier",
+    },
+)
@@ -186,6 +186,11 @@ class Operator(metaclass=OperatorMetaClass):
     description = ""
     category = "lazyflow"
 
+    # If True, requests for the outputs of this operator are executed directly in the
+    # request that waits for them, regardless of the roi size (see Slot.get).
+    # Set this for cheap operators, e.g. operators that only provide a view of their input.
+    executeInline = False
+
     inputs: InputDict
     outputs: OutputDict
 
@@ -23,8 +23,10 @@ from __future__ import division
 ###############################################################################
 
 # Python
+import collections
 import gc
 import threading
+import time
 import weakref
 import functools
 import atexit
@@ -35,6 +37,7 @@ import warnings
 from lazyflow.utility import OrderedSignal
 from lazyflow.utility import log_exception
 from lazyflow.utility import Memory
+from lazyflow.utility import bufferPool
 
 
 import logging
@@ -44,6 +47,12 @@ logger = logging.getLogger(__name__)
 default_refresh_interval = 10
 
 
+def _get_cache_pool(cache):
+    # caches registered via Cache.register don't necessarily implement getCachePool
+    get_pool = getattr(cache, "getCachePool", None)
+    return get_pool() if get_pool is not None else None
+
+
 class _CacheMemoryManager(threading.Thread):
     """
     class for the management of cache memory
@@ -72,6 +81,12 @@ class _CacheMemoryManager(threading.Thread):
 
     the interval is measured in seconds. Each change of refresh interval
     triggers cleanup.
+
+    Caches that keep track of their memory usage incrementally report newly
+    stored data via notifyMemoryIncrease(). As soon as the cache memory
+    estimated from the last cleanup and the growth since then exceeds the
+    allowed cache memory, cleanup is triggered immediately instead of at
+    the next refresh.
     """
 
     totalCacheMemory = OrderedSignal()
@@ -97,6 +112,18 @@ class _CacheMemoryManager(threading.Thread):
         # target usage fraction
         self._target_usage = 0.90
 
+        # bookkeeping for cleanup triggered by notifyMemoryIncrease
+        self._usage_lock = threading.Lock()
+        self._last_total = 0
+        self._last_pool_usage = {}
+        self._growth_since_cleanup = 0
+        self._pool_growth_since_cleanup = collections.defaultdict(int)
+        self._cleanup_requested = False
+        self._last_cleanup_time = 0.0
+        # minimum time between two triggered cleanups, in seconds,
+        # in case cleanup can't get below the limit (e.g. memory held by unmanaged caches)
+        self._min_trigger_interval = 1.0
+
         self._stopped = False
         self.start()
         atexit.register(self.stop)
@@ -124,6 +151,14 @@ class _CacheMemoryManager(threading.Thread):
         with self._first_class_caches_lock:
             return list(self._first_class_caches)
 
+    def getCachePoolUsage(self):
+        """
+        get a dict of pool name -> used memory as measured by the last cleanup,
+        caches without a pool are reported under None
+        """
+        with self._usage_lock:
+            return dict(self._last_pool_usage)
+
     def getCaches(self):
         """
         get a list of all caches (including first class caches)
@@ -153,6 +188,35 @@ class _CacheMemoryManager(threading.Thread):
         elif isinstance(cache, ManagedCache):
             self._managed_caches.add(cache)
 
+    def notifyMemoryIncrease(self, nbytes, pool=None):
+        """
+        report that a cache (in the given memory pool) now holds nbytes more memory than before
+
+        This is cheap and can be called whenever a cache stores data, it
+        wakes the cleanup thread if the allowed memory for all caches or for
+        the pool is exceeded.
+        """
+        with self._usage_lock:
+            self._growth_since_cleanup += nbytes
+            self._pool_growth_since_cleanup[pool] += nbytes
+            if self._cleanup_requested or self._disabled:
+                return
+            total_ok = self._last_total + self._growth_since_cleanup <= self._max_usage * Memory.getAvailableRamCaches()
+            pool_memory = Memory.getAvailableRamCachePool(pool)
+            pool_ok = (
+                pool_memory is None
+                or self._last_pool_usage.get(pool, 0) + self._pool_growth_since_cleanup[pool]
+                <= self._max_usage * pool_memory
+            )
+            if total_ok and pool_ok:
+                return
+            if time.time() - self._last_cleanup_time < self._min_trigger_interval:
+                return
+            self._cleanup_requested = True
+
+        with self._condition:
+            self._condition.notify_all()
+
     def run(self):
         """
         main loop
@@ -175,6 +239,7 @@ class _CacheMemoryManager(threading.Thread):
         try:
             # notify subscribed functions about current cache memory
             total = 0
+            pool_usage = collections.defaultdict(int)
 
             # Avoid "RuntimeError: Set changed size during iteration"
             with self._first_class_caches_lock:
@@ -182,10 +247,20 @@ class _CacheMemoryManager(threading.Thread):
 
             for cache in first_class_caches:
                 if isinstance(cache, ObservableCache):
-                    total += cache.usedMemory()
+                    used = cache.usedMemory()
+                    total += used
+                    pool_usage[_get_cache_pool(cache)] += used
             self.totalCacheMemory(total)
             cache = None
 
+            with self._usage_lock:
+                self._last_total = total
+                self._last_pool_usage = dict(pool_usage)
+                self._growth_since_cleanup = 0
+                self._pool_growth_since_cleanup.clear()
+                self._cleanup_requested = False
+                self._last_cleanup_time = time.time()
+
             # check current memory state
             cache_memory = Memory.getAvailableRamCaches()
             cache_pct = 0.0
@@ -200,30 +275,71 @@ class _CacheMemoryManager(threading.Thread):
                     cache_pct,
                 )
             )
+            logger.debug(
+                "Buffer pool holds {} of idle buffers ({})".format(
+                    Memory.format(bufferPool.idleMemory()), bufferPool.stats()
+                )
+            )
+
+            pool_limits = {}
+            for pool in Memory.getCachePools():
+                pool_memory = Memory.getAvailableRamCachePool(pool)
+                if pool_memory is not None:
+                    pool_limits[pool] = pool_memory
+            full_pools = [
+                pool for pool, pool_memory in pool_limits.items() if pool_usage[pool] > self._max_usage * pool_memory
+            ]
 
-            if total <= self._max_usage * cache_memory:
+            if total <= self._max_usage * cache_memory and not full_pools:
                 return
 
+            # idle pooled buffers are cheaper to give up than cached data
+            freed = bufferPool.clear()
+            if freed:
+                logger.debug(f"Dropped idle pooled buffers ({Memory.format(freed)})")
+
             cache_entries = []
             cache_entries += [
-                (cache.lastAccessTime(), cache.name, cache.freeMemory) for cache in list(self._managed_caches)
+                (cache.lastAccessTime(), cache.name, cache.freeMemory, _get_cache_pool(cache))
+                for cache in list(self._managed_caches)
             ]
             cache_entries += [
-                (lastAccessTime, f"{cache.name}: {blockKey}", functools.partial(cache.freeBlock, blockKey))
+                (
+                    lastAccessTime,
+                    f"{cache.name}: {blockKey}",
+                    functools.partial(cache.freeBlock, blockKey),
+                    _get_cache_pool(cache),
+                )
                 for cache in list(self._managed_blocked_caches)
                 for blockKey, lastAccessTime in cache.getBlockAccessTimes()
             ]
+            # caches in pinned pools are never cleaned up
+            cache_entries = [entry for entry in cache_entries if not Memory.isCachePoolPinned(entry[3])]
             cache_entries.sort(key=lambda entry: entry[0])
 
-            for lastAccessTime, info, cleanupFun in cache_entries:
-                if total <= self._target_usage * cache_memory:
-                    break
-                mem = cleanupFun()
-                logger.debug(f"Cleaned up {info} ({Memory.format(mem)})")
-                total -= mem
+            def clean_up(entries, done):
+                nonlocal total
+                for lastAccessTime, info, cleanupFun, pool in entries:
+                    if done():
+                        break
+                    mem = cleanupFun()
+                    logger.debug(f"Cleaned up {info} ({Memory.format(mem)})")
+                    total -= mem
+                    pool_usage[pool] -= mem
+
+            # First bring every pool back to its own budget, then the total back to the budget for all caches.
+            for pool in full_pools:
+                clean_up(
+                    [entry for entry in cache_entries if entry[3] == pool],
+                    lambda: pool_usage[pool] <= self._target_usage * pool_limits[pool],
+                )
+            clean_up(cache_entries, lambda: total <= self._target_usage * cache_memory)
+
+            with self._usage_lock:
+                self._last_total = total
+                self._last_pool_usage = dict(pool_usage)
 
             # Remove references to cache entries before triggering garbage collection.
-            cleanupFun = None
             cache_entries = None
             gc.collect()
 
@@ -236,10 +352,12 @@ class _CacheMemoryManager(threading.Thread):
 
     def _wait(self):
         """
-        sleep for _refresh_interval seconds or until woken up
+        sleep for _refresh_interval seconds or until woken up (or cleanup was requested)
         """
         with self._condition:
-            self._condition.wait(self._refresh_interval)
+            # a cleanup might have been requested while the last one was running
+            if not self._cleanup_requested:
+                self._condition.wait(self._refresh_interval)
 
     def stop(self):
         """
@@ -300,3 +418,11 @@ def addFirstClassCache(cache):
 
 def setRefreshInterval(seconds):
     _cache_memory_manager.setRefreshInterval(seconds)
+
+
+def notifyMemoryIncrease(nbytes, pool=None):
+    _cache_memory_manager.notifyMemoryIncrease(nbytes, pool)
+
+
+def getCachePoolUsage():
+    return _cache_memory_manager.getCachePoolUsage()
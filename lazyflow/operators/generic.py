@@ -338,6 +338,8 @@ class OpSingleChannelSelector(Operator):
     Index = InputSlot()
     Output = OutputSlot()
 
+    executeInline = True
+
     def setupOutputs(self):
         channelAxis = self.Input.meta.axistags.channelIndex
         inshape = list(self.Input.meta.shape)
@@ -415,6 +417,8 @@ class OpSubRegion(Operator):
     Roi = InputSlot()  # value slot. value is a tuple: (start, stop)
     Output = OutputSlot(allow_mask=True)
 
+    executeInline = True
+
     def setupOutputs(self):
         self._roi = self.Roi.value
         assert isinstance(self._roi[0], tuple)
@@ -429,6 +433,8 @@ class OpSubRegion(Operator):
         else:
             self.Output.meta.assignFrom(self.Input.meta)
             self.Output.meta.shape = tuple(stop - start)
+            # Output rois don't have to be shifted if the region starts at the origin
+            self.Output.setPassThrough(None if start.any() else self.Input)
 
     def execute(self, slot, subindex, output_roi, result):
         input_roi = numpy.array((output_roi.start, output_roi.stop))
@@ -801,6 +807,8 @@ class OpDtypeView(Operator):
 
     Output = OutputSlot()
 
+    executeInline = True
+
     def setupOutputs(self):
         self.Output.meta.assignFrom(self.Input.meta)
         self.Output.meta.dtype = self.OutputDtype.value
@@ -1,5 +1,3 @@
-from __future__ import absolute_import
-
 ###############################################################################
 #   lazyflow: data flow based lazy parallel computation framework
 #
@@ -21,45 +19,47 @@ from __future__ import absolute_import
 # This information is also available on the ilastik web site at:
 # 		   http://ilastik.org/license/
 ###############################################################################
-from .ioOperators import OpImageReader, OpStackLoader, OpStackWriter, OpStackToH5Writer, OpH5N5WriterBigDataset
-
-# All "Read" operators must come before OpInputDataReader, which uses them.
-from .opStreamingMmfReader import OpStreamingMmfReader
-from .opStreamingUfmfReader import OpStreamingUfmfReader
-from .opRawBinaryFileReader import OpRawBinaryFileReader
-from .opNpyFileReader import OpNpyFileReader
-from .opStreamingH5N5Reader import OpStreamingH5N5Reader
-from .opStreamingH5N5SequenceReaderS import OpStreamingH5N5SequenceReaderS
-from .opStreamingH5N5SequenceReaderM import OpStreamingH5N5SequenceReaderM
-from .opBlockwiseFilesetReader import OpBlockwiseFilesetReader
-from .opRESTfulBlockwiseFilesetReader import OpRESTfulBlockwiseFilesetReader
-from .opTiledVolumeReader import OpTiledVolumeReader
-from .opCachedTiledVolumeReader import OpCachedTiledVolumeReader
-from .opKlbReader import OpKlbReader
-from .opTiffReader import OpTiffReader
-from .opTiffSequenceReader import OpTiffSequenceReader
-from .opRESTfulPrecomputedChunkedVolumeReader import OpRESTfulPrecomputedChunkedVolumeReader
-
-# Try to import the dvid-related operator.
-# If it fails, that's okay.
-try:
-    from .opDvidVolume import OpDvidVolume
-    from .opDvidRoi import OpDvidRoi
-    from .opExportDvidVolume import OpExportDvidVolume
-except ImportError as ex:
-    # If the exception was not related to libdvid, then re-raise it.
-    if "libdvid" not in ex.args[0]:
-        raise
-
-from .opInputDataReader import *
-
-from .opNpyWriter import OpNpyWriter
-from .opExport2DImage import OpExport2DImage
-from .opExportMultipageTiff import OpExportMultipageTiff
-from .opExportMultipageTiffSequence import OpExportMultipageTiffSequence
-from .opExportToArray import OpExportToArray
-from .opExportSlot import OpExportSlot
-from .opFormattedDataExport import OpFormattedDataExport
+from lazyflow.utility.lazyImport import lazy_attributes
 
-from .hdf5SerializerKnime import *
-from .opExportToKnime import OpExportToKnime
+# Readers and writers are imported on first access, see lazyflow.operators.
+# The dvid operators require libdvid: importing them raises an ImportError if it isn't installed.
+__getattr__, __dir__, __all__ = lazy_attributes(
+    __name__,
+    {
+        "OpImageReader": ".ioOperators",
+        "OpStackLoader": ".ioOperators",
+        "OpStackWriter": ".ioOperators",
+        "OpStackToH5Writer": ".ioOperators",
+        "OpH5N5WriterBigDataset": ".ioOperators",
+        "OpStreamingMmfReader": ".opStreamingMmfReader",
+        "OpStreamingUfmfReader": ".opStreamingUfmfReader",
+        "OpRawBinaryFileReader": ".opRawBinaryFileReader",
+        "OpNpyFileReader": ".opNpyFileReader",
+        "OpStreamingH5N5Reader": ".opStreamingH5N5Reader",
+        "OpStreamingH5N5SequenceReaderS": ".opStreamingH5N5SequenceReaderS",
+        "OpStreamingH5N5SequenceReaderM": ".opStreamingH5N5SequenceReaderM",
+        "OpBlockwiseFilesetReader": ".opBlockwiseFilesetReader",
+        "OpRESTfulBlockwiseFilesetReader": ".opRESTfulBlockwiseFilesetReader",
+        "OpTiledVolumeReader": ".opTiledVolumeReader",
+        "OpCachedTiledVolumeReader": ".opCachedTiledVolumeReader",
+        "OpKlbReader": ".opKlbReader",
+        "OpTiffReader": ".opTiffReader",
+        "OpTiffSequenceReader": ".opTiffSequenceReader",
+        "OpRESTfulPrecomputedChunkedVolumeReader": ".opRESTfulPrecomputedChunkedVolumeReader",
+        "OpBigTiffReader": ".opBigTiffReader",
+        "OpDvidVolume": ".opDvidVolume",
+        "OpDvidRoi": ".opDvidRoi",
+        "OpExportDvidVolume": ".opExportDvidVolume",
+        "OpInputDataReader": ".opInputDataReader",
+        "OpNpyWriter": ".opNpyWriter",
+        "OpExport2DImage": ".opExport2DImage",
+        "OpExportMultipageTiff": ".opExportMultipageTiff",
+        "OpExportMultipageTiffSequence": ".opExportMultipageTiffSequence",
+        "OpExportToArray": ".opExportToArray",
+        "OpExportSlot": ".opExportSlot",
+        "OpFormattedDataExport": ".opFormattedDataExport",
+        "write_numpy_structured_array_to_HDF5": ".hdf5SerializerKnime",
+        "read_numpy_structured_array_from_HDF5": ".hdf5SerializerKnime",
+        "OpExportToKnime": ".opExportToKnime",
+    },
+)
@@ -659,7 +659,9 @@ class OpH5N5WriterBigDataset(Operator):
         batch_size = None
         if self.BatchSize.ready():
             batch_size = self.BatchSize.value
-        requester = BigRequestStreamer(self.Image, roiFromShape(self.Image.meta.shape), batchSize=batch_size)
+        requester = BigRequestStreamer(
+            self.Image, roiFromShape(self.Image.meta.shape), batchSize=batch_size, alignment=self.d.chunks
+        )
         requester.resultSignal.subscribe(handle_block_result)
         requester.progressSignal.subscribe(self.progressSignal)
         requester.execute()
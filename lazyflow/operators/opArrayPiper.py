@@ -32,9 +32,14 @@ class OpArrayPiper(Operator):
     # Outputs
     Output = OutputSlot(allow_mask=True)
 
+    executeInline = True
+
     def setupOutputs(self):
         inputSlot = self.inputs["Input"]
         self.outputs["Output"].meta.assignFrom(inputSlot.meta)
+        # Subclasses that override execute() can't skip it
+        if type(self).execute is OpArrayPiper.execute:
+            self.Output.setPassThrough(self.Input)
 
     def execute(self, slot, subindex, roi, result):
         key = roi.toSlice()
@@ -26,6 +26,7 @@ import copy
 
 from lazyflow.graph import Operator, InputSlot, OutputSlot
 from lazyflow.utility import RamMeasurementContext
+from lazyflow.utility.compression import DEFAULT_CODEC
 
 from .opCacheFixer import OpCacheFixer
 from .opCache import ManagedBlockedCache
@@ -49,6 +50,7 @@ class OpBlockedArrayCache(Operator, ManagedBlockedCache):
     # If not provided, will be set to Input.meta.shape
     BypassModeEnabled = InputSlot(value=False)
     CompressionEnabled = InputSlot(value=False)
+    CompressionCodec = InputSlot(value=DEFAULT_CODEC)
 
     Output = OutputSlot(allow_mask=True)
     CleanBlocks = OutputSlot()  # A list of slicings indicating which blocks are stored in the cache and clean.
@@ -74,6 +76,7 @@ class OpBlockedArrayCache(Operator, ManagedBlockedCache):
 
         self._opSimpleBlockedArrayCache = OpSimpleBlockedArrayCache(parent=self)
         self._opSimpleBlockedArrayCache.CompressionEnabled.connect(self.CompressionEnabled)
+        self._opSimpleBlockedArrayCache.CompressionCodec.connect(self.CompressionCodec)
         self._opSimpleBlockedArrayCache.Input.connect(self._opCacheFixer.Output)
         self._opSimpleBlockedArrayCache.BlockShape.connect(self.BlockShape)
         self._opSimpleBlockedArrayCache.BypassModeEnabled.connect(self.BypassModeEnabled)
@@ -62,6 +62,25 @@ class Cache(with_metaclass(ABCMeta, object)):
         else:
             manager.addCache(self)
 
+    def setCachePool(self, pool):
+        """
+        assign this cache (and all caches below it) to a named memory pool,
+        see lazyflow.utility.Memory.setCachePool
+        """
+        self._cache_pool = pool
+
+    def getCachePool(self):
+        """
+        get the memory pool of this cache, which is inherited from its parents if it wasn't set
+        """
+        op = self
+        while op is not None:
+            pool = getattr(op, "_cache_pool", None)
+            if pool is not None:
+                return pool
+            op = getattr(op, "parent", None)
+        return None
+
     def generateReport(self, memInfoNode):
         rs = []
         for child in self.children:
@@ -74,6 +93,7 @@ class Cache(with_metaclass(ABCMeta, object)):
         memInfoNode.type = type(self)
         memInfoNode.id = id(self)
         memInfoNode.name = self.name
+        memInfoNode.pool = self.getCachePool()
 
 
 class ObservableCache(Cache):
@@ -232,6 +252,9 @@ class MemInfoNode(object):
     # operator name
     name = None
 
+    # name of the memory pool the cache belongs to (None if not assigned)
+    pool = None
+
     # additional info set by cache implementation
     info = None
 
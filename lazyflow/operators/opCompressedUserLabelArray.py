@@ -43,6 +43,7 @@ from lazyflow.roi import (
     roiFromShape,
 )
 from lazyflow.operators.opCompressedCache import OpUnmanagedCompressedCache
+from lazyflow.request import RequestLock
 from lazyflow.rtype import SubRegion
 
 logger = logging.getLogger(__name__)
@@ -84,6 +85,9 @@ class OpCompressedUserLabelArray(OpUnmanagedCompressedCache):
     def __init__(self, *args, **kwargs):
         self._blockshape = None
         self._label_to_purge = 0
+        # key -> function that returns the (slicing, data) pairs to write, see deferInput()
+        self._deferred_inputs = collections.OrderedDict()
+        self._deferred_lock = RequestLock()
         super(OpCompressedUserLabelArray, self).__init__(*args, **kwargs)
 
         # ignoring the ideal chunk shape is ok because we use the input only
@@ -100,6 +104,37 @@ class OpCompressedUserLabelArray(OpUnmanagedCompressedCache):
     def mergeLabels(self, from_label, into_label):
         self._purge_label(from_label, True, into_label)
 
+    def deferInput(self, key, rois, load):
+        """
+        Register label data that is only written into the array (as if by setInSlot) once it is needed,
+        i.e. when an output is requested or new labels are written.
+        The given rois are marked dirty right away, as if the data was written.
+
+        :param key: identifies the data, a pending load with the same key is replaced
+        :param rois: list of (start, stop) that the data will be written to
+        :param load: function that returns an iterable of (slicing, data) pairs to write
+        """
+        with self._deferred_lock:
+            self._deferred_inputs.pop(key, None)
+            self._deferred_inputs[key] = load
+        for roi in rois:
+            self.Output.setDirty(*roi)
+
+    def loadDeferredInput(self):
+        """
+        Write all data registered with deferInput() into the array.
+        """
+        if not self._deferred_inputs:
+            return
+        with self._deferred_lock:
+            while self._deferred_inputs:
+                key, load = next(iter(self._deferred_inputs.items()))
+                for slicing, data in load():
+                    roi = SubRegion(self.Input, pslice=slicing)
+                    self._setInSlotInput(self.Input, (), roi, data, notify=False)
+                # Only forget the load once it succeeded, so that it is retried otherwise.
+                del self._deferred_inputs[key]
+
     def setupOutputs(self):
         # Due to a temporary naming clash, pass our subclass blockshape to the superclass
         # TODO: Fix this by renaming the BlockShape slots to be consistent.
@@ -131,6 +166,7 @@ class OpCompressedUserLabelArray(OpUnmanagedCompressedCache):
         if self._blockshape is None:
             self._blockshape = numpy.minimum(self.BlockShape.value, self.Output.meta.shape)
         elif self.blockShape.value != self._blockshape:
+            self.loadDeferredInput()
             nonzero_blocks_destination = [None]
             self._execute_nonzeroBlocks(nonzero_blocks_destination)
             nonzero_blocks = nonzero_blocks_destination[0]
@@ -194,6 +230,7 @@ class OpCompressedUserLabelArray(OpUnmanagedCompressedCache):
             self.Output.setDirty(*block_roi)
 
     def execute(self, slot, subindex, roi, destination):
+        self.loadDeferredInput()
         if slot == self.Output:
             self._executeOutput(roi, destination)
         elif slot == self.nonzeroBlocks:
@@ -390,13 +427,14 @@ class OpCompressedUserLabelArray(OpUnmanagedCompressedCache):
         pass
 
     def setInSlot(self, slot, subindex, roi, new_pixels):
+        self.loadDeferredInput()
         if slot is self.Input:
             self._setInSlotInput(slot, subindex, roi, new_pixels)
         else:
             # We don't yet support the InputHdf5 slot in this function.
             assert False, "Unsupported slot for setInSlot: {}".format(slot.name)
 
-    def _setInSlotInput(self, slot, subindex, roi, new_pixels):
+    def _setInSlotInput(self, slot, subindex, roi, new_pixels, notify=True):
         """
         Since this is a label array, inserting pixels has a special meaning:
         We only overwrite the new non-zero pixels. In the new data, zeros mean "don't change".
@@ -408,6 +446,8 @@ class OpCompressedUserLabelArray(OpUnmanagedCompressedCache):
         ...
         N: change to N
         eraser_magic_value: change to 0
+
+        If notify is False, no dirty notifications are sent for the changed blocks.
         """
         if isinstance(new_pixels, vigra.VigraArray):
             new_pixels = new_pixels.view(numpy.ndarray)
@@ -430,7 +470,7 @@ class OpCompressedUserLabelArray(OpUnmanagedCompressedCache):
 
             # Extract the data to modify
             original_block_data = self.Output.stype.allocateDestination(block_slot_roi)
-            self.execute(self.Output, (), block_slot_roi, original_block_data)
+            self._executeOutput(block_slot_roi, original_block_data)
 
             # Reset the pixels we need to change (so we can use |= below)
             original_block_data[new_block_pixels.nonzero()] = 0
@@ -458,7 +498,8 @@ class OpCompressedUserLabelArray(OpUnmanagedCompressedCache):
             # During project import, this is slightly worse.
             # But during label import from disk, this is very important.a
             # FIXME: Shouldn't this notification be triggered from within OpUnmanagedCompressedCache?
-            self.Output.setDirty(*block_roi)
+            if notify:
+                self.Output.setDirty(*block_roi)
 
         return max_label  # Internal use: Return max label
 
@@ -469,6 +510,7 @@ class OpCompressedUserLabelArray(OpUnmanagedCompressedCache):
 
         Returns: the max label found in the slot.
         """
+        self.loadDeferredInput()
         assert self._blockshape is not None
         assert self.Output.meta.shape[:-1] == slot.meta.shape[:-1], "{} != {}".format(
             self.Output.meta.shape, slot.meta.shape
@@ -34,9 +34,13 @@ import pickle as pickle
 import tempfile
 from threading import Lock as ThreadLock
 import re
+import time
+import weakref
 
 
 from lazyflow.graph import Operator, InputSlot, OutputSlot
+from lazyflow.operators import cacheMemoryManager
+from lazyflow.operators.opCache import ManagedBlockedCache
 from lazyflow.stype import Opaque
 from lazyflow.rtype import SubRegion
 from lazyflow.request import Request, RequestPool
@@ -65,9 +69,12 @@ _defaultBinSize = 30
 ############################
 
 
-class OpDetectMissing(Operator):
+class OpDetectMissing(Operator, ManagedBlockedCache):
     """
     Sub-Operator for detection of missing image content
+
+    The patch predictions of each detected slice are cached, the slices are the blocks
+    that the cache memory manager frees when memory runs low.
     """
 
     InputVolume = InputSlot()
@@ -86,6 +93,8 @@ class OpDetectMissing(Operator):
 
     ### PRIVATE class attributes ###
     _manager = None
+    # incremented whenever the (global) detectors change
+    _detectorGeneration = 0
 
     ### PRIVATE attributes ###
     _inputRange = (0, 255)
@@ -100,11 +109,32 @@ class OpDetectMissing(Operator):
 
     def __init__(self, *args, **kwargs):
         super(OpDetectMissing, self).__init__(*args, **kwargs)
+        self._sliceCacheLock = ThreadLock()
+        self._resetSliceCache()
         self.TrainingHistograms.setValue(_defaultTrainingHistograms())
 
+        # Now that we're initialized, it's safe to register with the memory manager
+        self.registerWithMemoryManager()
+
     def propagateDirty(self, slot, subindex, roi):
         if slot == self.InputVolume:
+            axes = self.InputVolume.meta.getAxisKeys()
+            ranges = {a: (start, stop) for a, start, stop in zip(axes, roi.start, roi.stop)}
+            t, c, z = (ranges.get(a, (0, 1)) for a in "tcz")
+            with self._sliceCacheLock:
+                dirty_keys = [
+                    key
+                    for key in self._sliceCache
+                    if t[0] <= key[0] < t[1] and c[0] <= key[1] < c[1] and z[0] <= key[-1] < z[1]
+                ]
+            for key in dirty_keys:
+                self.freeBlock(key)
             self.Output.setDirty(roi)
+        else:
+            self._resetSliceCache()
+
+        if slot == self.DetectionMethod:
+            self.Output.setDirty()
 
         if slot == self.TrainingHistograms:
             OpDetectMissing._needsTraining = True
@@ -136,6 +166,8 @@ class OpDetectMissing(Operator):
 
         self.Detector.meta.shape = (1,)
 
+        self._resetSliceCache()
+
     def execute(self, slot, subindex, roi, result):
 
         if slot == self.Detector:
@@ -154,18 +186,27 @@ class OpDetectMissing(Operator):
         data = self.InputVolume.get(roi).wait()
         dataZYXCT = vigra.taggedView(data, self.InputVolume.meta.axistags).withAxes(*"zyxct")
 
+        # position of the data, for the slice cache
+        start = dict(zip(self.InputVolume.meta.getAxisKeys(), roi.start))
+        stop = dict(zip(self.InputVolume.meta.getAxisKeys(), roi.stop))
+        yx = (start.get("y", 0), stop.get("y", 1), start.get("x", 0), stop.get("x", 1))
+
         # walk over time and channel axes
         for t in range(dataZYXCT.shape[4]):
             for c in range(dataZYXCT.shape[3]):
-                resultZYXCT[..., c, t] = self._detectMissing(dataZYXCT[..., c, t])
+                resultZYXCT[..., c, t] = self._detectMissing(
+                    dataZYXCT[..., c, t], (start.get("t", 0) + t, start.get("c", 0) + c) + yx, start.get("z", 0)
+                )
 
         return result
 
-    def _detectMissing(self, data):
+    def _detectMissing(self, data, sliceKey=None, zOffset=0):
         """
         detects missing regions and labels each missing region with 1
         :param data: 3d data with axistags 'zyx'
         :type data: array-like
+        :param sliceKey: (t, c, y and x roi) of the data, the detection results for each slice are cached under
+                         this key (and the z position of the slice, zOffset + z), None disables the cache
         """
 
         assert (
@@ -186,25 +227,89 @@ class OpDetectMissing(Operator):
             raise ValueError("HaloSize must be a non-negative integer")
 
         maxZ = data.shape[0]
+        (_, slices) = _patchBounds(data.shape[1:], patchSize, haloSize)
+
+        def detectSlice(z):
+            key = None if sliceKey is None else sliceKey + (zOffset + z,)
+            generation = OpDetectMissing._detectorGeneration
+            with self._sliceCacheLock:
+                cached = self._sliceCache.get(key)
+                if cached is not None:
+                    self._sliceAccessTimes[key] = time.time()
+            if cached is not None and cached[0] == generation:
+                pred = cached[1]
+            else:
+                (hists, _) = _patchHistograms(
+                    data[z, :, :].view(np.ndarray), patchSize, haloSize, self.NHistogramBins.value, self._inputRange
+                )
+                pred = self.predict(hists, method=self.DetectionMethod.value)
+                if key is not None:
+                    self._storeSlice(key, generation, pred)
+
+            for i in np.flatnonzero(pred > 0):
+                # patch is classified as missing
+                result[z, slices[i][0], slices[i][1]] |= 1
 
         # walk over slices
+        pool = RequestPool()
         for z in range(maxZ):
-            patches, slices = _patchify(data[z, :, :], patchSize, haloSize)
-            hists = []
-            # walk over patches
-            for patch in patches:
-                (hist, _) = np.histogram(patch, bins=self.NHistogramBins.value, range=self._inputRange, density=True)
-                hists.append(hist)
-            hists = np.vstack(hists)
-
-            pred = self.predict(hists, method=self.DetectionMethod.value)
-            for i, p in enumerate(pred):
-                if p > 0:
-                    # patch is classified as missing
-                    result[z, slices[i][0], slices[i][1]] |= 1
+            pool.add(Request(partial(detectSlice, z)))
+        pool.wait()
+        pool.clean()
 
         return result
 
+    def _storeSlice(self, key, generation, pred):
+        with self._sliceCacheLock:
+            nbytes = pred.nbytes
+            replaced = self._sliceCache.get(key)
+            if replaced is not None:
+                nbytes -= replaced[1].nbytes
+            self._sliceCache[key] = (generation, pred)
+            self._usedMemory += nbytes
+            self._sliceAccessTimes[key] = time.time()
+
+        if nbytes > 0:
+            cacheMemoryManager.notifyMemoryIncrease(nbytes, self.getCachePool())
+
+    def _resetSliceCache(self):
+        with self._sliceCacheLock:
+            # (t, c, y and x roi, z) -> (detector generation, patch predictions) of the slices detected so far
+            self._sliceCache = {}
+            self._sliceAccessTimes = {}
+            self._usedMemory = 0
+
+    ##
+    ## ManagedBlockedCache interface implementation
+    ##
+    def usedMemory(self):
+        return self._usedMemory
+
+    def fractionOfUsedMemoryDirty(self):
+        # dirty slices are discarded immediately
+        return 0.0
+
+    def getBlockAccessTimes(self):
+        with self._sliceCacheLock:
+            return list(self._sliceAccessTimes.items())
+
+    def freeBlock(self, key):
+        with self._sliceCacheLock:
+            self._sliceAccessTimes.pop(key, None)
+            cached = self._sliceCache.pop(key, None)
+            if cached is None:
+                return 0
+            self._usedMemory -= cached[1].nbytes
+            return cached[1].nbytes
+
+    def freeMemory(self):
+        used = self.usedMemory()
+        self._resetSliceCache()
+        return used
+
+    def freeDirtyMemory(self):
+        return 0
+
     def train(self, force=False):
         """
         trains with samples drawn from slot TrainingHistograms
@@ -385,10 +490,9 @@ class OpDetectMissing(Operator):
         labels = [0] * len(negative) + [1] * len(positive)
         samples = np.vstack((negative, positive))
 
-        svm = SVC(C=1000, kernel=_histogramIntersectionKernel)
-
-        svm.fit(samples, labels)
+        svm = _fitIntersectionKernelSVC(samples, labels)
         cls._manager.add(svm, nBins, overwrite=True)
+        OpDetectMissing._detectorGeneration += 1
 
     @classmethod
     def predict(cls, X, method="classic"):
@@ -408,7 +512,7 @@ class OpDetectMissing(Operator):
             svm = PseudoSVC()
         else:
             try:
-                svm = cls._manager.get(nBins)
+                svm = _fastSVC(cls._manager.get(nBins))
             except SVMManager.NotTrainedError:
                 # fail gracefully if not trained => responsibility of user!
                 svm = PseudoSVC()
@@ -450,6 +554,7 @@ class OpDetectMissing(Operator):
     @classmethod
     def reset(cls):
         cls._manager = SVMManager()
+        OpDetectMissing._detectorGeneration += 1
         logger.debug("Reset all detectors.")
 
     @classmethod
@@ -473,6 +578,7 @@ class OpDetectMissing(Operator):
                 logger.error("Failed overloading detector due to an error: {}".format(str(err)))
                 return
             cls._manager.overload(d)
+            OpDetectMissing._detectorGeneration += 1
             logger.debug("Loaded detector: {}".format(str(cls._manager)))
 
 
@@ -499,11 +605,8 @@ class PseudoSVC(object):
         pass
 
     def predict(self, *args, **kwargs):
-        X = args[0]
-        out = np.zeros(len(X))
-        for k, patch in enumerate(X):
-            out[k] = 1 if np.all(patch[1:] == 0) else 0
-        return out
+        X = np.asarray(args[0])
+        return np.all(X[:, 1:] == 0, axis=1).astype(np.float64)
 
 
 class SVMManager(object):
@@ -564,56 +667,215 @@ def _chooseRandomSubset(data, n):
     return (data[choice[:n]], choice[:n], data[choice[n:]], choice[n:])
 
 
-def _patchify(data, patchSize, haloSize):
+def _patchBounds(shape, patchSize, haloSize):
     """
-    data must be 2D y-x
+    shape must be 2D y-x
 
-    returns (patches, slices)
+    returns (bounds, slices), bounds are (top, bottom, left, right) of the patches including their halo,
+    slices are the (y, x) slices of the patches without halo
     """
 
-    patches = []
+    bounds = []
     slices = []
-    nPatchesX = data.shape[1] // patchSize + (1 if data.shape[1] % patchSize > 0 else 0)
-    nPatchesY = data.shape[0] // patchSize + (1 if data.shape[0] % patchSize > 0 else 0)
+    nPatchesX = shape[1] // patchSize + (1 if shape[1] % patchSize > 0 else 0)
+    nPatchesY = shape[0] // patchSize + (1 if shape[0] % patchSize > 0 else 0)
 
     for y in range(nPatchesY):
         for x in range(nPatchesX):
-            right = min((x + 1) * patchSize + haloSize, data.shape[1])
-            bottom = min((y + 1) * patchSize + haloSize, data.shape[0])
+            right = min((x + 1) * patchSize + haloSize, shape[1])
+            bottom = min((y + 1) * patchSize + haloSize, shape[0])
 
-            rightIsIncomplete = (x + 1) * patchSize > data.shape[1]
-            bottomIsIncomplete = (y + 1) * patchSize > data.shape[0]
+            rightIsIncomplete = (x + 1) * patchSize > shape[1]
+            bottomIsIncomplete = (y + 1) * patchSize > shape[0]
 
             left = max(x * patchSize - haloSize, 0) if not rightIsIncomplete else max(0, right - patchSize - haloSize)
             top = max(y * patchSize - haloSize, 0) if not bottomIsIncomplete else max(0, bottom - patchSize - haloSize)
 
-            patches.append(data[top:bottom, left:right])
+            bounds.append((top, bottom, left, right))
 
             if rightIsIncomplete:
-                horzSlice = slice(max(data.shape[1] - patchSize, 0), data.shape[1])
+                horzSlice = slice(max(shape[1] - patchSize, 0), shape[1])
             else:
                 horzSlice = slice(patchSize * x, patchSize * (x + 1))
 
             if bottomIsIncomplete:
-                vertSlice = slice(max(data.shape[0] - patchSize, 0), data.shape[0])
+                vertSlice = slice(max(shape[0] - patchSize, 0), shape[0])
             else:
                 vertSlice = slice(patchSize * y, patchSize * (y + 1))
 
             slices.append((vertSlice, horzSlice))
 
+    return (bounds, slices)
+
+
+def _patchify(data, patchSize, haloSize):
+    """
+    data must be 2D y-x
+
+    returns (patches, slices)
+    """
+
+    (bounds, slices) = _patchBounds(data.shape, patchSize, haloSize)
+    patches = [data[top:bottom, left:right] for (top, bottom, left, right) in bounds]
     return (patches, slices)
 
 
+def _binIndices(data, nBins, intRange):
+    """
+    the histogram bin of each value in data, as np.histogram(data, bins=nBins, range=intRange) chooses it
+    (values outside of the range, which np.histogram ignores, get bin nBins)
+    """
+
+    edges = np.linspace(intRange[0], intRange[1], nBins + 1)
+
+    def binOf(values):
+        indices = np.searchsorted(edges, values, side="right") - 1
+        # the last bin includes its right edge
+        indices[values == edges[-1]] = nBins - 1
+        indices[(values < edges[0]) | (values > edges[-1])] = nBins
+        return indices
+
+    data = np.asarray(data)
+    if data.dtype in (np.uint8, np.uint16):
+        # look up the bins of all possible values, instead of searching the bin of each pixel
+        return binOf(np.arange(np.iinfo(data.dtype).max + 1))[data]
+    return binOf(data)
+
+
+def _normalizeHistograms(counts, nBins, intRange):
+    """
+    counts -> densities, as np.histogram(..., density=True) computes them
+    """
+
+    db = np.diff(np.linspace(intRange[0], intRange[1], nBins + 1))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return counts / db / counts.sum(axis=1, keepdims=True)
+
+
+def _patchHistograms(data, patchSize, haloSize, nBins, intRange):
+    """
+    histograms of all patches of a 2D y-x slice (as _patchify cuts them) at once
+
+    The patch borders cut the slice into cells.  The histograms of all cells are counted in a
+    single pass over the slice, and each patch histogram is summed from a summed-area table
+    of the cell histograms.
+
+    returns (histograms, slices)
+    """
+
+    (bounds, slices) = _patchBounds(data.shape, patchSize, haloSize)
+    bounds = np.array(bounds)
+
+    yEdges = np.union1d(bounds[:, :2], [0, data.shape[0]])
+    xEdges = np.union1d(bounds[:, 2:], [0, data.shape[1]])
+    cellY = np.searchsorted(yEdges, np.arange(data.shape[0]), side="right") - 1
+    cellX = np.searchsorted(xEdges, np.arange(data.shape[1]), side="right") - 1
+
+    cells = (cellY[:, np.newaxis] * len(xEdges) + cellX[np.newaxis, :]) * (nBins + 1)
+    cells += _binIndices(data, nBins, intRange)
+    counts = np.bincount(cells.ravel(), minlength=len(yEdges) * len(xEdges) * (nBins + 1))
+    counts = counts.reshape((len(yEdges), len(xEdges), nBins + 1))[..., :nBins]
+
+    # table[i, j] holds the counts of all pixels above yEdges[i] and left of xEdges[j]
+    table = np.zeros((len(yEdges) + 1, len(xEdges) + 1, nBins), dtype=np.int64)
+    table[1:, 1:] = counts.cumsum(axis=0).cumsum(axis=1)
+
+    top, bottom = np.searchsorted(yEdges, bounds[:, 0]), np.searchsorted(yEdges, bounds[:, 1])
+    left, right = np.searchsorted(xEdges, bounds[:, 2]), np.searchsorted(xEdges, bounds[:, 3])
+    hists = table[bottom, right] - table[top, right] - table[bottom, left] + table[top, left]
+
+    return (_normalizeHistograms(hists, nBins, intRange), slices)
+
+
 def _histogramIntersectionKernel(X, Y):
     """
     implements the histogram intersection kernel in a fancy way
     (standard: k(x,y) = sum(min(x_i,y_i)) )
     """
 
-    A = X.reshape((X.shape[0], 1, X.shape[1]))
-    B = Y.reshape((1,) + Y.shape)
+    # bin by bin, so that memory stays at len(X) x len(Y)
+    K = np.zeros((X.shape[0], Y.shape[0]))
+    for i in range(X.shape[1]):
+        K += np.minimum.outer(X[:, i], Y[:, i])
+    return K
+
+
+def _fitIntersectionKernelSVC(samples, labels):
+    """
+    train a histogram intersection kernel SVM
+
+    With a callable kernel, the SVC does not keep its support vectors (support_vectors_ is empty),
+    they are stored as supportHistograms for _fastSVC.
+    """
+    svm = SVC(C=1000, kernel=_histogramIntersectionKernel)
+    svm.fit(samples, labels)
+    svm.supportHistograms = np.asarray(samples, dtype=np.float64)[svm.support_]
+    return svm
+
+
+class _IntersectionKernelSVC(object):
+    """
+    fast (and exact) prediction for a trained histogram intersection kernel SVM, see
+    MAJI ET AL.: CLASSIFICATION USING INTERSECTION KERNEL SUPPORT VECTOR MACHINES IS EFFICIENT, CVPR 2008
+
+    The decision function sum_i(alpha_i * sum_b(min(x_b, s_ib))) is a sum of piecewise linear functions
+    of the single bins x_b, which are evaluated by a binary search in the sorted support vectors of each bin,
+    instead of computing the kernel with every support vector.
+    """
+
+    def __init__(self, svm, supportVectors):
+        """
+        :param svm: trained binary SVC
+        :param supportVectors: training samples of the support vectors, in the order of svm.support_
+        """
+        self.classes = svm.classes_
+        self.intercept = svm.intercept_[0]
+        alpha = np.asarray(svm.dual_coef_).ravel()
+        supportVectors = np.asarray(supportVectors, dtype=np.float64)
+        assert supportVectors.shape[0] == len(alpha), "Need one support vector per dual coefficient."
+
+        order = np.argsort(supportVectors, axis=0)
+        self.values = np.take_along_axis(supportVectors, order, axis=0)
+        sortedAlpha = alpha[order]
+        nBins = supportVectors.shape[1]
+
+        # sum of alpha_i * s_ib over the j smallest s_ib, and sum of alpha_i over the others
+        self.lowerSums = np.vstack((np.zeros((1, nBins)), np.cumsum(sortedAlpha * self.values, axis=0)))
+        self.upperAlphas = np.vstack((np.cumsum(sortedAlpha[::-1], axis=0)[::-1], np.zeros((1, nBins))))
+
+    def decision_function(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        total = np.full(len(X), self.intercept, dtype=np.float64)
+        for b in range(X.shape[1]):
+            j = np.searchsorted(self.values[:, b], X[:, b])
+            total += self.lowerSums[j, b] + X[:, b] * self.upperAlphas[j, b]
+        return total
 
-    return np.sum(np.minimum(A, B), axis=2)
+    def predict(self, X):
+        return self.classes[(self.decision_function(X) > 0).astype(int)]
+
+
+_intersectionKernelSVCs = weakref.WeakKeyDictionary()
+_intersectionKernelSVCsLock = ThreadLock()
+
+
+def _fastSVC(svm):
+    """
+    the fast equivalent of svm, if there is one
+    (detectors trained before the support histograms were stored are used as they are)
+    """
+
+    if (
+        getattr(svm, "kernel", None) is not _histogramIntersectionKernel
+        or len(getattr(svm, "classes_", ())) != 2
+        or getattr(svm, "supportHistograms", None) is None
+    ):
+        return svm
+    with _intersectionKernelSVCsLock:
+        fast = _intersectionKernelSVCs.get(svm)
+        if fast is None:
+            fast = _intersectionKernelSVCs[svm] = _IntersectionKernelSVC(svm, svm.supportHistograms)
+    return fast
 
 
 def _defaultTrainingHistograms():
@@ -652,28 +914,12 @@ def extractHistograms(volume, labels, patchSize=64, haloSize=0, nBins=30, intRan
         0       ignore
         1       positive
         2       negative
-     - histogram extraction is attempted to be done in parallel
+     - histogram extraction is done in parallel for the slices
      - patches that intersect with the volume border are discarded
      - volume and labels must be 3d, and in order 'zyx' (if not VigraArrays)
      - returns: np.ndarray, shape: (nSamples,nBins+1), last column is the label
     """
 
-    # progress reporter class, histogram extraction can take quite a long time
-    class ProgressReporter(object):
-
-        lock = None
-
-        def __init__(self, nThreads):
-            self.lock = ThreadLock()
-            self.nThreads = nThreads
-            self.status = np.zeros((nThreads,))
-
-        def report(self, index):
-            self.lock.acquire()
-            self.status[index] = 1
-            logger.debug("Finished threads: %d/%d." % (self.status.sum(), len(self.status)))
-            self.lock.release()
-
     # sanity checks
     assert len(volume.shape) == 3, "Volume must be 3d data"
     assert volume.shape == labels.shape, "Volume and labels must have the same shape"
@@ -692,71 +938,56 @@ def extractHistograms(volume, labels, patchSize=64, haloSize=0, nBins=30, intRan
 
     # fill list of patch centers (VigraArray does not support bitwise_or)
     ind_z, ind_y, ind_x = np.where((labelsZYX == 1).view(np.ndarray) | (labelsZYX == 2).view(np.ndarray))
-    index = np.arange(len(ind_z))
-
-    # prepare chunking of histogram centers
-    chunkSize = 10000  # FIXME magic number??
-    nChunks = len(index) // chunkSize + (1 if len(index) % chunkSize > 0 else 0)
-    sliceList = [slice(k * chunkSize, min((k + 1) * chunkSize, len(index))) for k in range(nChunks)]
-    histoList = [None] * nChunks
-
-    # prepare subroutine for parallel extraction
-    reporter = ProgressReporter(nChunks)
-
-    # BEGIN subroutine
-    def _extractHistogramsSub(itemList):
-
-        xs = ind_x[itemList]
-        ys = ind_y[itemList]
-        zs = ind_z[itemList]
 
-        ymin = ys - patchSize // 2
-        ymax = ymin + patchSize
-
-        xmin = xs - patchSize // 2
-        xmax = xmin + patchSize
-
-        validPatchIndices = np.where(
-            np.all((ymin >= 0, xmin >= 0, xmax <= volumeZYX.shape[2], ymax <= volumeZYX.shape[1]), axis=0)
-        )[0]
-
-        if appendPositions:
-            out = np.zeros((len(validPatchIndices), nBins + 4))
-        else:
-            out = np.zeros((len(validPatchIndices), nBins + 1))
-
-        for k, patchInd in enumerate(validPatchIndices):
-            x = xs[patchInd]
-            y = ys[patchInd]
-            z = zs[patchInd]
-
-            vol = volumeZYX[z, ymin[patchInd] : ymax[patchInd], xmin[patchInd] : xmax[patchInd]]
-            (out[k, :nBins], _) = np.histogram(vol, bins=nBins, range=intRange, density=True)
-            out[k, nBins] = 1 if labelsZYX[z, y, x] == 1 else 0
-            if appendPositions:
-                out[k, nBins + 1 :] = [z, y, x]
+    # discard patches that intersect with the volume border
+    ymin = ind_y - patchSize // 2
+    xmin = ind_x - patchSize // 2
+    valid = (
+        (ymin >= 0) & (xmin >= 0) & (xmin + patchSize <= volumeZYX.shape[2]) & (ymin + patchSize <= volumeZYX.shape[1])
+    )
+    ind_z, ind_y, ind_x, ymin, xmin = (a[valid] for a in (ind_z, ind_y, ind_x, ymin, xmin))
 
-        return out
+    # the patches of each slice are extracted at once, in parallel for the slices
+    zs, firsts = np.unique(ind_z, return_index=True)
+    bounds = list(zip(firsts, list(firsts[1:]) + [len(ind_z)]))
+    histoList = [None] * len(zs)
 
     def partFun(i):
-        itemList = index[sliceList[i]]
-        histos = _extractHistogramsSub(itemList)
-        histoList[i] = histos
-
-        reporter.report(i)
-
-    # END subroutine
+        z = zs[i]
+        sl = slice(*bounds[i])
+        data = np.asarray(volumeZYX[z, :, :].view(np.ndarray))
+        binIndices = _binIndices(data, nBins, intRange)
+
+        # summed-area table of each bin over the slice, a patch histogram needs 4 lookups per bin
+        counts = np.zeros((len(ind_z[sl]), nBins), dtype=np.int64)
+        top, left = ymin[sl], xmin[sl]
+        bottom, right = top + patchSize, left + patchSize
+        table = np.zeros((data.shape[0] + 1, data.shape[1] + 1), dtype=np.int64)
+        for b in range(nBins):
+            np.cumsum(binIndices == b, axis=0, out=table[1:, 1:])
+            np.cumsum(table[1:, 1:], axis=1, out=table[1:, 1:])
+            counts[:, b] = table[bottom, right] - table[top, right] - table[bottom, left] + table[top, left]
+
+        out = np.zeros((len(counts), nBins + 4 if appendPositions else nBins + 1))
+        out[:, :nBins] = _normalizeHistograms(counts, nBins, intRange)
+        out[:, nBins] = np.asarray(labelsZYX[z, :, :].view(np.ndarray))[ind_y[sl], ind_x[sl]] == 1
+        if appendPositions:
+            out[:, nBins + 1 :] = np.stack((ind_z[sl], ind_y[sl], ind_x[sl]), axis=1)
+        histoList[i] = out
+        logger.debug("Extracted {} histograms from slice {}.".format(len(out), z))
 
     # pool the extraction requests
     pool = RequestPool()
 
-    for i in range(nChunks):
+    for i in range(len(zs)):
         req = Request(partial(partFun, i))
         pool.add(req)
 
     pool.wait()
     pool.clean()
 
+    if not histoList:
+        return np.zeros((0, nBins + 4 if appendPositions else nBins + 1))
     return np.vstack(histoList)
 
 
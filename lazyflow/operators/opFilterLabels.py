@@ -23,7 +23,7 @@ from lazyflow.graph import Operator, InputSlot, OutputSlot
 
 import numpy
 import logging
-from lazyflow.utility import vigra_bincount
+from lazyflow.utility import parallel_bincount, for_each_slab
 from lazyflow.utility.helpers import bigintprod
 
 logger = logging.getLogger(__name__)
@@ -78,16 +78,17 @@ def remove_wrongly_sized_connected_components(a, min_size, max_size=None, in_pla
             numpy.place(a, a, 1)
         return a
 
-    component_sizes = vigra_bincount(a)
+    component_sizes = parallel_bincount(a)
     bad_sizes = component_sizes < min_size
     if max_size is not None:
         numpy.logical_or(bad_sizes, component_sizes > max_size, out=bad_sizes)
     del component_sizes
 
-    bad_locations = bad_sizes[a]
-    a[bad_locations] = 0
-    del bad_locations
-    if bin_out:
-        # Replace non-zero values with 1
-        numpy.place(a, a, 1)
+    def remove(index, slab):
+        slab[bad_sizes[slab]] = 0
+        if bin_out:
+            # Replace non-zero values with 1
+            numpy.place(slab, slab, 1)
+
+    for_each_slab(remove, a)
     return numpy.asarray(a, dtype=original_dtype)
@@ -27,9 +27,10 @@ from builtins import range
 # 		   http://ilastik.org/license/
 ###############################################################################
 import logging
-from functools import partial
+from functools import partial, lru_cache
 import pickle as pickle
 import tempfile
+from threading import Lock as ThreadLock
 
 
 from lazyflow.graph import Operator, InputSlot, OutputSlot
@@ -82,6 +83,10 @@ class OpInterpMissingData(Operator):
     def __init__(self, *args, **kwargs):
         super(OpInterpMissingData, self).__init__(*args, **kwargs)
 
+        # missing-slice index: (t, c, y and x range) -> (detector generation, per z: 1 clean, 0 missing, -1 unknown)
+        self._sliceIndex = {}
+        self._sliceIndexLock = ThreadLock()
+
         self.detector = OpDetectMissing(parent=self)
         self.interpolator = OpInterpolate(parent=self)
 
@@ -110,6 +115,9 @@ class OpInterpMissingData(Operator):
 
         self.Detector.meta.shape = (1,)
 
+        with self._sliceIndexLock:
+            self._sliceIndex.clear()
+
     def execute(self, slot, subindex, roi, result):
         """
         execute
@@ -119,17 +127,11 @@ class OpInterpMissingData(Operator):
 
         assert method in list(self._requiredMargin.keys()), "Unknown interpolation method {}".format(method)
 
-        z_index = self.InputVolume.meta.axistags.index("z")
         c_index = self.InputVolume.meta.axistags.index("c")
         t_index = self.InputVolume.meta.axistags.index("t")
-        # nz = self.InputVolume.meta.getTaggedShape()['z']
 
         resultZYXCT = vigra.taggedView(result, self.InputVolume.meta.axistags).withAxes(*"zyxct")
 
-        # backup ROI
-        oldStart = np.copy(roi.start)
-        oldStop = np.copy(roi.stop)
-
         if c_index < len(roi.start):
             cRange = np.arange(roi.start[c_index], roi.stop[c_index])
         else:
@@ -140,46 +142,65 @@ class OpInterpMissingData(Operator):
         else:
             tRange = np.array([0])
 
-        for c in cRange:
-            for t in tRange:
+        def interpolateBlock(c, t, out):
+            # change roi to single block
+            blockRoi = SubRegion(self.Output, start=list(roi.start), stop=list(roi.stop))
+            if c_index < len(roi.start):
+                blockRoi.start[c_index] = c
+                blockRoi.stop[c_index] = c + 1
 
-                # change roi to single block
-                if c_index < len(roi.start):
-                    roi.start[c_index] = c
-                    roi.stop[c_index] = c + 1
+            if t_index < len(roi.start):
+                blockRoi.start[t_index] = t
+                blockRoi.stop[t_index] = t + 1
 
-                if t_index < len(roi.start):
-                    roi.start[t_index] = t
-                    roi.stop[t_index] = t + 1
+            out[...] = vigra.taggedView(self._interpolateBlock(blockRoi), self.InputVolume.meta.axistags).withAxes(
+                *"zyx"
+            )
 
-                # check if more input is needed, and how many
-                z_offsets = self._extendRoi(roi)
+        pool = RequestPool()
+        for i, c in enumerate(cRange):
+            for j, t in enumerate(tRange):
+                pool.add(Request(partial(interpolateBlock, c, t, resultZYXCT[..., i, j])))
+        pool.wait()
+        pool.clean()
 
-                # get extended interpolation
-                roi.start[z_index] -= z_offsets[0]
-                roi.stop[z_index] += z_offsets[1]
+        return result
 
-                a = self.interpolator.Output.get(roi).wait()
+    def _interpolateBlock(self, roi):
+        """
+        interpolated data of a roi with a single channel and time slice
+        """
+        z_index = self.InputVolume.meta.axistags.index("z")
+        zStart, zStop = roi.start[z_index], roi.stop[z_index]
 
-                # reduce to original roi
-                roi.stop = roi.stop - roi.start
-                roi.start *= 0
-                roi.start[z_index] += z_offsets[0]
-                roi.stop[z_index] -= z_offsets[1]
-                key = roiToSlice(roi.start, roi.stop)
+        # clean blocks are served straight from the input
+        if np.all(self._cleanSlices(roi, zStart, zStop)):
+            return self.InputVolume(roi.start, roi.stop).wait()
 
-                resultZYXCT[..., c, t] = vigra.taggedView(a[key], self.InputVolume.meta.axistags).withAxes(*"zyx")
+        # check if more input is needed, and how many
+        z_offsets = self._extendRoi(roi)
 
-                # restore ROI, will be used in other methods!!!
-                roi.start = np.copy(oldStart)
-                roi.stop = np.copy(oldStop)
+        # get extended interpolation
+        start = list(roi.start)
+        stop = list(roi.stop)
+        start[z_index] -= z_offsets[0]
+        stop[z_index] += z_offsets[1]
 
-        return result
+        a = self.interpolator.Output(start, stop).wait()
+
+        # reduce to original roi
+        key = [slice(None)] * len(start)
+        key[z_index] = slice(z_offsets[0], z_offsets[0] + zStop - zStart)
+        return a[tuple(key)]
 
     def propagateDirty(self, slot, subindex, roi):
 
         if slot == self.InputVolume:
+            self._invalidateSliceIndex(roi)
             self.Output.setDirty(roi)
+        elif slot != self.InputSearchDepth and slot != self.InterpolationMethod:
+            with self._sliceIndexLock:
+                self._sliceIndex.clear()
 
         if slot == self.OverloadDetector:
             self._dirty = True
@@ -190,78 +211,110 @@ class OpInterpMissingData(Operator):
     def train(self, force=False):
         return self.detector.train(force=force)
 
-    def _extendRoi(self, roi):
-        origStart = np.copy(roi.start)
-        origStop = np.copy(roi.stop)
+    def _sliceIndexKey(self, roi):
+        axes = self.InputVolume.meta.getAxisKeys()
+        return tuple(
+            (int(roi.start[axes.index(a)]), int(roi.stop[axes.index(a)])) if a in axes else (0, 1) for a in "tcyx"
+        )
 
-        offset_top = 0
-        offset_bot = 0
+    def _invalidateSliceIndex(self, roi):
+        axes = self.InputVolume.meta.getAxisKeys()
+        ranges = {a: (start, stop) for a, start, stop in zip(axes, roi.start, roi.stop)}
+        t, c, z = (ranges.get(a, (0, 1)) for a in "tcz")
+        with self._sliceIndexLock:
+            for key, (generation, clean) in list(self._sliceIndex.items()):
+                if t[0] <= key[0][0] < t[1] and c[0] <= key[1][0] < c[1]:
+                    # replace the array, so that detections running concurrently don't mark the slices as known
+                    clean = clean.copy()
+                    clean[z[0] : z[1]] = -1
+                    self._sliceIndex[key] = (generation, clean)
+
+    def _cleanSlices(self, roi, zStart, zStop):
+        """
+        whether the slices zStart..zStop-1 (restricted to the t, c, y and x range of roi) are free of missing data
+
+        The slices are looked up in the missing-slice index, slices that were not seen yet are detected at once.
+        """
+        z_index = self.InputVolume.meta.axistags.index("z")
+        key = self._sliceIndexKey(roi)
+        generation = OpDetectMissing._detectorGeneration
+
+        with self._sliceIndexLock:
+            entry = self._sliceIndex.get(key)
+            if entry is None or entry[0] != generation:
+                nz = self.InputVolume.meta.getTaggedShape()["z"]
+                entry = (generation, np.full(nz, -1, dtype=np.int8))
+                self._sliceIndex[key] = entry
+            clean = entry[1]
+            unknown = np.flatnonzero(clean[zStart:zStop] < 0) + zStart
+
+        if len(unknown) > 0:
+            start = list(roi.start)
+            stop = list(roi.stop)
+            start[z_index] = unknown[0]
+            stop[z_index] = unknown[-1] + 1
+            missing = vigra.taggedView(
+                self.detector.Output(start, stop).wait(), axistags=self.InputVolume.meta.axistags
+            ).withAxes(*"zyxct")
+            missing = missing.view(np.ndarray).reshape(missing.shape[0], -1)
+            with self._sliceIndexLock:
+                clean[start[z_index] : stop[z_index]] = ~np.any(missing, axis=1)
+
+        return clean[zStart:zStop] > 0
 
+    def _extendRoi(self, roi):
+        """
+        number of slices (top, bottom) the roi has to be extended by to get enough clean slices for
+        interpolating the missing slices at its borders
+        """
         z_index = self.InputVolume.meta.axistags.index("z")
 
         depth = self.InputSearchDepth.value
-        nRequestedSlices = roi.stop[z_index] - roi.start[z_index]
         nNeededSlices = self._requiredMargin[self.InterpolationMethod.value]
+        zStart, zStop = roi.start[z_index], roi.stop[z_index]
+        nz = self.InputVolume.meta.getTaggedShape()["z"]
 
-        missing = vigra.taggedView(
-            self.detector.Output.get(roi).wait(), axistags=self.InputVolume.meta.axistags
-        ).withAxes(*"zyx")
-
-        nGoodSlicesTop = 0
-        # go inside the roi
-        for k in range(nRequestedSlices):
-            if np.all(missing[k, ...] == 0):  # clean slice
-                nGoodSlicesTop += 1
-            else:
-                break
+        clean = self._cleanSlices(roi, zStart, zStop)
 
         # are we finished yet?
-        if nGoodSlicesTop >= nRequestedSlices:
+        if np.all(clean):
             return (0, 0)
 
-        # looks like we need more slices on top
-        while nGoodSlicesTop < nNeededSlices and offset_top < depth and roi.start[z_index] > 0:
-            roi.stop[z_index] = roi.start[z_index]
-            roi.start[z_index] -= 1
-            offset_top += 1
-            topmissing = self.detector.Output.get(roi).wait()
-            if np.all(topmissing == 0):  # clean slice
-                nGoodSlicesTop += 1
-            else:  # need to start again
-                nGoodSlicesTop = 0
-
-        nGoodSlicesBot = 0
-        # go inside the roi
-        for k in range(1, nRequestedSlices + 1):
-            if np.all(missing[-k, ...] == 0):  # clean slice
-                nGoodSlicesBot += 1
-            else:
-                break
+        # clean slices at the borders, inside the roi
+        nGoodSlicesTop = int(np.argmin(clean))
+        nGoodSlicesBot = int(np.argmin(clean[::-1]))
 
-        roi.start = np.copy(origStart)
-        roi.stop = np.copy(origStop)
+        # looks like we need more slices on top
+        offset_top = 0
+        if nGoodSlicesTop < nNeededSlices and depth > 0 and zStart > 0:
+            top = self._cleanSlices(roi, max(zStart - depth, 0), zStart)[::-1]
+            offset_top = _searchMargin(top, nGoodSlicesTop, nNeededSlices)
 
         # looks like we need more slices on bottom
-        while (
-            roi.stop[z_index] < self.InputVolume.meta.getTaggedShape()["z"]
-            and nGoodSlicesBot < nNeededSlices
-            and offset_bot < depth
-        ):
-            roi.start[z_index] = roi.stop[z_index]
-            roi.stop[z_index] += 1
-            offset_bot += 1
-            botmissing = self.detector.Output.get(roi).wait()
-            if np.all(botmissing == 0):  # clean slice
-                nGoodSlicesBot += 1
-            else:  # need to start again
-                nGoodSlicesBot = 0
-
-        roi.start = np.copy(origStart)
-        roi.stop = np.copy(origStop)
+        offset_bot = 0
+        if nGoodSlicesBot < nNeededSlices and depth > 0 and zStop < nz:
+            bot = self._cleanSlices(roi, zStop, min(zStop + depth, nz))
+            offset_bot = _searchMargin(bot, nGoodSlicesBot, nNeededSlices)
 
         return (offset_top, offset_bot)
 
 
+def _searchMargin(clean, nGoodSlices, nNeededSlices):
+    """
+    number of slices to go outward (over the slices in clean) until nNeededSlices consecutive clean slices are found
+    """
+    offset = 0
+    for isClean in clean:
+        if nGoodSlices >= nNeededSlices:
+            break
+        offset += 1
+        if isClean:
+            nGoodSlices += 1
+        else:  # need to start again
+            nGoodSlices = 0
+    return offset
+
+
 ################################
 ################################
 ################################
@@ -286,6 +339,28 @@ def _cubic_mat(n=1):
     return np.linalg.inv(A)
 
 
+@lru_cache(maxsize=128)
+def _linear_weights(n):
+    """
+    interpolation weights of the left and right boundary slice for n missing slices, shape (n, 2)
+    """
+    xs = np.linspace(0, 1, n + 2)[1:-1]
+    weights = np.stack((1 - xs, xs), axis=1)
+    weights.setflags(write=False)
+    return weights
+
+
+@lru_cache(maxsize=128)
+def _cubic_weights(n):
+    """
+    interpolation weights of the slices (minZ, minZ + 1, maxZ - 1, maxZ) for n missing slices, shape (n, 4)
+    """
+    xs = np.linspace(0, 1, n + 2)[1:-1]
+    weights = np.vander(xs, 4, increasing=True).dot(_cubic_mat(n))
+    weights.setflags(write=False)
+    return weights
+
+
 class OpInterpolate(Operator):
     InputVolume = InputSlot()
     Missing = InputSlot()
@@ -327,6 +402,8 @@ class OpInterpolate(Operator):
 
         for t in range(resultZYXCT.shape[4]):
             for c in range(resultZYXCT.shape[3]):
+                if not np.any(missingZYXCT[..., c, t]):
+                    continue
                 missingLabeled = vigra.analysis.labelVolumeWithBackground(missingZYXCT[..., c, t])
                 maxLabel = missingLabeled.max()
                 for i in range(1, maxLabel + 1):
@@ -410,29 +487,20 @@ class OpInterpolate(Operator):
 
         if method == "linear" or method == "cubic" and n > 1:
             # do a convex combination of the boundary slices
-            xs = np.linspace(0, 1, n + 2)
-            left = volume[minZ, minY : maxY + 1, minX : maxX + 1]
-            right = volume[maxZ, minY : maxY + 1, minX : maxX + 1]
+            left = volume[minZ, minY : maxY + 1, minX : maxX + 1].view(np.ndarray)
+            right = volume[maxZ, minY : maxY + 1, minX : maxX + 1].view(np.ndarray)
 
-            for i in range(n):
+            for i, (wLeft, wRight) in enumerate(_linear_weights(n)):
                 # interpolate every slice
-                volume[minZ + i + 1, minY : maxY + 1, minX : maxX + 1] = self._cast(
-                    (1 - xs[i + 1]) * left + xs[i + 1] * right
-                )
+                volume[minZ + i + 1, minY : maxY + 1, minX : maxX + 1] = self._cast(wLeft * left + wRight * right)
 
         elif method == "cubic":
-            # interpolation coefficients
+            # boundary slices, weighted with the interpolation coefficients of each missing slice
+            D = volume[[minZ, minZ + 1, maxZ - 1, maxZ], minY : maxY + 1, minX : maxX + 1].view(np.ndarray)
 
-            D = np.rollaxis(volume[[minZ, minZ + 1, maxZ - 1, maxZ], minY : maxY + 1, minX : maxX + 1], 0, 3)
-            F = np.tensordot(D, _cubic_mat(n), ([2], [1]))
-
-            xs = np.linspace(0, 1, n + 2)
-            for i in range(n):
+            for i, weights in enumerate(_cubic_weights(n)):
                 # interpolate every slice
-                x = xs[i + 1]
-                volume[minZ + i + 2, minY : maxY + 1, minX : maxX + 1] = self._cast(
-                    F[..., 0] + F[..., 1] * x + F[..., 2] * x ** 2 + F[..., 3] * x ** 3
-                )
+                volume[minZ + i + 2, minY : maxY + 1, minX : maxX + 1] = self._cast(np.tensordot(weights, D, axes=1))
 
         else:  # constant
             if minZ > 0:
@@ -32,6 +32,7 @@ from lazyflow.graph import Operator, InputSlot, OutputSlot
 from lazyflow.request import RequestPool
 from lazyflow.roi import sliceToRoi, roiToSlice
 from lazyflow.rtype import SubRegion
+from lazyflow.utility import bufferPool
 
 from .operators import OpArrayPiper
 from .filterOperators import (
@@ -50,6 +51,17 @@ if WITH_FAST_FILTERS:
 logger = logging.getLogger(__name__)
 
 
+def _free_array(array):
+    """Give a temporary array back to the buffer pool, or free its memory right away if it wasn't pooled."""
+    if bufferPool.release(array):
+        return
+    try:
+        array.resize((1,), refcheck=False)
+    except ValueError:
+        # Sometimes this fails, but that's okay.
+        logger.debug("Failed to free array memory.")
+
+
 class OpPixelFeaturesPresmoothed(Operator):
     name = "OpPixelFeaturesPresmoothed"
     category = "Vigra filter"
@@ -373,16 +385,18 @@ class OpPixelFeaturesPresmoothed(Operator):
 
             # pre-smooth for all requested time slices and all channels
             full_input_smooth_slice = (full_output_slice[0], slice(None), *input_smooth_slice)
-            req = self.Input[full_input_smooth_slice]
-            source = req.wait()
+            # the (converted) source and the presmoothed sources are temporaries, take them from the buffer pool
+            source = self.Input.stype.allocateDestination(
+                SubRegion(self.Input, pslice=full_input_smooth_slice), pooled=True
+            )
+            req = self.Input[full_input_smooth_slice].writeInto(source)
+            req.wait()
             req.clean()
             req.destination = None
             if source.dtype != numpy.float32:
-                sourceF = source.astype(numpy.float32)
-                try:
-                    source.resize((1,), refcheck=False)
-                except Exception:
-                    pass
+                sourceF = bufferPool.borrow(source.shape, numpy.float32)
+                sourceF[...] = source
+                _free_array(source)
                 del source
                 source = sourceF
 
@@ -414,7 +428,7 @@ class OpPixelFeaturesPresmoothed(Operator):
                     else:
                         tempSigma = self.scales[j]
 
-                    presmoothed_source[j] = numpy.ndarray(full_source_smooth_shape, numpy.float32)
+                    presmoothed_source[j] = bufferPool.borrow(full_source_smooth_shape, numpy.float32)
 
                     droi = (
                         (0, *tuple(smooth_filter_start._asint())),
@@ -435,11 +449,7 @@ class OpPixelFeaturesPresmoothed(Operator):
                     raise e
 
             del sourceV
-            try:
-                source.resize((1,), refcheck=False)
-            except ValueError:
-                # Sometimes this fails, but that's okay.
-                logger.debug("Failed to free array memory.")
+            _free_array(source)
             del source
 
             cnt = 0
@@ -492,10 +502,8 @@ class OpPixelFeaturesPresmoothed(Operator):
 
             for i in range(len(presmoothed_source)):
                 if presmoothed_source[i] is not None:
-                    try:
-                        presmoothed_source[i].resize((1,))
-                    except Exception:
-                        presmoothed_source[i] = None
+                    _free_array(presmoothed_source[i])
+                    presmoothed_source[i] = None
 
     def _computeGaussianSmoothing(self, vol, sigma, roi, in2d):
         if WITH_FAST_FILTERS:
@@ -40,6 +40,8 @@ class OpReorderAxes(Operator):
     AxisOrder = InputSlot()  # string: The desired output axis order
     Output = OutputSlot()
 
+    executeInline = True
+
     def __init__(self, graph=None, parent=None, Input=None, AxisOrder="tzyxc"):
         super().__init__(graph=graph, parent=parent)
         self.Input.setOrConnectIfAvailable(Input)
@@ -138,6 +140,9 @@ class OpReorderAxes(Operator):
         self._common_axis_transpose_order = list(map(output_common_axes.index, input_common_axes))
         self._in_unsqueeze_slicing = tuple(slice(None) if a in output_order else numpy.newaxis for a in input_order)
 
+        # Nothing to reorder: forward requests to the input
+        self.Output.setPassThrough(self.Input if "".join(input_order) == output_order else None)
+
     def execute(self, slot, subindex, out_roi, result):
         assert slot == self.Output, "Unknown output slot: {}".format(slot.name)
         assert len(self._invalid_axes) == 0, (
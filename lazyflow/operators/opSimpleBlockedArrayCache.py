@@ -8,6 +8,7 @@ from .opUnblockedArrayCache import OpUnblockedArrayCache
 from lazyflow.request import Request, RequestPool
 from lazyflow.roi import getIntersectingRois, roiToSlice
 from lazyflow.rtype import SubRegion
+from lazyflow.utility import bufferPool
 from lazyflow.utility.helpers import get_ram_per_element
 
 
@@ -64,7 +65,9 @@ class OpSimpleBlockedArrayCache(OpUnblockedArrayCache):
 
             # Skip cache and copy full block directly
             if self.BypassModeEnabled.value:
-                full_block_data = self.Output.stype.allocateDestination(SubRegion(self.Output, *full_block_roi))
+                full_block_data = self.Output.stype.allocateDestination(
+                    SubRegion(self.Output, *full_block_roi), pooled=True
+                )
 
                 self.Input(*full_block_roi).writeInto(full_block_data).block()
 
@@ -72,6 +75,7 @@ class OpSimpleBlockedArrayCache(OpUnblockedArrayCache):
                 self.Output.stype.copy_data(
                     result[roiToSlice(*output_roi)], full_block_data[roiToSlice(*roi_within_block)]
                 )
+                bufferPool.release(full_block_data)
             # If data data exists already or we can just fetch it without needing extra scratch space,
             # just call the base class
             elif block_roi is not None or (full_block_roi == clipped_block_roi).all():
@@ -85,13 +89,17 @@ class OpSimpleBlockedArrayCache(OpUnblockedArrayCache):
 
                 # (We use allocateDestination() here to support MaskedArray types.)
                 # TODO: We should probably just get rid of MaskedArray support altogether...
-                full_block_data = self.Output.stype.allocateDestination(SubRegion(self.Output, *full_block_roi))
+                # The cache stores its own copy, so the full block is only a temporary.
+                full_block_data = self.Output.stype.allocateDestination(
+                    SubRegion(self.Output, *full_block_roi), pooled=True
+                )
                 self._execute_Output_impl(full_block_roi, full_block_data)
 
                 roi_within_block = clipped_block_roi - full_block_roi[0]
                 self.Output.stype.copy_data(
                     result[roiToSlice(*output_roi)], full_block_data[roiToSlice(*roi_within_block)]
                 )
+                bufferPool.release(full_block_data)
 
         clipped_block_rois = getIntersectingRois(self.Input.meta.shape, self._blockshape, (roi.start, roi.stop), True)
         full_block_rois = getIntersectingRois(self.Input.meta.shape, self._blockshape, (roi.start, roi.stop), False)
@@ -36,6 +36,7 @@ from lazyflow.roi import sliceToRoi
 from lazyflow.operators.opCache import MemInfoNode
 from lazyflow.operators.opCache import ObservableCache
 from lazyflow.utility.helpers import get_ram_per_element
+from lazyflow.utility.compression import DEFAULT_CODEC
 
 
 class OpSlicedBlockedArrayCache(Operator, ObservableCache):
@@ -48,6 +49,7 @@ class OpSlicedBlockedArrayCache(Operator, ObservableCache):
     BlockShape = InputSlot()
     BypassModeEnabled = InputSlot(value=False)
     CompressionEnabled = InputSlot(value=False)
+    CompressionCodec = InputSlot(value=DEFAULT_CODEC)
 
     # Outputs
     Output = OutputSlot(allow_mask=True)
@@ -122,6 +124,7 @@ class OpSlicedBlockedArrayCache(Operator, ObservableCache):
                 op.inputs["fixAtCurrent"].connect(self.inputs["fixAtCurrent"])
                 op.BypassModeEnabled.connect(self.BypassModeEnabled)
                 op.CompressionEnabled.connect(self.CompressionEnabled)
+                op.CompressionCodec.connect(self.CompressionCodec)
                 self._innerOps.append(op)
 
                 op.inputs["Input"].connect(self.inputs["Input"])
@@ -194,5 +197,5 @@ class OpSlicedBlockedArrayCache(Operator, ObservableCache):
                 # It is considered an error to change the blockshape after the initial configuration.
             elif slot is self.fixAtCurrent:
                 self.Output.setDirty(slice(None))
-            elif slot not in (self.BypassModeEnabled, self.CompressionEnabled):
+            elif slot not in (self.BypassModeEnabled, self.CompressionEnabled, self.CompressionCodec):
                 assert False, "Unknown dirty input slot"
@@ -26,12 +26,13 @@ import time
 import collections
 from itertools import starmap
 import numpy
-import vigra
 
 from lazyflow.graph import Operator, InputSlot, OutputSlot
+from lazyflow.operators import cacheMemoryManager
 from lazyflow.operators.opCache import ManagedBlockedCache
 from lazyflow.request import RequestLock
-from lazyflow.roi import getIntersection, roiFromShape, roiToSlice, containing_rois, sliceToRoi
+from lazyflow.roi import RoiIndex, roiFromShape, roiToSlice, sliceToRoi
+from lazyflow.utility.compression import DEFAULT_CODEC, get_codec, stored_nbytes
 
 import logging
 
@@ -56,6 +57,8 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
 
     Input = InputSlot(allow_mask=True)
     CompressionEnabled = InputSlot(value=False)  # If True, compression will be enabled for certain dtypes
+    # Codec spec used if compression is enabled, e.g. "lz4", "zstd:5" or "blosc" (see lazyflow.utility.compression)
+    CompressionCodec = InputSlot(value=DEFAULT_CODEC)
     Output = OutputSlot(allow_mask=True)
 
     CleanBlocks = OutputSlot()  # A list of slicings indicating which blocks are stored in the cache and clean.
@@ -98,10 +101,14 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
         with self._lock:
             block_roi = self._get_containing_block_roi(request_roi)
             if block_roi is not None:
-                # Data is already in the cache. Just extract it.
-                block_relative_roi = numpy.array(request_roi) - block_roi[0]
-                self.Output.stype.copy_data(result, self._block_data[block_roi][roiToSlice(*block_relative_roi)])
-                return
+                block_data = self._block_data[block_roi]
+
+        if block_roi is not None:
+            # Data is already in the cache. Just extract it.
+            # Stored blocks are never modified, so this can (decompress and) copy outside of the lock.
+            block_relative_roi = numpy.array(request_roi) - block_roi[0]
+            self.Output.stype.copy_data(result, block_data[roiToSlice(*block_relative_roi)])
+            return
 
         if self.Input.meta.dontcache:
             # Data isn't in the cache, but we don't want to cache it anyway.
@@ -113,13 +120,9 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
 
     def _get_containing_block_roi(self, request_roi):
         # Does this roi happen to fit ENTIRELY within an existing stored block?
+        # The index only contains rois of stored blocks, so this doesn't scan all of them.
         request_roi = self._standardize_roi(*request_roi)
-        outer_rois = containing_rois(list(self._block_data.keys()), request_roi)
-        if len(outer_rois) > 0:
-            # Standardize roi for usage as dict key
-            block_roi = self._standardize_roi(*outer_rois[0])
-            return block_roi
-        return None
+        return self._block_index.containing(request_roi)
 
     def _fetch_and_store_block(self, block_roi, out):
         if out is not None:
@@ -156,28 +159,31 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
         Copy block_data and store it into the cache.
         The block_lock is not obtained here, so lock it before you call this.
         """
-        with self._lock:
-            if self.CompressionEnabled.value and numpy.dtype(block_data.dtype) in [
-                numpy.dtype(numpy.uint8),
-                numpy.dtype(numpy.uint32),
-                numpy.dtype(numpy.float32),
-            ]:
-                compressed_block = vigra.ChunkedArrayCompressed(
-                    block_data.shape, vigra.Compression.LZ4, block_data.dtype
-                )
-                compressed_block[:] = block_data
-                block_storage_data = compressed_block
-            else:
-                block_storage_data = block_data.copy()
+        # Compress (or copy) outside of the global lock, so that blocks can be stored in parallel
+        codec = get_codec(self.CompressionCodec.value) if self.CompressionEnabled.value else None
+        if codec is not None and codec.supports(block_data.dtype) and not isinstance(block_data, numpy.ma.MaskedArray):
+            block_storage_data = codec.compress(block_data)
+        else:
+            block_storage_data = block_data.copy()
 
+        with self._lock:
             # Store the data.
             # First double-check that the block wasn't removed from the
             #   cache while we were requesting it.
             # (Could have happened via propagateDirty() or eventually the arrayCacheMemoryMgr)
-            if block_roi in self._block_locks:
-                self._block_data[block_roi] = block_storage_data
-
-        self._last_access_times[block_roi] = time.time()
+            if block_roi not in self._block_locks:
+                return
+            nbytes = stored_nbytes(block_storage_data)
+            replaced_block = self._block_data.get(block_roi)
+            if replaced_block is not None:
+                nbytes -= stored_nbytes(replaced_block)
+            self._block_data[block_roi] = block_storage_data
+            self._block_index.add(block_roi)
+            self._used_memory += nbytes
+            self._last_access_time = self._last_access_times[block_roi] = time.time()
+
+        if nbytes > 0:
+            cacheMemoryManager.notifyMemoryIncrease(nbytes, self.getCachePool())
 
     def _execute_CleanBlocks(self, slot, subindex, roi, result):
         with self._lock:
@@ -198,7 +204,7 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
             self._store_block_data(block_roi, block_data)
 
     def propagateDirty(self, slot, subindex, roi):
-        if slot is self.CompressionEnabled:
+        if slot is self.CompressionEnabled or slot is self.CompressionCodec:
             return
 
         dirty_roi = self._standardize_roi(roi.start, roi.stop)
@@ -210,11 +216,10 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
             # Everything is dirty, so no need to loop
             self._resetBlocks()
         else:
-            # FIXME: This is O(N) for now.
-            #        We should speed this up by maintaining a bookkeeping data structure in execute().
-            for block_roi in list(self._block_data.keys()):
-                if getIntersection(block_roi, dirty_roi, assertIntersect=False):
-                    self.freeBlock(block_roi)
+            with self._lock:
+                dirty_blocks = self._block_index.intersecting(dirty_roi)
+            for block_roi in dirty_blocks:
+                self.freeBlock(block_roi)
 
         self.Output.setDirty(roi.start, roi.stop)
 
@@ -222,27 +227,15 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
     ## OpManagedCache interface implementation
     ##
     def usedMemory(self):
-        total = 0.0
-        for k in list(self._block_data.keys()):
-            try:
-                block = self._block_data[k]
-                bytes_per_pixel = numpy.dtype(block.dtype).itemsize
-                portion = block.size * bytes_per_pixel
-            except (KeyError, AttributeError):
-                # what could have happened and why it's fine
-                #  * block was deleted (then it does not occupy memory)
-                #  * block is not array data (then we don't know how
-                #    much memory it ouccupies)
-                portion = 0.0
-            total += portion
-        return total
+        # kept up to date on every store and free, see _store_block_data and freeBlock
+        return self._used_memory
 
     def fractionOfUsedMemoryDirty(self):
         # dirty memory is discarded immediately
         return 0.0
 
     def lastAccessTime(self):
-        return super(OpUnblockedArrayCache, self).lastAccessTime()
+        return self._last_access_time
 
     def getBlockAccessTimes(self):
         with self._lock:
@@ -260,12 +253,15 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
         with self._lock:
             if key not in self._block_locks:
                 return 0
-            block = self._block_data[key]
-            bytes_per_pixel = numpy.dtype(block.dtype).itemsize
-            mem = block.size * bytes_per_pixel
-            del self._block_data[key]
             del self._block_locks[key]
+            block = self._block_data.pop(key, None)
+            if block is None:
+                # The block is still being computed, it won't be stored.
+                return 0
+            mem = stored_nbytes(block)
+            self._block_index.remove(key)
             del self._last_access_times[key]
+            self._used_memory -= mem
             return mem
 
     def freeDirtyMemory(self):
@@ -275,4 +271,8 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
         with self._lock:
             self._block_data = {}
             self._block_locks = {}
+            # spatial index over the rois of all stored blocks
+            self._block_index = RoiIndex()
             self._last_access_times = collections.defaultdict(float)
+            self._last_access_time = 0.0
+            self._used_memory = 0
@@ -21,9 +21,11 @@
 ###############################################################################
 import logging
 import socket
+import threading
+import time
 import numpy
 import warnings
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from typing import Iterable, List, Callable, Tuple, Dict
 
 import xarray
@@ -73,10 +75,118 @@ def enforce_min_shape(min_shape, step, axes) -> Tuple[int, ...]:
     return tuple([int(s + i * m) for s, i in zip(min_shape, step)])
 
 
+class PredictBatcher:
+    """
+    Packs tiles that are predicted concurrently (by different lazyflow workers) into batches,
+    so that they are sent to the server in one call.
+
+    A batch is sent once it holds max_batch_size tiles, or max_delay seconds after its first tile arrived.
+    Only tiles of the same shape can be batched.
+
+    :param send: function(batch) -> future of the predictions for the batch, where batch is a float32 array
+                 with the tiles stacked along batch_axis
+    :param output_batch_axis: axis along which the predictions are split per tile (defaults to batch_axis)
+    """
+
+    def __init__(self, send, batch_axis=0, max_batch_size=4, max_delay=0.01, output_batch_axis=None):
+        self._send = send
+        self._batch_axis = batch_axis
+        self._output_batch_axis = batch_axis if output_batch_axis is None else output_batch_axis
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        # tile shape -> list of (tile, future, time it was submitted), in order of the oldest tile
+        self._pending = OrderedDict()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="PredictBatcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, tile: numpy.ndarray) -> MappableFuture:
+        """
+        Returns a future of the predictions for this tile (with a batch axis of size 1)
+        """
+        future = MappableFuture()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("PredictBatcher is closed")
+            self._pending.setdefault(tile.shape, []).append((tile, future, time.monotonic()))
+            self._cond.notify()
+        return future
+
+    def close(self):
+        """
+        Stop after sending the pending tiles.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _next_batch(self):
+        with self._cond:
+            while True:
+                if not self._pending:
+                    if self._closed:
+                        return None
+                    self._cond.wait()
+                    continue
+
+                shape, tiles = next(iter(self._pending.items()))
+                remaining = tiles[0][2] + self.max_delay - time.monotonic()
+                if len(tiles) >= self.max_batch_size or remaining <= 0 or self._closed:
+                    batch, tiles[:] = tiles[: self.max_batch_size], tiles[self.max_batch_size :]
+                    if not tiles:
+                        del self._pending[shape]
+                    else:
+                        self._pending.move_to_end(shape)
+                    return batch
+                self._cond.wait(remaining)
+
+    def _run(self):
+        while True:
+            items = self._next_batch()
+            if items is None:
+                return
+            futures = [future for _, future, _ in items]
+            try:
+                # Stacking converts the tiles to float32 in the same copy
+                tile_shape = items[0][0].shape
+                batch_shape = tile_shape[: self._batch_axis] + (len(items),) + tile_shape[self._batch_axis :]
+                batch = numpy.empty(batch_shape, dtype=numpy.float32)
+                batch_view = numpy.moveaxis(batch, self._batch_axis, 0)
+                for i, (tile, _, _) in enumerate(items):
+                    batch_view[i] = tile
+                predictions = self._send(batch)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            predictions.add_done_callback(lambda f, futures=futures: self._split(f, futures))
+
+    def _split(self, predictions, futures):
+        try:
+            result = predictions.result()
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+        for i, future in enumerate(futures):
+            index = (slice(None),) * self._output_batch_axis + (slice(i, i + 1),)
+            future.set_result(result[index])
+
+
 class ModelSession:
+    # Tiles that are predicted concurrently are sent in batches of up to this size,
+    # waiting at most PREDICT_BATCH_DELAY seconds for a batch to fill up.
+    # Only models whose input shape accepts any number of tiles along "b" are batched.
+    PREDICT_BATCH_SIZE = 4
+    PREDICT_BATCH_DELAY = 0.01
+
     def __init__(self, session, factory):
         self.__session = session
         self.__factory = factory
+        self.__batcher = None
+        self.__batcher_lock = threading.Lock()
 
     @property
     def tiktorchClient(self):
@@ -237,8 +347,59 @@ class ModelSession:
         self.tikTorchClient.remove_data("training", to_remove)
 
     def close(self):
+        if self.__batcher is not None:
+            self.__batcher.close()
         self.tiktorchClient.CloseModelSession(self.__session)
 
+    def _send_predict(self, tensor: numpy.ndarray, axes: str):
+        """Returns a future of the prediction for the (float32) tensor"""
+        resp = self.tiktorchClient.Predict.future(
+            inference_pb2.PredictRequest(
+                tensors=[converters.numpy_to_pb_tensor(tensor, axistags=axes)], modelSessionId=self.__session.id
+            )
+        )
+
+        def _to_numpy(resp):
+            assert len(resp.tensors) == 1
+            return converters.pb_tensor_to_numpy(resp.tensors[0])
+
+        return map_future(resp, _to_numpy)
+
+    def get_max_batch_size(self) -> int:
+        """Number of tiles that may be stacked along the "b" axis of the model input
+
+        An explicit input shape fixes the batch size, and a parametrized one only accepts
+        min + k * step tiles. So tiles are only batched (up to PREDICT_BATCH_SIZE) if "b"
+        is parametrized to start at 1 and grow in steps of 1.
+        """
+        input_shapes = self.__session.inputShapes
+        if len(input_shapes) != 1 or input_shapes[0].shapeType != 1:
+            return 1
+        min_batch = {d.name: d.size for d in input_shapes[0].shape.namedInts}.get("b", 1)
+        batch_step = {d.name: d.size for d in input_shapes[0].stepShape.namedInts}.get("b", 0)
+        if min_batch > 1 or batch_step != 1:
+            return 1
+        return max(self.PREDICT_BATCH_SIZE, 1)
+
+    def _get_batcher(self, input_axis_order: str):
+        # the raw predictions are in the model's output axis order
+        output_axis_order = self.output_axes[0]
+        if "b" not in input_axis_order or "b" not in output_axis_order:
+            return None
+        max_batch_size = self.get_max_batch_size()
+        if max_batch_size <= 1:
+            return None
+        with self.__batcher_lock:
+            if self.__batcher is None:
+                self.__batcher = PredictBatcher(
+                    lambda batch: self._send_predict(batch, input_axis_order),
+                    batch_axis=input_axis_order.index("b"),
+                    output_batch_axis=output_axis_order.index("b"),
+                    max_batch_size=max_batch_size,
+                    max_delay=self.PREDICT_BATCH_DELAY,
+                )
+            return self.__batcher
+
     def predict(self, feature_image, roi, axistags=None):
         """
         :param numpy.ndarray feature_image: classifier input
@@ -264,22 +425,19 @@ class ModelSession:
         input_axes = self.input_axes
         assert len(input_axes) == 1
         input_axis_order = input_axes[0]
+        # The reordered image is a view, it is only copied once to convert it to float32 (or to pack it in a batch)
         reordered_feature_image = reorder_axes(feature_image, from_axes_tags=axistags, to_axes_tags=input_axis_order)
-        if not reordered_feature_image.dtype == "float32":
-            reordered_feature_image = reordered_feature_image.astype("float32")
         try:
             current_rq = Request._current_request()
-            resp = self.tiktorchClient.Predict.future(
-                inference_pb2.PredictRequest(
-                    tensors=[converters.numpy_to_pb_tensor(reordered_feature_image, axistags=input_axis_order)],
-                    modelSessionId=self.__session.id,
-                )
-            )
-            resp.add_done_callback(lambda o: current_rq._wake_up())
+            batcher = self._get_batcher(input_axis_order)
+            if batcher is not None:
+                tile = reordered_feature_image[(slice(None),) * input_axis_order.index("b") + (0,)]
+                future = batcher.submit(tile)
+            else:
+                future = self._send_predict(reordered_feature_image.astype("float32", copy=False), input_axis_order)
+            future.add_done_callback(lambda o: current_rq._wake_up())
             current_rq._suspend()
-            resp = resp.result()
-            assert len(resp.tensors) == 1
-            result = converters.pb_tensor_to_numpy(resp.tensors[0])
+            result = future.result()
         except Exception:
             logger.exception("Predict call failed")
             return 0
@@ -116,6 +116,8 @@ class OpMetadataInjector(Operator):
 
     Output = OutputSlot()
 
+    executeInline = True
+
     def setupOutputs(self):
         self.Output.meta.assignFrom(self.Input.meta)
 
@@ -124,6 +126,10 @@ class OpMetadataInjector(Operator):
         for k, v in list(extraMetadata.items()):
             setattr(self.Output.meta, k, v)
 
+        # The data itself is unchanged, unless the metadata overrides its shape or dtype
+        same_data = self.Output.meta.shape == self.Input.meta.shape and self.Output.meta.dtype == self.Input.meta.dtype
+        self.Output.setPassThrough(self.Input if same_data else None)
+
     def execute(self, slot, subindex, roi, result):
         req = self.Input(roi.start, roi.stop)
         req.writeInto(result)
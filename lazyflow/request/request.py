@@ -291,6 +291,15 @@ class Request(object):
         """
         return _ValueRequest(value)
 
+    @classmethod
+    def inline(cls, fn):
+        """
+        Wraps a cheap workload with a Request like object, that runs the workload directly
+        in the context of the request that waits for it (see _InlineRequest).
+        Only use this from within a request.
+        """
+        return _InlineRequest(fn)
+
     def clean(self, _fullClean=True):
         """
         Delete all state from the request, for cleanup purposes.
@@ -1604,3 +1613,106 @@ class _ValueRequest:
             destination[...] = self.result[...]
 
         return self
+
+
+class _InlineRequest:
+    """
+    Pseudo request that behaves like a request.Request object.
+
+    wait() executes the workload synchronously in the greenlet of the waiting request.
+    A Request that is waited for before it was started does the same, but constructing it
+    (locks, signals, priorities, parent/child bookkeeping) can take longer than cheap workloads.
+    Everything else (submit(), callbacks, waiting from a foreign thread) is delegated to
+    a full Request, which is created on demand.
+    """
+
+    def __init__(self, fn):
+        self.fn = fn
+        self._request = None
+        self._executed = False
+        self._result = None
+        self._exception_info = None
+
+    def _full_request(self):
+        if self._request is None:
+            assert not self._executed
+            self._request = Request(self.fn)
+        return self._request
+
+    @property
+    def started(self):
+        return self._executed or (self._request is not None and self._request.started)
+
+    @property
+    def result(self):
+        if self._request is not None:
+            return self._request.result
+        assert self._executed, "Can't access the result until the request is complete."
+        return self._result
+
+    def wait(self, timeout=None):
+        if self._request is not None or (not self._executed and Request._current_request() is None):
+            return self._full_request().wait(timeout)
+
+        if not self._executed:
+            Request.raise_if_cancelled()
+            self._executed = True
+            try:
+                self._result = self.fn()
+            except Exception:
+                self._exception_info = sys.exc_info()
+                raise
+        elif self._exception_info is not None:
+            exc_type, exc_value, exc_tb = self._exception_info
+            raise_with_traceback(exc_value, exc_tb)
+        return self._result
+
+    def block(self, timeout=None):
+        self.wait(timeout)
+
+    def submit(self):
+        if not self._executed:
+            self._full_request().submit()
+
+    def notify_finished(self, fn):
+        if not self._executed:
+            self._full_request().notify_finished(fn)
+        elif self._exception_info is None:
+            fn(self._result)
+
+    def notify_failed(self, fn):
+        if not self._executed:
+            self._full_request().notify_failed(fn)
+        elif self._exception_info is not None:
+            fn(self._exception_info[1], self._exception_info)
+
+    def notify_cancelled(self, fn):
+        if not self._executed:
+            self._full_request().notify_cancelled(fn)
+
+    def add_done_callback(self, callback: Callable[["_InlineRequest"], None]) -> None:
+        if not self._executed:
+            self._full_request().add_done_callback(lambda _: callback(self))
+        else:
+            callback(self)
+
+    def cancel(self):
+        # An inline workload is cancelled together with the request that executes it
+        if self._request is not None:
+            self._request.cancel()
+
+    def clean(self):
+        if self._request is not None:
+            self._request.clean()
+        self.fn = None
+        self._result = None
+
+    def writeInto(self, destination):
+        if self._request is not None:
+            self._request.writeInto(destination)
+        else:
+            self.fn = Request._PartialWithAppendedArgs(self.fn, destination=destination)
+        return self
+
+    def getResult(self):
+        return self.result
@@ -23,6 +23,7 @@
 from collections.abc import Iterable
 import numbers
 from functools import partial
+import itertools
 from itertools import combinations
 from math import ceil, floor, log10, pow
 from typing import Sequence, Tuple, Union
@@ -803,6 +804,39 @@ def determine_optimal_request_blockshape(
     return tuple(blockshape)
 
 
+def align_blockshape(blockshape, alignments, max_blockshape):
+    """
+    Adjust a blockshape, so that its blocks are made up of whole blocks of the given alignment shapes
+    (e.g. the upstream ``ideal_blockshape``, a cache blockshape or the chunk shape of the output dataset).
+
+    Each dimension is rounded down to a multiple of the least common multiple of the alignments, and clipped to
+    max_blockshape.  The blockshape is a budget: it is never exceeded, so an alignment that (together with the
+    preceding ones) does not fit into it is ignored.  Alignment entries that are None or 0 are ignored, too.
+
+    >>> align_blockshape((100, 100, 10), [(64, 64, 1), (32, 32, 4)], (1000, 1000, 10))
+    (64, 64, 8)
+
+    >>> align_blockshape((10, 100), [(64, 64)], (50, 1000))
+    (10, 100)
+
+    >>> align_blockshape((1, 200, 200, 200, 1), [(1, 64, 64, 64, 1), (1, 50, 51, 50, 1)], (1, 1000, 1000, 1000, 1))
+    (1, 192, 192, 192, 1)
+    """
+    blockshape = numpy.asarray(blockshape, dtype=numpy.int64)
+    unit = numpy.ones(len(blockshape), dtype=numpy.int64)
+    for alignment in alignments:
+        if alignment is None:
+            continue
+        assert len(alignment) == len(blockshape)
+        alignment = numpy.array([a or 1 for a in alignment], dtype=numpy.int64)
+        aligned_unit = numpy.lcm(unit, alignment)
+        if (aligned_unit <= blockshape).all():
+            unit = aligned_unit
+
+    aligned = blockshape - blockshape % unit
+    return tuple(int(s) for s in numpy.minimum(aligned, max_blockshape))
+
+
 def slicing_to_string(slicing, max_shape=None):
     """
     Returns a string representation of the given slicing, which has been
@@ -828,6 +862,121 @@ def slicing_to_string(slicing, max_shape=None):
     return "(" + ",  ".join(slice_strings) + ")"
 
 
+class RoiIndex(object):
+    """
+    Spatial index over a set of (possibly overlapping) rois, implemented as a grid hash.
+
+    The grid cell shape is taken from the first roi added to the index, so that caches whose
+    blocks follow a regular blocking register each block in (very) few cells.
+    Rois that span more than max_cells_per_roi cells are kept in a separate list that is scanned linearly.
+    Lookups only inspect the rois registered in the cells touched by the query.
+
+    Example:
+        >>> index = RoiIndex()
+        >>> index.add(((0, 0), (10, 10)))
+        >>> index.add(((10, 0), (20, 10)))
+        >>> index.containing(((12, 3), (15, 5)))
+        ((10, 0), (20, 10))
+        >>> sorted(index.intersecting(((5, 5), (15, 6))))
+        [((0, 0), (10, 10)), ((10, 0), (20, 10))]
+    """
+
+    def __init__(self, max_cells_per_roi=64):
+        self._max_cells_per_roi = max_cells_per_roi
+        self._cell_shape = None
+        self._cells = {}
+        # roi -> list of cells it is registered in (None for oversized rois)
+        self._rois = {}
+        self._oversized = {}
+
+    def __len__(self):
+        return len(self._rois)
+
+    def __contains__(self, roi):
+        return roi in self._rois
+
+    def __iter__(self):
+        return iter(list(self._rois))
+
+    def _cell_range(self, roi):
+        start, stop = roi
+        first = tuple(int(a) // c for a, c in zip(start, self._cell_shape))
+        last = tuple(max(int(b) - 1, int(a)) // c for a, b, c in zip(start, stop, self._cell_shape))
+        return first, last
+
+    def _num_cells(self, first, last):
+        return bigintprod(numpy.subtract(last, first) + 1)
+
+    def _iter_cells(self, first, last):
+        return itertools.product(*(range(f, l + 1) for f, l in zip(first, last)))
+
+    def add(self, roi):
+        """Add roi, given as a hashable (start, stop) tuple, to the index."""
+        if roi in self._rois:
+            return
+        if self._cell_shape is None:
+            self._cell_shape = tuple(max(1, int(b) - int(a)) for a, b in zip(*roi))
+
+        first, last = self._cell_range(roi)
+        if self._num_cells(first, last) > self._max_cells_per_roi:
+            self._rois[roi] = None
+            self._oversized[roi] = None
+            return
+
+        cells = list(self._iter_cells(first, last))
+        for cell in cells:
+            self._cells.setdefault(cell, {})[roi] = None
+        self._rois[roi] = cells
+
+    def remove(self, roi):
+        """Remove roi from the index. Rois that are not in the index are ignored."""
+        cells = self._rois.pop(roi, None)
+        if cells is None:
+            self._oversized.pop(roi, None)
+            return
+        for cell in cells:
+            cell_rois = self._cells[cell]
+            del cell_rois[roi]
+            if not cell_rois:
+                del self._cells[cell]
+
+    def clear(self):
+        self._cell_shape = None
+        self._cells.clear()
+        self._rois.clear()
+        self._oversized.clear()
+
+    def containing(self, inner_roi):
+        """Return one of the indexed rois that entirely envelops inner_roi, or None."""
+        if not self._rois:
+            return None
+        inner_start, inner_stop = inner_roi
+        first, _ = self._cell_range(inner_roi)
+        # snapshot the candidates, so that lookups without a lock don't fail on concurrent modifications
+        for roi in tuple(self._cells.get(first, ())) + tuple(self._oversized):
+            start, stop = roi
+            if all(a <= b for a, b in zip(start, inner_start)) and all(a >= b for a, b in zip(stop, inner_stop)):
+                return roi
+        return None
+
+    def intersecting(self, roi):
+        """Return the list of indexed rois that intersect roi."""
+        if not self._rois:
+            return []
+        first, last = self._cell_range(roi)
+        if self._num_cells(first, last) > len(self._rois):
+            # The query is huge compared to the number of entries, scanning is cheaper.
+            candidates = self._rois
+        else:
+            candidates = {}
+            for cell in self._iter_cells(first, last):
+                candidates.update(self._cells.get(cell, {}))
+            candidates.update(self._oversized)
+        return [
+            candidate for candidate in candidates if getIntersection(candidate, roi, assertIntersect=False) is not None
+        ]
+
+
 class InvalidRoiException(Exception):
     pass
 
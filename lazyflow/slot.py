@@ -89,6 +89,10 @@ class Slot(object):
     # output and diagramming purposes.
     _global_counter = itertools.count()
 
+    # Output requests for rois with at most this many elements are executed inline
+    # when they are waited for from within a request (see get())
+    INLINE_EXECUTION_MAX_SIZE = 2 ** 16
+
     class SlotNotReadyError(Exception):
         pass
 
@@ -211,6 +215,10 @@ class Slot(object):
 
         self._resizing = False
 
+        # in the case of an OutputSlot, the input slot which provides
+        # exactly the same data (see setPassThrough)
+        self._pass_through_slot = None
+
         # Allow slots to be sorted by their order of creation for
         # debug output and diagramming purposes.
         self._global_slot_id = next(Slot._global_counter)
@@ -825,13 +833,56 @@ class Slot(object):
                 assert (
                     self._type != "input"
                 ), "This inputSlot has no value and no upstream_slot.  You can't ask for its data yet!"
+            if self._pass_through_slot is not None and not self._pass_through_slot._relays_value():
+                # The output is just a view of an input
+                # --> skip this operator and relay the request
+                # (unless that ends at a value, which execute() copies instead of returning a view of it)
+                return self._pass_through_slot.get(roi)
+
             # normal (outputslot) case
-            # --> construct heavy request object..
             execWrapper = Slot.RequestExecutionWrapper(self, roi)
+            if Request._current_request() is not None and (self.operator.executeInline or self._is_small_roi(roi)):
+                # cheap workload requested from within a request
+                # --> execute it directly in the waiting request instead of constructing a heavy request object
+                return Request.inline(execWrapper)
+
+            # --> construct heavy request object..
             request = Request(execWrapper)
 
             return request
 
+    def _relays_value(self):
+        """True if get() returns (a view of) the value of this or an upstream slot"""
+        slot = self
+        while slot is not None:
+            if slot._value is not None:
+                return True
+            slot = slot.upstream_slot if slot.upstream_slot is not None else slot._pass_through_slot
+        return False
+
+    @classmethod
+    def _is_small_roi(cls, roi):
+        if not isinstance(roi, rtype.SubRegion):
+            return False
+        size = 1
+        for start, stop in zip(roi.start, roi.stop):
+            size *= stop - start
+        return size <= cls.INLINE_EXECUTION_MAX_SIZE
+
+    def setPassThrough(self, input_slot):
+        """
+        Declare that this output provides exactly the data of one of its operator's input slots,
+        which must have the same shape and dtype.
+        Requests are then forwarded to input_slot without calling execute(), so that chains of
+        such operators collapse into the request of the first upstream operator that computes something.
+
+        Call this from setupOutputs(), with None to disable the forwarding again.
+        """
+        assert self._type == "output", "Only OutputSlots can be pass-through"
+        assert input_slot is None or (input_slot.operator is self.operator and input_slot._type == "input")
+        assert self.level == 0
+        self._pass_through_slot = input_slot
+
     @staticmethod
     def _findUpstreamProblemSlot(slot):
         if slot.upstream_slot is not None:
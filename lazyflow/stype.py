@@ -28,6 +28,7 @@ import collections
 import warnings
 
 from .roi import roiToSlice
+from lazyflow.utility import bufferPool
 
 import h5py
 
@@ -107,7 +108,13 @@ class SlotType(object):
 
 
 class ArrayLike(SlotType):
-    def allocateDestination(self, roi):
+    def allocateDestination(self, roi, pooled=False):
+        """
+        Allocate an (uninitialized) array for the data of the given roi.
+
+        If pooled is True, the array is borrowed from lazyflow.utility.bufferPool (unless it is masked).
+        Use this for temporaries, and give them back with bufferPool.release() when they aren't needed anymore.
+        """
         # If we do not support masked arrays, ensure that we are not allocating one.
         assert self.slot.allow_mask or (not self.slot.meta.has_mask), (
             'Allocation of a masked array is expected by the slot, "%s", of operator, '
@@ -118,6 +125,8 @@ class ArrayLike(SlotType):
         )
 
         shape = roi.stop - roi.start if roi else self.slot.meta.shape
+        if pooled and not self.slot.meta.has_mask:
+            return bufferPool.borrow(tuple(shape), self.slot.meta.dtype)
         storage = numpy.ndarray(shape, dtype=self.slot.meta.dtype)
 
         # if self.slot.meta.axistags is True:
@@ -21,7 +21,7 @@ from __future__ import absolute_import
 # This information is also available on the ilastik web site at:
 # 		   http://ilastik.org/license/
 ###############################################################################
-from .alternative_numpy_functions import vigra_bincount, chunked_bincount
+from .alternative_numpy_functions import vigra_bincount, chunked_bincount, parallel_bincount, for_each_slab
 from .memory import Memory
 from . import helpers
 from . import jsonConfig
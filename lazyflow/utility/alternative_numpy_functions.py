@@ -1,8 +1,16 @@
 from __future__ import print_function
 from builtins import range
+from functools import partial
+
 import vigra
 import numpy as np
 
+from lazyflow.request import Request, RequestPool
+from lazyflow.utility.helpers import bigintprod
+
+# Elements per slab in for_each_slab()
+SLAB_SIZE = 2 ** 22
+
 
 def vigra_bincount(labels):
     """
@@ -41,8 +49,61 @@ def chunked_bincount(labels):
     return global_counts
 
 
+def slab_slices(shape, slab_size=None):
+    """
+    Index tuples that split an array with the given shape along its first non-singleton axis
+    into slabs of about slab_size (default: SLAB_SIZE) elements (at least one plane each).
+    """
+    if slab_size is None:
+        slab_size = SLAB_SIZE
+    axis = next((i for i, n in enumerate(shape) if n > 1), 0)
+    plane_size = max(bigintprod((1,) + tuple(shape[axis + 1 :])), 1)
+    n_planes = max(slab_size // plane_size, 1)
+    return [
+        (slice(None),) * axis + (slice(start, min(start + n_planes, shape[axis])),)
+        for start in range(0, shape[axis], n_planes)
+    ]
+
+
+def for_each_slab(func, *arrays, slab_size=None):
+    """
+    Call func(index, *slabs) in parallel for the slabs of the given arrays (which must have the same shape),
+    see slab_slices().  Returns the list of results, in slab order.
+    """
+    slices = slab_slices(arrays[0].shape, slab_size)
+    results = [None] * len(slices)
+
+    def process(index, slicing):
+        results[index] = func(index, *(a[slicing] for a in arrays))
+
+    if len(slices) == 1:
+        process(0, slices[0])
+        return results
+
+    pool = RequestPool()
+    for index, slicing in enumerate(slices):
+        pool.add(Request(partial(process, index, slicing)))
+    pool.wait()
+    pool.clean()
+    return results
+
+
+def parallel_bincount(labels):
+    """
+    vigra_bincount(), computed for slabs of the labels in parallel.
+    """
+    global_counts = np.array([]).astype(np.int64)
+    for slab_counts in for_each_slab(lambda index, slab: vigra_bincount(slab), labels):
+        if len(slab_counts) > len(global_counts):
+            slab_counts, global_counts = global_counts, slab_counts
+        global_counts[: len(slab_counts)] += slab_counts
+
+    return global_counts
+
+
 if __name__ == "__main__":
     a = np.random.randint(0, 100, size=(100, 100))
     assert (np.bincount(a.flat) == vigra_bincount(a)).all()
     assert (np.bincount(a.flat) == chunked_bincount(a)).all()
+    assert (np.bincount(a.flat) == parallel_bincount(a)).all()
     print("DONE.")
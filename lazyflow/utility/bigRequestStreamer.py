@@ -34,6 +34,7 @@ from lazyflow.roi import (
     getIntersection,
     determine_optimal_request_blockshape,
     determineBlockShape,
+    align_blockshape,
 )
 
 import logging
@@ -42,6 +43,10 @@ from .memory import Memory
 
 logger = logging.getLogger(__name__)
 
+# Adjacent blocks are requested together as long as the merged request has at most this many pixels,
+# since for smaller requests the scheduling overhead outweighs the work.
+DEFAULT_COALESCE_VOLUME = 2 ** 18
+
 
 class BigRequestStreamer(object):
     """
@@ -95,7 +100,15 @@ class BigRequestStreamer(object):
     """
 
     def __init__(
-        self, outputSlot, roi, blockshape=None, batchSize=None, blockAlignment="absolute", allowParallelResults=False
+        self,
+        outputSlot,
+        roi,
+        blockshape=None,
+        batchSize=None,
+        blockAlignment="absolute",
+        allowParallelResults=False,
+        alignment=None,
+        coalesceVolume=DEFAULT_COALESCE_VOLUME,
     ):
         """
         Constructor.
@@ -107,6 +120,12 @@ class BigRequestStreamer(object):
         :param blockAlignment: Determines how block the requests. Choices are 'absolute' or 'relative'.
         :param allowParallelResults: If False, The resultSignal will not be called in parallel.
                                      In that case, your handler function has no need for locks.
+        :param alignment: Shape that the default blockshape should be a multiple of, e.g. the chunk shape of the
+                          dataset the results are written to.  (The default blockshape is always aligned to the
+                          ``ideal_blockshape`` of the slot, which covers the blockshape of upstream caches.)
+        :param coalesceVolume: Adjacent blocks are requested together, as long as the merged request has at most
+                               this many pixels.  The resultSignal is still called for every block.
+                               Pass 0 to request every block separately.
         """
         self._outputSlot = outputSlot
         self._bigRoi = roi
@@ -119,6 +138,10 @@ class BigRequestStreamer(object):
 
         if blockshape is None:
             blockshape = self._determine_blockshape(outputSlot)
+            blockshape = align_blockshape(
+                blockshape, [outputSlot.meta.ideal_blockshape, alignment], outputSlot.meta.shape
+            )
+            logger.info("Aligned blockshape: {}".format(blockshape))
 
         assert blockAlignment in ["relative", "absolute"]
         if blockAlignment == "relative":
@@ -174,7 +197,9 @@ class BigRequestStreamer(object):
                         logger.debug("Requesting Roi: {}".format(block_bounds))
                         yield block_intersecting_portion
 
-        self._requestBatch = RoiRequestBatch(self._outputSlot, roiGen(), totalVolume, batchSize, allowParallelResults)
+        self._requestBatch = RoiRequestBatch(
+            self._outputSlot, roiGen(), totalVolume, batchSize, allowParallelResults, coalesceVolume
+        )
 
     def _determine_blockshape(self, outputSlot):
         """
@@ -277,6 +302,13 @@ class BigRequestStreamer(object):
         """
         return self._requestBatch.progressSignal
 
+    @property
+    def throughput(self):
+        """
+        Pixels per second achieved by the last call to :py:meth:`execute` (None before that).
+        """
+        return self._requestBatch.throughput
+
     def execute(self):
         """
         Request the data for the entire roi by breaking it up into many smaller requests,
@@ -289,6 +321,7 @@ class BigRequestStreamer(object):
         :py:obj:`resultSignal`.
         """
         self._requestBatch.execute()
+        logger.info("Processed {} at {:.0f} pixels/s".format(self._bigRoi, self.throughput))
 
 
 if __name__ == "__main__":
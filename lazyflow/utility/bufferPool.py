@@ -0,0 +1,184 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2022, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+"""
+Pool of reusable array buffers for large temporaries.
+
+Operators that allocate large temporary arrays for every request can borrow them from the
+pool and give them back once they are done, instead of allocating and freeing them each time::
+
+    tmp = bufferPool.borrow((10, 512, 512), numpy.float32)
+    try:
+        ...
+    finally:
+        bufferPool.release(tmp)
+
+The released array (and all views of it) must not be used anymore.
+Arrays that are never released are simply garbage collected.
+
+Buffers are grouped in size classes, so that a buffer can be reused for requests of slightly
+different shapes. Idle buffers are bounded by a fraction of the cache memory, and are dropped
+by the cache memory manager before it starts to clean up caches.
+"""
+import collections
+import threading
+import weakref
+
+import numpy
+
+from lazyflow.utility.memory import Memory
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _size_class(nbytes):
+    # 4 size classes per power of two, i.e. at most 25% overhead
+    step = 1 << max(nbytes.bit_length() - 3, 0)
+    return -(-nbytes // step) * step
+
+
+def _base_array(array):
+    while isinstance(array.base, numpy.ndarray):
+        array = array.base
+    return array
+
+
+class BufferPool(object):
+    """
+    Thread-safe pool of uint8 buffers, which are handed out as arrays of the requested shape and dtype.
+
+    :param max_idle_fraction: idle buffers may take at most this fraction of the memory available for caches
+    :param min_size: smaller arrays are allocated directly (not pooled)
+    """
+
+    def __init__(self, max_idle_fraction=0.1, min_size=2 ** 20):
+        self.max_idle_fraction = max_idle_fraction
+        self.min_size = min_size
+        self._lock = threading.Lock()
+        # size class -> list of idle buffers
+        self._idle = collections.defaultdict(list)
+        self._idle_bytes = 0
+        # borrowed buffers, by id (weak, so that buffers that are never released don't leak)
+        self._borrowed = weakref.WeakValueDictionary()
+        self._counters = collections.Counter()
+
+    def maxIdleMemory(self):
+        return int(Memory.getAvailableRamCaches() * self.max_idle_fraction)
+
+    def borrow(self, shape, dtype):
+        """
+        get an uninitialized array of the given shape and dtype
+        """
+        dtype = numpy.dtype(dtype)
+        nbytes = int(numpy.prod(shape, dtype=numpy.int64)) * dtype.itemsize
+        if nbytes < self.min_size:
+            with self._lock:
+                self._counters["unpooled"] += 1
+            return numpy.empty(shape, dtype=dtype)
+
+        size_class = _size_class(nbytes)
+        with self._lock:
+            idle = self._idle[size_class]
+            if idle:
+                buffer = idle.pop()
+                self._idle_bytes -= size_class
+                self._counters["reused"] += 1
+            else:
+                buffer = None
+                self._counters["allocated"] += 1
+                self._counters["allocated_bytes"] += size_class
+
+        if buffer is None:
+            buffer = numpy.empty(size_class, dtype=numpy.uint8)
+        with self._lock:
+            self._borrowed[id(buffer)] = buffer
+        return buffer[:nbytes].view(dtype).reshape(shape)
+
+    def release(self, array):
+        """
+        give an array obtained from borrow() back to the pool
+
+        Returns False if the array (or the array it is a view of) wasn't borrowed from this pool.
+        """
+        buffer = _base_array(array)
+        max_idle = self.maxIdleMemory()
+        with self._lock:
+            if self._borrowed.pop(id(buffer), None) is not buffer:
+                return False
+            self._counters["released"] += 1
+            if self._idle_bytes + buffer.nbytes > max_idle:
+                self._counters["discarded"] += 1
+                return True
+            self._idle[buffer.nbytes].append(buffer)
+            self._idle_bytes += buffer.nbytes
+        return True
+
+    def idleMemory(self):
+        """
+        memory held by buffers that are currently not in use
+        """
+        return self._idle_bytes
+
+    def clear(self):
+        """
+        drop all idle buffers, returns the amount of memory freed
+        """
+        with self._lock:
+            freed = self._idle_bytes
+            self._idle.clear()
+            self._idle_bytes = 0
+        return freed
+
+    def stats(self):
+        """
+        allocation counters: number of buffers allocated, reused, released and discarded (released
+        while the pool was full), arrays too small to be pooled, and bytes allocated for buffers
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats["idle_bytes"] = self._idle_bytes
+            stats["borrowed"] = len(self._borrowed)
+        return stats
+
+
+_buffer_pool = BufferPool()
+
+
+def borrow(shape, dtype):
+    return _buffer_pool.borrow(shape, dtype)
+
+
+def release(array):
+    return _buffer_pool.release(array)
+
+
+def idleMemory():
+    return _buffer_pool.idleMemory()
+
+
+def clear():
+    return _buffer_pool.clear()
+
+
+def stats():
+    return _buffer_pool.stats()
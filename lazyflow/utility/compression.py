@@ -0,0 +1,293 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2022, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+"""
+Codecs used by the lazyflow caches to keep blocks compressed in memory.
+
+Codecs are selected by a spec string "<name>[:<level>]", e.g. "lz4", "zstd:9" or "blosc:5".
+Compression doesn't touch any shared state, so callers can compress blocks in parallel
+without holding a lock.
+
+Like vigra's ChunkedArrayCompressed, blocks are compressed in chunks (see chunk_shape),
+so reading a small part of a block only decompresses the chunks it touches.
+
+    >>> codec = get_codec("zlib:1")
+    >>> data = numpy.zeros((100, 100), dtype=numpy.float32)
+    >>> block = codec.compress(data)
+    >>> block.nbytes < data.nbytes
+    True
+    >>> bool((block[10:20, 5] == data[10:20, 5]).all())
+    True
+"""
+import functools
+import itertools
+import logging
+import zlib
+
+import numpy
+
+try:
+    import numcodecs
+
+    _numcodecs_available = True
+except ImportError:
+    _numcodecs_available = False
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CODEC = "lz4"
+
+# Maximum number of elements of the chunks that blocks are compressed in
+CHUNK_SIZE = 2 ** 18
+
+
+def chunk_shape(shape, chunk_size=None):
+    """
+    Shape of the chunks a block of the given shape is compressed in:
+    the longest axis is halved until a chunk has at most chunk_size (default: CHUNK_SIZE) elements.
+    """
+    chunk_size = CHUNK_SIZE if chunk_size is None else chunk_size
+    chunk = [max(int(s), 1) for s in shape]
+    while numpy.prod(chunk, dtype=numpy.int64) > chunk_size:
+        axis = int(numpy.argmax(chunk))
+        chunk[axis] = (chunk[axis] + 1) // 2
+    return tuple(chunk)
+
+
+class CompressedBlock(object):
+    """
+    Immutable, compressed copy of an array.
+    Indexing with integers and slices (without step) only decompresses the chunks that contain the
+    requested part, other keys decompress the whole block.
+    """
+
+    __slots__ = ("shape", "dtype", "chunk_shape", "_payloads", "_codec")
+
+    def __init__(self, payloads, shape, dtype, codec, chunk_shape):
+        """
+        payloads: compressed chunks, in C order of the chunk grid
+        """
+        self.shape = tuple(shape)
+        self.dtype = numpy.dtype(dtype)
+        self.chunk_shape = tuple(chunk_shape)
+        self._payloads = tuple(payloads)
+        self._codec = codec
+
+    @property
+    def size(self):
+        return int(numpy.prod(self.shape, dtype=numpy.int64))
+
+    @property
+    def nbytes(self):
+        """Size of the compressed data"""
+        return sum(len(payload) for payload in self._payloads)
+
+    @property
+    def chunk_grid(self):
+        """Number of chunks along each axis"""
+        return tuple(-(-s // c) for s, c in zip(self.shape, self.chunk_shape))
+
+    def decompress(self):
+        return self._read((0,) * len(self.shape), self.shape)
+
+    def __getitem__(self, key):
+        roi = self._key_to_roi(key)
+        if roi is None:
+            return self.decompress()[key]
+        start, stop, squeeze = roi
+        return self._read(start, stop)[squeeze]
+
+    def _key_to_roi(self, key):
+        """
+        (start, stop, squeeze) of a key made of integers and slices without step, None for other keys.
+        squeeze removes the axes that were indexed with an integer from the roi.
+        """
+        key = key if isinstance(key, tuple) else (key,)
+        if len(key) > len(self.shape):
+            return None
+        key += (slice(None),) * (len(self.shape) - len(key))
+        start, stop, squeeze = [], [], []
+        for k, n in zip(key, self.shape):
+            if isinstance(k, slice):
+                b, e, step = k.indices(n)
+                if step != 1:
+                    return None
+                start.append(b)
+                stop.append(max(b, e))
+                squeeze.append(slice(None))
+            elif isinstance(k, (int, numpy.integer)) and not isinstance(k, bool) and -n <= k < n:
+                k = int(k) % n
+                start.append(k)
+                stop.append(k + 1)
+                squeeze.append(0)
+            else:
+                return None
+        return start, stop, tuple(squeeze)
+
+    def _read(self, start, stop):
+        """
+        Decompress the chunks that intersect the roi and copy the roi from them
+        """
+        out = numpy.empty(tuple(e - b for b, e in zip(start, stop)), dtype=self.dtype)
+        if out.size == 0:
+            return out
+        grid = self.chunk_grid
+        chunk_ranges = [range(b // c, -(-e // c)) for b, e, c in zip(start, stop, self.chunk_shape)]
+        for chunk_index in itertools.product(*chunk_ranges):
+            chunk_start = [i * c for i, c in zip(chunk_index, self.chunk_shape)]
+            chunk_stop = [min(b + c, s) for b, c, s in zip(chunk_start, self.chunk_shape, self.shape)]
+            payload_index = 0
+            for i, g in zip(chunk_index, grid):
+                payload_index = payload_index * g + i
+            chunk = self._codec.decode(
+                self._payloads[payload_index], tuple(e - b for b, e in zip(chunk_start, chunk_stop)), self.dtype
+            )
+            lower = [max(b, cb) for b, cb in zip(start, chunk_start)]
+            upper = [min(e, ce) for e, ce in zip(stop, chunk_stop)]
+            out[tuple(slice(l - b, u - b) for l, u, b in zip(lower, upper, start))] = chunk[
+                tuple(slice(l - cb, u - cb) for l, u, cb in zip(lower, upper, chunk_start))
+            ]
+        return out
+
+
+class BlockCodec(object):
+    """
+    Base class of the codecs: subclasses implement encode/decode on raw bytes.
+    """
+
+    name = None
+
+    def supports(self, dtype):
+        return numpy.dtype(dtype).kind in "biuf"
+
+    def compress(self, data):
+        data = numpy.asarray(data)
+        chunks = chunk_shape(data.shape)
+        grid = tuple(-(-s // c) for s, c in zip(data.shape, chunks))
+        payloads = []
+        for chunk_index in itertools.product(*(range(g) for g in grid)):
+            slicing = tuple(slice(i * c, (i + 1) * c) for i, c in zip(chunk_index, chunks))
+            payloads.append(self.encode(numpy.ascontiguousarray(data[slicing])))
+        return CompressedBlock(payloads, data.shape, data.dtype, self, chunks)
+
+    def encode(self, data):
+        raise NotImplementedError
+
+    def decode(self, payload, shape, dtype):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return "<{} {}>".format(type(self).__name__, self.name)
+
+
+class ZlibCodec(BlockCodec):
+    def __init__(self, level=1):
+        self.name = "zlib:{}".format(level)
+        self._level = level
+
+    def encode(self, data):
+        return zlib.compress(data.data, self._level)
+
+    def decode(self, payload, shape, dtype):
+        return numpy.frombuffer(bytearray(zlib.decompress(payload)), dtype=dtype).reshape(shape)
+
+
+class NumcodecsCodec(BlockCodec):
+    """
+    Wraps a codec from the numcodecs package (LZ4, Zstd, Blosc).
+    """
+
+    def __init__(self, name, codec):
+        self.name = name
+        self._codec = codec
+
+    def encode(self, data):
+        return self._codec.encode(data)
+
+    def decode(self, payload, shape, dtype):
+        out = numpy.empty(shape, dtype=dtype)
+        self._codec.decode(payload, out=out)
+        return out
+
+
+class VigraLZ4Codec(BlockCodec):
+    """
+    LZ4 compression via vigra.ChunkedArrayCompressed, used if numcodecs isn't installed.
+    vigra doesn't report the compressed size, so memory usage is accounted with the uncompressed size.
+    """
+
+    name = "lz4"
+    _supported_dtypes = (numpy.dtype(numpy.uint8), numpy.dtype(numpy.uint32), numpy.dtype(numpy.float32))
+
+    def supports(self, dtype):
+        return numpy.dtype(dtype) in self._supported_dtypes
+
+    def compress(self, data):
+        import vigra
+
+        compressed_block = vigra.ChunkedArrayCompressed(data.shape, vigra.Compression.LZ4, data.dtype)
+        compressed_block[:] = data
+        return compressed_block
+
+
+def stored_nbytes(block):
+    """
+    Number of bytes a block occupies in a cache, which is the compressed size for compressed blocks.
+    """
+    if isinstance(block, (numpy.ndarray, CompressedBlock)):
+        return block.nbytes
+    return block.size * numpy.dtype(block.dtype).itemsize
+
+
+@functools.lru_cache(maxsize=None)
+def get_codec(spec=DEFAULT_CODEC):
+    """
+    Return the codec for a spec string "<name>[:<level>]".
+
+    Known names are "lz4", "zstd" (levels 1-22, default 3), "blosc" (lz4 with byte shuffle,
+    levels 0-9, default 5) and "zlib" (levels 1-9, default 1).
+    zstd and blosc require numcodecs, if it's missing they fall back to zlib.
+    """
+    name, _, level = spec.partition(":")
+    name = name.strip().lower()
+    level = int(level) if level else None
+
+    if name == "zlib":
+        return ZlibCodec(1 if level is None else level)
+
+    if name == "lz4":
+        if _numcodecs_available:
+            return NumcodecsCodec("lz4", numcodecs.LZ4())
+        return VigraLZ4Codec()
+
+    if name in ("zstd", "blosc"):
+        if not _numcodecs_available:
+            logger.warning("Compression codec '{}' requires numcodecs, falling back to zlib".format(spec))
+            return ZlibCodec(1 if level is None else min(level, 9))
+        if name == "zstd":
+            level = 3 if level is None else level
+            return NumcodecsCodec("zstd:{}".format(level), numcodecs.Zstd(level=level))
+        level = 5 if level is None else level
+        return NumcodecsCodec(
+            "blosc:{}".format(level), numcodecs.Blosc(cname="lz4", clevel=level, shuffle=numcodecs.Blosc.SHUFFLE)
+        )
+
+    raise ValueError("Unknown compression codec: {}".format(spec))
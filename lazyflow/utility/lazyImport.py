@@ -0,0 +1,60 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2022, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+# 		   http://ilastik.org/license/
+###############################################################################
+import importlib
+import importlib.util
+import sys
+from typing import Callable, Dict, List, Tuple
+
+
+def lazy_attributes(package_name: str, attributes: Dict[str, str]) -> Tuple[Callable, Callable, List[str]]:
+    """
+    Let a package import the modules providing its public names on first access (PEP 562),
+    instead of importing all of them when the package itself is imported.
+
+    attributes maps the exported names to the (relative) modules defining them.
+    Submodules of the package can be accessed as attributes as well.
+    Returns __getattr__, __dir__ and __all__ for the package::
+
+        __getattr__, __dir__, __all__ = lazy_attributes(__name__, {"OpArrayPiper": ".opArrayPiper"})
+    """
+    package = sys.modules[package_name]
+
+    def __getattr__(name):
+        if name in attributes:
+            try:
+                module = importlib.import_module(attributes[name], package_name)
+            except ImportError as e:
+                raise ImportError("cannot import name {!r} from {!r}: {}".format(name, package_name, e)) from e
+            value = getattr(module, name)
+        elif not name.startswith("__") and importlib.util.find_spec("." + name, package_name) is not None:
+            value = importlib.import_module("." + name, package_name)
+        else:
+            raise AttributeError("module {!r} has no attribute {!r}".format(package_name, name))
+
+        # Subsequent lookups don't go through __getattr__ anymore
+        setattr(package, name, value)
+        return value
+
+    def __dir__():
+        return sorted(set(vars(package)) | set(attributes))
+
+    return __getattr__, __dir__, list(attributes)
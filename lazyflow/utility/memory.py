@@ -50,6 +50,8 @@ class Memory(object):
     _default_cache_fraction = 0.25
     _allowed_ram = _default_allowed_ram
     _user_limits_specified = {"total": False, "caches": False}
+    # pool name -> (fraction of cache memory or None, pinned)
+    _cache_pools = {}
 
     _magnitude_strings = {0: "B", 1: "KiB", 2: "MiB", 3: "GiB", 4: "TiB"}
     _magnitude_aliases = {
@@ -156,6 +158,77 @@ class Memory(object):
             comp = 0
         return comp
 
+    @classmethod
+    def setCachePool(cls, name, fraction=None, pinned=False):
+        """
+        configure the named cache pool
+
+        Caches are assigned to pools with Cache.setCachePool. A pool with a
+        fraction may use at most that fraction of the memory available for
+        caches, and is cleaned up on its own once it exceeds it. Caches in a
+        pinned pool are never cleaned up by the cache memory manager.
+        Caches not assigned to any pool are only limited by the total
+        memory for caches.
+        """
+        if fraction is not None and not 0 <= fraction <= 1:
+            raise ValueError("Cache pool fraction must be between 0 and 1, got {}".format(fraction))
+        cls._cache_pools[name] = (fraction, pinned)
+        if pinned:
+            logger.info("Cache pool '{}' is pinned".format(name))
+        elif fraction is not None:
+            logger.info("Cache pool '{}' limited to {:.0%} of cache memory".format(name, fraction))
+
+    @classmethod
+    def removeCachePool(cls, name):
+        cls._cache_pools.pop(name, None)
+
+    @classmethod
+    def getCachePools(cls):
+        """
+        get a dict of pool name -> (fraction, pinned) of all configured cache pools
+        """
+        return dict(cls._cache_pools)
+
+    @classmethod
+    def getAvailableRamCachePool(cls, name):
+        """
+        get the amount of memory, in bytes, the named cache pool may use,
+        None if the pool has no limit of its own
+        """
+        fraction, pinned = cls._cache_pools.get(name, (None, False))
+        if pinned or fraction is None:
+            return None
+        return cls.getAvailableRamCaches() * fraction
+
+    @classmethod
+    def isCachePoolPinned(cls, name):
+        return cls._cache_pools.get(name, (None, False))[1]
+
+    @staticmethod
+    def parseCachePools(s):
+        """
+        parse a cache pool configuration string into a dict of name -> (fraction, pinned)
+
+        >>> sorted(Memory.parseCachePools("features=50%, predictions=0.3, labels=pinned").items())
+        [('features', (0.5, False)), ('labels', (None, True)), ('predictions', (0.3, False))]
+        """
+        pools = {}
+        for item in s.split(","):
+            item = item.strip()
+            if not item:
+                continue
+            name, sep, value = item.partition("=")
+            name, value = name.strip(), value.strip()
+            if not sep or not name or not value:
+                raise FormatError("invalid cache pool specification: {}".format(item))
+            if value == "pinned":
+                pools[name] = (None, True)
+            elif value.endswith("%"):
+                pools[name] = (float(value[:-1]) / 100.0, False)
+            else:
+                pools[name] = (float(value), False)
+        return pools
+
     @staticmethod
     def format(ram, trailing_digits=1):
         mant, exp = Memory.toScientific(ram)
@@ -24,15 +24,19 @@ from builtins import next
 from builtins import range
 from builtins import object
 from future.utils import raise_with_traceback
+import collections
 import sys
+import time
 from functools import partial
 
 import numpy
 
 import lazyflow.stype
 from lazyflow.utility import OrderedSignal
+from lazyflow.roi import roiToSlice
 from lazyflow.utility.helpers import bigintprod
 from lazyflow.request import Request, SimpleRequestCondition, log_exception
+from lazyflow.request.request import _InlineRequest
 
 
 import logging
@@ -98,7 +102,9 @@ class RoiRequestBatch(object):
     Processed 5 result blocks with a total sum of: 14500
     """
 
-    def __init__(self, outputSlot, roiIterator, totalVolume=None, batchSize=2, allowParallelResults=False):
+    def __init__(
+        self, outputSlot, roiIterator, totalVolume=None, batchSize=2, allowParallelResults=False, coalesceVolume=0
+    ):
         """
         Constructor.
 
@@ -110,6 +116,9 @@ class RoiRequestBatch(object):
         :param batchSize: The maximum number of requests to launch in parallel.
         :param allowParallelResults: If False, The resultSignal will not be called in parallel.
                                      In that case, your handler function has no need for locks.
+        :param coalesceVolume: If given, consecutive rois that are adjacent along one axis (e.g. neighbouring blocks)
+                               are requested together, as long as the merged roi has at most this many pixels.
+                               The resultSignal is still called once for each of the rois from the roiIterator.
         """
         self._resultSignal = OrderedSignal()
         self._progressSignal = OrderedSignal()
@@ -118,20 +127,20 @@ class RoiRequestBatch(object):
             outputSlot.stype, lazyflow.stype.ArrayLike
         ), "Only Array-like slots supported."  # Because progress reporting depends on the roi shape
         self._outputSlot = outputSlot
-        self._roiIter = roiIterator
+        self._roiIter = _coalesced_rois(roiIterator, coalesceVolume)
         self._batchSize = batchSize
         self._allowParallelResults = allowParallelResults
 
+        # Finished, failed and cancelled requests are appended to this queue by the worker threads, and handled
+        # by the thread that runs execute().  (Appending to a deque is atomic, so the workers never wait for
+        # result handling.)  The condition is only used to wake up the executing thread.
+        self._completed = collections.deque()
         self._condition = SimpleRequestCondition()
 
-        self._activated_count = 0
-        self._completed_count = 0
-
-        self._failure_excinfo = None
-
         # Progress bookkeeping
         self._totalVolume = totalVolume
         self._processedVolume = 0
+        self._elapsed = None
 
     @property
     def resultSignal(self):
@@ -148,6 +157,15 @@ class RoiRequestBatch(object):
         """
         return self._progressSignal
 
+    @property
+    def throughput(self):
+        """
+        Pixels per second achieved by the last call to :py:meth:`execute` (None before that).
+        """
+        if self._elapsed is None:
+            return None
+        return self._processedVolume / max(self._elapsed, 1e-9)
+
     def execute(self):
         """
         Execute the batch of requests and wait for all of them to complete.
@@ -159,53 +177,40 @@ class RoiRequestBatch(object):
         :py:obj:`resultSignal`.
         """
         self.progressSignal(0)
+        start_time = time.perf_counter()
+
+        active_count = 0
+        exhausted = False
+        while True:
+            # Launch new requests until we have the correct number of active requests
+            while not exhausted and active_count < self._batchSize:
+                try:
+                    self._activateNewRequest()
+                except StopIteration:
+                    # We've run out of requests to launch.
+                    exhausted = True
+                else:
+                    active_count += 1
 
-        ## In the lines below, we acquire/release self._condition with high frequency,
-        ## to allow finishing requests to be handled in _handleCompletedRequest as soon as possible,
-        ## instead of forcing them to wait for the entire batch to be launched before the first
-        ## finished request can be handled and discarded.
+            if active_count == 0:
+                break
 
-        try:
-            # Start by activating a batch of N requests
-            for _ in range(self._batchSize):
-                with self._condition:
-                    self._activateNewRequest()
-                    self._activated_count += 1
-
-            # Loop until StopIteration
-            while True:
-                # Wait for at least one active request to finish
-                with self._condition:
-                    while (
-                        not self._failure_excinfo and (self._activated_count - self._completed_count) == self._batchSize
-                    ):
-                        self._condition.wait()
-
-                if self._failure_excinfo:
-                    exc_type, exc_value, exc_tb = self._failure_excinfo
-                    raise_with_traceback(exc_type(exc_value), exc_tb)
-
-                # Launch new requests until we have the correct number of active requests
-                while not self._failure_excinfo and self._activated_count - self._completed_count < self._batchSize:
-                    with self._condition:
-                        self._activateNewRequest()  # Eventually raises StopIteration
-                        self._activated_count += 1
-
-                if self._failure_excinfo:
-                    exc_type, exc_value, exc_tb = self._failure_excinfo
-                    raise_with_traceback(exc_type(exc_value), exc_tb)
-
-        except StopIteration:
-            # We've run out of requests to launch.
-            # Wait for the remaining active requests to finish.
+            # Wait for at least one active request to finish
             with self._condition:
-                while not self._failure_excinfo and self._completed_count < self._activated_count:
+                while not self._completed:
                     self._condition.wait()
 
-            if self._failure_excinfo:
-                exc_type, exc_value, exc_tb = self._failure_excinfo
-                raise_with_traceback(exc_type(exc_value), exc_tb)
+            while self._completed:
+                handler, args = self._completed.popleft()
+                active_count -= 1
+                handler(*args)
 
+        self._elapsed = time.perf_counter() - start_time
+        logger.debug(
+            "Processed {} pixels in {:.2f}s ({:.0f} pixels/s)".format(
+                self._processedVolume, self._elapsed, self.throughput
+            )
+        )
         self.progressSignal(100)
 
     def _activateNewRequest(self):
@@ -214,56 +219,59 @@ class RoiRequestBatch(object):
         Otherwise, raises StopIteration
         """
         # This could raise StopIteration
-        roi = next(self._roiIter)
+        roi, parts = next(self._roiIter)
         req = self._outputSlot(roi[0], roi[1])
 
         # We have to make sure that we didn't get a so-called "ValueRequest"
         # because those don't work the same way.
         # (This can happen if array data was given to a slot via setValue().)
-        assert isinstance(req, Request), "Can't use RoiRequestBatch with non-standard requests.  See comment above."
+        # (Inline requests are fine, they are converted to full requests when they are submitted.)
+        assert isinstance(
+            req, (Request, _InlineRequest)
+        ), "Can't use RoiRequestBatch with non-standard requests.  See comment above."
 
-        req.notify_finished(partial(self._handleCompletedRequest, roi))
+        req.notify_finished(partial(self._handleCompletedRequest, roi, parts))
         req.notify_failed(partial(self._handleFailedRequest, roi))
         req.notify_cancelled(partial(self._handleCancelledRequest, roi))
         req.submit()
 
-    def _handleCompletedRequest(self, roi, result):
-        try:
-            if self._allowParallelResults:
-                # Signal the user with the result before the critical section
-                self.resultSignal(roi, result)
-        except Exception:
-            # Always notify.
-            with self._condition:
-                self._failure_excinfo = sys.exc_info()
-                self._condition.notify()
-            raise
-
+    def _enqueue(self, handler, *args):
+        self._completed.append((handler, args))
         with self._condition:
+            self._condition.notify()
+
+    def _handleCompletedRequest(self, roi, parts, result):
+        results = _split_result(roi, parts, result)
+        if self._allowParallelResults:
+            # Signal the user with the result in the worker thread
             try:
-                if not self._allowParallelResults:
-                    # Signal here, inside the critical section.
-                    self.resultSignal(roi, result)
-
-                # Report progress (if possible)
-                if self._totalVolume is not None:
-                    self._processedVolume += bigintprod(numpy.subtract(roi[1], roi[0]))
-                    progress = 100 * self._processedVolume // self._totalVolume
-                    self.progressSignal(progress)
-
-                logger.debug("Request completed for roi: {}".format(roi))
-                self._completed_count += 1
-            finally:
-                # Always notify in this finally section,
-                #  even if the client result/progress handler raised.
-                self._condition.notify()
+                for part, part_result in results:
+                    self.resultSignal(part, part_result)
+            except Exception:
+                # Always notify.
+                self._enqueue(_raise, sys.exc_info())
+                raise
+            results = [(part, None) for part in parts]
+        self._enqueue(self._handleResults, roi, results)
+
+    def _handleResults(self, roi, results):
+        # Executed in the thread that runs execute(), so the results are never signalled in parallel.
+        for part, part_result in results:
+            if part_result is not None:
+                self.resultSignal(part, part_result)
+
+            # Report progress (if possible)
+            self._processedVolume += bigintprod(numpy.subtract(part[1], part[0]))
+            if self._totalVolume is not None:
+                progress = 100 * self._processedVolume // self._totalVolume
+                self.progressSignal(progress)
+
+        logger.debug("Request completed for roi: {}".format(roi))
 
     def _handleFailedRequest(self, roi, exc, exc_info):
-        with self._condition:
-            msg = "Encountered exception while processing roi: {}".format(roi)
-            log_exception(logger, msg, exc_info)
-            self._failure_excinfo = exc_info
-            self._condition.notify()
+        msg = "Encountered exception while processing roi: {}".format(roi)
+        log_exception(logger, msg, exc_info)
+        self._enqueue(_raise, exc_info)
 
     def _handleCancelledRequest(self, roi):
         # I can't think of a use-case for cancelling our child requests independent of our
@@ -271,8 +279,60 @@ class RoiRequestBatch(object):
             "You can cancel the parent request of this batch request action,"
             " but you can't cancel the child requests independently."
         )
-        with self._condition:
-            self._condition.notify()
+        self._enqueue(lambda: None)
+
+
+def _raise(exc_info):
+    exc_type, exc_value, exc_tb = exc_info
+    raise_with_traceback(exc_type(exc_value), exc_tb)
+
+
+def _merge_rois(roi, other):
+    """
+    Return the union of two rois if they are adjacent along one axis and identical along all others, else None.
+    """
+    same = (roi[0] == other[0]) & (roi[1] == other[1])
+    adjacent = ~same & (roi[1] == other[0])
+    if adjacent.sum() == 1 and same.sum() == len(same) - 1:
+        return roi[0], other[1]
+    return None
+
+
+def _coalesced_rois(roi_iterator, max_volume):
+    """
+    Merge consecutive rois from the iterator while the merged roi has at most max_volume pixels.
+    Yields ``(roi, parts)``, where parts are the original rois.
+    """
+    merged = None
+    parts = []
+    for roi in roi_iterator:
+        if max_volume:
+            roi_arrays = (numpy.asarray(roi[0]), numpy.asarray(roi[1]))
+            if merged is not None:
+                candidate = _merge_rois(merged, roi_arrays)
+                if candidate is not None and bigintprod(candidate[1] - candidate[0]) <= max_volume:
+                    merged = candidate
+                    parts.append(roi)
+                    continue
+                yield merged, parts
+            merged = roi_arrays
+            parts = [roi]
+        else:
+            yield roi, [roi]
+    if merged is not None:
+        yield merged, parts
+
+
+def _split_result(roi, parts, result):
+    """
+    Split the result of a (coalesced) roi into the results for each of its parts.
+    """
+    if len(parts) == 1:
+        return [(parts[0], result)]
+    start = numpy.asarray(roi[0])
+    return [
+        (part, result[roiToSlice(numpy.subtract(part[0], start), numpy.subtract(part[1], start))]) for part in parts
+    ]
 
 
 if __name__ == "__main__":
@@ -36,6 +36,7 @@ from lazyflow.stype import Opaque
 from lazyflow.rtype import List
 
 from ilastik.applets.base import jsonSerializerRegistry
+from ilastik.config import cfg as ilastik_config
 from ilastik.applets.base.appletSerializer import (
     getOrCreateGroup,
     deleteIfPresent,
@@ -426,6 +427,96 @@ class TestSerialBlockSlot(unittest.TestCase):
         os.remove(h5_filepath)
         shutil.rmtree(tmp_dir)
 
+    def testIncrementalSave(self):
+        tmp_dir = tempfile.mkdtemp()
+        h5_filepath = os.path.join(tmp_dir, "serial_blockslot_test.h5")
+
+        opLabelArrays, slotSerializer = self._init_objects()
+        opLabelArrays.Input[0][10:11, 10:20, 10:20, 0:1] = 1 * numpy.ones((1, 10, 10, 1), dtype=numpy.uint8)
+        opLabelArrays.Input[0][30:31, 30:40, 30:40, 0:1] = 2 * numpy.ones((1, 10, 10, 1), dtype=numpy.uint8)
+        opLabelArrays.Input[0][50:51, 50:60, 50:60, 0:1] = 3 * numpy.ones((1, 10, 10, 1), dtype=numpy.uint8)
+
+        def saved_blocks(lane_group):
+            return {ds.attrs["blockSlice"]: (name, ds.attrs["contentHash"]) for name, ds in lane_group.items()}
+
+        with h5py.File(h5_filepath, "w") as f:
+            label_group = f.create_group("label_data")
+            slotSerializer.serialize(label_group)
+            lane_group = label_group[slotSerializer.name]["0000"]
+            before = saved_blocks(lane_group)
+            assert len(before) == 3
+            for ds in lane_group.values():
+                ds.attrs["marker"] = True
+
+            # Change one block, erase another one, and add a new one
+            opLabelArrays.Input[0][30:31, 30:40, 30:40, 0:1] = 4 * numpy.ones((1, 10, 10, 1), dtype=numpy.uint8)
+            opLabelArrays.Input[0][50:51, 50:60, 50:60, 0:1] = 255 * numpy.ones((1, 10, 10, 1), dtype=numpy.uint8)
+            opLabelArrays.Input[0][70:71, 70:80, 70:80, 0:1] = 5 * numpy.ones((1, 10, 10, 1), dtype=numpy.uint8)
+            slotSerializer.serialize(label_group)
+
+            after = saved_blocks(lane_group)
+            unchanged = b"[10:20,10:20,10:20,0:1]"
+            assert set(after) == {unchanged, b"[30:40,30:40,30:40,0:1]", b"[70:80,70:80,70:80,0:1]"}
+            assert after[unchanged] == before[unchanged]
+            assert [name for name, ds in lane_group.items() if "marker" in ds.attrs] == [after[unchanged][0]]
+
+        opLabelArrays, slotSerializer = self._init_objects()
+        with h5py.File(h5_filepath, "r") as f:
+            slotSerializer.deserialize(f["label_data"])
+
+        assert (opLabelArrays.Output[0][10:11, 10:20, 10:20, 0:1].wait() == 1).all()
+        assert (opLabelArrays.Output[0][30:31, 30:40, 30:40, 0:1].wait() == 4).all()
+        assert (opLabelArrays.Output[0][50:51, 50:60, 50:60, 0:1].wait() == 0).all()
+        assert (opLabelArrays.Output[0][70:71, 70:80, 70:80, 0:1].wait() == 5).all()
+
+        os.remove(h5_filepath)
+        shutil.rmtree(tmp_dir)
+
+    def testLazyLoading(self):
+        tmp_dir = tempfile.mkdtemp()
+        h5_filepath = os.path.join(tmp_dir, "serial_blockslot_test.h5")
+
+        opLabelArrays, slotSerializer = self._init_objects()
+        opLabelArrays.Input[0][10:11, 10:20, 10:20, 0:1] = 1 * numpy.ones((1, 10, 10, 1), dtype=numpy.uint8)
+        opLabelArrays.Input[0][30:31, 30:40, 30:40, 0:1] = 2 * numpy.ones((1, 10, 10, 1), dtype=numpy.uint8)
+        with h5py.File(h5_filepath, "w") as f:
+            slotSerializer.serialize(f.create_group("label_data"))
+
+        # Like in a workflow, the labels are written to a slot that is connected to the label array
+        graph = Graph()
+        opSource = OperatorWrapper(OpArrayPiper, graph=graph)
+        opSource.Input.resize(1)
+        opSource.Input[0].setValue(vigra.taggedView(numpy.zeros((100, 100, 100, 1), dtype=numpy.uint32), "zyxc"))
+        opLabelArrays = OperatorWrapper(OpCompressedUserLabelArray, graph=graph)
+        opLabelArrays.Input.connect(opSource.Output)
+        opLabelArrays.eraser.setValue(255)
+        opLabelArrays.deleteLabel.setValue(-1)
+        opLabelArrays.blockShape.setValue((10, 10, 10, 1))
+        slotSerializer = SerialBlockSlot(opLabelArrays.Output, opLabelArrays.Input, opLabelArrays.nonzeroBlocks)
+
+        dirty_rois = []
+        opLabelArrays.Output[0].notifyDirty(lambda slot, roi: dirty_rois.append((list(roi.start), list(roi.stop))))
+
+        with h5py.File(h5_filepath, "r") as f:
+            ilastik_config.set("ilastik", "lazy_project_loading", "true")
+            try:
+                slotSerializer.deserialize(f["label_data"])
+            finally:
+                ilastik_config.set("ilastik", "lazy_project_loading", "false")
+
+            # Nothing was read yet, but downstream operators know which data changed
+            assert opLabelArrays.innerOperators[0]._cacheFiles == {}
+            assert sorted(dirty_rois) == [[[10, 10, 10, 0], [20, 20, 20, 1]], [[30, 30, 30, 0], [40, 40, 40, 1]]]
+
+            assert (opLabelArrays.Output[0][10:11, 10:20, 10:20, 0:1].wait() == 1).all()
+            assert len(opLabelArrays.innerOperators[0]._cacheFiles) == 2
+
+        assert (opLabelArrays.Output[0][30:31, 30:40, 30:40, 0:1].wait() == 2).all()
+        assert len(opLabelArrays.nonzeroBlocks[0].value) == 2
+
+        os.remove(h5_filepath)
+        shutil.rmtree(tmp_dir)
+
     def testBasic2(self):
         tmp_dir = tempfile.mkdtemp()
         h5_filepath = os.path.join(tmp_dir, "serial_blockslot_test.h5")
@@ -0,0 +1,73 @@
+import numpy
+import pytest
+
+from ilastik.applets.base.applet import DatasetConstraintError
+from ilastik.applets.tracking.conservation.opConservationTracking import (
+    _build_traxels_for_frame,
+    _filter_objects_by_range,
+)
+
+
+@pytest.fixture
+def frame_features():
+    # object 0 is the background
+    return {
+        "RegionCenter": numpy.array([[0.0, 0.0], [2.0, 3.0], [10.0, 10.0], [5.0, 5.0]]),
+        "Coord<Minimum>": numpy.array([[0, 0], [1, 2], [9, 9], [4, 4]]),
+        "Coord<Maximum>": numpy.array([[0, 0], [3, 4], [11, 11], [6, 6]]),
+        "Count": numpy.array([[100], [9], [9], [1]]),
+    }
+
+
+def test_filter_objects_by_range():
+    lower = numpy.array([[0, 0, 0], [5, 5, 0], [20, 0, 0]])
+    upper = numpy.array([[2, 2, 0], [8, 8, 0], [25, 2, 0]])
+    sizes = numpy.array([4, 9, 6])
+    keep = _filter_objects_by_range(lower, upper, sizes, (0, 10), (0, 10), (0, 1), (5, 100))
+    numpy.testing.assert_array_equal(keep, [False, True, False])
+
+
+def test_build_traxels_for_frame(frame_features):
+    div_probs = numpy.array([[0.0, 0.0], [0.5, 0.5], [0.0, 1.0], [1.0, 0.0]])
+    traxels, filtered = _build_traxels_for_frame(
+        3, frame_features, (0, 8), (0, 8), (0, 1), (2, 50), (1.0, 1.0, 2.0), div_probs=div_probs
+    )
+
+    # object 2 lies outside the x/y ranges, object 3 is too small
+    assert filtered == [2, 3]
+    assert list(traxels.keys()) == [1]
+
+    traxel = traxels[1]
+    assert traxel.Id == 1
+    assert traxel.Timestep == 3
+    assert list(traxel.Features["com"]) == [2.0, 3.0, 0.0]
+    assert list(traxel.Features["CoordMinimum"]) == [1.0, 2.0, 0.0]
+    assert list(traxel.Features["CoordMaximum"]) == [3.0, 4.0, 0.0]
+    assert list(traxel.Features["count"]) == [9.0]
+    assert list(traxel.Features["divProb"]) == [0.5, 0.5]
+
+
+def test_build_traxels_for_frame_clips_probabilities(frame_features):
+    det_probs = numpy.array([[0.0, 0.0], [0.0, 1.0], [0.3, 0.7], [1.0, 0.0]])
+    traxels, filtered = _build_traxels_for_frame(
+        0, frame_features, (0, 20), (0, 20), (0, 1), (0, 50), (1.0, 1.0, 1.0), det_probs=det_probs
+    )
+    assert filtered == []
+    assert list(traxels[1].Features["detProb"]) == [0.0000001, 0.99999999]
+    assert list(traxels[2].Features["detProb"]) == [0.3, 0.7]
+
+
+def test_build_traxels_for_empty_frame():
+    empty = {"RegionCenter": numpy.zeros((0,)), "Coord<Minimum>": [], "Coord<Maximum>": [], "Count": []}
+    assert _build_traxels_for_frame(0, empty, (0, 1), (0, 1), (0, 1), (0, 1), (1.0, 1.0, 1.0)) == ({}, [])
+
+
+def test_build_traxels_for_frame_invalid_dimensionality():
+    features = {
+        "RegionCenter": numpy.zeros((2, 4)),
+        "Coord<Minimum>": numpy.zeros((2, 4)),
+        "Coord<Maximum>": numpy.zeros((2, 4)),
+        "Count": numpy.ones((2, 1)),
+    }
+    with pytest.raises(DatasetConstraintError):
+        _build_traxels_for_frame(0, features, (0, 1), (0, 1), (0, 1), (0, 2), (1.0, 1.0, 1.0))
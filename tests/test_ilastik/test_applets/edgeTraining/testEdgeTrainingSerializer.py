@@ -6,6 +6,7 @@ import vigra
 from ilastikrag import Rag
 
 from ilastik.applets.edgeTraining import OpEdgeTraining
+from ilastik.applets.edgeTraining.blockwiseRag import BlockwiseRag
 from ilastik.applets.edgeTraining.edgeTrainingSerializer import EdgeTrainingSerializer
 from lazyflow.utility.testing import SlotDesc, build_multi_output_mock_op
 
@@ -102,6 +103,36 @@ def test_serializer_roundtrip(graph, inputs, empty_project_file, superpixels, ra
     assert op_load_content_lane.opRagCache._value is not None
 
 
+def test_serializer_blockwise_rag(graph, inputs, empty_project_file, superpixels):
+    op = OpEdgeTraining(graph=graph)
+    op.VoxelData.connect(inputs.VoxelData)
+    op.Superpixels.connect(inputs.Superpixels)
+    op.WatershedSelectedInput.connect(inputs.WatershedSelectedInput)
+
+    # built by OpCreateRag
+    rag = op.getLane(0).Rag.value
+    assert isinstance(rag, BlockwiseRag)
+
+    serializer = EdgeTrainingSerializer(op, "EdgeTraining")
+    serializer.serializeToHdf5(empty_project_file, empty_project_file.name)
+
+    op_load = OpEdgeTraining(graph=graph)
+    op_load.VoxelData.connect(inputs.VoxelData)
+    op_load.Superpixels.connect(inputs.Superpixels)
+    op_load.WatershedSelectedInput.connect(inputs.WatershedSelectedInput)
+    deserializer = EdgeTrainingSerializer(op_load, "EdgeTraining")
+    deserializer.deserializeFromHdf5(empty_project_file, empty_project_file.name)
+
+    loaded_rag = op_load.getLane(0).opRagCache._value
+    assert isinstance(loaded_rag, BlockwiseRag)
+    numpy.testing.assert_array_equal(loaded_rag.edge_ids, rag.edge_ids)
+    numpy.testing.assert_array_equal(loaded_rag.edge_sizes, rag.edge_sizes)
+    assert loaded_rag.max_sp == rag.max_sp == 2
+    assert loaded_rag.axiskeys == "yx"
+    # the labels are read from the superpixels
+    numpy.testing.assert_array_equal(loaded_rag.label_img, superpixels[..., 0])
+
+
 @pytest.mark.parametrize(
     "serializer_version,train_rf,expect_cached_features",
     [("0.1", False, False), ("0.2", False, True), ("0.1", True, True), ("0.2", True, True)],
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+import vigra
+
+import ilastikrag
+from ilastikrag.util import generate_random_voronoi
+
+from ilastik.applets.edgeTraining.blockwiseRag import BLOCKWISE_FEATURES, BlockwiseRag
+from ilastik.applets.edgeTraining.util import block_edge_table, blockwise_edge_statistics, blockwise_edge_table
+
+
+@pytest.mark.parametrize(
+    "shape,block_shape", [((60, 70), (16, 16)), ((30, 40, 50), (16, 16, 16)), ((20, 20), (20, 20))]
+)
+def test_blockwise_edge_table_matches_rag(shape, block_shape):
+    superpixels = generate_random_voronoi(shape, 40)
+    rag = ilastikrag.Rag(superpixels)
+
+    edge_ids, edge_sizes, sp_ids = blockwise_edge_table(superpixels.view(np.ndarray), block_shape)
+    np.testing.assert_array_equal(edge_ids, rag.edge_ids)
+    assert edge_sizes.shape == (rag.num_edges,)
+    assert (edge_sizes > 0).all()
+    assert len(sp_ids) == rag.num_sp
+    assert sp_ids[-1] == rag.max_sp
+
+
+def test_edge_sizes():
+    # 1 1 2
+    # 1 3 2
+    labels = np.array([[1, 1, 2], [1, 3, 2]], dtype=np.uint32)
+    edge_ids, edge_sizes, sp_ids = blockwise_edge_table(labels, (1, 2))
+    np.testing.assert_array_equal(edge_ids, [[1, 2], [1, 3], [2, 3]])
+    np.testing.assert_array_equal(edge_sizes, [1, 2, 1])
+    np.testing.assert_array_equal(sp_ids, [1, 2, 3])
+
+
+def test_block_edge_table_counts_pairs_once():
+    labels = np.array([[1, 2], [3, 4]], dtype=np.uint32)
+    keys_a, sizes_a, sp_ids_a = block_edge_table(labels, (0, 0), (1, 2))
+    keys_b, sizes_b, sp_ids_b = block_edge_table(labels, (1, 0), (2, 2))
+    # the upper block sees its pairs to the lower block, the lower block only the pair within the last row
+    assert [(k >> 32, k & 0xFFFFFFFF) for k in keys_a] == [(1, 2), (1, 3), (2, 4)]
+    assert [(k >> 32, k & 0xFFFFFFFF) for k in keys_b] == [(3, 4)]
+    assert sizes_a.sum() + sizes_b.sum() == 4
+    # only the superpixels within the block
+    np.testing.assert_array_equal(sp_ids_a, [1, 2])
+    np.testing.assert_array_equal(sp_ids_b, [3, 4])
+
+
+def test_edge_statistics():
+    # 1 1 2
+    # 1 3 2
+    labels = np.array([[1, 1, 2], [1, 3, 2]], dtype=np.uint32)
+    values = np.array([[0, 2, 4], [6, 8, 10]], dtype=np.float32)
+    edge_ids, _, _ = blockwise_edge_table(labels, (1, 2))
+    statistics = blockwise_edge_statistics(labels, values, edge_ids, (1, 2))
+    # edge values: (1, 2): 3; (1, 3): 5, 7; (2, 3): 9
+    np.testing.assert_allclose(statistics["count"], [1, 2, 1])
+    np.testing.assert_allclose(statistics["sum"], [3, 12, 9])
+    np.testing.assert_allclose(statistics["minimum"], [3, 5, 9])
+    np.testing.assert_allclose(statistics["maximum"], [3, 7, 9])
+    np.testing.assert_allclose(statistics["mean"], [3, 6, 9])
+    np.testing.assert_allclose(statistics["variance"], [0, 1, 0])
+
+
+@pytest.mark.parametrize("shape,block_shape", [((60, 70), (16, 16)), ((30, 40, 50), (16, 16, 16))])
+def test_blockwise_rag_matches_rag(shape, block_shape):
+    superpixels = generate_random_voronoi(shape, 40)
+    rag = ilastikrag.Rag(superpixels)
+    values = np.random.default_rng(0).random(shape, dtype=np.float32)
+    axiskeys = "".join(superpixels.axistags.keys())
+
+    blockwise_rag = BlockwiseRag.from_label_source(superpixels.view(np.ndarray), axiskeys, block_shape)
+    np.testing.assert_array_equal(blockwise_rag.edge_ids, rag.edge_ids)
+    assert blockwise_rag.num_edges == rag.num_edges
+    assert blockwise_rag.num_sp == rag.num_sp
+    assert blockwise_rag.max_sp == rag.max_sp
+
+    feature_names = list(BLOCKWISE_FEATURES) + ["standard_sp_mean"]
+    expected_df = rag.compute_features(vigra.taggedView(values, axiskeys), feature_names)
+    edge_features_df = blockwise_rag.compute_features(values, feature_names)
+    assert list(edge_features_df.columns) == list(expected_df.columns)
+    np.testing.assert_array_equal(edge_features_df[["sp1", "sp2"]].values, expected_df[["sp1", "sp2"]].values)
+    np.testing.assert_allclose(edge_features_df.values[:, 2:], expected_df.values[:, 2:], rtol=1e-4, atol=1e-5)
@@ -1,10 +1,13 @@
 import numpy as np
 import pandas as pd
+import vigra
 
+import ilastikrag
 from ilastikrag.util import generate_random_voronoi
 
 from lazyflow.graph import Graph
 from ilastik.applets.edgeTraining import OpEdgeTraining
+from ilastik.applets.edgeTraining.opEdgeTraining import OpComputeEdgeFeatures
 
 import logging
 
@@ -57,3 +60,64 @@ class TestOpEdgeTraining(object):
         # ON
         assert edge_prob_dict[edge_C] > 0.5, "Expected > 0.5, got {}".format(edge_prob_dict[edge_C])
         assert edge_prob_dict[edge_D] > 0.5, "Expected > 0.5, got {}".format(edge_prob_dict[edge_D])
+
+    def testFeatureCache(self):
+        superpixels = generate_random_voronoi((50, 50, 50), 50)
+        superpixels = superpixels.insertChannelAxis()
+
+        voxel_data = np.concatenate([superpixels.astype(np.float32)] * 2, axis=-1)
+        voxel_data = vigra.taggedView(voxel_data, superpixels.axistags)
+
+        op = OpComputeEdgeFeatures(graph=Graph())
+        op.VoxelData.setValue(voxel_data, extra_meta={"channel_names": ["a", "b"]})
+        op.WatershedSelectedInput.setValue(voxel_data)
+        op.TrainRandomForest.setValue(True)
+
+        rag = ilastikrag.Rag(superpixels.dropChannelAxis())
+        computed = []
+        compute_features = rag.compute_features
+
+        def recording_compute_features(voxel_data, feature_names, *args, **kwargs):
+            computed.append(list(feature_names))
+            return compute_features(voxel_data, feature_names, *args, **kwargs)
+
+        rag.compute_features = recording_compute_features
+        op.Rag.setValue(rag)
+
+        def expected_columns(feature_names_per_channel):
+            # The columns of each channel in the order of ilastikrag
+            columns = ["sp1", "sp2"]
+            for channel_name in op.VoxelData.meta.channel_names:
+                feature_names = feature_names_per_channel[channel_name]
+                channel_df = compute_features(superpixels.dropChannelAxis().astype(np.float32), feature_names)
+                columns += [channel_name + " " + column for column in channel_df.columns.values[2:]]
+            return columns
+
+        feature_names = {"a": ["standard_edge_mean"], "b": ["standard_edge_count", "standard_edge_mean"]}
+        op.FeatureNames.setValue(feature_names)
+        df = op.EdgeFeaturesDataFrame.value
+        assert list(df.columns) == expected_columns(feature_names)
+        assert sorted(computed) == [["standard_edge_count", "standard_edge_mean"], ["standard_edge_mean"]]
+
+        # Removing features doesn't compute anything, adding a feature only computes that feature
+        computed.clear()
+        feature_names = {"a": ["standard_edge_count", "standard_edge_mean"], "b": ["standard_edge_count"]}
+        op.FeatureNames.setValue(feature_names)
+        df2 = op.EdgeFeaturesDataFrame.value
+        assert list(df2.columns) == expected_columns(feature_names)
+        assert computed == [["standard_edge_count"]]
+        np.testing.assert_array_equal(df2["a standard_edge_mean"].values, df["a standard_edge_mean"].values)
+        np.testing.assert_array_equal(df2["b standard_edge_count"].values, df["b standard_edge_count"].values)
+
+        # Dirty data of one channel only recomputes that channel
+        computed.clear()
+        op.VoxelData.setDirty(np.s_[..., 1:2])
+        op.EdgeFeaturesDataFrame.value
+        assert computed == [["standard_edge_count"]]
+
+        # Renamed channels don't get the cached features of the old names
+        computed.clear()
+        op.VoxelData.setValue(voxel_data, check_changed=False, extra_meta={"channel_names": ["b", "a"]})
+        df3 = op.EdgeFeaturesDataFrame.value
+        assert list(df3.columns) == expected_columns(feature_names)
+        assert sorted(computed) == [["standard_edge_count"], ["standard_edge_count", "standard_edge_mean"]]
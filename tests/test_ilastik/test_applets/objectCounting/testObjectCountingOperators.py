@@ -27,6 +27,8 @@ import ilastik.ilastik_logging
 ilastik.ilastik_logging.default_config.init()
 
 import unittest
+from unittest import mock
+
 import numpy as np
 import vigra
 from lazyflow.graph import Graph
@@ -41,14 +43,17 @@ from ilastik.applets.objectClassification.opObjectClassification import (
 
 from ilastik.applets.counting.opCounting import (
     OpCounting,
+    OpEnsembleMargin,
     OpMean,
     OpVolumeOperator,
+    OpSummedAreaTable,
     OpLabelPipeline,
     OpPredictionPipelineNoCache,
     OpPredictionPipeline,
 )
 
 from ilastik.applets.counting.countingOperators import OpTrainCounter, OpPredictCounter, OpLabelPreviewer
+from ilastik.applets.counting.countingsvr import SVR
 
 
 # def segImage():
@@ -103,6 +108,257 @@ class TestOpMean(unittest.TestCase):
         np.testing.assert_allclose(np.mean(rimg.view(np.ndarray), axis=2), mean.view(np.ndarray)[..., 0:1, 0])
 
 
+class TestOpSummedAreaTable(unittest.TestCase):
+    def setUp(self):
+        g = Graph()
+        self.op = OpSummedAreaTable(graph=g)
+        self.op.BlockShape.setValue((16, 20, None))
+        self.density = vigra.taggedView(np.random.rand(50, 70, 1), "yxc")
+        self.op.Input.setValue(self.density)
+
+    def testTotal(self):
+        np.testing.assert_allclose(self.op.Output[:].wait()[0], self.density.sum())
+
+    def testRoiSums(self):
+        roiSum = self.op.RoiSum.value
+        for start, stop in [((0, 0, 0), (50, 70, 1)), ((3, 5, 0), (47, 66, 1)), ((16, 20, 0), (32, 40, 1))]:
+            expected = self.density[tuple(slice(a, b) for a, b in zip(start, stop))].sum()
+            np.testing.assert_allclose(roiSum(start, stop), expected)
+        # rois are clipped to the input
+        np.testing.assert_allclose(roiSum((40, 60, 0), (100, 100, 1)), self.density[40:, 60:].sum())
+        assert roiSum((5, 5, 0), (5, 9, 1)) == 0
+
+    def testDirty(self):
+        roiSum = self.op.RoiSum.value
+        np.testing.assert_allclose(roiSum((3, 5, 0), (47, 66, 1)), self.density[3:47, 5:66].sum())
+        density = self.density.copy()
+        density[10:12, 30:33] += 1
+        self.op.Input.setValue(density)
+        np.testing.assert_allclose(roiSum((3, 5, 0), (47, 66, 1)), density[3:47, 5:66].sum())
+        np.testing.assert_allclose(self.op.Output[:].wait()[0], density.sum())
+
+
+def objectArray(items):
+    """
+    a 1D object array holding items (e.g. a list of slicings) without numpy unpacking them
+    """
+    array = np.empty((len(items),), dtype=object)
+    for i, item in enumerate(items):
+        array[i] = item
+    return array
+
+
+class FakeRegressor(object):
+    """
+    predicts a fixed linear combination of the features
+    """
+
+    def __init__(self, weights, offset):
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.offset = offset
+
+    def predict(self, features):
+        return features.dot(self.weights) + self.offset
+
+
+class TestOpTrainCounter(unittest.TestCase):
+    def setUp(self):
+        g = Graph()
+        self.op = OpTrainCounter(graph=g)
+        self.op.fixClassifier.setValue(False)
+        self.op.UpperBound.setValue(1.0)
+
+        np.random.seed(0)
+        self.images = []
+        self.foreground = []
+        self.background = []
+        self.blocks = [
+            [(slice(0, 10), slice(0, 10), slice(0, 1)), (slice(10, 20), slice(0, 20), slice(0, 1))],
+            [(slice(0, 20), slice(10, 20), slice(0, 1))],
+        ]
+        for lane in range(2):
+            self.images.append(vigra.taggedView(np.random.rand(20, 20, 3).astype(np.float32), "yxc"))
+            foreground = np.zeros((20, 20, 1), dtype=np.uint8)
+            foreground[[2, 5, 14, 17], [3, 16, 4, 12]] = 1
+            self.foreground.append(vigra.taggedView(foreground, "yxc"))
+            background = np.zeros((20, 20, 1), dtype=np.uint8)
+            background[[1, 8, 11, 19], [18, 1, 15, 9]] = 2
+            self.background.append(vigra.taggedView(background, "yxc"))
+
+        self.op.Images.setValues(self.images)
+        self.op.ForegroundLabels.setValues(self.foreground)
+        self.op.BackgroundLabels.setValues(self.background)
+        self.op.nonzeroLabelBlocks.resize(2)
+        for lane, blocks in enumerate(self.blocks):
+            self.op.nonzeroLabelBlocks[lane].setValue(objectArray([blocks]))
+
+    def expectedTrainingData(self):
+        # Samples as collected before blocks were processed in parallel:
+        # the positive samples of all blocks in order, followed by the negative samples of all blocks in order
+        svr = SVR(**self.op._svr.get_params())
+        positives = []
+        negatives = []
+        for lane, blocks in enumerate(self.blocks):
+            opGaussian = OpLabelPreviewer(graph=self.op.graph)
+            opGaussian.sigma.setValue(self.op.Sigma.value)
+            opGaussian.Input.setValue(self.foreground[lane])
+            for b in blocks:
+                image = self.images[lane][b[:-1] + (slice(None),)].view(np.ndarray)
+                labblock = opGaussian.Output[b].wait().reshape(image.shape[:-1])
+                bgindices = np.ravel_multi_index(
+                    np.where(self.background[lane][b] == 2), self.background[lane][b].shape
+                )
+                newDot, mapping, tags = svr.prepareDataRefactored(labblock, bgindices)
+                features = image.reshape((-1, image.shape[-1]))[mapping]
+                labels = newDot[mapping]
+                positives.append((features[: tags[0]], labels[: tags[0]]))
+                negatives.append((features[tags[0] :], labels[tags[0] :]))
+            opGaussian.cleanUp()
+        samples = positives + negatives
+        features = np.concatenate([f for f, _ in samples]).astype(np.float64)
+        labels = np.concatenate([l for _, l in samples]).astype(np.float64)
+        tags = [sum(len(l) for _, l in positives), sum(len(l) for _, l in negatives)]
+        return features, labels, tags
+
+    def testTrainingMatrix(self):
+        calls = []
+
+        def fitPrepared(svr, img, dot, tags, **kwargs):
+            calls.append((img.copy(), dot.copy(), list(tags), kwargs))
+
+        with mock.patch.object(SVR, "fitPrepared", autospec=True, side_effect=fitPrepared):
+            regressors = self.op.Classifier[:].wait()
+
+        assert len(regressors) == OpTrainCounter.numRegressors
+        assert all(isinstance(regressor, SVR) for regressor in regressors)
+        assert len(calls) == OpTrainCounter.numRegressors
+
+        features, labels, tags = self.expectedTrainingData()
+        assert tags[0] > 0 and tags[1] > 0
+        for img, dot, fullTags, kwargs in calls:
+            np.testing.assert_array_equal(img, features)
+            np.testing.assert_array_equal(dot, labels)
+            assert fullTags == tags
+            assert kwargs["numRegressors"] == OpTrainCounter.numRegressors
+            assert not kwargs["trainAll"]
+
+        for regressor in regressors:
+            np.testing.assert_array_equal(regressor._minmax[0], features.min(axis=0))
+            np.testing.assert_array_equal(regressor._minmax[1], features.max(axis=0))
+
+    def testNoLabels(self):
+        for lane in range(2):
+            self.op.nonzeroLabelBlocks[lane].setValue(objectArray([[]]))
+        regressors = self.op.Classifier[:].wait()
+        assert all(regressor is None for regressor in regressors)
+
+
+class TestOpPredictCounter(unittest.TestCase):
+    def setUp(self):
+        g = Graph()
+        self.op = OpPredictCounter(graph=g)
+        np.random.seed(0)
+        self.features = vigra.taggedView(np.random.rand(10, 12, 3).astype(np.float32), "yxc")
+        self.forests = [FakeRegressor(np.random.rand(3), i) for i in range(OpTrainCounter.numRegressors)]
+        self.op.Image.setValue(self.features)
+        self.op.Classifier.setValue(objectArray(self.forests))
+        self.op.LabelsCount.setValue(OpTrainCounter.numRegressors)
+
+    def expectedPrediction(self, key):
+        # All forests predict the whole (spatial) roi, their predictions are stacked along the channel axis
+        image = self.features[key[:-1] + (slice(None),)].view(np.ndarray)
+        features = np.asarray(image.reshape((-1, image.shape[-1])), dtype=np.float32)
+        predictions = [forest.predict(features).reshape(image.shape[:-1]) for forest in self.forests]
+        return np.dstack(predictions)[..., key[-1]]
+
+    def testFullRoi(self):
+        key = (slice(None), slice(None), slice(None))
+        assert self.op.PMaps.meta.shape == (10, 12, OpTrainCounter.numRegressors)
+        np.testing.assert_allclose(self.op.PMaps[key].wait(), self.expectedPrediction(key), rtol=1e-6)
+
+    def testChannelSubset(self):
+        for key in [
+            (slice(2, 7), slice(3, 12), slice(1, 2)),
+            (slice(None), slice(0, 5), slice(2, 4)),
+            (slice(4, 5), slice(None), slice(0, 1)),
+        ]:
+            prediction = self.op.PMaps[key].wait()
+            expected = self.expectedPrediction(key)
+            assert prediction.shape == expected.shape
+            np.testing.assert_allclose(prediction, expected, rtol=1e-6)
+
+    def testUntrained(self):
+        self.op.Classifier.setValue(objectArray([None] * OpTrainCounter.numRegressors))
+        prediction = self.op.PMaps[:, :, 1:2].wait()
+        assert prediction.shape == (10, 12, 1)
+        assert not prediction.any()
+
+
+class TestSVRPredict(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.image = np.random.rand(6, 7, 3) - 0.3
+        self.regressors = [FakeRegressor(np.random.rand(3) - 0.5, 0.0), None, FakeRegressor(np.random.rand(3), -0.5)]
+
+    def expectedPrediction(self, svr):
+        # one channel per regressor (zeros for untrained ones), negative predictions are clipped
+        image = self.image.reshape((-1, self.image.shape[-1]))
+        if svr._normalizes():
+            # SVR.normalize only scales the features
+            image = image * svr._scalingFactor
+        predictions = [
+            np.zeros(self.image.shape[:-1]) if r is None else r.predict(image).reshape(self.image.shape[:-1])
+            for r in self.regressors
+        ]
+        return np.maximum(np.dstack(predictions), 0)
+
+    def testPredict(self):
+        svr = SVR(method="RandomForest")
+        svr._regressor = self.regressors
+        image = self.image.copy()
+        prediction = svr.predict(image)
+        assert prediction.shape == self.image.shape[:-1] + (len(self.regressors),)
+        np.testing.assert_allclose(prediction, self.expectedPrediction(svr))
+        assert (prediction >= 0).all()
+        assert not prediction[..., 1].any()
+        # the input isn't modified
+        np.testing.assert_array_equal(image, self.image)
+
+    def testPredictNormalized(self):
+        minima = self.image.reshape((-1, 3)).min(axis=0)
+        maxima = self.image.reshape((-1, 3)).max(axis=0)
+        svr = SVR(method="svrBoxed-gurobi", minmax=(minima, maxima))
+        svr._regressor = self.regressors
+        image = self.image.copy()
+        prediction = svr.predict(image)
+        assert svr._normalizes()
+        np.testing.assert_allclose(prediction, self.expectedPrediction(svr))
+        np.testing.assert_array_equal(image, self.image)
+
+
+class TestOpEnsembleMargin(unittest.TestCase):
+    def setUp(self):
+        g = Graph()
+        self.op = OpEnsembleMargin(graph=g)
+
+    def expectedMargin(self, pmap):
+        # difference of the two largest predictions of each pixel
+        pmap_sort = np.sort(pmap, axis=-1)
+        return pmap_sort[..., -1:] - pmap_sort[..., -2:-1]
+
+    def testMargin(self):
+        np.random.seed(0)
+        for numChannels in (2, 3, 5):
+            pmap = np.random.rand(8, 9, numChannels).astype(np.float32)
+            # ties between the largest predictions
+            pmap[0, 0, :] = 0.5
+            self.op.Input.setValue(vigra.taggedView(pmap, "yxc"))
+            assert self.op.Output.meta.shape == (8, 9, 1)
+            np.testing.assert_allclose(self.op.Output[:].wait(), self.expectedMargin(pmap))
+            np.testing.assert_allclose(self.op.Output[2:5, 3:9, :].wait(), self.expectedMargin(pmap)[2:5, 3:9])
+            assert self.op.Output[0, 0, :].wait() == 0
+
+
 # class TestOpObjectTrain(unittest.TestCase):
 #
 #     nRandomForests = 1
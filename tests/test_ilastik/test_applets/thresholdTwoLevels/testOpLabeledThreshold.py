@@ -2,6 +2,7 @@ import numpy as np
 import vigra
 
 from lazyflow.graph import Graph
+from lazyflow.utility import alternative_numpy_functions
 from ilastik.applets.thresholdTwoLevels.opThresholdTwoLevels import OpLabeledThreshold, ThresholdMethod, _has_graphcut
 
 
@@ -41,6 +42,23 @@ class TestOpLabeledThreshold(object):
         assert result.max() == 3
         assert (result.astype(bool) == data.astype(bool)).all()
 
+    def test_simple_in_slabs(self, monkeypatch):
+        # one row per slab, the components have to be merged across the slab borders
+        monkeypatch.setattr(alternative_numpy_functions, "SLAB_SIZE", 1)
+        data = self.data
+
+        op = OpLabeledThreshold(graph=Graph())
+        op.Method.setValue(ThresholdMethod.SIMPLE)
+        op.FinalThreshold.setValue(0.5)
+        op.Input.setValue(data.copy())
+        op.CoreLabels.setValue(np.zeros_like(data))
+
+        result = op.Output[:].wait()[0, ..., 0]
+        expected = vigra.analysis.labelMultiArrayWithBackground((data[0, ..., 0] >= 0.5).view(np.uint8))
+        assert result.max() == expected.max() == 3
+        # same components
+        assert np.unique(np.stack((result.ravel(), expected.ravel())), axis=1).shape[1] == 4
+
     def test_hysteresis(self):
         data = self.data
         core_binary = data == 5
@@ -4,6 +4,7 @@ import subprocess
 import pytest
 import numpy as np
 import xarray
+import h5py
 from imageio import imread
 
 from ilastik.experimental.api import from_project_file
@@ -135,3 +136,47 @@ class TestIlastikApi:
         project_path = test_data_lookup.find_project(proj)
         with pytest.raises(ValueError):
             from_project_file(project_path)
+
+    @pytest.mark.parametrize(
+        "input, proj",
+        [
+            (TestData.DATA_1_CHANNEL, TestProjects.PIXEL_CLASS_1_CHANNEL_XYC),
+            (TestData.DATA_1_CHANNEL_3D, TestProjects.PIXEL_CLASS_3D),
+        ],
+    )
+    def test_predict_blocks(self, test_data_lookup, input, proj):
+        project_path = test_data_lookup.find_project(proj)
+        input_data = _load_as_xarray(test_data_lookup.find_dataset(input))
+
+        pipeline = from_project_file(project_path)
+        expected_prediction = pipeline.predict(input_data)
+
+        prediction = np.zeros_like(expected_prediction.values)
+        block_count = 0
+        for slicing, block in pipeline.predict_blocks(input_data, block_shape={"x": 20, "y": 30, "z": 10}):
+            assert block.dims == expected_prediction.dims
+            prediction[slicing] = block.values
+            block_count += 1
+
+        assert block_count > 1
+        np.testing.assert_array_almost_equal(prediction, expected_prediction)
+
+    def test_predict_into_lazy_dataset(self, test_data_lookup, tmp_path):
+        project_path = test_data_lookup.find_project(TestProjects.PIXEL_CLASS_1_CHANNEL_XYC)
+        input_data = _load_as_xarray(test_data_lookup.find_dataset(TestData.DATA_1_CHANNEL))
+
+        pipeline = from_project_file(project_path)
+        expected_prediction = pipeline.predict(input_data)
+
+        with h5py.File(tmp_path / "data.h5", "w") as f:
+            source = f.create_dataset("raw", data=input_data.values)
+            out = f.create_dataset("pred", shape=expected_prediction.shape, dtype="float32")
+
+            with pytest.raises(ValueError):
+                pipeline.predict_blocks(source)
+
+            pipeline.predict_into(source, out, axes="".join(input_data.dims), block_shape={"x": 32, "y": 32})
+            np.testing.assert_array_almost_equal(out[()], expected_prediction)
+
+            with pytest.raises(ValueError):
+                pipeline.predict_into(source, f.create_dataset("wrong", shape=(1, 2, 3)), axes="".join(input_data.dims))
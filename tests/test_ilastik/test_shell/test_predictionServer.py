@@ -0,0 +1,99 @@
+import io
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import numpy
+import pytest
+
+from ilastik.shell.headless.predictionServer import Job, PredictionServer
+
+
+@pytest.fixture
+def server():
+    started = threading.Event()
+    release = threading.Event()
+    order = []
+
+    def run_job(shell, job):
+        order.append(job.id)
+        if job.args == ["block"]:
+            started.set()
+            release.wait(5)
+        if job.args == ["fail"]:
+            raise ValueError("invalid input")
+        if job.to_array:
+            return [numpy.full((2, 3), job.id)]
+        return [f"{shell}/{job.args[0]}.h5"]
+
+    server = PredictionServer({"proj": "shell"}, ("127.0.0.1", 0), run_job=run_job)
+    server.started, server.release, server.order = started, release, order
+    server.start()
+    yield server
+    release.set()
+    server.shutdown()
+
+
+def _request(server, method, path, body=None):
+    url = "http://{}:{}{}".format(*server.address, path)
+    data = json.dumps(body).encode() if body is not None else None
+    with urllib.request.urlopen(urllib.request.Request(url, data=data, method=method)) as response:
+        content = response.read()
+        if response.headers["Content-Type"] == "application/json":
+            return json.loads(content)
+        return content
+
+
+def test_jobs_run_by_priority(server):
+    blocking = server.submit("proj", ["block"])
+    assert server.started.wait(5)
+    low = _request(server, "POST", "/jobs", {"project": "proj", "args": ["low"]})["id"]
+    high = _request(server, "POST", "/jobs", {"project": "proj", "args": ["high"], "priority": 5})["id"]
+    server.release.set()
+
+    status = _request(server, "GET", f"/jobs/{low}?wait=5")
+    assert status["status"] == Job.DONE
+    assert status["results"] == ["shell/low.h5"]
+    assert set(status["timings"]) == {"queued", "running"}
+    assert server.order == [blocking.id, high, low]
+
+
+def test_array_results_and_failures(server):
+    job = _request(server, "POST", "/jobs", {"project": "proj", "args": ["x"], "to_array": True})["id"]
+    assert _request(server, "GET", f"/jobs/{job}?wait=5")["results"] == [{"shape": [2, 3], "dtype": "int64"}]
+    result = numpy.load(io.BytesIO(_request(server, "GET", f"/jobs/{job}/result?index=0")))
+    numpy.testing.assert_array_equal(result, numpy.full((2, 3), job))
+
+    failed = _request(server, "POST", "/jobs", {"project": "proj", "args": ["fail"]})["id"]
+    status = _request(server, "GET", f"/jobs/{failed}?wait=5")
+    assert status["status"] == Job.FAILED
+    assert "invalid input" in status["error"]
+
+    _request(server, "DELETE", f"/jobs/{job}")
+    with pytest.raises(urllib.error.HTTPError) as e:
+        _request(server, "GET", f"/jobs/{job}")
+    assert e.value.code == 404
+
+
+def test_unknown_project(server):
+    with pytest.raises(urllib.error.HTTPError) as e:
+        _request(server, "POST", "/jobs", {"project": "other"})
+    assert e.value.code == 400
+    assert _request(server, "GET", "/projects") == ["proj"]
+
+
+@pytest.mark.parametrize("priority", ["high", None, 1.5, float("nan"), float("inf"), [1]])
+def test_invalid_priority(server, priority):
+    first = server.submit("proj", ["first"])
+    with pytest.raises(ValueError):
+        server.submit("proj", ["invalid"], priority=priority)
+    with pytest.raises(urllib.error.HTTPError) as e:
+        _request(server, "POST", "/jobs", {"project": "proj", "args": ["invalid"], "priority": priority})
+    assert e.value.code == 400
+
+    # Rejected jobs are neither registered nor queued, later jobs still run
+    last = _request(server, "POST", "/jobs", {"project": "proj", "args": ["last"], "priority": 2.0})["id"]
+    assert last == first.id + 1
+    assert _request(server, "GET", f"/jobs/{last}?wait=5")["status"] == Job.DONE
+    assert server.order == [first.id, last]
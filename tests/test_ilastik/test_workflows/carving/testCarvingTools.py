@@ -127,3 +127,54 @@ class TestCarvingTools(unittest.TestCase):
         res = parallel_filter(name, x, sigma, outer_scale=outer_scale, max_workers=4)
         exp = fastfilters.structureTensorEigenvalues(x, sigma, outer_scale)
         assert numpy.allclose(res, exp)
+
+    def test_parallel_filter_out(self):
+        from ilastik.workflows.carving.carvingTools import parallel_filter
+
+        shape = 3 * (64,)
+        x = numpy.random.rand(*shape).astype("float32")
+        out = numpy.zeros(shape, dtype="float32")
+
+        res = parallel_filter("gaussianSmoothing", x, 1.6, max_workers=4, block_shape=[32] * 3, out=out)
+        assert res is out
+        assert numpy.allclose(out, fastfilters.gaussianSmoothing(x, 1.6))
+
+    def test_accumulate_edge_features(self):
+        import nifty.graph.rag
+        from ilastik.workflows.carving.carvingTools import accumulate_edge_features, parallel_watershed
+
+        shape = (60,) * 3
+        x = numpy.random.rand(*shape).astype("float32")
+        labels, max_id = parallel_watershed(x, max_workers=4, block_shape=[20, 20, 20], halo=[5, 5, 5])
+
+        uv_ids, edge_strength, edge_sizes, node_sizes = accumulate_edge_features(
+            x, labels, block_shape=[16, 16, 16], max_workers=4
+        )
+
+        rag = nifty.graph.rag.gridRag(labels, int(max_id) + 1)
+        assert numpy.array_equal(uv_ids, rag.uvIds())
+        assert numpy.array_equal(node_sizes, numpy.bincount(labels.ravel()))
+        assert edge_strength.shape == edge_sizes.shape == (rag.numberOfEdges,)
+        assert edge_sizes.min() > 0
+
+        # the blockshape must not change the result
+        uv_ids2, edge_strength2, edge_sizes2, _ = accumulate_edge_features(
+            x, labels, block_shape=[60, 60, 60], max_workers=1
+        )
+        assert numpy.array_equal(uv_ids, uv_ids2)
+        assert numpy.allclose(edge_strength, edge_strength2)
+        assert numpy.array_equal(edge_sizes, edge_sizes2)
+
+    def test_agglomerate_labels_in_place(self):
+        from ilastik.workflows.carving.carvingTools import parallel_watershed, agglomerate_labels
+
+        shape = (200,) * 2
+        x = numpy.random.rand(*shape).astype("float32")
+        over_seg, _ = parallel_watershed(x, max_workers=4, block_shape=[50, 50], halo=[10, 10])
+        expected, expected_max_id = agglomerate_labels(x, over_seg, max_workers=4, reduce_to=0.5)
+
+        seg, max_id = agglomerate_labels(x, over_seg, max_workers=4, reduce_to=0.5, out=over_seg)
+        assert seg is over_seg
+        assert max_id == expected_max_id
+        assert numpy.array_equal(seg, expected)
+        assert numpy.array_equal(numpy.unique(seg), numpy.arange(1, max_id + 1))
@@ -0,0 +1,153 @@
+import h5py
+import numpy
+import pytest
+from functools import partial
+
+from ilastik.workflows.carving.objectStore import (
+    DatasetLoader,
+    LazyObjectStore,
+    SupervoxelIndex,
+    read_array,
+    read_voxels,
+    write_compressed,
+)
+
+
+@pytest.fixture
+def project_group(tmp_path):
+    with h5py.File(tmp_path / "objects.h5", "w") as f:
+        yield f.create_group("objects")
+
+
+def test_values_in_memory():
+    store = LazyObjectStore()
+    store["a"] = 1
+    store["b"] = 2
+    assert list(store) == ["a", "b"]
+    assert store["b"] == 2
+    del store["a"]
+    assert "a" not in store
+    assert len(store) == 1
+    with pytest.raises(KeyError):
+        del store["a"]
+
+
+def test_lazy_values_are_loaded_on_access():
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return "value"
+
+    store = LazyObjectStore()
+    store.set_lazy("a", loader)
+    assert "a" in store
+    assert not store.is_loaded("a")
+    assert calls == []
+
+    assert store["a"] == "value"
+    assert store["a"] == "value"
+    assert store.is_loaded("a")
+    assert len(calls) == 1
+
+    # assigning a new value drops the loader
+    store["a"] = "new"
+    assert store["a"] == "new"
+    assert len(calls) == 1
+
+
+def test_lazy_values_without_caching():
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return "value"
+
+    store = LazyObjectStore(cache_loaded=False)
+    store.set_lazy("a", loader)
+    assert store["a"] == "value"
+    assert store["a"] == "value"
+    assert not store.is_loaded("a")
+    assert len(calls) == 2
+
+
+def test_set_lazy_releases_value():
+    store = LazyObjectStore(cache_loaded=False)
+    store["a"] = "value"
+    store.set_lazy("a", lambda: "from file")
+    assert not store.is_loaded("a")
+    assert store["a"] == "from file"
+
+
+def test_voxels_roundtrip(project_group):
+    voxels = numpy.array([[1, 2, 3], [4, 5, 6]])
+    dataset = write_compressed(project_group, "fg_voxels", voxels)
+    assert dataset.compression == "gzip"
+
+    store = LazyObjectStore(cache_loaded=False)
+    store.set_lazy("obj", partial(read_voxels, project_group["fg_voxels"]))
+    loaded = store["obj"]
+    assert len(loaded) == 3
+    numpy.testing.assert_array_equal(loaded[0], [1, 4])
+    numpy.testing.assert_array_equal(loaded[2], [3, 6])
+
+
+def test_write_empty(project_group):
+    write_compressed(project_group, "sv", numpy.zeros((1, 0), dtype=numpy.int64))
+    assert read_array(project_group["sv"]).shape == (1, 0)
+
+
+def test_dataset_loader_resolves_path_on_access(tmp_path):
+    files = {}
+    with h5py.File(tmp_path / "a.h5", "w") as f:
+        write_compressed(f.create_group("objects"), "sv", numpy.array([1, 2]))
+        files["current"] = f
+        loader = DatasetLoader(lambda: files["current"], f["objects/sv"].name, read_array)
+        numpy.testing.assert_array_equal(loader(), [1, 2])
+
+        # rewritten datasets are found again
+        del f["objects/sv"]
+        write_compressed(f["objects"], "sv", numpy.array([3]))
+        numpy.testing.assert_array_equal(loader(), [3])
+
+    # the loader follows the project file to a new file, e.g. after Save As
+    with h5py.File(tmp_path / "b.h5", "w") as f:
+        write_compressed(f.create_group("objects"), "sv", numpy.array([4, 5]))
+        files["current"] = f
+        numpy.testing.assert_array_equal(loader(), [4, 5])
+
+
+def test_supervoxel_index():
+    index = SupervoxelIndex()
+    # LUTs are stored as numpy.where results
+    index["a"] = numpy.where(numpy.array([0, 1, 0, 1, 0, 0]))
+    index["b"] = numpy.array([3, 4])
+    index["c"] = numpy.array([2])
+    object_numbers = {"a": 1, "b": 2, "c": 5}
+
+    # later objects win where objects overlap, like the former loop over all LUTs
+    numpy.testing.assert_array_equal(index.done_lut(5, object_numbers), [0, 1, 5, 2, 2, 0])
+    numpy.testing.assert_array_equal(index.done_lut(5, object_numbers, exclude="b"), [0, 1, 5, 1, 0, 0])
+    assert index.names_for_supervoxel(3) == ["a", "b"]
+    assert index.names_for_supervoxel(0) == []
+
+    del index["a"]
+    assert "a" not in index
+    numpy.testing.assert_array_equal(index.done_lut(5, object_numbers), [0, 0, 5, 2, 2, 0])
+
+
+def test_supervoxel_index_roundtrip(project_group):
+    index = SupervoxelIndex()
+    index.write_hdf5(project_group.create_group("empty"))
+    assert len(SupervoxelIndex.read_hdf5(project_group["empty"])) == 0
+
+    index["a"] = numpy.array([[1, 3]])
+    index["b"] = numpy.array([], dtype=numpy.int64)
+    index["c"] = numpy.array([2])
+    index.write_hdf5(project_group.create_group("index"))
+
+    loaded = SupervoxelIndex.read_hdf5(project_group["index"])
+    assert loaded.names() == ["a", "b", "c"]
+    numpy.testing.assert_array_equal(loaded.supervoxels("a"), [1, 3])
+    assert loaded.supervoxels("b").size == 0
+    numpy.testing.assert_array_equal(loaded.done_lut(3, {"a": 1, "b": 2, "c": 3}), [0, 1, 3, 1])
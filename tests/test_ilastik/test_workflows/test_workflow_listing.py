@@ -50,7 +50,7 @@ import pytest
 )
 def test_listing(monkeypatch, workflowclasses, subclasses, expected):
 
-    monkeypatch.setattr(ilastik.workflows, "WORKFLOW_CLASSES", workflowclasses)
+    monkeypatch.setattr(ilastik.workflows, "iter_workflow_classes", lambda: iter(workflowclasses))
     monkeypatch.setattr(ilastik.workflow, "all_subclasses", lambda _: subclasses)
     discovered_workflows = list(ilastik.workflow.getAvailableWorkflows())
 
@@ -58,3 +58,14 @@ def test_listing(monkeypatch, workflowclasses, subclasses, expected):
     for disc, exp in zip(discovered_workflows, expected):
         assert disc[1] == exp[0]
         assert disc[2] == exp[1]
+
+
+def test_getWorkflowFromName_stops_at_match(monkeypatch):
+    first = Mock(workflowName="First", __name__="First", workflowDisplayName=None)
+
+    def iter_workflow_classes():
+        yield first
+        raise AssertionError("remaining workflows should not be imported")
+
+    monkeypatch.setattr(ilastik.workflows, "iter_workflow_classes", iter_workflow_classes)
+    assert ilastik.workflow.getWorkflowFromName("First") is first
@@ -0,0 +1,34 @@
+import numpy
+import vigra
+
+from lazyflow.graph import Graph
+from lazyflow.roi import getBlockBounds, getIntersectingBlocks, roiFromShape, roiToSlice
+
+from ilastik.workflows.voxelSegmentation.opSlic import OpSlic
+
+
+def test_blockwise_supervoxel_ids_are_unique_across_blocks():
+    data = numpy.random.default_rng(0).random((40, 50, 30, 1)).astype(numpy.float32)
+    blockshape = (20, 25, 30, 1)
+
+    op = OpSlic(graph=Graph())
+    op.Input.setValue(vigra.taggedView(data, "zyxc"))
+    op.NumSegments.setValue(60)
+    op.BlockShape.setValue(blockshape)
+    op.Halo.setValue(4)
+    supervoxels = op.Output[:].wait()[..., 0]
+
+    block_ids = []
+    for block_start in getIntersectingBlocks(blockshape, roiFromShape(data.shape)):
+        block_roi = getBlockBounds(data.shape, blockshape, block_start)
+        block_ids.append(set(numpy.unique(supervoxels[roiToSlice(*block_roi)[:-1]])))
+    assert len(block_ids) == 4
+    for i, ids in enumerate(block_ids):
+        for other_ids in block_ids[i + 1 :]:
+            assert not ids & other_ids
+
+    # The ids are consecutive over the whole image
+    numpy.testing.assert_array_equal(numpy.unique(supervoxels), numpy.arange(sum(map(len, block_ids))))
+
+    # A request for a part of the image gives the same ids
+    numpy.testing.assert_array_equal(op.Output[10:30, 20:30].wait()[..., 0], supervoxels[10:30, 20:30])
@@ -0,0 +1,41 @@
+import numpy
+import pytest
+
+from ilastik.workflows.voxelSegmentation.utils import get_supervoxel_features, get_supervoxel_labels
+
+
+def per_supervoxel_labels(labels, supervoxel_mask, supervoxel_ids):
+    """Label of each supervoxel computed with one mask per supervoxel"""
+    result = []
+    for supervoxel in supervoxel_ids:
+        counts = numpy.bincount(labels[supervoxel_mask[..., 0] == supervoxel].ravel())
+        result.append(0 if len(counts) == 1 else counts[1:].argmax() + 1)
+    return numpy.array(result)
+
+
+@pytest.fixture
+def volume():
+    rng = numpy.random.default_rng(42)
+    supervoxel_mask = rng.integers(0, 30, size=(10, 12, 8, 1))
+    labels = rng.integers(0, 4, size=(10, 12, 8, 1)) * (rng.random((10, 12, 8, 1)) < 0.1)
+    return labels, supervoxel_mask
+
+
+def test_supervoxel_labels_match_per_supervoxel_loop(volume):
+    labels, supervoxel_mask = volume
+    expected = per_supervoxel_labels(labels, supervoxel_mask, range(30))
+    numpy.testing.assert_array_equal(get_supervoxel_labels(labels, supervoxel_mask), expected)
+
+
+def test_supervoxel_labels_of_selected_ids(volume):
+    labels, supervoxel_mask = volume
+    supervoxel_ids = numpy.array([17, 3, 25, 0])
+    expected = per_supervoxel_labels(labels, supervoxel_mask, supervoxel_ids)
+    numpy.testing.assert_array_equal(get_supervoxel_labels(labels, supervoxel_mask, supervoxel_ids), expected)
+
+
+def test_supervoxel_features_match_per_supervoxel_mean(volume):
+    _, supervoxel_mask = volume
+    features = numpy.random.default_rng(0).random(supervoxel_mask.shape[:-1] + (3,))
+    expected = [features[supervoxel_mask[..., 0] == v].mean(axis=0) for v in range(30)]
+    numpy.testing.assert_allclose(get_supervoxel_features(features, supervoxel_mask), expected)
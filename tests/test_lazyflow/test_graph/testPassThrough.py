@@ -0,0 +1,91 @@
+from unittest import mock
+
+import numpy
+import pytest
+
+from lazyflow.graph import Graph, Operator, InputSlot, OutputSlot
+from lazyflow.operators.opArrayPiper import OpArrayPiper
+from lazyflow.operators.opReorderAxes import OpReorderAxes
+from lazyflow.request import Request
+from lazyflow.utility.testing import OpArrayPiperWithAccessCount
+import vigra
+
+
+@pytest.fixture
+def piper_execute():
+    with mock.patch.object(OpArrayPiper, "execute", autospec=True, side_effect=OpArrayPiper.execute) as execute:
+        yield execute
+
+
+@pytest.fixture
+def data():
+    return vigra.taggedView(numpy.random.randint(0, 255, (10, 20, 30), dtype=numpy.uint8), "zyx")
+
+
+def test_piper_chain_is_collapsed(piper_execute, data):
+    graph = Graph()
+    source = OpArrayPiperWithAccessCount(graph=graph)
+    source.Input.setValue(data)
+
+    upstream = source.Output
+    pipers = []
+    for _ in range(5):
+        op = OpArrayPiper(graph=graph)
+        op.Input.connect(upstream)
+        upstream = op.Output
+        pipers.append(op)
+
+    numpy.testing.assert_array_equal(upstream[2:5, :, 10:].wait(), data[2:5, :, 10:])
+    assert piper_execute.call_count == 0
+    assert source.accessCount == 1
+
+
+def test_piper_copies_values(piper_execute, data):
+    op = OpArrayPiper(graph=Graph())
+    op.Input.setValue(data.copy())
+
+    result = op.Output[:].wait()
+    result[:] = 0
+    numpy.testing.assert_array_equal(op.Output[:].wait(), data)
+    assert piper_execute.call_count == 2
+
+
+def test_reorder_axes_passes_through_identity(data):
+    graph = Graph()
+    source = OpArrayPiperWithAccessCount(graph=graph)
+    source.Input.setValue(data)
+
+    op = OpReorderAxes(graph=graph, Input=source.Output, AxisOrder="zyx")
+    with mock.patch.object(op, "execute") as execute:
+        numpy.testing.assert_array_equal(op.Output[:].wait(), data)
+        execute.assert_not_called()
+
+    op.AxisOrder.setValue("xyz")
+    numpy.testing.assert_array_equal(op.Output[:].wait(), data.transpose())
+
+
+class OpSum(Operator):
+    Input = InputSlot()
+    Output = OutputSlot()
+
+    def setupOutputs(self):
+        self.Output.meta.shape = (1,)
+        self.Output.meta.dtype = object
+
+    def execute(self, slot, subindex, roi, result):
+        result[0] = (self.Input[:].wait().sum(), Request._current_request())
+        return result
+
+    def propagateDirty(self, slot, subindex, roi):
+        self.Output.setDirty()
+
+
+def test_small_requests_are_executed_inline(data):
+    op = OpSum(graph=Graph())
+    op.Input.setValue(data)
+
+    def outer():
+        total, executing_request = op.Output[:].wait()[0]
+        return total, executing_request is Request._current_request()
+
+    assert Request(outer).wait() == (data.sum(), True)
@@ -193,6 +193,82 @@ class TestCacheMemoryManager:
         c = pipe.accessCount
         assert c > b, "did not clean up"
 
+    def testCleanupTriggeredByCacheGrowth(self, cacheMemoryManager):
+        vol = np.zeros((100, 100), dtype=np.uint8)
+        vol = vigra.taggedView(vol, axistags="xy")
+
+        g = Graph()
+        pipe = OpArrayPiperWithAccessCount(graph=g)
+        cache = OpBlockedArrayCache(graph=g)
+        cache.BlockShape.setValue((10, 100))
+        cache.Input.connect(pipe.Output)
+        pipe.Input.setValue(vol)
+
+        # The periodic cleanup won't run during this test (apart from the one triggered by setting the interval)
+        cacheMemoryManager._min_trigger_interval = 0.0
+        cacheMemoryManager.setRefreshInterval(3600)
+        cacheMemoryManager.enable()
+        Memory.setAvailableRamCaches(5 * 10 * 100)
+        time.sleep(0.2)
+
+        cleaned_up = []
+        cacheMemoryManager.totalCacheMemory.subscribe(cleaned_up.append)
+
+        # first block stays within the budget
+        cache.Output[:10, :].wait()
+        time.sleep(0.1)
+        assert cleaned_up == []
+
+        # exceeding the budget wakes the manager
+        cache.Output[...].wait()
+        for _ in range(50):
+            if cleaned_up:
+                break
+            time.sleep(0.1)
+        assert cleaned_up, "cleanup wasn't triggered"
+        assert cache.usedMemory() <= 5 * 10 * 100
+
+    def testCachePools(self, cacheMemoryManager):
+        vol = vigra.taggedView(np.zeros((100, 100), dtype=np.uint8), axistags="xy")
+
+        g = Graph()
+        pipe = OpArrayPiperWithAccessCount(graph=g)
+        pipe.Input.setValue(vol)
+        pinned_cache = OpBlockedArrayCache(graph=g)
+        pinned_cache.setCachePool("test_pinned")
+        limited_cache = OpBlockedArrayCache(graph=g)
+        limited_cache.setCachePool("test_limited")
+        for cache in (pinned_cache, limited_cache):
+            cache.BlockShape.setValue((10, 100))
+            cache.Input.connect(pipe.Output)
+
+        Memory.setCachePool("test_pinned", pinned=True)
+        Memory.setCachePool("test_limited", 0.2)
+        try:
+            # the total would even allow both caches to be filled completely
+            Memory.setAvailableRamCaches(20000)
+            cacheMemoryManager.setRefreshInterval(0.01)
+            cacheMemoryManager.enable()
+
+            pinned_cache.Output[...].wait()
+            limited_cache.Output[...].wait()
+            time.sleep(0.5)
+
+            assert pinned_cache.usedMemory() == vol.nbytes
+            assert limited_cache.usedMemory() <= 0.2 * 20000
+            usage = cacheMemoryManager.getCachePoolUsage()
+            assert usage["test_pinned"] == vol.nbytes
+            assert usage["test_limited"] <= 0.2 * 20000
+
+            # pinned caches aren't cleaned up even if the total is exceeded
+            Memory.setAvailableRamCaches(0)
+            time.sleep(0.5)
+            assert pinned_cache.usedMemory() == vol.nbytes
+            assert limited_cache.usedMemory() == 0
+        finally:
+            Memory.removeCachePool("test_pinned")
+            Memory.removeCachePool("test_limited")
+
     def testBadMemoryConditions(self):
         """
         TestCacheMemoryManager.testBadMemoryConditions
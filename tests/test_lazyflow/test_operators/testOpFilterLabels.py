@@ -25,6 +25,7 @@ import numpy
 import vigra
 from lazyflow.graph import Graph
 from lazyflow.operators import OpFilterLabels
+from lazyflow.utility import alternative_numpy_functions
 
 
 class TestOpFilterLabels(object):
@@ -58,3 +59,16 @@ class TestOpFilterLabels(object):
         expectedData[0, 0, 50:53, 50:53, 0] = 0
         filtered2 = op.Output[:].wait()
         assert (filtered2 == expectedData).all()
+
+    def testSlabs(self, monkeypatch):
+        # the labels are counted and filtered in slabs of single planes
+        monkeypatch.setattr(alternative_numpy_functions, "SLAB_SIZE", 1)
+        op = OpFilterLabels(graph=Graph())
+        op.Input.setValue(self.inputData)
+        op.MinLabelSize.setValue(6)
+        op.MaxLabelSize.setValue(8)
+
+        expectedData = numpy.array(self.inputData)
+        expectedData[0, 0:2] = 0
+
+        assert (op.Output[:].wait() == expectedData).all()
@@ -307,6 +307,95 @@ class TestDetection(unittest.TestCase):
             assert has, "Mising patch {}".format(ep)
             pass
 
+    def testPatchHistograms(self):
+        from lazyflow.operators.opDetectMissingData import _patchify, _patchHistograms
+
+        data = np.random.randint(0, 256, (50, 37)).astype(np.uint8)
+        data[:20, :10] = 0
+        for patchSize, haloSize in [(8, 3), (64, 0), (1, 1)]:
+            (patches, slices) = _patchify(data, patchSize, haloSize)
+            (hists, histSlices) = _patchHistograms(data, patchSize, haloSize, 30, (0, 255))
+            expected = [np.histogram(patch, bins=30, range=(0, 255), density=True)[0] for patch in patches]
+            assert_array_almost_equal(hists, np.vstack(expected))
+            self.assertEqual(slices, histSlices)
+
+    def testFastIntersectionKernelSVM(self):
+        from lazyflow.operators.opDetectMissingData import _fastSVC
+
+        svm = OpDetectMissing._manager.get(self.op.NHistogramBins.value)
+        hists = np.random.dirichlet(np.ones(self.op.NHistogramBins.value), size=100) / 8.5
+        fast = _fastSVC(svm)
+        assert fast is not svm
+        assert_array_almost_equal(fast.decision_function(hists), svm.decision_function(hists))
+        assert_array_equal(fast.predict(hists), svm.predict(hists))
+
+    def testFastSVMMatchesTrainedKernelSVM(self):
+        from lazyflow.operators.opDetectMissingData import _fastSVC, _fitIntersectionKernelSVC
+
+        nBins = 16
+        rng = np.random.RandomState(0)
+        negative = rng.dirichlet(np.ones(nBins), size=80)
+        positive = rng.dirichlet(np.full(nBins, 0.2), size=80)
+        samples = np.vstack((negative, positive))
+        labels = [0] * len(negative) + [1] * len(positive)
+
+        svm = _fitIntersectionKernelSVC(samples, labels)
+        assert len(svm.supportHistograms) == len(svm.support_)
+
+        hists = np.vstack((rng.dirichlet(np.ones(nBins), size=50), rng.dirichlet(np.full(nBins, 0.2), size=50)))
+        fast = _fastSVC(svm)
+        assert fast is not svm
+        assert_array_almost_equal(fast.decision_function(hists), svm.decision_function(hists))
+        assert_array_equal(fast.predict(hists), svm.predict(hists))
+
+        # the detector ops predict with the fast SVM
+        OpDetectMissing._manager.add(svm, nBins, overwrite=True)
+        try:
+            assert_array_equal(OpDetectMissing.predict(hists, method="svm"), svm.predict(hists))
+        finally:
+            OpDetectMissing._manager.remove(nBins)
+
+    def testSliceCache(self):
+        (v, m, _) = _singleMissingLayer(layer=15, nx=64, ny=64, nz=50, method="linear")
+        self.op.InputVolume.setValue(v)
+        assert_array_equal(self.op.Output[:].wait().view(type=np.ndarray), m.view(type=np.ndarray))
+        assert len(self.op._sliceCache) == 50
+
+        # cached slices are not detected again
+        self.op._sliceCache = {key: (generation, 1 - pred) for key, (generation, pred) in self.op._sliceCache.items()}
+        assert_array_equal(self.op.Output[:].wait().view(type=np.ndarray), 1 - m.view(type=np.ndarray))
+
+        # ... unless they are dirty
+        self.op.InputVolume.setDirty()
+        assert_array_equal(self.op.Output[:].wait().view(type=np.ndarray), m.view(type=np.ndarray))
+
+    def testSliceCacheMemory(self):
+        (v, m, _) = _singleMissingLayer(layer=15, nx=64, ny=64, nz=50, method="linear")
+        self.op.InputVolume.setValue(v)
+        self.op.Output[:].wait()
+        used = self.op.usedMemory()
+        assert used > 0
+        blocks = [key for key, _ in self.op.getBlockAccessTimes()]
+        assert sorted(blocks) == sorted(self.op._sliceCache)
+
+        # the memory manager frees single slices or the whole cache
+        freed = self.op.freeBlock(blocks[0])
+        assert freed > 0
+        assert self.op.usedMemory() == used - freed
+        assert blocks[0] not in self.op._sliceCache
+        assert len(self.op.getBlockAccessTimes()) == 49
+
+        assert self.op.freeMemory() == used - freed
+        assert self.op.usedMemory() == 0
+        assert len(self.op._sliceCache) == 0
+        assert len(self.op.getBlockAccessTimes()) == 0
+        assert_array_equal(self.op.Output[:].wait().view(type=np.ndarray), m.view(type=np.ndarray))
+        assert self.op.usedMemory() == used
+
+        # changed inputs discard the cache
+        self.op.PatchSize.setValue(32)
+        assert self.op.usedMemory() == 0
+
     def testPatchDetection(self):
         vol = vigra.taggedView(np.ones((5, 5), dtype=np.uint8) * 128, axistags=vigra.defaultAxistags("xy"))
         vol[2:5, 2:5] = 0
@@ -586,6 +675,25 @@ class TestInterpMissingData(unittest.TestCase):
         assert_array_almost_equal(result.squeeze(), exp[:, :, nz + 1].view(np.ndarray).squeeze(), decimal=3)
         pass
 
+    def testSliceTiles(self):
+        interpolationMethod = "linear"
+        self.op.InterpolationMethod.setValue(interpolationMethod)
+        (vol, _, exp) = _getTestVolume("multiple blocks empty", interpolationMethod)
+
+        self.op.InputVolume.setValue(vol)
+        self.op.InputSearchDepth.setValue(5)
+        self.op.PatchSize.setValue(vol.shape[0])
+
+        for z in range(vol.shape[2]):
+            result = self.op.Output[:, :, z].wait()
+            assert_array_almost_equal(result.squeeze(), exp[:, :, z].view(np.ndarray).squeeze(), decimal=2)
+
+        # every slice was detected once, and is known in the missing-slice index
+        assert len(self.op._sliceIndex) == 1
+        (_, clean) = next(iter(self.op._sliceIndex.values()))
+        assert_array_equal(np.flatnonzero(clean == 0), [10, 11, 30, 31])
+        assert np.all(clean >= 0)
+
     def test4D(self):
         vol = vigra.VigraArray(np.ones((10, 64, 64, 3)), axistags=vigra.defaultAxistags("cxyz"))
         self.op.InputVolume.setValue(vol)
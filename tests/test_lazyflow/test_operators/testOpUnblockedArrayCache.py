@@ -103,6 +103,36 @@ class TestOpUnblockedArrayCacheCache(object):
         # No blocks left in the cache
         assert opCache.CleanBlocks.value == []
 
+    def testPartialDirty(self):
+        graph = Graph()
+        opDataProvider = OpArrayPiperWithAccessCount(graph=graph)
+        opCache = OpUnblockedArrayCache(graph=graph)
+
+        data = np.random.random((100, 100)).astype(np.float32)
+        opDataProvider.Input.setValue(vigra.taggedView(data, "yx"))
+        opCache.Input.connect(opDataProvider.Output)
+
+        for y in range(0, 100, 10):
+            for x in range(0, 100, 10):
+                opCache.Output(*((y, x), (y + 10, x + 10))).wait()
+        assert len(opCache.CleanBlocks.value) == 100
+        assert opDataProvider.accessCount == 100
+
+        # Requests within a stored block are served from the cache
+        assert (opCache.Output[12:18, 33:40].wait() == data[12:18, 33:40]).all()
+        assert opDataProvider.accessCount == 100
+
+        # Only the blocks intersecting the dirty region are discarded
+        opDataProvider.Input.setDirty((15, 15), (35, 25))
+        clean_blocks = opCache.CleanBlocks.value
+        assert len(clean_blocks) == 100 - 3 * 2
+        assert tuple(make_key[10:20, 10:20]) not in clean_blocks
+        assert tuple(make_key[30:40, 20:30]) not in clean_blocks
+        assert tuple(make_key[10:20, 30:40]) in clean_blocks
+
+        assert (opCache.Output[12:18, 13:20].wait() == data[12:18, 13:20]).all()
+        assert opDataProvider.accessCount == 101
+
     def testCacheApi(self):
         graph = Graph()
         opDataProvider = OpArrayPiperWithAccessCount(graph=graph)
@@ -168,3 +198,62 @@ class TestOpUnblockedArrayCacheCache(object):
         cache_data = opCache.Output(*inner_roi).wait()
         assert (cache_data == data[roiToSlice(*inner_roi)]).all()
         assert opDataProvider.accessCount == 0
+
+    def testCompressionCodec(self):
+        graph = Graph()
+        opDataProvider = OpArrayPiperWithAccessCount(graph=graph)
+        opCache = OpUnblockedArrayCache(graph=graph)
+        opCache.CompressionEnabled.setValue(True)
+        opCache.CompressionCodec.setValue("zlib:3")
+
+        data = np.zeros((100, 100, 100), dtype=np.float64)
+        data[10:20] = 1
+        opDataProvider.Input.setValue(vigra.taggedView(data, "zyx"))
+        opCache.Input.connect(opDataProvider.Output)
+
+        rois = [((z, 0, 0), (z + 10, 100, 100)) for z in range(0, 100, 10)]
+        pool = RequestPool()
+        for roi in rois:
+            pool.add(opCache.Output(*roi))
+        pool.wait()
+        assert opDataProvider.accessCount == len(rois)
+
+        # The true compressed size is reported
+        assert 0 < opCache.usedMemory() < data.nbytes / 10
+
+        for roi in rois:
+            assert (opCache.Output(*roi).wait() == data[roiToSlice(*roi)]).all()
+        assert opDataProvider.accessCount == len(rois)
+
+        assert opCache.freeBlock(rois[0]) > 0
+        assert len(opCache.CleanBlocks.value) == len(rois) - 1
+
+    def testUsedMemoryAccounting(self):
+        graph = Graph()
+        opDataProvider = OpArrayPiperWithAccessCount(graph=graph)
+        opCache = OpUnblockedArrayCache(graph=graph)
+
+        data = np.random.random((100, 100)).astype(np.float32)
+        opDataProvider.Input.setValue(vigra.taggedView(data, "yx"))
+        opCache.Input.connect(opDataProvider.Output)
+        assert opCache.usedMemory() == 0
+        assert opCache.lastAccessTime() == 0.0
+
+        block_nbytes = 10 * 100 * data.itemsize
+        for y in range(0, 100, 10):
+            opCache.Output(*((y, 0), (y + 10, 100))).wait()
+        assert opCache.usedMemory() == 10 * block_nbytes
+        assert opCache.lastAccessTime() > 0.0
+
+        # Storing the same block again doesn't count twice
+        opCache.Input[0:10, 0:100] = np.zeros((10, 100), dtype=np.float32)
+        assert opCache.usedMemory() == 10 * block_nbytes
+
+        assert opCache.freeBlock(((0, 0), (10, 100))) == block_nbytes
+        assert opCache.usedMemory() == 9 * block_nbytes
+
+        opDataProvider.Input.setDirty((15, 0), (25, 1))
+        assert opCache.usedMemory() == 7 * block_nbytes
+
+        assert opCache.freeMemory() == 7 * block_nbytes
+        assert opCache.usedMemory() == 0
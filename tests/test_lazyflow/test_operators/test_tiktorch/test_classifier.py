@@ -1,7 +1,9 @@
+from concurrent.futures import Future, ThreadPoolExecutor
 from unittest import mock
 
-from lazyflow.operators.tiktorch.classifier import ModelSession, enforce_min_shape
+from lazyflow.operators.tiktorch.classifier import ModelSession, PredictBatcher, enforce_min_shape
 
+import numpy
 import pytest
 from tiktorch.proto import inference_pb2
 
@@ -125,3 +127,117 @@ def test_get_output_axes(pb_session):
 def test_enforce_min_shape(min_shape, step, axes, expected):
     enforced_shape = enforce_min_shape(min_shape, step, axes)
     assert enforced_shape == expected
+
+
+class StandInServer:
+    """Predicts 2 * input, and records the shapes of the batches it got"""
+
+    def __init__(self):
+        self.batch_shapes = []
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def send(self, batch):
+        self.batch_shapes.append(batch.shape)
+        return self._executor.submit(lambda: 2 * batch)
+
+
+def test_batcher_packs_concurrent_tiles():
+    server = StandInServer()
+    batcher = PredictBatcher(server.send, batch_axis=1, max_batch_size=3, max_delay=10)
+    tiles = [numpy.full((2, 4, 5), i, dtype=numpy.uint8) for i in range(3)]
+    futures = [batcher.submit(tile) for tile in tiles]
+
+    for tile, future in zip(tiles, futures):
+        result = future.result(timeout=5)
+        assert result.dtype == numpy.float32
+        numpy.testing.assert_array_equal(result, 2 * tile[:, None])
+    assert server.batch_shapes == [(2, 3, 4, 5)]
+    batcher.close()
+
+
+def test_batcher_sends_partial_batch_after_delay():
+    server = StandInServer()
+    batcher = PredictBatcher(server.send, max_batch_size=8, max_delay=0.01)
+    future = batcher.submit(numpy.ones((4, 5)))
+    numpy.testing.assert_array_equal(future.result(timeout=5), 2 * numpy.ones((1, 4, 5)))
+    assert server.batch_shapes == [(1, 4, 5)]
+    batcher.close()
+
+
+def test_batcher_does_not_mix_shapes():
+    server = StandInServer()
+    batcher = PredictBatcher(server.send, max_batch_size=2, max_delay=10)
+    futures = [batcher.submit(numpy.ones(shape)) for shape in [(4, 5), (3, 5), (4, 5), (3, 5)]]
+    for future in futures:
+        future.result(timeout=5)
+    assert sorted(server.batch_shapes) == [(2, 3, 5), (2, 4, 5)]
+    batcher.close()
+
+
+def test_batcher_passes_on_errors():
+    def send(batch):
+        future = Future()
+        future.set_exception(RuntimeError("server error"))
+        return future
+
+    batcher = PredictBatcher(send, max_batch_size=2, max_delay=10)
+    futures = [batcher.submit(numpy.ones((4, 5))) for _ in range(2)]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="server error"):
+            future.result(timeout=5)
+    batcher.close()
+
+
+def test_batcher_splits_along_output_batch_axis():
+    def send(batch):
+        # the model returns its predictions with the batch axis first
+        future = Future()
+        future.set_result(2 * numpy.moveaxis(batch, 1, 0))
+        return future
+
+    batcher = PredictBatcher(send, batch_axis=1, output_batch_axis=0, max_batch_size=2, max_delay=10)
+    tiles = [numpy.full((3, 4), i) for i in range(2)]
+    futures = [batcher.submit(tile) for tile in tiles]
+    for tile, future in zip(tiles, futures):
+        numpy.testing.assert_array_equal(future.result(timeout=5), 2 * tile[None])
+    batcher.close()
+
+
+def _batch_session(input_shape):
+    return inference_pb2.ModelSession(
+        inputAxes=["bcyx"], outputAxes=["bcyx"], hasTraining=False, inputShapes=[input_shape]
+    )
+
+
+def _named_ints(**sizes):
+    return inference_pb2.NamedInts(namedInts=[inference_pb2.NamedInt(name=k, size=v) for k, v in sizes.items()])
+
+
+@pytest.mark.parametrize(
+    "input_shape, expected",
+    [
+        (inference_pb2.InputShape(shapeType=0, shape=_named_ints(b=1, c=1, y=256, x=256)), 1),
+        (inference_pb2.InputShape(shapeType=0, shape=_named_ints(b=4, c=1, y=256, x=256)), 1),
+        (
+            inference_pb2.InputShape(
+                shapeType=1, shape=_named_ints(b=1, c=1, y=64, x=64), stepShape=_named_ints(b=0, c=0, y=16, x=16)
+            ),
+            1,
+        ),
+        (
+            inference_pb2.InputShape(
+                shapeType=1, shape=_named_ints(b=1, c=1, y=64, x=64), stepShape=_named_ints(b=2, c=0, y=16, x=16)
+            ),
+            1,
+        ),
+        (
+            inference_pb2.InputShape(
+                shapeType=1, shape=_named_ints(b=1, c=1, y=64, x=64), stepShape=_named_ints(b=1, c=0, y=16, x=16)
+            ),
+            ModelSession.PREDICT_BATCH_SIZE,
+        ),
+    ],
+)
+def test_max_batch_size_follows_input_shape(input_shape, expected):
+    model_session = ModelSession(session=_batch_session(input_shape), factory=mock.Mock())
+    assert model_session.get_max_batch_size() == expected
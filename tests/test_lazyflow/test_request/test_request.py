@@ -348,3 +348,67 @@ class TestRequestAddDoneCallback:
             req.wait()
 
         cb.assert_called_once_with(req)
+
+
+class TestInlineRequest:
+    def test_wait_executes_in_waiting_request(self):
+        def outer():
+            current = Request._current_request()
+            inner = Request.inline(lambda: Request._current_request())
+            return inner.wait() is current
+
+        assert Request(outer).wait()
+
+    def test_wait_from_foreign_thread(self):
+        req = Request.inline(lambda: 42)
+        assert not req.started
+        assert req.wait() == 42
+        assert req.started
+
+    def test_exception_is_raised_on_every_wait(self):
+        def outer():
+            inner = Request.inline(partial(_raise, TExc()))
+            for _ in range(2):
+                with pytest.raises(TExc):
+                    inner.wait()
+            return True
+
+        assert Request(outer).wait()
+
+    def test_writeInto(self):
+        def outer():
+            dst = np.zeros(3)
+            Request.inline(lambda destination: np.add(destination, 1, out=destination)).writeInto(dst).wait()
+            return dst
+
+        assert_array_equal(Request(outer).wait(), [1, 1, 1])
+
+    def test_submit_and_callbacks_use_full_request(self):
+        cb = mock.Mock()
+
+        def outer():
+            inner = Request.inline(lambda: 42)
+            inner.notify_finished(cb)
+            inner.submit()
+            return inner.wait()
+
+        assert Request(outer).wait() == 42
+        cb.assert_called_once_with(42)
+
+    def test_callbacks_after_inline_execution(self):
+        finished, failed = mock.Mock(), mock.Mock()
+
+        def outer():
+            inner = Request.inline(lambda: 42)
+            inner.wait()
+            inner.notify_finished(finished)
+            inner.notify_failed(failed)
+            return inner.result
+
+        assert Request(outer).wait() == 42
+        finished.assert_called_once_with(42)
+        failed.assert_not_called()
+
+
+def _raise(exc):
+    raise exc
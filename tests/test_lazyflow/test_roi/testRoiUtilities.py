@@ -12,6 +12,8 @@ from lazyflow.roi import (
     nonzero_bounding_box,
     containing_rois,
     getIntersectingBlocks,
+    RoiIndex,
+    align_blockshape,
 )
 
 
@@ -19,6 +21,28 @@ def test_determine_optimal_request_blockshape_exceeds_memory():
     assert (64, 64, 1) == determine_optimal_request_blockshape((1000, 1000, 100), (0, 0, 1), 100000, 10, 1000)
 
 
+class TestAlignBlockshape(object):
+    def testAligned(self):
+        assert align_blockshape(
+            (1, 200, 200, 200, 1), [(1, 64, 64, 64, 1), (1, 32, 32, 32, 1)], (1, 1000, 1000, 1000, 1)
+        ) == (1, 192, 192, 192, 1)
+
+    def testMismatchedChunksAndTiles(self):
+        # e.g. chunks from determineBlockShape vs. the tiles of an upstream cache:
+        # their least common multiple exceeds the budget, so the chunk alignment is ignored
+        budget = (1, 200, 200, 200, 1)
+        blockshape = align_blockshape(budget, [(1, 64, 64, 64, 1), (1, 50, 51, 50, 1)], (1, 1000, 1000, 1000, 1))
+        assert blockshape == (1, 192, 192, 192, 1)
+
+    def testNeverExceedsBudget(self):
+        budget = (1, 30, 500, 500, 1)
+        blockshape = align_blockshape(budget, [(1, 64, 64, 64, 1), None], (1, 1000, 1000, 1000, 1))
+        assert blockshape == budget
+
+        # ... nor the maximum shape
+        assert align_blockshape((100, 100), [(64, 64)], (50, 1000)) == (50, 64)
+
+
 class Test_determineBlockShape(object):
     def testBasic(self):
         max_shape = (1000, 1000, 1000, 1)
@@ -140,6 +164,57 @@ class TestContainingRois(object):
         assert result.shape == (0,)
 
 
+class TestRoiIndex(object):
+    def _random_rois(self, rng, count, shape=(100, 100, 100)):
+        rois = set()
+        while len(rois) < count:
+            start = rng.randint(0, 90, size=3)
+            stop = start + rng.randint(1, 30, size=3)
+            rois.add((tuple(map(int, start)), tuple(map(int, numpy.minimum(stop, shape)))))
+        return sorted(rois)
+
+    def testMatchesLinearScan(self):
+        rng = numpy.random.RandomState(0)
+        rois = self._random_rois(rng, 200)
+        index = RoiIndex()
+        for roi in rois:
+            index.add(roi)
+        assert len(index) == len(rois)
+
+        for query in self._random_rois(rng, 100):
+            expected = [roi for roi in rois if getIntersection(roi, query, assertIntersect=False) is not None]
+            assert sorted(index.intersecting(query)) == expected
+
+            containing = index.containing(query)
+            expected_containing = containing_rois(rois, query)
+            if len(expected_containing) == 0:
+                assert containing is None
+            else:
+                assert containing in [(tuple(start), tuple(stop)) for start, stop in expected_containing.tolist()]
+
+    def testRemove(self):
+        index = RoiIndex()
+        index.add(((0, 0), (10, 10)))
+        index.add(((0, 0), (1000, 1000)))
+        index.add(((10, 0), (20, 10)))
+
+        assert index.containing(((12, 3), (15, 5))) in [((0, 0), (1000, 1000)), ((10, 0), (20, 10))]
+        assert index.containing(((12, 3), (25, 5))) == ((0, 0), (1000, 1000))
+        index.remove(((0, 0), (1000, 1000)))
+        assert index.containing(((12, 3), (25, 5))) is None
+        assert index.containing(((12, 3), (15, 5))) == ((10, 0), (20, 10))
+        assert index.intersecting(((5, 5), (6, 6))) == [((0, 0), (10, 10))]
+
+        index.remove(((0, 0), (10, 10)))
+        index.remove(((0, 0), (10, 10)))
+        assert index.intersecting(((5, 5), (6, 6))) == []
+        assert list(index) == [((10, 0), (20, 10))]
+
+        index.clear()
+        assert len(index) == 0
+        assert index.containing(((12, 3), (15, 5))) is None
+
+
 class TestGetIntersectionBlocks(TestCase):
     def test_invalid_parameters(self):
         with self.assertRaises(AssertionError):
@@ -104,3 +104,37 @@ class TestMemory(unittest.TestCase):
         (mant, exp) = sci(x, base=10, expstep=3)
         assert_equal(mant, 223)
         assert_equal(exp, 3)
+
+    def testCachePools(self):
+        Memory.setAvailableRamCaches(1000)
+        try:
+            Memory.setCachePool("features", 0.5)
+            Memory.setCachePool("labels", pinned=True)
+
+            assert Memory.getAvailableRamCachePool("features") == 500
+            assert Memory.getAvailableRamCachePool("labels") is None
+            assert Memory.getAvailableRamCachePool("unknown") is None
+            assert Memory.getAvailableRamCachePool(None) is None
+            assert Memory.isCachePoolPinned("labels")
+            assert not Memory.isCachePoolPinned("features")
+            assert Memory.getCachePools() == {"features": (0.5, False), "labels": (None, True)}
+
+            with self.assertRaises(ValueError):
+                Memory.setCachePool("features", 1.5)
+        finally:
+            Memory.removeCachePool("features")
+            Memory.removeCachePool("labels")
+        assert Memory.getCachePools() == {}
+
+    def testParseCachePools(self):
+        pools = Memory.parseCachePools(" raw=10%, features=0.5,predictions=30% ,labels=pinned,")
+        assert pools == {
+            "raw": (0.1, False),
+            "features": (0.5, False),
+            "predictions": (0.3, False),
+            "labels": (None, True),
+        }
+        assert Memory.parseCachePools("") == {}
+
+        with self.assertRaises(FormatError):
+            Memory.parseCachePools("features")
@@ -29,6 +29,7 @@ import threading
 from lazyflow.graph import Graph
 from lazyflow.roi import getIntersectingBlocks, getBlockBounds, roiToSlice
 from lazyflow.operators import OpArrayPiper
+from lazyflow.utility.testing import OpArrayPiperWithAccessCount
 
 from lazyflow.utility import RoiRequestBatch
 
@@ -110,6 +111,32 @@ class TestRoiRequestBatch(object):
         with pytest.raises(SpecialException):
             batch.execute()
 
+    def testCoalescesAdjacentRois(self):
+        op = OpArrayPiperWithAccessCount(graph=Graph())
+        inputData = numpy.indices((100, 100)).sum(0)
+        op.Input.setValue(inputData)
+        roiList = [
+            getBlockBounds([100, 100], [10, 10], start)
+            for start in getIntersectingBlocks([10, 10], ([0, 0], [100, 100]))
+        ]
+
+        results = numpy.zeros((100, 100), dtype=numpy.int32)
+        resultRois = []
+
+        def handleResult(roi, result):
+            resultRois.append(roi)
+            results[roiToSlice(*roi)] = result
+
+        batch = RoiRequestBatch(op.Output, iter(roiList), 10000, batchSize=4, coalesceVolume=500)
+        batch.resultSignal.subscribe(handleResult)
+        batch.execute()
+
+        assert (results == inputData).all()
+        assert len(resultRois) == len(roiList)
+        # Each row of blocks is requested in two halves
+        assert op.accessCount == 20
+        assert batch.throughput > 0
+
     def testPropagatesProcessingException(self, op_raising_at_3):
         roiList = [
             ((0, 0, 0), (4, 4, 4)),
@@ -0,0 +1,64 @@
+from unittest import mock
+
+import numpy
+import pytest
+
+from lazyflow.utility.bufferPool import BufferPool
+
+
+@pytest.fixture
+def pool():
+    pool = BufferPool(min_size=1024)
+    with mock.patch.object(pool, "maxIdleMemory", return_value=2 ** 20):
+        yield pool
+
+
+def test_buffers_are_reused(pool):
+    a = pool.borrow((10, 100), numpy.float32)
+    assert a.shape == (10, 100) and a.dtype == numpy.float32
+    address = a.__array_interface__["data"][0]
+    assert pool.release(a)
+    assert pool.idleMemory() == 4096
+
+    # a slightly different request falls into the same size class
+    b = pool.borrow((4, 1020), numpy.uint8)
+    assert b.shape == (4, 1020) and b.dtype == numpy.uint8
+    assert b.__array_interface__["data"][0] == address
+    assert pool.idleMemory() == 0
+
+    stats = pool.stats()
+    assert stats["allocated"] == 1
+    assert stats["reused"] == 1
+    assert stats["borrowed"] == 1
+
+
+def test_views_can_be_released(pool):
+    a = pool.borrow((100, 100), numpy.uint8)
+    assert pool.release(a[10:20])
+    assert not pool.release(a), "released twice"
+
+
+def test_small_and_foreign_arrays_are_not_pooled(pool):
+    small = pool.borrow((10,), numpy.uint8)
+    assert not pool.release(small)
+    assert not pool.release(numpy.zeros((100, 100)))
+    assert pool.idleMemory() == 0
+    assert pool.stats()["unpooled"] == 1
+
+
+def test_idle_memory_is_bounded(pool):
+    arrays = [pool.borrow((2 ** 19,), numpy.uint8) for _ in range(3)]
+    for a in arrays:
+        assert pool.release(a)
+    assert pool.idleMemory() == 2 ** 20
+    assert pool.stats()["discarded"] == 1
+
+
+def test_clear(pool):
+    a = pool.borrow((100, 100), numpy.uint8)
+    pool.release(a)
+    assert pool.clear() == 10240
+    assert pool.idleMemory() == 0
+    assert pool.stats()["allocated"] == 1
+    pool.borrow((100, 100), numpy.uint8)
+    assert pool.stats()["allocated"] == 2
@@ -0,0 +1,97 @@
+import numpy
+import pytest
+
+from lazyflow.utility import compression
+from lazyflow.utility.compression import CompressedBlock, ZlibCodec, get_codec, stored_nbytes
+
+requires_numcodecs = pytest.mark.skipif(not compression._numcodecs_available, reason="numcodecs is not installed")
+
+
+@pytest.mark.parametrize(
+    "spec",
+    [
+        "zlib",
+        "zlib:6",
+        pytest.param("lz4", marks=requires_numcodecs),
+        pytest.param("zstd:5", marks=requires_numcodecs),
+        pytest.param("blosc", marks=requires_numcodecs),
+    ],
+)
+@pytest.mark.parametrize("dtype", [numpy.uint8, numpy.uint32, numpy.float32, numpy.float64])
+def test_roundtrip(spec, dtype):
+    codec = get_codec(spec)
+    data = (numpy.arange(40 * 50 * 3).reshape((40, 50, 3)) % 17).astype(dtype)
+
+    block = codec.compress(data[:, ::2])
+    assert isinstance(block, CompressedBlock)
+    assert block.shape == (40, 25, 3)
+    assert block.dtype == numpy.dtype(dtype)
+    assert block.size == 40 * 25 * 3
+    assert 0 < stored_nbytes(block) < data[:, ::2].nbytes
+
+    decompressed = block[:]
+    assert (decompressed == data[:, ::2]).all()
+    decompressed[:] = 0  # results must be writable and independent of the stored block
+    assert (block[5:10, 3] == data[5:10, 6]).all()
+
+
+def test_get_codec():
+    assert get_codec("zlib:3") is get_codec("zlib:3")
+    assert isinstance(get_codec("ZLIB"), ZlibCodec)
+    with pytest.raises(ValueError):
+        get_codec("foo")
+
+
+def test_stored_nbytes_uncompressed():
+    data = numpy.zeros((10, 10), dtype=numpy.float32)
+    assert stored_nbytes(data) == 400
+
+
+def test_chunk_shape():
+    assert compression.chunk_shape((40, 25, 3), chunk_size=4000) == (40, 25, 3)
+    assert compression.chunk_shape((40, 25, 3), chunk_size=100) == (5, 4, 3)
+    assert compression.chunk_shape((1, 512, 512, 1, 2), chunk_size=2 ** 18) == (1, 256, 512, 1, 2)
+    assert compression.chunk_shape((0, 10), chunk_size=4) == (1, 3)
+
+
+class CountingCodec(ZlibCodec):
+    def __init__(self):
+        super().__init__()
+        self.decoded = 0
+
+    def decode(self, payload, shape, dtype):
+        self.decoded += 1
+        return super().decode(payload, shape, dtype)
+
+
+def test_partial_decompression(monkeypatch):
+    monkeypatch.setattr(compression, "CHUNK_SIZE", 100)
+    data = numpy.arange(40 * 25 * 3, dtype=numpy.float32).reshape((40, 25, 3))
+    codec = CountingCodec()
+    block = codec.compress(data)
+    assert block.chunk_shape == (5, 4, 3)
+    assert block.chunk_grid == (8, 7, 1)
+    assert 0 < block.nbytes
+
+    for key in [
+        numpy.s_[:],
+        numpy.s_[5:10, 3],
+        numpy.s_[3:12, 6:20, 1:3],
+        numpy.s_[-3:, -1, 0],
+        numpy.s_[39, 24, 2],
+        numpy.s_[10:10],
+        numpy.s_[::2, 3],  # keys with steps and other keys decompress the whole block
+        numpy.s_[..., 1],
+        numpy.s_[data[..., 0] > 100],
+    ]:
+        result = block[key]
+        assert result.shape == data[key].shape
+        assert (result == data[key]).all()
+
+    # only the chunks that contain the requested part are decompressed
+    codec.decoded = 0
+    assert (block[6:9, 8:13, 1] == data[6:9, 8:13, 1]).all()
+    assert codec.decoded == 2
+    codec.decoded = 0
+    assert (block.decompress() == data).all()
+    assert codec.decoded == 8 * 7
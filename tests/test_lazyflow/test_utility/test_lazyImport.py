@@ -0,0 +1,69 @@
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+
+@pytest.fixture
+def lazy_package(tmp_path, monkeypatch):
+    package = tmp_path / "lazypkg"
+    package.mkdir()
+    (package / "__init__.py").write_text(
+        textwrap.dedent(
+            """
+            from lazyflow.utility.lazyImport import lazy_attributes
+
+            __getattr__, __dir__, __all__ = lazy_attributes(__name__, {"A": ".a", "B": ".b"})
+            """
+        )
+    )
+    (package / "a.py").write_text("A = 1\n")
+    (package / "b.py").write_text("import lazypkg_missing_dependency\nB = 2\n")
+    (package / "sub.py").write_text("C = 3\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield "lazypkg"
+    for name in list(sys.modules):
+        if name.split(".")[0] == "lazypkg":
+            del sys.modules[name]
+
+
+def test_attributes_are_imported_on_access(lazy_package):
+    import lazypkg
+
+    assert "lazypkg.a" not in sys.modules
+    from lazypkg import A
+
+    assert A == 1
+    assert "lazypkg.a" in sys.modules
+    assert "A" in vars(lazypkg)
+    assert sorted(lazypkg.__all__) == ["A", "B"]
+    assert {"A", "B"} <= set(dir(lazypkg))
+
+
+def test_submodules(lazy_package):
+    import lazypkg
+
+    assert lazypkg.sub.C == 3
+    with pytest.raises(AttributeError):
+        lazypkg.nonexistent
+
+
+def test_failing_import_names_attribute(lazy_package):
+    with pytest.raises(ImportError, match="cannot import name 'B'"):
+        from lazypkg import B
+
+
+def test_import_lazyflow_does_not_import_operators():
+    script = textwrap.dedent(
+        """
+        import sys
+        import lazyflow
+        from lazyflow.operators import OpArrayPiper
+
+        assert "lazyflow.operators.opPixelFeaturesPresmoothed" not in sys.modules
+        assert "lazyflow.operators.ioOperators.opInputDataReader" not in sys.modules
+        assert "lazyflow.classifiers.sklearnLazyflowClassifier" not in sys.modules
+        """
+    )
+    subprocess.check_call([sys.executable, "-c", script])